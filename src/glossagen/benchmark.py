@@ -0,0 +1,462 @@
+"""Offline throughput benchmarks of the pipelines, with a local stand-in language model."""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from glossagen.__about__ import __version__
+
+DEFAULT_PDFS = ["./data/paper.pdf"]
+DEFAULT_LATEX = ["./scripts/latex.tex"]
+DEFAULT_SYNTHETIC_PAGES = [10, 100]
+DEFAULT_CHUNK_SIZE = 20000  # the chunk size of GlossaryGenerator
+KG_CHUNK_SIZE = 2000  # the chunk size of create_documents_from_research_doc
+PARAGRAPHS_PER_PAGE = 4
+SENTENCES_PER_PARAGRAPH = 6
+
+SYNTHETIC_TERMS = [
+    ("metal-organic framework", "MOF"),
+    ("zeolitic imidazolate framework", "ZIF"),
+    ("covalent organic framework", "COF"),
+    ("powder X-ray diffraction", "PXRD"),
+    ("scanning electron microscopy", "SEM"),
+    ("thermogravimetric analysis", "TGA"),
+    ("Brunauer-Emmett-Teller surface area", "BET"),
+    ("density functional theory", "DFT"),
+    ("nuclear magnetic resonance", "NMR"),
+    ("glass ionomer cement", "GIC"),
+]
+SYNTHETIC_VERBS = ["improves", "stabilizes", "is characterized by", "is compared with", "limits"]
+SYNTHETIC_OBJECTS = [
+    "the porosity of the material",
+    "the uptake of carbon dioxide",
+    "the crystallinity after activation",
+    "the stability in water",
+    "the antibacterial activity",
+]
+
+
+def synthetic_sentence(rng: random.Random) -> str:
+    """Return a random sentence that mentions an abbreviated technical term."""
+    expansion, abbreviation = rng.choice(SYNTHETIC_TERMS)
+    term = rng.choice([f"The {expansion} ({abbreviation})", f"The {abbreviation}"])
+    return f"{term} {rng.choice(SYNTHETIC_VERBS)} {rng.choice(SYNTHETIC_OBJECTS)}."
+
+
+def synthetic_paragraph(rng: random.Random) -> str:
+    """Return a random paragraph of SENTENCES_PER_PARAGRAPH sentences."""
+    return " ".join(synthetic_sentence(rng) for _ in range(SENTENCES_PER_PARAGRAPH))
+
+
+def make_synthetic_pdf(path: str, pages: int, seed: int = 0) -> str:
+    """
+    Write a PDF that looks like a paper: numbered bold headings, body text and references.
+
+    Args:
+        path (str): The file to write.
+        pages (int): The number of body pages; a page of references follows them.
+        seed (int): The seed of the text, so that the same arguments give the same document.
+
+    Returns
+    -------
+        str: The path of the PDF.
+    """
+    import fitz  # PyMuPDF
+
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for number in range(1, pages + 1):
+        page = doc.new_page()
+        page.insert_textbox(
+            fitz.Rect(50, 50, 550, 80), f"{number}. Section {number}", fontname="hebo", fontsize=12
+        )
+        body = "\n\n".join(synthetic_paragraph(rng) for _ in range(PARAGRAPHS_PER_PAGE))
+        page.insert_textbox(fitz.Rect(50, 90, 550, 800), body, fontname="helv", fontsize=10)
+    page = doc.new_page()
+    page.insert_textbox(fitz.Rect(50, 50, 550, 80), "References", fontname="hebo", fontsize=12)
+    references = "\n".join(f"{i}. A. Author, J. Chem. {2000 + i}, {i}, 1-10." for i in range(30))
+    page.insert_textbox(fitz.Rect(50, 90, 550, 800), references, fontname="helv", fontsize=10)
+    doc.save(path)
+    doc.close()
+    return path
+
+
+def make_synthetic_latex(path: str, sections: int, seed: int = 0) -> str:
+    """
+    Write a LaTeX document with sections, comments, macros and a figure environment.
+
+    Args:
+        path (str): The file to write.
+        sections (int): The number of sections.
+        seed (int): The seed of the text.
+
+    Returns
+    -------
+        str: The path of the .tex file.
+    """
+    rng = random.Random(seed)
+    lines = ["\\documentclass{article}", "\\usepackage{graphicx}", "\\begin{document}"]
+    for number in range(1, sections + 1):
+        lines.append(f"\\section{{Section {number}}} % generated")
+        for _ in range(PARAGRAPHS_PER_PAGE):
+            lines.extend([synthetic_paragraph(rng), ""])
+        lines.extend(
+            [
+                "\\begin{figure}",
+                "\\includegraphics[width=\\linewidth]{figure.png}",
+                "\\end{figure}",
+            ]
+        )
+    lines.append("\\end{document}")
+    with open(path, "w", encoding="utf-8") as file:
+        file.write("\n".join(lines) + "\n")
+    return path
+
+
+def measure(function: Callable[[], Any], repeat: int = 1) -> Tuple[Any, Dict[str, float]]:
+    """
+    Time a function.
+
+    Args:
+        function (Callable): The function to time, without arguments.
+        repeat (int): The number of runs.
+
+    Returns
+    -------
+        tuple: The result of the last run and the "seconds" (median) and "best" run times.
+    """
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return result, {"seconds": statistics.median(times), "best": min(times)}
+
+
+def stage_result(timing: Dict[str, float], items: int, unit: str, **extra: Any) -> Dict[str, Any]:
+    """Combine the timing of a stage with its throughput in units per second."""
+    throughput = items / timing["seconds"] if timing["seconds"] > 0 else None
+    return {**timing, "items": items, "unit": unit, "throughput": throughput, **extra}
+
+
+def _language_model_usage(language_model: Any, before: Dict[str, int]) -> Dict[str, int]:
+    """Return the requests and tokens of the language model since `before`."""
+    after = language_model.usage()
+    return {key: value - before.get(key, 0) for key, value in after.items()}
+
+
+def _kg_chunking(research_doc: Any) -> Callable[[], List[Any]]:
+    """Return the chunking step of the knowledge graph pipeline, which needs langchain."""
+    from glossagen.pipelines.knowledge_graph import create_documents_from_research_doc
+
+    return lambda: create_documents_from_research_doc(research_doc, KG_CHUNK_SIZE)
+
+
+def benchmark_pdf(  # noqa: PLR0913
+    path: str,
+    language_model: Any,
+    workers: int = 1,
+    repeat: int = 1,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    graph_latency: float = 0.0,
+) -> Dict[str, Any]:
+    """
+    Measure every stage of the pipelines, and the whole glossary pipeline, on a PDF.
+
+    Args:
+        path (str): The PDF.
+        language_model (OfflineLM): The language model, already set with set_language_model.
+        workers (int): The maximum number of concurrent language model requests.
+        repeat (int): The number of runs of every stage.
+        chunk_size (int): The chunk size of the glossary extraction.
+        graph_latency (float): The time in seconds every write to the fake graph takes.
+
+    Returns
+    -------
+        dict: The document, its size and the results of every stage.
+    """
+    import fitz  # PyMuPDF
+
+    from glossagen.pipelines.generate_glossary import GlossaryGenerator, generate_glossary
+    from glossagen.pipelines.glossary_to_ontology import OntologyGenerator
+    from glossagen.pipelines.knowledge_graph import build_knowledge_graph
+    from glossagen.utils import (
+        InMemoryGraph,
+        OfflineGraphTransformer,
+        ResearchDoc,
+        segment_document,
+    )
+
+    with fitz.open(path) as doc:
+        pages = doc.page_count
+    stages: Dict[str, Any] = {}
+
+    research_doc, timing = measure(lambda: ResearchDoc.from_pdf(path), repeat)
+    characters = len(research_doc.paper)
+    stages["load"] = stage_result(timing, pages, "pages", characters=characters)
+
+    segments, timing = measure(lambda: segment_document(research_doc, chunk_size), repeat)
+    stages["segment"] = stage_result(timing, characters, "characters", chunks=len(segments))
+
+    generator = GlossaryGenerator(research_doc, chunk_size=chunk_size, max_workers=workers)
+    chunks = [segment.text for segment in segments]
+    usage = language_model.usage()
+    results, timing = measure(lambda: generator.extract_chunks(chunks), repeat)
+    lm_usage = _language_model_usage(language_model, usage)
+    stages["extract"] = stage_result(timing, len(chunks), "chunks", lm=lm_usage)
+
+    glossary, timing = measure(lambda: generator.merge_chunk_results(results), repeat)
+    raw_terms = sum(len(result) for result in results)
+    stages["deduplicate"] = stage_result(timing, raw_terms, "terms", merged=len(glossary))
+
+    definitions = {entry.term: entry.definition for entry in glossary}
+    usage = language_model.usage()
+    _, timing = measure(
+        lambda: OntologyGenerator(definitions).generate_ontology_from_glossary(), repeat
+    )
+    lm_usage = _language_model_usage(language_model, usage)
+    stages["ontology"] = stage_result(timing, len(definitions), "terms", lm=lm_usage)
+
+    try:
+        documents, timing = measure(_kg_chunking(research_doc), repeat)
+        stages["kg_chunking"] = stage_result(
+            timing, characters, "characters", chunks=len(documents)
+        )
+    except ImportError as error:
+        stages["kg_chunking"] = {"skipped": f"knowledge graph pipeline unavailable: {error}"}
+
+    kg_documents = [
+        SimpleNamespace(page_content=segment.text)
+        for segment in segment_document(research_doc, KG_CHUNK_SIZE)
+    ]
+
+    def build_graph() -> Dict[str, int]:
+        graph = InMemoryGraph(latency=graph_latency)
+        transformer = OfflineGraphTransformer(latency=language_model.latency)
+        return build_knowledge_graph(kg_documents, transformer, graph, max(workers, 1))
+
+    graph_stats, timing = measure(build_graph, repeat)
+    stages["kg_build"] = stage_result(timing, len(kg_documents), "chunks", **graph_stats)
+
+    with tempfile.TemporaryDirectory() as directory:
+        shutil.copy(path, os.path.join(directory, "paper.pdf"))
+        usage = language_model.usage()
+        glossary_table, timing = measure(
+            lambda: generate_glossary(
+                directory,
+                log_to_wandb_flag=False,
+                max_workers=workers,
+                use_cache=False,
+                parse_workers=1,
+            ),
+            repeat,
+        )
+        lm_usage = _language_model_usage(language_model, usage)
+    end_to_end = stage_result(timing, pages, "pages", terms=len(glossary_table), lm=lm_usage)
+
+    return {
+        "document": path,
+        "pages": pages,
+        "characters": characters,
+        "stages": stages,
+        "end_to_end": end_to_end,
+    }
+
+
+def benchmark_latex(path: str, repeat: int = 1) -> Dict[str, Any]:
+    """
+    Measure the text extraction of a LaTeX document.
+
+    Args:
+        path (str): The .tex file.
+        repeat (int): The number of runs.
+
+    Returns
+    -------
+        dict: The document, its size and the result of the extraction stage.
+    """
+    from glossagen.pipelines.latex_glossary import extract_text_from_latex
+
+    size = os.path.getsize(path)
+    text, timing = measure(lambda: extract_text_from_latex(path), repeat)
+    return {
+        "document": path,
+        "bytes": size,
+        "stages": {"extract_text": stage_result(timing, size, "bytes", characters=len(text))},
+    }
+
+
+def run_benchmarks(  # noqa: PLR0913
+    pdfs: Sequence[str] = DEFAULT_PDFS,
+    latex_files: Sequence[str] = DEFAULT_LATEX,
+    synthetic_pages: Sequence[int] = DEFAULT_SYNTHETIC_PAGES,
+    latency: float = 0.0,
+    workers: int = 1,
+    repeat: int = 1,
+    graph_latency: float = 0.0,
+    output: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Run the benchmarks without network access, with an OfflineLM in place of OpenAI.
+
+    Missing bundled documents are skipped, so the benchmarks run from any directory; synthetic
+    documents are generated in a temporary directory.
+
+    Args:
+        pdfs (Sequence[str]): The PDFs to benchmark.
+        latex_files (Sequence[str]): The LaTeX documents to benchmark.
+        synthetic_pages (Sequence[int]): The sizes of the synthetic PDFs (and of the synthetic
+            LaTeX documents, in sections) to generate and benchmark.
+        latency (float): The time in seconds every language model request takes.
+        workers (int): The maximum number of concurrent language model requests.
+        repeat (int): The number of runs of every stage.
+        graph_latency (float): The time in seconds every write to the fake graph takes.
+        output (str): The JSON file to write the results to.
+
+    Returns
+    -------
+        dict: The environment, configuration and results.
+    """
+    from glossagen.utils import OfflineLM, init_dspy, set_language_model
+
+    language_model = OfflineLM(latency=latency)
+    previous = set_language_model(language_model)
+    init_dspy()
+    documents: List[Dict[str, Any]] = []
+    start = time.perf_counter()
+    try:
+        with tempfile.TemporaryDirectory() as directory, contextlib.redirect_stdout(io.StringIO()):
+            synthetic_pdfs = [
+                make_synthetic_pdf(os.path.join(directory, f"synthetic-{pages}.pdf"), pages)
+                for pages in synthetic_pages
+            ]
+            synthetic_latex = [
+                make_synthetic_latex(os.path.join(directory, f"synthetic-{pages}.tex"), pages)
+                for pages in synthetic_pages
+            ]
+            for path in [*pdfs, *synthetic_pdfs]:
+                if os.path.exists(path):
+                    documents.append(
+                        benchmark_pdf(
+                            path, language_model, workers, repeat, DEFAULT_CHUNK_SIZE, graph_latency
+                        )
+                    )
+            for path in [*latex_files, *synthetic_latex]:
+                if os.path.exists(path):
+                    documents.append(benchmark_latex(path, repeat))
+    finally:
+        set_language_model(previous)
+
+    results = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "environment": {
+            "glossagen": __version__,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "config": {
+            "latency": latency,
+            "workers": workers,
+            "repeat": repeat,
+            "graph_latency": graph_latency,
+            "chunk_size": DEFAULT_CHUNK_SIZE,
+        },
+        "seconds": time.perf_counter() - start,
+        "documents": documents,
+    }
+    if output:
+        with open(output, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+    return results
+
+
+def format_results(results: Dict[str, Any]) -> str:
+    """Format the stage results as a table, one line per document and stage."""
+    lines = [f"{'document':<32} {'stage':<12} {'seconds':>9} {'throughput':>20}"]
+    for document in results["documents"]:
+        name = os.path.basename(document["document"])
+        stages = dict(document["stages"])
+        if "end_to_end" in document:
+            stages["end_to_end"] = document["end_to_end"]
+        for stage, result in stages.items():
+            if "skipped" in result:
+                lines.append(f"{name:<32} {stage:<12} {'skipped':>9}")
+                continue
+            throughput = result["throughput"]
+            rate = f"{throughput:.1f} {result['unit']}/s" if throughput is not None else "-"
+            lines.append(f"{name:<32} {stage:<12} {result['seconds']:>9.4f} {rate:>20}")
+    return "\n".join(lines)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    """Run the offline benchmarks from the command line."""
+    parser = argparse.ArgumentParser(
+        description="Measure the throughput of the pipelines with a local stand-in LM."
+    )
+    parser.add_argument("--pdf", nargs="*", default=DEFAULT_PDFS, help="PDFs to benchmark.")
+    parser.add_argument(
+        "--latex", nargs="*", default=DEFAULT_LATEX, help="LaTeX documents to benchmark."
+    )
+    parser.add_argument(
+        "--synthetic-pages",
+        type=int,
+        nargs="*",
+        default=DEFAULT_SYNTHETIC_PAGES,
+        help="Sizes of the generated synthetic documents, in pages.",
+    )
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.0,
+        help="The time in seconds every language model request takes.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="The maximum number of concurrent requests to the language model.",
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="The number of runs per stage.")
+    parser.add_argument(
+        "--graph-latency",
+        type=float,
+        default=0.0,
+        help="The time in seconds every write to the fake graph database takes.",
+    )
+    parser.add_argument(
+        "--output",
+        type=str,
+        default="benchmark_results.json",
+        help="The JSON file to write the results to.",
+    )
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(
+        args.pdf,
+        args.latex,
+        args.synthetic_pages,
+        latency=args.latency,
+        workers=args.workers,
+        repeat=args.repeat,
+        graph_latency=args.graph_latency,
+        output=args.output,
+    )
+    print(format_results(results))
+    print(f"Results written to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,7 @@
 """CLI for GlossaGen."""
 
 import argparse
-
-from glossagen.pipelines import generate_glossary
+import os
 
 
 def hello_world(custom_msg: str) -> str:
@@ -10,8 +9,8 @@ def hello_world(custom_msg: str) -> str:
     return f"Hello {custom_msg}"
 
 
-def main() -> None:
-    """CLI for GlossaGen."""
+def make_parser() -> argparse.ArgumentParser:
+    """Create the argument parser of the CLI."""
     parser = argparse.ArgumentParser(description="Generate a glossary out of a research paper.")
     parser.add_argument(
         "document_directory",
@@ -20,10 +19,327 @@ def main() -> None:
         default="./data",
         help="The directory where the research document is stored.",
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="The maximum number of concurrent requests to the language model.",
+    )
+    parser.add_argument(
+        "--rpm",
+        type=float,
+        default=os.getenv("GLOSSAGEN_RPM"),
+        help="Limit the requests per minute to the language model (default: $GLOSSAGEN_RPM).",
+    )
+    parser.add_argument(
+        "--tpm",
+        type=float,
+        default=os.getenv("GLOSSAGEN_TPM"),
+        help="Limit the tokens per minute of the language model (default: $GLOSSAGEN_TPM).",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=str,
+        default=None,
+        help="The directory of the extraction cache (default: ~/.cache/glossagen).",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Bypass the extraction cache and send every chunk to the language model.",
+    )
+    parser.add_argument(
+        "--clear-cache",
+        action="store_true",
+        help="Remove all entries from the extraction cache before running.",
+    )
+    parser.add_argument(
+        "--store",
+        type=str,
+        default=None,
+        help="Add the generated glossaries to this term store (a SQLite file).",
+    )
+    parser.add_argument(
+        "--skip-known",
+        action="store_true",
+        help=(
+            "Take the terms already in the term store (--store) from there instead of asking "
+            "the language model to define them again."
+        ),
+    )
+    parser.add_argument(
+        "--top-k",
+        type=int,
+        default=None,
+        help="Keep only the most important glossary entries (default: keep all, unranked).",
+    )
+    parser.add_argument(
+        "--min-score",
+        type=float,
+        default=None,
+        help="Keep only glossary entries with at least this importance score (0 to 3).",
+    )
+    parser.add_argument(
+        "--rerank",
+        action="store_true",
+        help="Let the language model filter the ranked glossary in one more request.",
+    )
+    parser.add_argument(
+        "--log-sink",
+        choices=["none", "jsonl", "wandb"],
+        default=None,
+        help=(
+            "Where to log the glossaries: nowhere, a local JSONL file or an offline wandb run "
+            "(default: wandb for a single document, none in corpus mode)."
+        ),
+    )
+    parser.add_argument(
+        "--log-path",
+        type=str,
+        default=None,
+        help="The file of the jsonl log sink (default: glossagen_metrics.jsonl).",
+    )
+    parser.add_argument(
+        "--trace-sink",
+        choices=["none", "json", "otlp"],
+        default="none",
+        help=(
+            "Where to export the per-stage trace (timings, tokens, cost): nowhere, a local JSON "
+            "lines file or OpenTelemetry OTLP/JSON. A summary table is printed in any case."
+        ),
+    )
+    parser.add_argument(
+        "--trace-path",
+        type=str,
+        default=None,
+        help=(
+            "The trace file (default: glossagen_trace.jsonl), or for otlp also the URL of a "
+            "collector, e.g. http://localhost:4318."
+        ),
+    )
+    parser.add_argument(
+        "--prefilter",
+        action="store_true",
+        help=(
+            "Skip chunks with few candidate terms (abbreviations, capitalized phrases, rare "
+            "words) and pass the candidates of the other chunks to the language model."
+        ),
+    )
+    parser.add_argument(
+        "--stream",
+        type=str,
+        default=None,
+        metavar="PATH",
+        help=(
+            "Write the glossary entries to PATH (.jsonl, .csv or .parquet) as soon as their "
+            "chunk is done, deduplicated but not ranked."
+        ),
+    )
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help=(
+            "Run a local glossary service instead: documents posted to /jobs are queued and "
+            "their entries streamed from /jobs/<id>/entries, with the model, cache and store "
+            "kept warm between jobs."
+        ),
+    )
+    parser.add_argument(
+        "--host",
+        type=str,
+        default="127.0.0.1",
+        help="Service mode: the interface to listen on (default: local clients only).",
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=8765,
+        help="Service mode: the port to listen on.",
+    )
+    parser.add_argument(
+        "--document-root",
+        type=str,
+        default=None,
+        help=(
+            "Service mode: also accept jobs for local documents below this directory by path "
+            "(default: uploads only)."
+        ),
+    )
+    parser.add_argument(
+        "--job-workers",
+        type=int,
+        default=2,
+        help="Service mode: the number of documents processed at the same time.",
+    )
+    parser.add_argument(
+        "--max-queue",
+        type=int,
+        default=16,
+        help="Service mode: the maximum number of jobs waiting; more are rejected.",
+    )
+    parser.add_argument(
+        "--corpus",
+        action="store_true",
+        help="Treat the directory as a corpus: process every PDF and .tex file below it.",
+    )
+    parser.add_argument(
+        "--output-dir",
+        type=str,
+        default="./glossaries",
+        help="Corpus mode: where to write one glossary per document and the combined index.",
+    )
+    parser.add_argument(
+        "--parse-workers",
+        type=int,
+        default=None,
+        help=(
+            "The number of processes parsing documents, or the pages of a large PDF outside "
+            "corpus mode (default: number of CPUs)."
+        ),
+    )
+    parser.add_argument(
+        "--no-resume",
+        action="store_true",
+        help="Corpus mode: ignore the manifest of an earlier run and process every document.",
+    )
+    return parser
+
+
+def logs_or_traces(args: argparse.Namespace) -> bool:
+    """Return whether logging or tracing options were given."""
+    return (
+        args.log_sink is not None
+        or args.log_path is not None
+        or args.trace_sink != "none"
+        or args.trace_path is not None
+    )
+
+
+def check_arguments(parser: argparse.ArgumentParser, args: argparse.Namespace) -> None:
+    """Exit with an error for combinations of options that are not supported."""
+    if args.skip_known and args.store is None:
+        parser.error("--skip-known requires --store")
+    if args.serve and (
+        args.corpus
+        or args.stream is not None
+        or args.top_k is not None
+        or args.min_score is not None
+        or args.rerank
+    ):
+        parser.error(
+            "--serve cannot be combined with --corpus, --stream, --top-k, --min-score or --rerank"
+        )
+    if args.serve and logs_or_traces(args):
+        parser.error(
+            "--serve cannot be combined with --log-sink, --log-path, --trace-sink or --trace-path"
+        )
+    if args.stream is not None:
+        if args.corpus or args.top_k is not None or args.min_score is not None or args.rerank:
+            parser.error(
+                "--stream cannot be combined with --corpus, --top-k, --min-score or --rerank"
+            )
+        if not args.stream.lower().endswith((".jsonl", ".csv", ".parquet")):
+            parser.error("--stream must be a .jsonl, .csv or .parquet file")
+        if logs_or_traces(args):
+            parser.error(
+                "--stream cannot be combined with --log-sink, --log-path, --trace-sink or "
+                "--trace-path"
+            )
+
 
+def main() -> None:
+    """CLI for GlossaGen."""
+    parser = make_parser()
     args = parser.parse_args()
+    check_arguments(parser, args)
+
+    # Imported here, so that --help and argument errors don't load the pipelines
+    from glossagen.pipelines import generate_corpus_glossaries, generate_glossary
+    from glossagen.utils import ExtractionCache, configure_gateway
+
+    configure_gateway(args.rpm, args.tpm)
+    if args.clear_cache:
+        cache = ExtractionCache(args.cache_dir)
+        cache.clear()
+        cache.close()
+
+    if args.serve:
+        from glossagen.service import serve
 
-    generate_glossary(args.document_directory)
+        serve(
+            args.host,
+            args.port,
+            job_workers=args.job_workers,
+            max_workers=args.workers,
+            max_queue=args.max_queue,
+            use_cache=not args.no_cache,
+            cache_dir=args.cache_dir,
+            store_path=args.store,
+            prefilter=args.prefilter,
+            skip_known=args.skip_known,
+            document_root=args.document_root,
+        )
+        return
+
+    if args.stream is not None:
+        from glossagen.pipelines import iter_glossary
+        from glossagen.utils import make_glossary_writer
+
+        with make_glossary_writer(args.stream) as writer:
+            for entry in iter_glossary(
+                args.document_directory,
+                max_workers=args.workers,
+                use_cache=not args.no_cache,
+                cache_dir=args.cache_dir,
+                parse_workers=args.parse_workers,
+                store_path=args.store,
+                prefilter=args.prefilter,
+                skip_known=args.skip_known,
+            ):
+                writer.write(entry)
+                print(f"{writer.written}. {entry.term}")
+        print(f"Wrote {writer.written} glossary entries to {args.stream}")
+        return
+
+    if args.corpus:
+        generate_corpus_glossaries(
+            args.document_directory,
+            args.output_dir,
+            parse_workers=args.parse_workers,
+            lm_workers=args.workers,
+            use_cache=not args.no_cache,
+            cache_dir=args.cache_dir,
+            resume=not args.no_resume,
+            store_path=args.store,
+            log_sink=args.log_sink or "none",
+            log_path=args.log_path,
+            trace_sink=args.trace_sink,
+            trace_path=args.trace_path,
+            skip_known=args.skip_known,
+            prefilter=args.prefilter,
+            top_k=args.top_k,
+            min_score=args.min_score,
+            rerank=args.rerank,
+        )
+        return
+
+    generate_glossary(
+        args.document_directory,
+        max_workers=args.workers,
+        use_cache=not args.no_cache,
+        cache_dir=args.cache_dir,
+        parse_workers=args.parse_workers,
+        store_path=args.store,
+        log_sink=args.log_sink,
+        log_path=args.log_path,
+        trace_sink=args.trace_sink,
+        trace_path=args.trace_path,
+        prefilter=args.prefilter,
+        skip_known=args.skip_known,
+        top_k=args.top_k,
+        min_score=args.min_score,
+        rerank=args.rerank,
+    )
 
 
 if __name__ == "__main__":
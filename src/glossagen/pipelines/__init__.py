@@ -1 +1,45 @@
-from .generate_glossary import generate_glossary
+"""Glossary pipelines, imported lazily on first attribute access (PEP 562)."""
+
+import importlib
+import sys
+import types
+from typing import TYPE_CHECKING, Any, Dict, List
+
+if TYPE_CHECKING:
+    from .corpus import generate_corpus_glossaries
+    from .generate_glossary import aiter_glossary, generate_glossary, iter_glossary
+
+_MODULES: Dict[str, str] = {
+    "aiter_glossary": "generate_glossary",
+    "generate_corpus_glossaries": "corpus",
+    "generate_glossary": "generate_glossary",
+    "iter_glossary": "generate_glossary",
+}
+
+__all__ = ["aiter_glossary", "generate_corpus_glossaries", "generate_glossary", "iter_glossary"]
+
+
+def __getattr__(name: str) -> Any:
+    if name not in _MODULES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{_MODULES[name]}", __name__), name)
+    globals()[name] = value  # later lookups bypass __getattr__
+    return value
+
+
+def __dir__() -> List[str]:
+    return sorted(set(globals()) | set(__all__))
+
+
+class _PipelinesModule(types.ModuleType):
+    """The package module, keeping functions that share their name with their submodule."""
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        # Importing the submodule generate_glossary sets it as an attribute of the package,
+        # which would shadow the generate_glossary function
+        if isinstance(value, types.ModuleType) and _MODULES.get(name) == name:
+            value = getattr(value, name)
+        super().__setattr__(name, value)
+
+
+sys.modules[__name__].__class__ = _PipelinesModule
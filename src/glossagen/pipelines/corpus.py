@@ -0,0 +1,538 @@
+"""Generate glossaries for a whole corpus of research documents."""
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import pandas as pd
+
+from glossagen.pipelines.generate_glossary import (
+    GlossaryEntry,
+    GlossaryGenerator,
+    TerminusTechnicus,
+    Text2GlossarySignature,
+    glossary_to_dataframe,
+)
+from glossagen.pipelines.parsing import discover_documents, parse_document
+from glossagen.utils import (
+    CandidatePrefilter,
+    ExtractionCache,
+    JobManifest,
+    KnownTerms,
+    MetricsLogger,
+    ResearchDoc,
+    TermRanker,
+    TermStore,
+    TokenBudget,
+    bind_language_model,
+    config_hash,
+    current_lm_config,
+    file_hash,
+    init_dspy,
+    make_logger,
+    make_tracer,
+    set_tracer,
+    trace,
+)
+from glossagen.utils.cache_utils import signature_fingerprint
+from glossagen.utils.manifest_utils import PaperState
+
+
+class PaperJob:
+    """Collect the chunk results of one paper and write its glossary once all are done."""
+
+    def __init__(
+        self,
+        generator: GlossaryGenerator,
+        chunks: List[str],
+        output_path: str,
+        completed: Optional[Dict[int, List[TerminusTechnicus]]] = None,
+    ):
+        """
+        Initialize a PaperJob object.
+
+        The chunks are planned with the generator, see GlossaryGenerator.plan_requests: the
+        chunks it skips are done right away, with the entries of their known terms.
+
+        Args:
+            generator (GlossaryGenerator): The generator of the paper; its research document
+                is the paper.
+            chunks (list[str]): The chunks of the document.
+            output_path (str): Where to write the glossary of the document.
+            completed (dict[int, list[TerminusTechnicus]]): Results of chunks completed in an
+                earlier run, by chunk index.
+        """
+        completed = completed or {}
+        self.generator = generator
+        self.path = generator.research_doc.doc_src
+        self.chunks = chunks
+        self.output_path = output_path
+        self.candidates = generator.plan_requests(chunks)
+        self.results: List[Optional[List[TerminusTechnicus]]] = [
+            completed.get(index) for index in range(len(chunks))
+        ]
+        for index in generator.skipped_chunks:
+            if self.results[index] is None:
+                self.results[index] = generator.skipped_glossary(
+                    chunks[index], self.candidates[index]
+                )
+        self.pending_chunks = [index for index, result in enumerate(self.results) if result is None]
+        self.failed_chunks: List[int] = []
+        self.remaining = len(self.pending_chunks)
+        self.lock = threading.Lock()
+
+    def chunk_done(self, index: int, result: Optional[List[TerminusTechnicus]]) -> bool:
+        """
+        Record the result of a chunk, None if its extraction failed.
+
+        Returns
+        -------
+            bool: True if this was the last outstanding chunk of the paper.
+        """
+        with self.lock:
+            self.results[index] = result or []
+            if result is None:
+                self.failed_chunks.append(index)
+            self.remaining -= 1
+            return self.remaining == 0
+
+    def glossary(self) -> List[GlossaryEntry]:
+        """Merge the chunk results in chunk order and deduplicate them."""
+        return self.generator.merge_chunk_results([result or [] for result in self.results])
+
+
+def _output_path(corpus_directory: str, output_directory: str, path: str) -> str:
+    """Mirror the location of a document below the corpus root in the output directory."""
+    relative = os.path.relpath(path, corpus_directory)
+    return os.path.join(output_directory, os.path.splitext(relative)[0] + ".glossary.csv")
+
+
+def _run_config(chunk_size: Optional[int], chunk_overlap: int, **options: Any) -> Dict[str, Any]:
+    """Collect the settings that determine the glossaries of a corpus run."""
+    return {
+        "chunk_size": chunk_size,
+        "chunk_overlap": chunk_overlap,
+        "signature": signature_fingerprint(Text2GlossarySignature),
+        **options,
+        **current_lm_config(),
+    }
+
+
+def _iter_parsed(
+    parse_pool: ProcessPoolExecutor,
+    paths: List[str],
+    max_pending: int,
+    **options: Any,
+) -> Iterator[Tuple[str, Optional[Tuple[ResearchDoc, List[str]]]]]:
+    """Parse documents in the process pool, keeping at most max_pending parses in flight."""
+    path_iter = iter(paths)
+    pending: Dict[Future[Tuple[ResearchDoc, List[str]]], str] = {}
+
+    def submit_next() -> None:
+        path = next(path_iter, None)
+        if path is not None:
+            pending[parse_pool.submit(parse_document, path, **options)] = path
+
+    for _ in range(max_pending):
+        submit_next()
+    while pending:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            path = pending.pop(future)
+            submit_next()
+            parsed: Optional[Tuple[ResearchDoc, List[str]]] = None
+            try:
+                parsed = future.result()
+            except Exception as error:  # a broken file must not stop the corpus run
+                print(f"Parsing failed for {path}: {error!r}")
+            yield path, parsed
+
+
+class CorpusRun:
+    """
+    Generate one glossary per document of a corpus and a combined index.
+
+    Documents are parsed and chunked in a process pool with parse_workers processes. Every paper
+    then gets a GlossaryGenerator with the settings of the run, which extracts, deduplicates,
+    ranks and stores its glossary like a single-document run; only its chunks are fed into one
+    language model work queue shared by all papers, served by lm_workers threads. The queue is
+    bounded, so parsing pauses while the model is the bottleneck. Each paper's glossary is
+    written as soon as its last chunk is done; the index of all glossaries is written at the
+    end.
+
+    Progress is journaled in manifest.jsonl in the output directory: every completed chunk is
+    recorded as soon as it finishes. A re-run skips papers whose glossary was written with the
+    same file content and configuration, resumes half-finished papers from their completed
+    chunks and redoes papers whose file or configuration changed.
+
+    Attributes
+    ----------
+        corpus_directory (str): The root directory of the corpus.
+        output_directory (str): The directory to write the glossaries to.
+        parse_workers (int): The number of parsing processes.
+        lm_workers (int): The maximum number of concurrent requests to the language model.
+        chunk_size (int): The maximum size of a chunk in characters, or None to pack the
+            chunks by tokens, see budget.
+        chunk_overlap (int): The maximum overlap between consecutive chunks.
+        budget (TokenBudget): The token limits of a request, or None for those of the
+            configured language model. Only used without chunk_size.
+        cache (ExtractionCache): The cache of previous extractions, or None.
+        resume (bool): Whether to reuse the progress recorded in the manifest.
+        known_terms (KnownTerms): The terms of the store, which are not requested again, or
+            None. It is reloaded whenever a paper has been added to the store.
+        prefilter (CandidatePrefilter): Finds the candidate terms of the chunks locally, or
+            None.
+        ranker (TermRanker): Ranks the glossary of every paper, or None.
+        rerank (bool): Whether the language model filters the ranked glossaries.
+    """
+
+    def __init__(  # noqa: PLR0913
+        self,
+        corpus_directory: str,
+        output_directory: str,
+        parse_workers: Optional[int] = None,
+        lm_workers: int = 4,
+        chunk_size: Optional[int] = None,
+        chunk_overlap: int = 0,
+        cache: Optional[ExtractionCache] = None,
+        resume: bool = True,
+        store: Optional[TermStore] = None,
+        logger: Optional[MetricsLogger] = None,
+        known_terms: Optional[KnownTerms] = None,
+        budget: Optional[TokenBudget] = None,
+        prefilter: Optional[CandidatePrefilter] = None,
+        ranker: Optional[TermRanker] = None,
+        rerank: bool = False,
+    ):
+        """
+        Initialize a CorpusRun object.
+
+        Args:
+            corpus_directory (str): The root directory of the corpus.
+            output_directory (str): The directory to write the glossaries to.
+            parse_workers (int): The number of parsing processes. Defaults to the number of CPUs.
+            lm_workers (int): The maximum number of concurrent requests to the language model.
+            chunk_size (int): The maximum size of a chunk in characters. By default, the
+                chunks are packed by tokens instead, see budget.
+            chunk_overlap (int): The maximum overlap between consecutive chunks.
+            cache (ExtractionCache): Cache for chunk extractions.
+            resume (bool): Whether to reuse the progress recorded in the manifest. If False,
+                every paper is processed afresh.
+            store (TermStore): Store to add the glossary of every finished paper to.
+            logger (MetricsLogger): Logger for the glossary of every finished paper; one run
+                covers the whole corpus.
+            known_terms (KnownTerms): The terms of earlier glossaries, see GlossaryGenerator.
+            budget (TokenBudget): The token limits of one request. Defaults to the limits of
+                the language model configured when the run starts.
+            prefilter (CandidatePrefilter): Local search for candidate terms, see
+                GlossaryGenerator.
+            ranker (TermRanker): Local ranking of the glossary of every paper, see
+                GlossaryGenerator.rank_glossary.
+            rerank (bool): Whether to let the language model filter every ranked glossary.
+        """
+        self.corpus_directory = corpus_directory
+        self.output_directory = output_directory
+        self.parse_workers = parse_workers or os.cpu_count() or 1
+        self.lm_workers = lm_workers
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.cache = cache
+        self.resume = resume
+        self.store = store
+        self.logger = logger
+        self.known_terms = known_terms
+        self.budget = budget
+        self.prefilter = prefilter
+        self.ranker = ranker
+        self.rerank = rerank
+        self.manifest = JobManifest(os.path.join(output_directory, "manifest.jsonl"))
+        self.run_config_hash = ""
+        self.paper_hashes: Dict[str, str] = {}
+        self.index_parts: Dict[str, pd.DataFrame] = {}
+        self._index_lock = threading.Lock()
+        # Bound the chunks waiting for the model, so parsed papers don't pile up in memory
+        self._queue_slots = threading.BoundedSemaphore(4 * lm_workers)
+
+    def _lookup(self, path: str) -> Optional[PaperState]:
+        """Return the reusable manifest state of a paper, if any."""
+        if not self.resume:
+            return None
+        return self.manifest.lookup(path, self.paper_hashes[path], self.run_config_hash)
+
+    def plan(self, paths: List[str]) -> List[str]:
+        """
+        Collect the glossaries completed in an earlier run and return the papers left to do.
+
+        Args:
+            paths (list[str]): The documents of the corpus.
+
+        Returns
+        -------
+            list[str]: The documents that have to be parsed.
+        """
+        paths_to_parse = []
+        for path in paths:
+            self.paper_hashes[path] = file_hash(path)
+            state = self._lookup(path)
+            if state is not None and state.output_path and os.path.exists(state.output_path):
+                glossary = pd.read_csv(state.output_path, keep_default_na=False)
+                self.index_parts[path] = glossary.assign(Paper=path)
+            else:
+                paths_to_parse.append(path)
+        print(f"Skipping {len(self.index_parts)} documents completed in an earlier run")
+        return paths_to_parse
+
+    def make_generator(self, research_doc: ResearchDoc) -> GlossaryGenerator:
+        """Create the glossary generator of a paper, with the settings of the run."""
+        return GlossaryGenerator(
+            research_doc,
+            chunk_size=self.chunk_size,
+            max_workers=self.lm_workers,
+            cache=self.cache,
+            chunk_overlap=self.chunk_overlap,
+            store=self.store,
+            logger=self.logger,
+            budget=self.budget,
+            prefilter=self.prefilter,
+            known_terms=self.known_terms,
+            ranker=self.ranker,
+            rerank=self.rerank,
+        )
+
+    def start_job(self, research_doc: ResearchDoc, chunks: List[str]) -> PaperJob:
+        """Create the job of a parsed paper, resuming from the manifest if possible."""
+        path = research_doc.doc_src
+        output_path = _output_path(self.corpus_directory, self.output_directory, path)
+        generator = self.make_generator(research_doc)
+        state = self._lookup(path)
+        if state is not None and state.num_chunks == len(chunks):
+            completed = {
+                index: [TerminusTechnicus(**entry) for entry in entries]
+                for index, entries in state.chunks.items()
+            }
+            print(f"Resuming {path} with {len(completed)} of {len(chunks)} chunks done")
+            return PaperJob(generator, chunks, output_path, completed)
+        self.manifest.start_paper(path, self.paper_hashes[path], self.run_config_hash, len(chunks))
+        return PaperJob(generator, chunks, output_path)
+
+    def finish_paper(self, job: PaperJob) -> None:
+        """Write the glossary of a paper whose chunks are all done."""
+        with trace("output", paper=job.path, failed_chunks=len(job.failed_chunks)):
+            entries = job.glossary()
+            ranked = job.generator.rank_glossary(entries, job.chunks)
+            glossary = glossary_to_dataframe(ranked)
+            os.makedirs(os.path.dirname(job.output_path), exist_ok=True)
+            glossary.to_csv(job.output_path, index=False)
+            if job.failed_chunks:
+                # Failed chunks are not journaled, so the next run retries them
+                print(f"{job.path}: {len(job.failed_chunks)} of {len(job.chunks)} chunks failed")
+            else:
+                self.manifest.finish_paper(job.path, job.output_path)
+            job.generator.save_glossary(ranked, stored=entries)
+            if self.known_terms is not None:
+                self.known_terms.refresh()
+        with self._index_lock:
+            self.index_parts[job.path] = glossary.assign(Paper=job.path)
+
+    def run_chunk(self, job: PaperJob, index: int) -> None:
+        """Extract one chunk of a paper, journal it and finish the paper if it was the last."""
+        try:
+            with trace("corpus.chunk", paper=job.path, chunk=index):
+                result: Optional[List[TerminusTechnicus]] = job.generator.extract_chunk(
+                    job.chunks[index], job.candidates[index]
+                )
+        except Exception as error:  # one bad chunk must not discard the others
+            print(f"Extraction failed for chunk {index} of {job.path}: {error!r}")
+            result = None
+        finally:
+            self._queue_slots.release()
+        if result is not None:
+            self.manifest.record_chunk(job.path, index, [entry.model_dump() for entry in result])
+        if job.chunk_done(index, result):
+            self.finish_paper(job)
+
+    def run(self) -> pd.DataFrame:
+        """
+        Process the corpus.
+
+        Returns
+        -------
+            pd.DataFrame: The combined index with the glossary columns and "Paper".
+        """
+        paths = discover_documents(self.corpus_directory)
+        print(f"Found {len(paths)} documents in {self.corpus_directory}")
+        if self.chunk_size is None and self.budget is None:
+            self.budget = TokenBudget.for_model(current_lm_config()["model"])
+        self.run_config_hash = config_hash(
+            _run_config(
+                self.chunk_size,
+                self.chunk_overlap,
+                chunk_tokens=self.budget.chunk_tokens if self.budget is not None else None,
+                prefilter=self.prefilter is not None,
+                top_k=self.ranker.top_k if self.ranker is not None else None,
+                min_score=self.ranker.min_score if self.ranker is not None else None,
+                rerank=self.rerank,
+            )
+        )
+        paths_to_parse = self.plan(paths)
+
+        chunk_futures: List[Future[None]] = []
+        run_chunk = bind_language_model(self.run_chunk)
+        # Spawned (not forked) parse processes, since the model threads are already running
+        parse_pool = ProcessPoolExecutor(
+            max_workers=self.parse_workers, mp_context=multiprocessing.get_context("spawn")
+        )
+        with parse_pool, ThreadPoolExecutor(max_workers=self.lm_workers) as lm_pool:
+            for _, parsed in _iter_parsed(
+                parse_pool,
+                paths_to_parse,
+                2 * self.parse_workers,
+                chunk_size=self.chunk_size,
+                chunk_overlap=self.chunk_overlap,
+                budget=self.budget,
+            ):
+                if parsed is None:
+                    continue
+                job = self.start_job(*parsed)
+                if not job.pending_chunks:
+                    self.finish_paper(job)
+                for index in job.pending_chunks:
+                    self._queue_slots.acquire()
+                    chunk_futures.append(lm_pool.submit(run_chunk, job, index))
+        for future in chunk_futures:
+            future.result()  # re-raise errors from writing the glossaries
+        self.manifest.compact()
+        self.manifest.close()
+
+        return self.write_index(paths)
+
+    def write_index(self, paths: List[str]) -> pd.DataFrame:
+        """Combine the glossaries of all papers, in corpus order, into index.csv."""
+        index_frames = [self.index_parts[path] for path in paths if path in self.index_parts]
+        index = (
+            pd.concat(index_frames, ignore_index=True)
+            if index_frames
+            else pd.DataFrame(columns=["Term", "Definition", "Aliases", "Paper"])
+        )
+        os.makedirs(self.output_directory, exist_ok=True)
+        index.to_csv(os.path.join(self.output_directory, "index.csv"), index=False)
+        print(f"Wrote {len(self.index_parts)} glossaries and index.csv to {self.output_directory}")
+        return index
+
+
+def generate_corpus_glossaries(  # noqa: PLR0913
+    corpus_directory: str,
+    output_directory: str,
+    parse_workers: Optional[int] = None,
+    lm_workers: int = 4,
+    chunk_size: Optional[int] = None,
+    chunk_overlap: int = 0,
+    use_cache: bool = True,
+    cache_dir: Optional[str] = None,
+    resume: bool = True,
+    store_path: Optional[str] = None,
+    log_sink: str = "none",
+    log_path: Optional[str] = None,
+    trace_sink: str = "none",
+    trace_path: Optional[str] = None,
+    skip_known: bool = False,
+    prefilter: bool = False,
+    top_k: Optional[int] = None,
+    min_score: Optional[float] = None,
+    rerank: bool = False,
+) -> pd.DataFrame:
+    """
+    Generate one glossary per document of a corpus and a combined index, see CorpusRun.
+
+    Args:
+        corpus_directory (str): The root directory of the corpus.
+        output_directory (str): The directory to write the glossaries to.
+        parse_workers (int): The number of parsing processes. Defaults to the number of CPUs.
+        lm_workers (int): The maximum number of concurrent requests to the language model.
+        chunk_size (int): The maximum size of a chunk in characters. By default, the chunks
+            are packed by the token budget of the language model, see TokenBudget.
+        chunk_overlap (int): The maximum overlap between consecutive chunks.
+        use_cache (bool): Whether to reuse (and store) chunk extractions from the on-disk cache.
+        cache_dir (str): The cache directory, see ExtractionCache.
+        resume (bool): Whether to reuse the progress recorded in the manifest in the output
+            directory. If False, every paper is processed afresh.
+        store_path (str): The term store to add the glossaries to, see TermStore. By default,
+            the glossaries are not stored.
+        log_sink (str): Where to log the glossaries: "none", "jsonl" or "wandb", see
+            make_logger.
+        log_path (str): The file of the "jsonl" log sink.
+        trace_sink (str): Where to export the trace of the run: "none", "json" or "otlp", see
+            make_tracer. A summary of the stages and papers is printed in any case.
+        trace_path (str): The trace file, or the collector URL of the "otlp" sink.
+        skip_known (bool): Whether to take the terms already in the term store, including
+            those of the papers finished earlier in the run, from there instead of requesting
+            them again, see KnownTerms. Requires store_path.
+        prefilter (bool): Whether to skip chunks with few candidate terms and pass the
+            candidates of the others to the language model, see CandidatePrefilter.
+        top_k (int): The number of entries to keep per glossary, by importance (see
+            TermRanker). By default, all entries are kept in order of appearance.
+        min_score (float): The importance a glossary entry needs to be kept.
+        rerank (bool): Whether to let the language model filter every ranked glossary.
+
+    Returns
+    -------
+        pd.DataFrame: The combined index with the glossary columns and "Paper".
+    """
+    init_dspy()
+    tracer = make_tracer(trace_sink, trace_path)
+    previous_tracer = set_tracer(tracer)
+    cache: Optional[ExtractionCache] = None
+    store: Optional[TermStore] = None
+    logger: Optional[MetricsLogger] = None
+    try:
+        cache = ExtractionCache(cache_dir) if use_cache else None
+        store = TermStore(store_path) if store_path else None
+        logger = make_logger(log_sink, log_path)
+        corpus_run = CorpusRun(
+            corpus_directory,
+            output_directory,
+            parse_workers=parse_workers,
+            lm_workers=lm_workers,
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            cache=cache,
+            resume=resume,
+            store=store,
+            logger=logger,
+            known_terms=KnownTerms(store) if skip_known and store is not None else None,
+            prefilter=CandidatePrefilter() if prefilter else None,
+            ranker=(
+                TermRanker(store, top_k=top_k, min_score=min_score)
+                if top_k is not None or min_score is not None or rerank
+                else None
+            ),
+            rerank=rerank,
+        )
+        index = corpus_run.run()
+        logger.log({"Papers": index["Paper"].nunique(), "Index Length": len(index)})
+        if cache is not None:
+            print(f"Extraction cache: {cache.hits} hits, {cache.misses} misses")
+        if store is not None:
+            print(
+                f"Term store {store.path}: {len(store)} entries from {len(store.papers())} papers"
+            )
+    finally:
+        if logger is not None:
+            logger.close()
+        if cache is not None:
+            cache.close()
+        if store is not None:
+            store.close()
+        set_tracer(previous_tracer)
+        summary = tracer.format_summary()
+        tracer.close()
+    print(summary)
+    return index
@@ -1,14 +1,57 @@
 """Module for generating a glossary based on a research document."""
 
-import re
-from typing import Any, Dict, Optional
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+)
 
 import dspy
 import pandas as pd
 from pydantic import BaseModel, Field
 
-import wandb
-from glossagen.utils import ResearchDoc, ResearchDocLoader, init_dspy
+from glossagen.utils import (
+    CandidatePrefilter,
+    ChunkCandidates,
+    ExtractionCache,
+    KnownTerms,
+    MetricsLogger,
+    ResearchDoc,
+    ResearchDocLoader,
+    StoredTerm,
+    StreamingDeduplicator,
+    TermRanker,
+    TermStore,
+    aiterate_in_thread,
+    bind_language_model,
+    bind_span,
+    cached_prediction,
+    chunk_document,
+    current_lm_config,
+    glossary_row,
+    init_dspy,
+    iterate_in_thread,
+    local_candidates,
+    make_logger,
+    make_tracer,
+    merge_near_duplicates,
+    set_tracer,
+    trace,
+)
+from glossagen.utils.dedup_utils import normalize_term
+from glossagen.utils.token_utils import TokenBudget
+
+MAX_KNOWN_TERMS = 50  # known terms listed per request
 
 
 class TerminusTechnicus(BaseModel):
@@ -18,6 +61,13 @@ class TerminusTechnicus(BaseModel):
     definition: str = Field(..., title="The definition of the technical term.")
 
 
+class GlossaryEntry(TerminusTechnicus):
+    """A terminus technicus of the final glossary, with the other spellings merged into it."""
+
+    aliases: List[str] = Field(default_factory=list, title="Other spellings of the term.")
+    chunk: Optional[int] = Field(None, title="The index of the chunk the entry was taken from.")
+
+
 class Text2GlossarySignature(dspy.Signature):
     """Generating a list of termini technici from a text in materials science and chemistry."""
 
@@ -28,6 +78,37 @@ class Text2GlossarySignature(dspy.Signature):
     )
 
 
+class Text2GlossaryWithCandidatesSignature(dspy.Signature):
+    """Generating a list of termini technici from a text in materials science and chemistry."""
+
+    text: str = dspy.InputField(desc="The text to extract the termini technici from.")
+    candidates: str = dspy.InputField(
+        desc="""Candidate terms found in the text by a simple local search, separated by "; ".
+        They can be incomplete or contain general terms."""
+    )
+    glossary: list[TerminusTechnicus] = dspy.OutputField(
+        desc="""The list of termini technici extracted from the text.
+        ONLY TAKE VERY INPORTANT TERMS, no general terms like Chemistry."""
+    )
+
+
+class Text2NewTermsSignature(dspy.Signature):
+    """Generating a list of new termini technici from a text in materials science and chemistry."""
+
+    text: str = dspy.InputField(desc="The text to extract the termini technici from.")
+    candidates: str = dspy.InputField(
+        desc="""Candidate terms found in the text by a simple local search, separated by "; ",
+        or "none". They can be incomplete or contain general terms."""
+    )
+    known_terms: str = dspy.InputField(
+        desc="""Terms of the text that are already in the glossary, separated by "; "."""
+    )
+    glossary: list[TerminusTechnicus] = dspy.OutputField(
+        desc="""The list of termini technici extracted from the text, WITHOUT the known terms.
+        ONLY TAKE VERY INPORTANT TERMS, no general terms like Chemistry."""
+    )
+
+
 class KeepImportantTerms(dspy.Signature):
     """Keep only the important terms from a list of termini technici."""
 
@@ -38,8 +119,6 @@ class KeepImportantTerms(dspy.Signature):
         desc="""The list of important terms extracted from the termini technici.
         NEEDS to be abbreviations or very important terms."""
     )
-    # TODO: better reranking
-    # TODO: abbreviations?
 
 
 class GlossaryGenerator:
@@ -50,19 +129,83 @@ class GlossaryGenerator:
     ----------
         research_doc (ResearchDoc): The research document to generate the glossary from.
         glossary_predictor (dspy.Predict): The predictor used to generate the glossary.
-        chunk_size (int): The size of the chunks to split the research document into.
+        chunk_size (int): The size of the chunks in characters, or None to pack the chunks by
+            tokens, see budget.
+        budget (TokenBudget): The token limits of a request, or None for those of the configured
+            language model. Only used without chunk_size.
+        chunk_overlap (int): The maximum number of characters a chunk repeats from the previous one.
+        max_workers (int): The maximum number of chunks sent to the language model concurrently.
         reranker (dspy.TypedChainOfThought): The reranker used to filter important terms.
+        ranker (TermRanker): Sorts the final glossary by importance and keeps the top entries,
+            or None to keep the glossary in order of appearance.
+        rerank (bool): Whether the reranker filters the ranked glossary in a final pass.
+        cache (ExtractionCache): The cache of previous extractions, or None to always query.
+        store (TermStore): The store the final glossary is added to, or None.
+        logger (MetricsLogger): The logger of the final glossary, or None.
+        prefilter (CandidatePrefilter): Finds the candidate terms of the chunks locally, or None
+            to send every chunk to the language model without candidates.
+        failed_chunks (list[int]): Indices of the chunks whose extraction failed in the last run.
+        known_terms (KnownTerms): The terms of earlier glossaries, which are not requested from
+            the language model again, or None.
+        skipped_chunks (list[int]): Indices of the chunks the prefilter skipped in the last run,
+            including those whose candidates were all known.
 
     Methods
     -------
-        __init__(self, research_doc: ResearchDoc, chunk_size: int = 20000):
+        __init__(self, research_doc: ResearchDoc, chunk_size: Optional[int] = None,
+                 max_workers: int = 1, cache: Optional[ExtractionCache] = None,
+                 chunk_overlap: int = 0, store: Optional[TermStore] = None,
+                 logger: Optional[MetricsLogger] = None, budget: Optional[TokenBudget] = None,
+                 prefilter: Optional[CandidatePrefilter] = None,
+                 known_terms: Optional[KnownTerms] = None,
+                 ranker: Optional[TermRanker] = None, rerank: bool = False):
             Initialize a GlossaryGenerator object.
 
+        split_into_chunks(self) -> list[str]:
+            Split the research document at structural boundaries into chunks that fit the token
+            budget, or of at most chunk_size characters.
+
+        token_budget(self) -> Optional[TokenBudget]:
+            Return the token budget of the chunks, or None if they are sized in characters.
+
+        extract_chunk(self, part_text: str, candidates: Optional[list[str]] = None)
+                -> list[TerminusTechnicus]:
+            Extract the termini technici from a single chunk.
+
+        prefilter_chunks(self, chunks: list[str]) -> list[Optional[ChunkCandidates]]:
+            Find the candidate terms of all chunks and decide which are worth a request.
+
+        plan_requests(self, chunks: list[str]) -> list[Optional[list[str]]]:
+            Decide which chunks are sent to the language model, and with which candidates.
+
+        known_candidates(self, part_text: str, candidates: Optional[list[str]] = None)
+                -> list[StoredTerm]:
+            Return the stored entries of the known terms among the candidates of a chunk.
+
+        skipped_glossary(self, part_text: str, candidates: Optional[list[str]] = None)
+                -> list[TerminusTechnicus]:
+            Return the glossary of a chunk that is not sent: the entries of its known terms.
+
+        iter_chunk_results(self, chunks: list[str])
+                -> Iterator[tuple[int, list[TerminusTechnicus]]]:
+            Extract the termini technici from all chunks and yield them as each chunk is done.
+
+        extract_chunks(self, chunks: list[str]) -> list[list[TerminusTechnicus]]:
+            Extract the termini technici from all chunks, optionally concurrently.
+
         normalize_term(self, term: str) -> str:
             Normalize a term by converting it to lowercase and removing common plural endings.
 
-        deduplicate_entries(self, glossary: list[TerminusTechnicus]) -> list[TerminusTechnicus]:
-            Deduplicate the glossary entries by considering plurals and similar-sounding terms.
+        deduplicate_entries(self, glossary: list[TerminusTechnicus],
+                            chunks: Optional[list[int]] = None) -> list[GlossaryEntry]:
+            Merge near-duplicate glossary entries and abbreviations into canonical entries.
+
+        merge_chunk_results(self, results: list[list[TerminusTechnicus]]) -> list[GlossaryEntry]:
+            Combine the extractions of all chunks and deduplicate them.
+
+        rank_glossary(self, glossary: list[GlossaryEntry], chunks: list[str])
+                -> list[GlossaryEntry]:
+            Sort the glossary by importance, keep the top entries and optionally rerank them.
 
         format_nicely(self, glossary: list[TerminusTechnicus]) -> str:
             Format the glossary nicely.
@@ -70,21 +213,87 @@ class GlossaryGenerator:
         generate_glossary_from_doc(self) -> pd.DataFrame:
             Generate the glossary based on the research document.
 
+        save_glossary(self, glossary: list[GlossaryEntry],
+                      stored: Optional[list[GlossaryEntry]] = None) -> None:
+            Log the final glossary and add it, or the whole deduplicated glossary, to the term
+            store.
+
+        stream_glossary(self, emit: Callable[[GlossaryEntry], None]) -> list[GlossaryEntry]:
+            Generate the glossary, passing every new entry to emit as soon as its chunk is done.
+
+        iter_glossary(self) -> Iterator[GlossaryEntry]:
+            Generate the glossary and yield the new entries as each chunk is done.
+
+        aiter_glossary(self) -> AsyncIterator[GlossaryEntry]:
+            The asynchronous iter_glossary.
+
     """
 
-    def __init__(self, research_doc: ResearchDoc, chunk_size: int = 20000):
+    def __init__(  # noqa: PLR0913
+        self,
+        research_doc: ResearchDoc,
+        chunk_size: Optional[int] = None,
+        max_workers: int = 1,
+        cache: Optional[ExtractionCache] = None,
+        chunk_overlap: int = 0,
+        store: Optional[TermStore] = None,
+        logger: Optional[MetricsLogger] = None,
+        budget: Optional[TokenBudget] = None,
+        prefilter: Optional[CandidatePrefilter] = None,
+        known_terms: Optional[KnownTerms] = None,
+        ranker: Optional[TermRanker] = None,
+        rerank: bool = False,
+    ):
         """
         Initialize a GlossaryGenerator object.
 
         Args:
             research_doc (ResearchDoc): The research document to generate the glossary from.
-            chunk_size (int): The size of the chunks to split the research document into.
+            chunk_size (int): The size of the chunks in characters. By default, the chunks are
+                packed by tokens instead, see budget.
+            max_workers (int): The maximum number of concurrent requests to the language model.
+                With the default of 1, the chunks are processed one after the other.
+            cache (ExtractionCache): Cache for chunk extractions. Chunks found in the cache are
+                not sent to the language model again.
+            chunk_overlap (int): The maximum number of characters a chunk repeats from the
+                previous chunk, so that terms defined across a chunk boundary are not lost.
+            store (TermStore): Store to add the final glossary to, with the document source
+                as the paper.
+            logger (MetricsLogger): Logger for the final glossary, see log_glossary.
+            budget (TokenBudget): The token limits of one request, which determine the size of
+                the chunks and the max_tokens requested for each. Defaults to the limits of the
+                language model configured when the chunks are made, see TokenBudget.for_model.
+            prefilter (CandidatePrefilter): Local search for candidate terms. Chunks it finds
+                too few candidates in are skipped, and the others are sent together with their
+                candidates. By default, every chunk is sent on its own.
+            known_terms (KnownTerms): Terms of earlier glossaries. Known terms are left out of
+                the requests and their stored entries are added to the chunk glossaries instead;
+                chunks whose candidates are all known are not sent at all.
+            ranker (TermRanker): Local ranking of the final glossary, see rank_glossary.
+            rerank (bool): Whether to let the language model filter the ranked glossary with
+                KeepImportantTerms, in one more request.
 
         """
+        if max_workers < 1:
+            raise ValueError(f"max_workers must be at least 1, got {max_workers}.")
         self.research_doc = research_doc
         self.glossary_predictor = dspy.TypedPredictor(Text2GlossarySignature)
+        self.candidate_predictor = dspy.TypedPredictor(Text2GlossaryWithCandidatesSignature)
+        self.new_terms_predictor = dspy.TypedPredictor(Text2NewTermsSignature)
         self.reranker = dspy.TypedChainOfThought(KeepImportantTerms)
         self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.budget = budget
+        self.max_workers = max_workers
+        self.cache = cache
+        self.store = store
+        self.logger = logger
+        self.prefilter = prefilter
+        self.known_terms = known_terms
+        self.ranker = ranker
+        self.rerank = rerank
+        self.failed_chunks: List[int] = []
+        self.skipped_chunks: List[int] = []
 
     def normalize_term(self, term: str) -> str:
         """Normalize a term by converting it to lowercase and removing common plural endings.
@@ -94,37 +303,95 @@ class GlossaryGenerator:
 
         Returns
         -------
-            str: The normalized term.
+            str: The normalized term, see dedup_utils.normalize_term.
         """
-        term = term.lower().strip()
-        # Remove common plural endings
-        if term.endswith("ies"):
-            term = re.sub("ies$", "y", term)
-        elif term.endswith("es"):
-            term = re.sub("es$", "e", term)
-        elif term.endswith("s"):
-            term = term[:-1]
-        return term
+        return normalize_term(term)
+
+    def deduplicate_entries(
+        self, glossary: list[TerminusTechnicus], chunks: Optional[list[int]] = None
+    ) -> list[GlossaryEntry]:
+        """Merge near-duplicate glossary entries and abbreviations into canonical entries.
 
-    def deduplicate_entries(self, glossary: list[TerminusTechnicus]) -> list[TerminusTechnicus]:
-        """Deduplicate the glossary entries by considering plurals and similar-sounding terms.
+        Plurals, spelling variants ("metal-organic framework", "metal organic frameworks") and
+        abbreviations ("MOF", "metal-organic frameworks (MOFs)") end up in one entry, see
+        merge_near_duplicates. The other spellings are kept as its aliases.
 
         Args:
             glossary (list[TerminusTechnicus]): The glossary to deduplicate.
+            chunks (list[int]): The index of the chunk of every entry, kept for the canonical
+                entries.
 
         Returns
         -------
-            list[TerminusTechnicus]: The deduplicated glossary.
+            list[GlossaryEntry]: The deduplicated glossary, in order of first appearance.
+        """
+        with trace("dedup", entries=len(glossary)) as span:
+            merged = merge_near_duplicates(
+                [entry.term for entry in glossary], [entry.definition for entry in glossary]
+            )
+            span.set(merged_entries=len(merged))
+        return [
+            GlossaryEntry(
+                term=glossary[index].term,
+                definition=glossary[index].definition,
+                aliases=aliases,
+                chunk=chunks[index] if chunks is not None else None,
+            )
+            for index, aliases in merged
+        ]
+
+    def merge_chunk_results(self, results: List[List[TerminusTechnicus]]) -> List[GlossaryEntry]:
         """
-        normalized_terms = set()
-        deduplicated_glossary = []
+        Combine the extractions of all chunks, in chunk order, and deduplicate them.
 
-        for term in glossary:
-            normalized = self.normalize_term(term.term)
-            if normalized not in normalized_terms:
-                normalized_terms.add(normalized)
-                deduplicated_glossary.append(term)
-        return deduplicated_glossary
+        Args:
+            results (list[list[TerminusTechnicus]]): The termini technici of every chunk.
+
+        Returns
+        -------
+            list[GlossaryEntry]: The deduplicated glossary, with the chunk of every entry.
+        """
+        combined = [entry for result in results for entry in result]
+        chunks = [index for index, result in enumerate(results) for _ in result]
+        return self.deduplicate_entries(combined, chunks)
+
+    def rank_glossary(
+        self, glossary: List[GlossaryEntry], chunks: List[str]
+    ) -> List[GlossaryEntry]:
+        """
+        Sort the glossary by importance, keep the top entries and optionally rerank them.
+
+        The ranker scores the entries locally, see TermRanker, with the spread of the terms over
+        the sections of the research document, or over its chunks if it has fewer than two
+        sections. With rerank, the language model then filters the short list; if that request
+        fails, the ranked glossary is kept.
+
+        Args:
+            glossary (list[GlossaryEntry]): The deduplicated glossary.
+            chunks (list[str]): The chunks of the research document.
+
+        Returns
+        -------
+            list[GlossaryEntry]: The kept entries, most important first.
+        """
+        if self.ranker is not None:
+            with trace("rank", entries=len(glossary)) as span:
+                sections = self.research_doc.section_texts()
+                texts = sections if len(sections) > 1 else chunks
+                glossary = self.ranker.rank(glossary, texts, self.research_doc.doc_src)
+                span.set(kept=len(glossary))
+        if not self.rerank or not glossary:
+            return glossary
+        with trace("rerank", entries=len(glossary)) as span:
+            try:
+                important = self.reranker(termini_technici=glossary).important_terms
+            except Exception as error:  # the ranked glossary is still usable
+                print(f"Reranking failed: {error!r}")
+                return glossary
+            keep = {entry.term.casefold() for entry in important}
+            reranked = [entry for entry in glossary if entry.term.casefold() in keep]
+            span.set(kept=len(reranked))
+        return reranked
 
     def format_nicely(self, glossary: list[TerminusTechnicus]) -> str:
         """
@@ -143,6 +410,424 @@ class GlossaryGenerator:
             formatted_glossary += f"{i+1}. {term.term}: {term.definition}\n"
         return formatted_glossary
 
+    def token_budget(self) -> Optional[TokenBudget]:
+        """
+        Return the token budget of the chunks, or None if they are sized in characters.
+
+        Without a budget given, the budget of the configured language model is created on
+        first use.
+
+        Returns
+        -------
+            TokenBudget: The budget of one request.
+        """
+        if self.chunk_size is not None:
+            return None
+        if self.budget is None:
+            try:
+                model = current_lm_config()["model"]
+            except RuntimeError:  # no language model configured yet
+                model = None
+            self.budget = TokenBudget.for_model(model)
+        return self.budget
+
+    def split_into_chunks(self) -> List[str]:
+        """
+        Split the research document into chunks that fit the token budget of a request.
+
+        The chunks end at section, paragraph or sentence boundaries, and short neighbouring
+        chunks are merged, see pack_document. With chunk_size set, the chunks are at most
+        chunk_size characters long instead, see segment_document.
+
+        Returns
+        -------
+            list[str]: The chunks, in document order.
+        """
+        budget = self.token_budget()
+        with trace(
+            "chunk",
+            characters=len(self.research_doc.paper),
+            chunk_size=self.chunk_size,
+            chunk_overlap=self.chunk_overlap,
+        ) as span:
+            if budget is not None:
+                span.set(chunk_tokens=budget.chunk_tokens, tokenizer=budget.tokenizer.name)
+            segments = chunk_document(
+                self.research_doc, self.chunk_size, self.chunk_overlap, budget
+            )
+            span.set(chunks=len(segments))
+        return [segment.text for segment in segments]
+
+    def extract_chunk(
+        self, part_text: str, candidates: Optional[List[str]] = None
+    ) -> List[TerminusTechnicus]:
+        """
+        Extract the termini technici from a single chunk.
+
+        With a token budget, the request asks for as many completion tokens as the glossary of
+        a chunk of this size is expected to need, see TokenBudget.output_tokens. With known
+        terms, the known candidates of the chunk are left out of the request (see
+        Text2NewTermsSignature and known_candidates) and their stored entries are added to the
+        result.
+
+        Args:
+            part_text (str): The chunk of the research document.
+            candidates (list[str]): Candidate terms found in the chunk, passed to the language
+                model as hints (see Text2GlossaryWithCandidatesSignature), or None.
+
+        Returns
+        -------
+            list[TerminusTechnicus]: The termini technici found in the chunk.
+        """
+        known = self.known_candidates(part_text, candidates)
+        budget = self.token_budget()
+        max_tokens = None
+        signature: Type[dspy.Signature] = Text2GlossarySignature
+        predictor = self.glossary_predictor
+        inputs = {"text": part_text}
+        if known:
+            signature = Text2NewTermsSignature
+            predictor = self.new_terms_predictor
+            inputs["candidates"] = "; ".join(self.new_candidates(candidates or [])) or "none"
+            inputs["known_terms"] = "; ".join(entry.term for entry in known[:MAX_KNOWN_TERMS])
+        elif candidates is not None:
+            signature = Text2GlossaryWithCandidatesSignature
+            predictor = self.candidate_predictor
+            inputs["candidates"] = "; ".join(candidates) or "none"
+        with trace(
+            "extract.chunk", characters=len(part_text), cached=True, known_terms=len(known)
+        ) as span:
+            if budget is not None:
+                max_tokens = budget.output_tokens(budget.count(part_text))
+                span.set(max_tokens=max_tokens)
+
+            def predict() -> List[TerminusTechnicus]:
+                span.set(cached=False)
+                if max_tokens is None:
+                    return list(predictor(**inputs).glossary)
+                return list(predictor(**inputs, config={"max_tokens": max_tokens}).glossary)
+
+            glossary = cached_prediction(
+                self.cache, signature, inputs, predict, TerminusTechnicus, max_tokens=max_tokens
+            )
+            span.set(terms=len(glossary))
+        return self.add_known_terms(glossary, known)
+
+    def new_candidates(self, candidates: List[str]) -> List[str]:
+        """Return the candidates that are not known terms."""
+        if self.known_terms is None:
+            return list(candidates)
+        return [candidate for candidate in candidates if not self.known_terms.is_known(candidate)]
+
+    def known_candidates(
+        self, part_text: str, candidates: Optional[List[str]] = None
+    ) -> List[StoredTerm]:
+        """
+        Return the stored entries of the known terms among the candidates of a chunk.
+
+        Only these terms, which the language model would otherwise be asked for, are taken
+        from the store. A stored term that merely occurs in the chunk, like a general term of
+        another paper's glossary, is not added to its glossary.
+
+        Args:
+            part_text (str): The chunk of the research document.
+            candidates (list[str]): The candidates of the prefilter. By default, the candidates
+                are found in the chunk alone, see local_candidates.
+
+        Returns
+        -------
+            list[StoredTerm]: The known entries, each once, in the order of the candidates.
+        """
+        if self.known_terms is None:
+            return []
+        found: Dict[int, StoredTerm] = {}
+        for candidate in local_candidates(part_text) if candidates is None else candidates:
+            entry = self.known_terms.lookup(candidate)
+            if entry is not None:
+                found.setdefault(id(entry), entry)
+        return list(found.values())
+
+    def add_known_terms(
+        self, glossary: List[TerminusTechnicus], known: List[StoredTerm]
+    ) -> List[TerminusTechnicus]:
+        """
+        Add the stored entries of known terms to a chunk glossary, unless it has them already.
+
+        Args:
+            glossary (list[TerminusTechnicus]): The termini technici extracted from a chunk.
+            known (list[StoredTerm]): The known candidates of the chunk, see known_candidates.
+
+        Returns
+        -------
+            list[TerminusTechnicus]: The extracted termini technici, then the known ones.
+        """
+        if self.known_terms is None or not known:
+            return glossary
+        extracted = {id(self.known_terms.lookup(entry.term)) for entry in glossary}
+        return glossary + [
+            TerminusTechnicus(term=entry.term, definition=entry.definition)
+            for entry in known
+            if id(entry) not in extracted
+        ]
+
+    def _extract_chunk_safely(
+        self, index: int, part_text: str, candidates: Optional[List[str]] = None
+    ) -> Optional[List[TerminusTechnicus]]:
+        """Extract a chunk, returning None instead of raising if the extraction fails."""
+        try:
+            return self.extract_chunk(part_text, candidates)
+        except Exception as error:  # one bad chunk must not discard the others
+            print(f"Extraction failed for chunk {index}: {error!r}")
+            return None
+
+    def _all_known(self, candidates: List[str]) -> bool:
+        """Return whether there are candidates and all of them are known terms."""
+        return (
+            bool(candidates)
+            and self.known_terms is not None
+            and not self.new_candidates(candidates)
+        )
+
+    def prefilter_chunks(self, chunks: List[str]) -> List[Optional[ChunkCandidates]]:
+        """
+        Find the candidate terms of all chunks and decide which are worth a request.
+
+        Args:
+            chunks (list[str]): The chunks of the research document.
+
+        Returns
+        -------
+            list[ChunkCandidates]: The candidates of every chunk, or only None without a
+                prefilter.
+        """
+        if self.prefilter is None:
+            return [None] * len(chunks)
+        with trace("prefilter", chunks=len(chunks)) as span:
+            analyses = self.prefilter.analyze(chunks)
+            span.set(skipped=sum(not analysis.keep for analysis in analyses))
+        return list(analyses)
+
+    def plan_requests(self, chunks: List[str]) -> List[Optional[List[str]]]:
+        """
+        Decide which chunks are sent to the language model, and with which candidates.
+
+        The chunks the prefilter skips (see prefilter_chunks) and those whose candidates are
+        all known terms are recorded in skipped_chunks; their glossary is skipped_glossary.
+
+        Args:
+            chunks (list[str]): The chunks of the research document.
+
+        Returns
+        -------
+            list[list[str]]: The candidates of every chunk, or only None without a prefilter.
+        """
+        analyses = self.prefilter_chunks(chunks)
+        self.skipped_chunks = [
+            index
+            for index, analysis in enumerate(analyses)
+            if analysis is not None and (not analysis.keep or self._all_known(analysis.candidates))
+        ]
+        return [analysis.candidates if analysis is not None else None for analysis in analyses]
+
+    def skipped_glossary(
+        self, part_text: str, candidates: Optional[List[str]] = None
+    ) -> List[TerminusTechnicus]:
+        """Return the glossary of a chunk that is not sent: the entries of its known terms."""
+        return self.add_known_terms([], self.known_candidates(part_text, candidates))
+
+    def iter_chunk_results(
+        self, chunks: List[str]
+    ) -> Iterator[Tuple[int, List[TerminusTechnicus]]]:
+        """
+        Extract the termini technici from all chunks and yield them as each chunk is done.
+
+        With max_workers > 1 the chunks are sent to the language model concurrently, with at
+        most max_workers requests in flight, and are yielded in completion order. A chunk
+        whose extraction fails contributes an empty list and its index is recorded in
+        failed_chunks. With a prefilter, the chunks it skips contribute an empty list without
+        a request, see prefilter_chunks, and their indices are recorded in skipped_chunks. So do
+        the chunks whose candidates are all known terms, which contribute the known entries.
+        If the caller stops early, the chunks not yet sent are cancelled.
+
+        Args:
+            chunks (list[str]): The chunks of the research document.
+
+        Yields
+        ------
+            tuple[int, list[TerminusTechnicus]]: The index of a chunk and its termini technici.
+        """
+        candidates = self.plan_requests(chunks)
+        requests = sorted(set(range(len(chunks))) - set(self.skipped_chunks))
+        self.failed_chunks = []
+        for index in self.skipped_chunks:
+            yield index, self.skipped_glossary(chunks[index], candidates[index])
+        if self.max_workers == 1 or len(requests) <= 1:
+            for index in requests:
+                yield (
+                    index,
+                    self._record_result(
+                        index, self._extract_chunk_safely(index, chunks[index], candidates[index])
+                    ),
+                )
+        else:
+            executor = ThreadPoolExecutor(max_workers=self.max_workers)
+            extract = bind_span(bind_language_model(self._extract_chunk_safely))
+            futures = {
+                executor.submit(extract, index, chunks[index], candidates[index]): index
+                for index in requests
+            }
+            try:
+                for future in as_completed(futures):
+                    yield futures[future], self._record_result(futures[future], future.result())
+            finally:
+                for future in futures:
+                    future.cancel()
+                executor.shutdown(wait=False)
+
+        if self.skipped_chunks:
+            print(f"Prefilter skipped {len(self.skipped_chunks)} of {len(chunks)} chunks")
+        self.failed_chunks.sort()
+        if self.failed_chunks:
+            print(f"{len(self.failed_chunks)} of {len(chunks)} chunks failed: {self.failed_chunks}")
+
+    def _record_result(
+        self, index: int, result: Optional[List[TerminusTechnicus]]
+    ) -> List[TerminusTechnicus]:
+        """Record a failed chunk extraction (None) in failed_chunks and return the result."""
+        if result is None:
+            self.failed_chunks.append(index)
+            return []
+        return result
+
+    def extract_chunks(self, chunks: List[str]) -> List[List[TerminusTechnicus]]:
+        """
+        Extract the termini technici from all chunks, see iter_chunk_results.
+
+        The results are returned in chunk order regardless of completion order, so the merged
+        glossary is the same as for a sequential run.
+
+        Args:
+            chunks (list[str]): The chunks of the research document.
+
+        Returns
+        -------
+            list[list[TerminusTechnicus]]: The termini technici per chunk, in chunk order.
+        """
+        results: List[List[TerminusTechnicus]] = [[] for _ in chunks]
+        for index, result in self.iter_chunk_results(chunks):
+            results[index] = result
+        return results
+
+    def save_glossary(
+        self, glossary: List[GlossaryEntry], stored: Optional[List[GlossaryEntry]] = None
+    ) -> None:
+        """
+        Log the final glossary and add it to the term store, if the generator has them.
+
+        Args:
+            glossary (list[GlossaryEntry]): The final glossary.
+            stored (list[GlossaryEntry]): The glossary to add to the term store instead, e.g.
+                the deduplicated glossary before ranking kept only the top entries.
+        """
+        if self.logger is not None:
+            budget = self.token_budget()
+            log_glossary(
+                self.logger,
+                glossary,
+                self.chunk_size,
+                self.research_doc.doc_src,
+                chunk_tokens=budget.chunk_tokens if budget is not None else None,
+            )
+        if self.store is not None:
+            self.store.add_glossary(
+                self.research_doc.doc_src, glossary if stored is None else stored
+            )
+
+    def stream_glossary(self, emit: Callable[[GlossaryEntry], None]) -> List[GlossaryEntry]:
+        """
+        Generate the glossary, passing every new entry to emit as soon as its chunk is done.
+
+        The entries are deduplicated as they come, see StreamingDeduplicator: an entry is only
+        emitted for a term not seen in earlier chunks, with the other spellings of its own
+        chunk as aliases. Spellings found in later chunks are added to the aliases of the
+        returned glossary, which is logged and stored like that of generate_glossary_from_doc.
+        The glossary is not ranked, since ranking needs all entries.
+
+        Args:
+            emit (Callable): Called with a copy of every new entry, in the order found.
+
+        Returns
+        -------
+            list[GlossaryEntry]: The whole glossary, in the order emitted.
+        """
+        metadata = self.research_doc.metadata_dict
+        with trace(
+            "glossary",
+            paper=self.research_doc.doc_src,
+            title=metadata.get("title"),
+            doi=metadata.get("doi"),
+            streaming=True,
+        ) as span:
+            chunks = self.split_into_chunks()
+            deduplicator = StreamingDeduplicator()
+            glossary: List[GlossaryEntry] = []
+            for index, result in self.iter_chunk_results(chunks):
+                merged, extended = deduplicator.merge(
+                    [entry.term for entry in result], [entry.definition for entry in result]
+                )
+                for group, spellings in extended.items():
+                    entry = glossary[group]
+                    entry.aliases += [
+                        spelling
+                        for spelling in spellings
+                        if spelling != entry.term.strip() and spelling not in entry.aliases
+                    ]
+                for position, aliases in merged:
+                    glossary.append(
+                        GlossaryEntry(
+                            term=result[position].term,
+                            definition=result[position].definition,
+                            aliases=aliases,
+                            chunk=index,
+                        )
+                    )
+                    emit(glossary[-1].model_copy(deep=True))
+            span.set(entries=len(glossary))
+            with trace("output", entries=len(glossary)):
+                self.save_glossary(glossary)
+        return glossary
+
+    def iter_glossary(self) -> Iterator[GlossaryEntry]:
+        """
+        Generate the glossary and yield the new entries as each chunk is done.
+
+        The glossary is generated in a background thread, see stream_glossary and
+        iterate_in_thread; stopping early cancels the chunks not yet sent.
+
+        Yields
+        ------
+            GlossaryEntry: The entries, deduplicated against the earlier ones.
+        """
+        init_dspy()
+        return iterate_in_thread(self._bound_stream_glossary())
+
+    def aiter_glossary(self) -> AsyncIterator[GlossaryEntry]:
+        """
+        Generate the glossary and yield the new entries to an event loop, see iter_glossary.
+
+        Yields
+        ------
+            GlossaryEntry: The entries, deduplicated against the earlier ones.
+        """
+        init_dspy()
+        return aiterate_in_thread(self._bound_stream_glossary())
+
+    def _bound_stream_glossary(
+        self,
+    ) -> Callable[[Callable[[GlossaryEntry], None]], List[GlossaryEntry]]:
+        """Return stream_glossary bound to the language model and span of the calling thread."""
+        return bind_span(bind_language_model(self.stream_glossary))
+
     def generate_glossary_from_doc(self) -> pd.DataFrame:
         """
         Generate the glossary based on the research document.
@@ -153,80 +838,222 @@ class GlossaryGenerator:
 
         """
         init_dspy()
-        total_text = self.research_doc.paper
-        total_length = len(total_text)
-        parts = (
-            total_length + self.chunk_size - 1
-        ) // self.chunk_size  # Compute the number of chunks needed
-
-        print("Extracting glossary from the text...")
-        print(f"Total text length: {total_length}")
-        print(f"Chunk size: {self.chunk_size}")
-        combined_glossary = []
-
-        for i in range(parts):
-            start_index = i * self.chunk_size
-            end_index = min((i + 1) * self.chunk_size, total_length)
-            part_text = total_text[start_index:end_index]
-            print(part_text[:100] + "...")  # Print the first 100 characters of each part
-            glossary_part = self.glossary_predictor(text=part_text)
-            combined_glossary.extend(glossary_part.glossary)
-
-        combined_glossary_deduplicate = self.deduplicate_entries(combined_glossary)
-        # combined_glossary_deduplicate_reranked = self.reranker(
-        #     termini_technici=combined_glossary_deduplicate
-        # ).important_terms
-        combined_glossary_deduplicate_reranked = combined_glossary_deduplicate
-
-        log_to_wandb(combined_glossary_deduplicate_reranked, self.chunk_size)
-
-        glossary_df = pd.DataFrame(
-            [
-                {"Term": term.term, "Definition": term.definition}
-                for term in combined_glossary_deduplicate_reranked
-            ]
-        )
+        metadata = self.research_doc.metadata_dict
+        with trace(
+            "glossary",
+            paper=self.research_doc.doc_src,
+            title=metadata.get("title"),
+            doi=metadata.get("doi"),
+        ):
+            chunks = self.split_into_chunks()
+            combined_glossary_deduplicate = self.merge_chunk_results(self.extract_chunks(chunks))
+            combined_glossary_deduplicate_reranked = self.rank_glossary(
+                combined_glossary_deduplicate, chunks
+            )
+
+            with trace("output", entries=len(combined_glossary_deduplicate_reranked)):
+                # The store keeps every term, also those ranked below top_k or min_score
+                self.save_glossary(
+                    combined_glossary_deduplicate_reranked, stored=combined_glossary_deduplicate
+                )
+                return glossary_to_dataframe(combined_glossary_deduplicate_reranked)
+
+
+def glossary_to_dataframe(glossary: Sequence[TerminusTechnicus]) -> pd.DataFrame:
+    """
+    Convert a list of termini technici into a glossary table.
 
-        return glossary_df
+    Args:
+        glossary (Sequence[TerminusTechnicus]): The glossary entries.
+
+    Returns
+    -------
+        pd.DataFrame: The glossary with the columns "Term", "Definition" and "Aliases" (the
+            other spellings of merged entries, separated by "; ").
+    """
+    glossary_df: pd.DataFrame = pd.DataFrame(
+        [glossary_row(term) for term in glossary], columns=["Term", "Definition", "Aliases"]
+    )
+    return glossary_df
 
 
-def log_to_wandb(
-    glossary: list[TerminusTechnicus],
-    chunk_size: int,
-    project_name: str = "GlossaGen",
-    config: Optional[Dict[Any, Any]] = None,
+def log_glossary(
+    logger: MetricsLogger,
+    glossary: Sequence[TerminusTechnicus],
+    chunk_size: Optional[int],
+    paper: str,
+    chunk_tokens: Optional[int] = None,
 ) -> None:
     """
-    Initialize wandb and log the generated glossary as a wandb.Table.
+    Log the generated glossary of a paper, as a table, and its size.
 
     Args:
-        glossary (list[TerminusTechnicus]): The list of glossary terms to log.
-        chunk_size (int): The size of the chunks the research document was split into.
-        project_name (str): The name of the wandb project.
-        config (dict): Configuration parameters for the wandb run.
+        logger (MetricsLogger): The logger; logging happens in its background thread.
+        glossary (Sequence[TerminusTechnicus]): The glossary terms to log.
+        chunk_size (int): The size of the chunks in characters, or None if packed by tokens.
+        paper (str): The source of the research document.
+        chunk_tokens (int): The token limit of the chunks, if packed by tokens.
     """
-    # Initialize wandb
-    wandb.init(project=project_name, config=config)
+    metrics = {"Paper": paper, "Glossary Length": len(glossary), "Chunk Size": chunk_size}
+    if chunk_tokens is not None:
+        metrics["Chunk Tokens"] = chunk_tokens
+    logger.log(
+        metrics,
+        tables={
+            "Generated Glossary": {
+                "columns": ["Term", "Definition"],
+                "rows": [[term.term, term.definition] for term in glossary],
+            }
+        },
+    )
 
-    # Prepare data for wandb.Table
-    table_data = [[term.term, term.definition] for term in glossary]
-    glossary_table = wandb.Table(columns=["Term", "Definition"], data=table_data)  # type: ignore
 
-    # Log the glossary table
-    wandb.log({"Generated Glossary": glossary_table})
-    wandb.log({"Glossary Length": len(glossary)})
-    wandb.log({"Chunk Size": chunk_size})
+def _stream_document_glossary(  # noqa: PLR0913
+    emit: Callable[[GlossaryEntry], None],
+    document_directory: str,
+    max_workers: int = 1,
+    use_cache: bool = True,
+    cache_dir: Optional[str] = None,
+    parse_workers: Optional[int] = None,
+    store_path: Optional[str] = None,
+    prefilter: bool = False,
+    skip_known: bool = False,
+) -> None:
+    """Load a research document and pass its glossary entries to emit, see iter_glossary."""
+    loader = ResearchDocLoader(document_directory)
+    research_doc = loader.load(workers=parse_workers or os.cpu_count() or 1)
+    cache = ExtractionCache(cache_dir) if use_cache else None
+    store = TermStore(store_path) if store_path else None
+    try:
+        GlossaryGenerator(
+            research_doc,
+            max_workers=max_workers,
+            cache=cache,
+            store=store,
+            prefilter=CandidatePrefilter() if prefilter else None,
+            known_terms=KnownTerms(store) if skip_known and store is not None else None,
+        ).stream_glossary(emit)
+    finally:
+        if cache is not None:
+            cache.close()
+        if store is not None:
+            store.close()
+
+
+def iter_glossary(  # noqa: PLR0913
+    document_directory: str,
+    max_workers: int = 1,
+    use_cache: bool = True,
+    cache_dir: Optional[str] = None,
+    parse_workers: Optional[int] = None,
+    store_path: Optional[str] = None,
+    prefilter: bool = False,
+    skip_known: bool = False,
+) -> Iterator[GlossaryEntry]:
+    """
+    Generate a glossary based on a research document and yield its entries as they are found.
 
-    # Finish the wandb run
-    wandb.finish()
+    Unlike generate_glossary, the entries come as soon as their chunk is done, deduplicated
+    against the earlier ones but not ranked, see GlossaryGenerator.stream_glossary. Write them
+    with a GlossaryWriter to consume the glossary while it grows.
+
+    Args:
+        document_directory (str): The directory where the research document is stored.
+        max_workers (int): The maximum number of concurrent requests to the language model.
+        use_cache (bool): Whether to reuse (and store) chunk extractions from the on-disk cache.
+        cache_dir (str): The cache directory, see ExtractionCache.
+        parse_workers (int): The number of processes extracting the pages of a large PDF.
+        store_path (str): The term store to add the glossary to once it is complete.
+        prefilter (bool): Whether to skip chunks with few candidate terms, see
+            CandidatePrefilter.
+        skip_known (bool): Whether to take the terms already in the term store from there,
+            see KnownTerms. Requires store_path.
+
+    Yields
+    ------
+        GlossaryEntry: The new entries, in the order found.
+    """
+    init_dspy()
+    produce = functools.partial(
+        _stream_document_glossary,
+        document_directory=document_directory,
+        max_workers=max_workers,
+        use_cache=use_cache,
+        cache_dir=cache_dir,
+        parse_workers=parse_workers,
+        store_path=store_path,
+        prefilter=prefilter,
+        skip_known=skip_known,
+    )
+    return iterate_in_thread(bind_span(bind_language_model(produce)))
 
 
-def generate_glossary(document_directory: str, log_to_wandb_flag: bool = True) -> pd.DataFrame:
+def aiter_glossary(document_directory: str, **options: Any) -> AsyncIterator[GlossaryEntry]:
+    """
+    Generate a glossary and yield its entries to an event loop as they are found.
+
+    Args:
+        document_directory (str): The directory where the research document is stored.
+        **options: The options of iter_glossary.
+
+    Yields
+    ------
+        GlossaryEntry: The new entries, in the order found.
+    """
+    init_dspy()
+    produce = functools.partial(
+        _stream_document_glossary, document_directory=document_directory, **options
+    )
+    return aiterate_in_thread(bind_span(bind_language_model(produce)))
+
+
+def generate_glossary(  # noqa: PLR0913
+    document_directory: str,
+    log_to_wandb_flag: bool = True,
+    max_workers: int = 1,
+    use_cache: bool = True,
+    cache_dir: Optional[str] = None,
+    parse_workers: Optional[int] = None,
+    store_path: Optional[str] = None,
+    log_sink: Optional[str] = None,
+    log_path: Optional[str] = None,
+    trace_sink: str = "none",
+    trace_path: Optional[str] = None,
+    prefilter: bool = False,
+    skip_known: bool = False,
+    top_k: Optional[int] = None,
+    min_score: Optional[float] = None,
+    rerank: bool = False,
+) -> pd.DataFrame:
     """
     Generate a glossary based on a research document.
 
     Args:
         document_directory (str): The directory where the research document is stored.
+        log_to_wandb_flag (bool): Whether to log the glossary to an offline wandb run, unless
+            log_sink says otherwise.
+        max_workers (int): The maximum number of concurrent requests to the language model.
+        use_cache (bool): Whether to reuse (and store) chunk extractions from the on-disk cache.
+        cache_dir (str): The cache directory, see ExtractionCache.
+        parse_workers (int): The number of processes extracting the pages of a large PDF.
+            Defaults to the number of CPUs; small PDFs are always read in a single process.
+        store_path (str): The term store to add the glossary to, see TermStore. By default,
+            the glossary is not stored.
+        log_sink (str): Where to log the glossary: "none", "jsonl" or "wandb", see
+            make_logger. Defaults to "wandb" if log_to_wandb_flag is set, "none" otherwise.
+        log_path (str): The file of the "jsonl" log sink.
+        trace_sink (str): Where to export the trace of the run: "none", "json" or "otlp", see
+            make_tracer. A summary of the stages is printed in any case.
+        trace_path (str): The trace file, or the collector URL of the "otlp" sink.
+        prefilter (bool): Whether to skip chunks with few candidate terms and pass the
+            candidates of the others to the language model, see CandidatePrefilter.
+        skip_known (bool): Whether to take the terms already in the term store from there
+            instead of requesting them again, see KnownTerms. Requires store_path.
+        top_k (int): The number of glossary entries to keep, by importance (see TermRanker).
+            By default, all entries are kept in order of appearance; with top_k, min_score or
+            rerank, they are sorted by importance. The term store gets all entries either way.
+        min_score (float): The importance a glossary entry needs to be kept.
+        rerank (bool): Whether to let the language model filter the ranked glossary.
 
     Returns
     -------
@@ -234,23 +1061,52 @@ def generate_glossary(document_directory: str, log_to_wandb_flag: bool = True) -
 
     """
     init_dspy()
-
-    loader = ResearchDocLoader(document_directory)
-    research_doc = loader.load()
-    research_doc.extract_metadata()
-
-    print("--------------------------------------------------")
-    print("Extracted Metadata:")
-    for key, value in research_doc.metadata_dict.items():
-        print(f"{key}: {value}")
-    print("--------------------------------------------------")
-    print("Paper Text:", research_doc.paper[:1000])
-
-    glossary_generator = GlossaryGenerator(research_doc)
-    glossary = glossary_generator.generate_glossary_from_doc()
+    tracer = make_tracer(trace_sink, trace_path)
+    previous_tracer = set_tracer(tracer)
+    cache: Optional[ExtractionCache] = None
+    store: Optional[TermStore] = None
+    logger: Optional[MetricsLogger] = None
+    try:
+        loader = ResearchDocLoader(document_directory)
+        research_doc = loader.load(workers=parse_workers or os.cpu_count() or 1)
+
+        cache = ExtractionCache(cache_dir) if use_cache else None
+        store = TermStore(store_path) if store_path else None
+        logger = make_logger(log_sink or ("wandb" if log_to_wandb_flag else "none"), log_path)
+        glossary_generator = GlossaryGenerator(
+            research_doc,
+            max_workers=max_workers,
+            cache=cache,
+            store=store,
+            logger=logger,
+            prefilter=CandidatePrefilter() if prefilter else None,
+            known_terms=KnownTerms(store) if skip_known and store is not None else None,
+            ranker=(
+                TermRanker(store, top_k=top_k, min_score=min_score)
+                if top_k is not None or min_score is not None or rerank
+                else None
+            ),
+            rerank=rerank,
+        )
+        glossary = glossary_generator.generate_glossary_from_doc()
+        if cache is not None:
+            print(f"Extraction cache: {cache.hits} hits, {cache.misses} misses")
+        if store is not None:
+            print(f"Term store {store.path}: {len(store)} entries")
+    finally:
+        if logger is not None:
+            logger.close()
+        if cache is not None:
+            cache.close()
+        if store is not None:
+            store.close()
+        set_tracer(previous_tracer)
+        summary = tracer.format_summary()
+        tracer.close()
 
     print("Generated Glossary:")
     print(glossary)
+    print(summary)
 
     return glossary
 
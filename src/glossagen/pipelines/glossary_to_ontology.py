@@ -1,27 +1,58 @@
 """Module to generate an ontology from a glossary."""
 
-from typing import Any, Dict, List
+import re
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 import dspy
 from pydantic import BaseModel, Field
 
 from glossagen.pipelines import generate_glossary
-from glossagen.utils import init_dspy
-
-
-def generate_ontology_from_glossary(document_directory: str) -> Any:
+from glossagen.utils import (
+    ExtractionCache,
+    bind_language_model,
+    bind_span,
+    cached_prediction,
+    init_dspy,
+    trace,
+)
+
+DEFAULT_SHARD_SIZE = 200  # glossary terms per labels/relations prompt
+DEFAULT_ONTOLOGY_WORKERS = 4
+
+
+def generate_ontology_from_glossary(
+    document_directory: str,
+    use_cache: bool = True,
+    shard_size: Optional[int] = DEFAULT_SHARD_SIZE,
+    max_workers: int = DEFAULT_ONTOLOGY_WORKERS,
+) -> Any:
     """Generate ontology from a glossary.
 
     Args:
         document_directory (str): The directory containing the research documents.
+        use_cache (bool): Whether to reuse (and store) predictions from the on-disk cache.
+        shard_size (int): The number of terms per prompt, or None for a single prompt.
+        max_workers (int): The maximum number of concurrent requests to the language model.
 
     Returns
     -------
         Any: The generated ontology.
     """
-    glossary = generate_glossary(document_directory).set_index("Term").to_dict()["Definition"]
-    ontogen = OntologyGenerator(glossary)
-    return ontogen.generate_ontology_from_glossary()
+    glossary = (
+        generate_glossary(document_directory, use_cache=use_cache)
+        .set_index("Term")
+        .to_dict()["Definition"]
+    )
+    cache = ExtractionCache() if use_cache else None
+    try:
+        ontogen = OntologyGenerator(
+            glossary, cache=cache, shard_size=shard_size, max_workers=max_workers
+        )
+        return ontogen.generate_ontology_from_glossary()
+    finally:
+        if cache is not None:
+            cache.close()
 
 
 class OntologyEntityLabels(BaseModel):
@@ -56,52 +87,165 @@ class Glossary2Relations(dspy.Signature):
     )
 
 
+def _normalize(text: str) -> str:
+    """Return the key under which labels and relations are deduplicated."""
+    return " ".join(re.sub(r"[^\w\s]", " ", text).casefold().split())
+
+
+def merge_labels(predictions: List[List[OntologyEntityLabels]]) -> Dict[str, str]:
+    """
+    Merge the labels predicted for the shards of a glossary.
+
+    Labels that differ only in case, spacing or punctuation are merged, keeping the name and
+    description of their first occurrence.
+
+    Args:
+        predictions (list[list[OntologyEntityLabels]]): The labels of every shard, in order.
+
+    Returns
+    -------
+        dict[str, str]: The description of every label.
+    """
+    labels: Dict[str, Tuple[str, str]] = {}
+    for predicted_labels in predictions:
+        for predicted in predicted_labels:
+            name, _, description = predicted.label.partition(":")
+            key = _normalize(name)
+            if key and key not in labels:
+                labels[key] = (name.strip(), description.strip())
+    return dict(labels.values())
+
+
+def merge_relations(predictions: List[List[OntologyRelation]]) -> List[str]:
+    """
+    Merge the relations predicted for the shards of a glossary.
+
+    Args:
+        predictions (list[list[OntologyRelation]]): The relations of every shard, in order.
+
+    Returns
+    -------
+        list[str]: The distinct relations (ignoring case, spacing and punctuation), in order of
+            first occurrence.
+    """
+    relations: Dict[str, str] = {}
+    for predicted_relations in predictions:
+        for predicted in predicted_relations:
+            key = _normalize(predicted.relation)
+            if key:
+                relations.setdefault(key, predicted.relation.strip())
+    return list(relations.values())
+
+
 class OntologyGenerator:
     """
     A class that generates a ontology based on a glossary.
 
     Attributes
     ----------
-        research_doc (ResearchDoc): The research document to generate the glossary from.
-        glossary_predictor (dspy.Predict): The predictor used to generate the glossary.
+        glossary_text (str): The glossary, one "term: definition" line per term.
+        shards (list[str]): The parts of the glossary text sent in one prompt each.
+        labels_predictor (dspy.TypedPredictor): The predictor of the entity labels.
+        relations_predictor (dspy.TypedPredictor): The predictor of the relations.
 
     Methods
     -------
-        generate_glossary: Generates the glossary based on the research document.
+        generate_ontology_from_glossary: Generates the ontology of the glossary.
 
     """
 
-    def __init__(self, glossary: Dict[str, str]):
+    def __init__(
+        self,
+        glossary: Dict[str, str],
+        cache: Optional[ExtractionCache] = None,
+        shard_size: Optional[int] = DEFAULT_SHARD_SIZE,
+        max_workers: int = DEFAULT_ONTOLOGY_WORKERS,
+    ):
         """
-        Initialize a GlossaryGenerator object.
+        Initialize an OntologyGenerator object.
 
         Args:
-            research_doc (ResearchDoc): The research document to generate the glossary from.
-            chunk_size (int): The size of the chunks to split the research document into.
+            glossary (dict[str, str]): The definition of every term.
+            cache (ExtractionCache): Cache for the label and relation predictions.
+            shard_size (int): The number of terms per labels and relations prompt, or None to
+                send the whole glossary in one prompt each. Larger glossaries are split into
+                shards (map) whose labels and relations are merged (reduce).
+            max_workers (int): The maximum number of concurrent requests to the language model.
 
         """
-        self.glossary_text = "\n".join(f"{key}: {value}" for key, value in glossary.items())
+        if shard_size is not None and shard_size < 1:
+            raise ValueError(f"shard_size must be at least 1, got {shard_size}.")
+        if max_workers < 1:
+            raise ValueError(f"max_workers must be at least 1, got {max_workers}.")
+        lines = [f"{key}: {value}" for key, value in glossary.items()]
+        self.glossary_text = "\n".join(lines)
+        step = shard_size or max(len(lines), 1)
+        self.shards = ["\n".join(lines[i : i + step]) for i in range(0, len(lines), step)] or [""]
+        self.max_workers = max_workers
         self.relations_predictor = dspy.TypedPredictor(Glossary2Relations)
         self.labels_predictor = dspy.TypedPredictor(Glossary2Labels)
+        self.cache = cache
+
+    def _predict_labels(self, input_text: str) -> List[OntologyEntityLabels]:
+        """Predict the entity labels, reusing a cached prediction if available."""
+        return cached_prediction(
+            self.cache,
+            Glossary2Labels,
+            {"input_text": input_text},
+            lambda: list(self.labels_predictor(input_text=input_text)["labels"]),
+            OntologyEntityLabels,
+        )
+
+    def _predict_relations(self, input_text: str) -> List[OntologyRelation]:
+        """Predict the relations, reusing a cached prediction if available."""
+        return cached_prediction(
+            self.cache,
+            Glossary2Relations,
+            {"input_text": input_text},
+            lambda: list(self.relations_predictor(input_text=input_text)["relations"]),
+            OntologyRelation,
+        )
+
+    def _predict_shard(self, kind: str, index: int, input_text: str) -> List[Any]:
+        """Predict the labels or relations of one shard, in a span of its own."""
+        with trace(f"ontology.{kind}", shard=index, characters=len(input_text)) as span:
+            if kind == "labels":
+                predicted: List[Any] = self._predict_labels(input_text)
+            else:
+                predicted = self._predict_relations(input_text)
+            span.set(**{kind: len(predicted)})
+        return predicted
 
     def generate_ontology_from_glossary(self, verbose: bool = False) -> Any:
         """
-        Generate the glossary based on the research document.
+        Generate the ontology of the glossary.
+
+        The labels and relations of all shards are predicted concurrently, with at most
+        max_workers requests in flight, and then merged and deduplicated.
 
         Returns
         -------
-            Any: The generated glossary.
+            Ontology: The generated ontology.
 
         """
         init_dspy()
-        predicted_labels = self.labels_predictor(input_text=self.glossary_text)
-        predicted_relations = self.relations_predictor(input_text=self.glossary_text)
-
-        label_dict = {
-            label.label.split(":")[0].strip(): label.label.split(":")[1].strip()
-            for label in predicted_labels["labels"]
-        }
-        relations = [relation.relation for relation in predicted_relations["relations"]]
+        tasks = [
+            (kind, index) for index in range(len(self.shards)) for kind in ("labels", "relations")
+        ]
+        predict: Callable[..., List[Any]] = bind_span(bind_language_model(self._predict_shard))
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(tasks))) as executor:
+            futures: Dict[Tuple[str, int], Future[List[Any]]] = {
+                (kind, index): executor.submit(predict, kind, index, self.shards[index])
+                for kind, index in tasks
+            }
+            predictions = {key: future.result() for key, future in futures.items()}
+
+        label_dict = merge_labels(
+            [predictions["labels", index] for index in range(len(self.shards))]
+        )
+        relations = merge_relations(
+            [predictions["relations", index] for index in range(len(self.shards))]
+        )
 
         if verbose:
             print(label_dict)
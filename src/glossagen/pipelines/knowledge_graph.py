@@ -1,25 +1,68 @@
 """Pipeline to generate a knowledge graph from research documents."""
 
+import argparse
 import datetime
-import os
-from typing import List
+import hashlib
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
-from dotenv import load_dotenv
-from langchain_community.graphs import Neo4jGraph
-from langchain_core.documents import Document
-from langchain_experimental.graph_transformers import LLMGraphTransformer
-from langchain_openai import ChatOpenAI
+from glossagen.utils import (
+    ResearchDoc,
+    ResearchDocLoader,
+    Segment,
+    bind_span,
+    get_gateway,
+    load_environment,
+    segment_document,
+    segment_text,
+    trace,
+)
+from glossagen.utils.graph_utils import (
+    DEFAULT_BATCH_SIZE,
+    GRAPH_SINKS,
+    CsvGraphSink,
+    make_graph_sink,
+    write_graph_batch,
+)
+from glossagen.utils.token_utils import estimate_tokens
 
-from glossagen.utils import ResearchDocLoader
+DEFAULT_LM_WORKERS = 4
+KG_COMPLETION_TOKENS = 1000  # reserved per document for the rate limits
+DEFAULT_DOCUMENT_DIRECTORY = "./papers/Chem. Rev. 2022, 122, 12207-12243"
 
-load_dotenv()
-os.environ["NEO4J_URI"] = os.getenv("NEO4J_URI", "")
-os.environ["NEO4J_USERNAME"] = os.getenv("NEO4J_USERNAME", "")
-os.environ["NEO4J_PASSWORD"] = os.getenv("NEO4J_PASSWORD", "")
 
+def create_documents_from_segments(segments: List[Segment]) -> List[Any]:
+    """Create documents from the segments of a text.
 
-def create_documents_from_text_chunks(text: str, max_length: int = 2000) -> List[Document]:
-    """Create documents from text by dividing it into chunks of max_length characters.
+    Args:
+        segments (List[Segment]): The segments to wrap.
+
+    Returns
+    -------
+        List[Document]: The list of documents, with the segment offsets and section as metadata.
+    """
+    from langchain_core.documents import Document
+
+    current_time = str(datetime.datetime.now())
+    documents = [
+        Document(
+            page_content=segment.text,
+            metadata={
+                "generated_at": current_time,
+                "start": segment.start,
+                "end": segment.end,
+                "section": segment.section,
+            },
+        )
+        for segment in segments
+    ]
+    return documents
+
+
+def create_documents_from_text_chunks(text: str, max_length: int = 2000) -> List[Any]:
+    """Create documents from text by dividing it into chunks of at most max_length characters.
+
+    The chunks end at paragraph or sentence boundaries, see segment_text.
 
     Args:
         text (str): The text to divide into chunks.
@@ -29,21 +72,163 @@ def create_documents_from_text_chunks(text: str, max_length: int = 2000) -> List
     -------
         List[Document]: The list of documents created from the text chunks.
     """
-    current_time = str(datetime.datetime.now())
-    documents = []
-    for start in range(0, len(text), max_length):
-        # Extract a substring from the text starting at 'start' up to 'start+max_length'
-        chunk = text[start : start + max_length]
-        documents.append(Document(page_content=chunk, metadata={"generated_at": current_time}))
-    # take doc 4-7 HACK FOR NOW
-    documents = documents[12:16]
-    # documents = documents[8:11]
-    return documents
+    return create_documents_from_segments(segment_text(text, max_length))
 
 
-def main() -> None:
-    """Orchestrate graph generation from research documents."""
-    document_directory = "./papers/Chem. Rev. 2022, 122, 12207-12243"
+def create_documents_from_research_doc(
+    research_doc: ResearchDoc, max_length: int = 2000, overlap: int = 0
+) -> List[Any]:
+    """Create documents from a research document, cut at section, paragraph and sentence ends.
+
+    Args:
+        research_doc (ResearchDoc): The research document to divide into chunks.
+        max_length (int): The maximum length of each chunk.
+        overlap (int): The maximum overlap between consecutive chunks.
+
+    Returns
+    -------
+        List[Document]: The list of documents created from the text chunks.
+    """
+    return create_documents_from_segments(segment_document(research_doc, max_length, overlap))
+
+
+def _convert_document(
+    transformer: Any, index: int, document: Any
+) -> Tuple[int, Optional[List[Any]]]:
+    """Convert one document to graph documents, returning None instead of raising on failure."""
+    try:
+        with trace("kg.extract", chunk=index, characters=len(document.page_content)) as span:
+            text = document.page_content
+            # Through the gateway, so that the graph and glossary requests share the rate limits
+            graph_documents = get_gateway().call(
+                lambda: transformer.convert_to_graph_documents([document]),
+                tokens=estimate_tokens(text) + KG_COMPLETION_TOKENS,
+                key=hashlib.sha256(f"{id(transformer)}:{text}".encode()).hexdigest(),
+            )
+            span.set(
+                nodes=sum(len(graph_document.nodes) for graph_document in graph_documents),
+                relationships=sum(
+                    len(graph_document.relationships) for graph_document in graph_documents
+                ),
+            )
+        return index, graph_documents
+    except Exception as error:  # one bad chunk must not discard the others
+        print(f"Graph extraction failed for chunk {index}: {error!r}")
+        return index, None
+
+
+def iter_graph_documents(
+    transformer: Any, documents: Iterable[Any], max_workers: int = DEFAULT_LM_WORKERS
+) -> Iterator[Tuple[int, Optional[List[Any]]]]:
+    """
+    Convert documents to graph documents with at most max_workers concurrent LM calls.
+
+    Documents are submitted as earlier ones complete, so at most 2 * max_workers are in flight
+    or waiting and the documents may come from a lazy iterator. Results are yielded in
+    completion order, as soon as they are available.
+
+    Args:
+        transformer: The graph transformer, e.g. LLMGraphTransformer or OfflineGraphTransformer.
+        documents (Iterable[Document]): The documents, with a page_content.
+        max_workers (int): The maximum number of concurrent requests to the language model.
+
+    Yields
+    ------
+        tuple[int, list[GraphDocument]]: The index of the document and its graph documents, or
+            None if the conversion failed.
+    """
+    if max_workers < 1:
+        raise ValueError(f"max_workers must be at least 1, got {max_workers}.")
+    convert = bind_span(_convert_document)
+    pending: Set[Future[Tuple[int, Optional[List[Any]]]]] = set()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for index, document in enumerate(documents):
+            if len(pending) >= 2 * max_workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+            pending.add(executor.submit(convert, transformer, index, document))
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+
+def build_knowledge_graph(
+    documents: Iterable[Any],
+    transformer: Any,
+    graph: Any,
+    max_workers: int = DEFAULT_LM_WORKERS,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> Dict[str, int]:
+    """
+    Extract the knowledge graph of all documents and write it to a graph in batches.
+
+    Graph documents are written while the extraction of later documents is still running, in
+    batches of batch_size documents with a few UNWIND/MERGE statements each (see
+    write_graph_batch). Every batch is its own transaction and writing is idempotent, so a large
+    paper never needs one giant transaction and a rerun does not duplicate the graph.
+
+    Args:
+        documents (Iterable[Document]): The documents, e.g. from
+            create_documents_from_research_doc.
+        transformer: The graph transformer, e.g. LLMGraphTransformer or OfflineGraphTransformer.
+        graph: The graph sink (see make_graph_sink), or a graph database like Neo4jGraph.
+        max_workers (int): The maximum number of concurrent requests to the language model.
+        batch_size (int): The number of graph documents per write.
+
+    Returns
+    -------
+        dict: The numbers of "documents", "failed" documents, "batches" and of the nodes and
+            relationships written ("nodes", "relationships"; counted once per batch).
+    """
+    if batch_size < 1:
+        raise ValueError(f"batch_size must be at least 1, got {batch_size}.")
+    stats = {"documents": 0, "failed": 0, "batches": 0, "nodes": 0, "relationships": 0}
+    batch: List[Any] = []
+
+    def write() -> None:
+        with trace("kg.write", documents=len(batch)) as span:
+            nodes, relationships = write_graph_batch(graph, batch)
+            span.set(nodes=nodes, relationships=relationships)
+        stats["batches"] += 1
+        stats["nodes"] += nodes
+        stats["relationships"] += relationships
+        batch.clear()
+
+    for _, graph_documents in iter_graph_documents(transformer, documents, max_workers):
+        stats["documents"] += 1
+        if graph_documents is None:
+            stats["failed"] += 1
+            continue
+        batch.extend(graph_documents)
+        if len(batch) >= batch_size:
+            write()
+    if batch:
+        write()
+    return stats
+
+
+def main(
+    document_directory: str = DEFAULT_DOCUMENT_DIRECTORY,
+    sink: str = "neo4j",
+    path: Optional[str] = None,
+) -> None:
+    """
+    Orchestrate graph generation from research documents.
+
+    Args:
+        document_directory (str): The directory of the research document.
+        sink (str): Where to write the graph: "neo4j" (the database of $NEO4J_URI, with the
+            credentials of the .env file), "sqlite" (embedded store) or "csv" (files for
+            neo4j-admin import).
+        path (str): The SQLite file or CSV directory, see make_graph_sink.
+    """
+    # Imported here, so that the pipeline functions work (and are testable) without langchain
+    from langchain_experimental.graph_transformers import LLMGraphTransformer
+    from langchain_openai import ChatOpenAI
+
+    load_environment()
     # ontology = generate_ontology_from_glossary(document_directory)
     labels = {
         "Material": "Various materials used in dentistry and medicine, such as zeolites, glass ionomer cements, acrylic resins, and mineral trioxide aggregate.",  # noqa
@@ -71,10 +256,10 @@ def main() -> None:
     allowed_nodes = list(labels.keys())
     allowed_relationships = relations
 
-    # Setting up the Neo4j graph instance
-    graph = Neo4jGraph()
-
-    llm = ChatOpenAI(temperature=0, model_name="gpt-4o")  # type: ignore
+    # The pooled client of the gateway; rate limit errors are retried by the gateway
+    llm = ChatOpenAI(  # type: ignore
+        temperature=0, model_name="gpt-4o", http_client=get_gateway().http_client(), max_retries=0
+    )
     llm_transformer = LLMGraphTransformer(
         llm=llm,
         allowed_nodes=allowed_nodes,
@@ -86,16 +271,29 @@ def main() -> None:
         document_directory
     )  # Update this part with your method to load documents
     research_doc = loader.load()
-    full_text = research_doc.paper  # Assuming `paper` is a string containing the full text
-    docs = create_documents_from_text_chunks(full_text)
-
-    graph_documents = llm_transformer.convert_to_graph_documents(docs)
-    for doc in graph_documents:
-        print(f"Nodes:{doc.nodes}")
-        print(f"Relationships:{doc.relationships}")
+    docs = create_documents_from_research_doc(research_doc)
 
-    graph.add_graph_documents(graph_documents)
+    graph = make_graph_sink(sink, path)
+    try:
+        stats = build_knowledge_graph(docs, llm_transformer, graph)
+    finally:
+        graph.close()
+    if isinstance(graph, CsvGraphSink):
+        print(
+            f"Import from {graph.directory} with: neo4j-admin database import full "
+            + " ".join(graph.arguments)
+        )
+    print(
+        f"Wrote {stats['nodes']} nodes and {stats['relationships']} relationships from "
+        f"{stats['documents'] - stats['failed']} of {stats['documents']} chunks "
+        f"in {stats['batches']} batches"
+    )
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Generate a knowledge graph out of a paper.")
+    parser.add_argument("document_directory", nargs="?", default=DEFAULT_DOCUMENT_DIRECTORY)
+    parser.add_argument("--sink", choices=GRAPH_SINKS, default="neo4j")
+    parser.add_argument("--path", default=None, help="The SQLite file or CSV directory.")
+    args = parser.parse_args()
+    main(args.document_directory, sink=args.sink, path=args.path)
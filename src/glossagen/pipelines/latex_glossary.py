@@ -3,59 +3,60 @@
 import re
 import sys
 
+import pandas as pd
+
 from glossagen.pipelines.generate_glossary import GlossaryGenerator, ResearchDoc
+from glossagen.utils.latex_utils import iter_latex_blocks
+
+LATEX_SPECIAL = re.compile(r"[\\&%$#_{}~^]")
+LATEX_ESCAPES = {"\\": r"\textbackslash{}", "~": r"\textasciitilde{}", "^": r"\^{}"}
 
 
 def extract_text_from_latex(latex_file_path: str) -> str:
-    """Extract readable text from .tex document, focusing on content between begin and end doc.
+    r"""Extract readable text from .tex document, focusing on content between begin and end doc.
+
+    Files included with \input or \include are followed, see LatexTokenizer.
 
     Args:
         latex_file_path (str): The path to the LaTeX file.
 
     Returns
     -------
-        str: The extracted text from the LaTeX file.
+        str: The extracted text from the LaTeX file, with a blank line after every paragraph.
+    """
+    return "".join(block.text for block in iter_latex_blocks(latex_file_path))
+
+
+def escape_latex(text: str) -> str:
+    """Escape the characters with a special meaning in LaTeX."""
+    return LATEX_SPECIAL.sub(
+        lambda match: LATEX_ESCAPES.get(match.group(), "\\" + match.group()), text
+    )
+
+
+def glossary_to_latex(glossary: pd.DataFrame) -> str:
+    """
+    Format a glossary as LaTeX, one "term: definition" line per entry.
+
+    Args:
+        glossary (pd.DataFrame): The glossary, with the columns Term and Definition.
+
+    Returns
+    -------
+        str: The LaTeX source.
     """
-    text = []
-    with open(latex_file_path, encoding="utf-8") as file:
-        capture = False
-        ignore_block = False
-        for line in file:
-            if "\\begin{document}" in line:
-                capture = True
-                continue
-            elif "\\end{document}" in line:
-                break
-
-            if capture:
-                if "\\begin{" in line:
-                    # Detect entering a block to ignore
-                    ignore_block = True
-                if "\\end{" in line:
-                    # Detect leaving a block to ignore
-                    ignore_block = False
-                    continue
-
-                if not ignore_block:
-                    # Remove LaTeX commands and comments only if not within an ignored block
-                    line_no_comments = re.sub(r"%.*$", "", line)  # Remove comments
-                    line_no_cmds = re.sub(
-                        r"\\[^\s]*\s*", "", line_no_comments
-                    )  # Remove LaTeX commands
-                    if line_no_cmds.strip():
-                        text.append(line_no_cmds.strip())
-
-    return " ".join(text)
+    return "\n".join(
+        f"\\textbf{{{escape_latex(term)}}}: {escape_latex(' '.join(definition.split()))}\\\\"
+        for term, definition in zip(glossary["Term"], glossary["Definition"])
+    )
 
 
 def main(latex_file_path: str) -> None:
     """Extract glossary from LaTeX document."""
-    text = extract_text_from_latex(latex_file_path)
-    research_doc = ResearchDoc.from_text(text=text, doc_src="LaTeX source")
+    research_doc = ResearchDoc.from_latex(latex_file_path, doc_src="LaTeX source")
     glossary_generator = GlossaryGenerator(research_doc)
     glossary = glossary_generator.generate_glossary_from_doc()
-    # replace every \n with \\ and print
-    print(glossary.replace("\n", "\\\\"))
+    print(glossary_to_latex(glossary))
 
 
 if __name__ == "__main__":
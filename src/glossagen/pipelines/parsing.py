@@ -0,0 +1,97 @@
+"""Loading and chunking of corpus documents, light enough to run in worker processes."""
+
+import os
+from typing import List, Optional, Tuple
+
+from glossagen.utils import ResearchDoc, TokenBudget, chunk_document
+
+DOCUMENT_EXTENSIONS = (".pdf", ".tex")
+
+
+def is_latex_root(path: str) -> bool:
+    r"""Return whether a .tex file is the root of a project, i.e. has a \documentclass."""
+    with open(path, encoding="utf-8", errors="replace") as file:
+        return any("\\documentclass" in line for line in file)
+
+
+def discover_documents(corpus_directory: str) -> List[str]:
+    r"""
+    Find all PDF and LaTeX documents in a directory tree.
+
+    LaTeX files without a \documentclass are parts of a project (e.g. the chapters of a
+    thesis), which are read with the root file that includes them, so they are left out.
+
+    Args:
+        corpus_directory (str): The root directory of the corpus.
+
+    Returns
+    -------
+        list[str]: The paths of the documents, sorted.
+
+    Raises
+    ------
+        FileNotFoundError: If the corpus directory does not exist.
+    """
+    if not os.path.isdir(corpus_directory):
+        raise FileNotFoundError(f"The specified directory {corpus_directory} does not exist.")
+    paths = []
+    for directory, _, filenames in os.walk(corpus_directory):
+        for filename in filenames:
+            path = os.path.join(directory, filename)
+            if filename.lower().endswith(".tex") and not is_latex_root(path):
+                continue
+            if filename.lower().endswith(DOCUMENT_EXTENSIONS):
+                paths.append(path)
+    return sorted(paths)
+
+
+def load_document(path: str, doc_src: Optional[str] = None) -> ResearchDoc:
+    """
+    Load a PDF or LaTeX document.
+
+    Args:
+        path (str): The path of the document.
+        doc_src (str): The source of the document. Defaults to path.
+
+    Returns
+    -------
+        ResearchDoc: The loaded document.
+    """
+    if path.lower().endswith(".tex"):
+        return ResearchDoc.from_latex(path, doc_src)
+    return ResearchDoc.from_pdf(path, doc_src)
+
+
+def parse_document(
+    path: str,
+    chunk_size: Optional[int] = None,
+    chunk_overlap: int = 0,
+    budget: Optional[TokenBudget] = None,
+) -> Tuple[ResearchDoc, List[str]]:
+    """
+    Load a document and split it into chunks.
+
+    This is the CPU-bound part of the pipeline and runs in a worker process. The chunks are
+    those of GlossaryGenerator.split_into_chunks with the same settings, see chunk_document.
+
+    Args:
+        path (str): The path of the document.
+        chunk_size (int): The maximum size of a chunk in characters. By default, the chunks
+            are packed by tokens instead.
+        chunk_overlap (int): The maximum overlap between consecutive chunks.
+        budget (TokenBudget): The token budget of one request, used without chunk_size.
+
+    Returns
+    -------
+        tuple[ResearchDoc, list[str]]: The document, without the layout blocks that are only
+            needed for the chunking, and its chunks in document order.
+    """
+    research_doc = load_document(path)
+    try:
+        segments = chunk_document(research_doc, chunk_size, chunk_overlap, budget)
+    finally:
+        if research_doc.fitz_paper is not None:
+            research_doc.fitz_paper.close()
+            research_doc.fitz_paper = None
+    research_doc.blocks = []
+    return research_doc, [segment.text for segment in segments]
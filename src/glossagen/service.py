@@ -0,0 +1,486 @@
+"""A long-running glossary service: a bounded job queue behind a local HTTP API."""
+
+import json
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+from glossagen.pipelines.generate_glossary import GlossaryEntry, GlossaryGenerator
+from glossagen.pipelines.parsing import DOCUMENT_EXTENSIONS, load_document
+from glossagen.utils import (
+    CandidatePrefilter,
+    ExtractionCache,
+    KnownTerms,
+    TermStore,
+    bind_language_model,
+    glossary_row,
+    init_dspy,
+    trace,
+)
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_JOB_WORKERS = 2
+DEFAULT_MAX_QUEUE = 16
+MAX_FINISHED_JOBS = 100  # finished jobs kept for their status and results
+MAX_UPLOAD_BYTES = 200 * 1024 * 1024
+
+
+class GlossaryJob:
+    """
+    A document queued for a glossary, with the entries found so far.
+
+    Attributes
+    ----------
+        id (str): The job id.
+        source (str): The document as named by the client, the source of the glossary.
+        path (str): The file the document is read from.
+        status (str): "queued", "running", "done" or "failed".
+        entries (list[GlossaryEntry]): The entries found so far, in the order found.
+        error (str): Why the job failed, or None.
+        created (float): When the job was submitted, as a Unix time.
+        started (float): When the job started running, or None.
+        finished (float): When the job was done or failed, or None.
+    """
+
+    def __init__(self, source: str, path: str, upload_directory: Optional[str] = None):
+        """
+        Queue a document.
+
+        Args:
+            source (str): The document as named by the client.
+            path (str): The file the document is read from.
+            upload_directory (str): A directory holding the uploaded document, removed when
+                the job is finished.
+        """
+        self.id = uuid.uuid4().hex
+        self.source = source
+        self.path = path
+        self.upload_directory = upload_directory
+        self.status = "queued"
+        self.entries: List[GlossaryEntry] = []
+        self.error: Optional[str] = None
+        self.created = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self._condition = threading.Condition()
+
+    @property
+    def done(self) -> bool:
+        """Whether the job is done or failed."""
+        return self.status in ("done", "failed")
+
+    def start(self) -> None:
+        """Mark the job as running."""
+        with self._condition:
+            self.status = "running"
+            self.started = time.time()
+
+    def add_entry(self, entry: GlossaryEntry) -> None:
+        """Add a new entry and wake up the readers of the results."""
+        with self._condition:
+            self.entries.append(entry)
+            self._condition.notify_all()
+
+    def finish(self, error: Optional[str] = None) -> None:
+        """Mark the job as done, or as failed with the given error, and remove the upload."""
+        with self._condition:
+            self.status = "failed" if error is not None else "done"
+            self.error = error
+            self.finished = time.time()
+            self._condition.notify_all()
+        if self.upload_directory is not None:
+            shutil.rmtree(self.upload_directory, ignore_errors=True)
+
+    def iter_entries(self) -> Iterator[GlossaryEntry]:
+        """
+        Yield the entries of the job, waiting for new ones until the job is finished.
+
+        Yields
+        ------
+            GlossaryEntry: The entries, in the order found.
+        """
+        position = 0
+        while True:
+            with self._condition:
+                while position == len(self.entries) and not self.done:
+                    self._condition.wait()
+                entries = self.entries[position:]
+                done = self.done
+            yield from entries
+            position += len(entries)
+            if done and position == len(self.entries):
+                return
+
+    def summary(self) -> Dict[str, Any]:
+        """Return the status of the job as a JSON object."""
+        return {
+            "id": self.id,
+            "source": self.source,
+            "status": self.status,
+            "entries": len(self.entries),
+            "error": self.error,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+        }
+
+
+class GlossaryService:
+    """
+    Generate glossaries for queued documents, keeping the language model, caches and store warm.
+
+    The service configures the language model once and shares one extraction cache, term store
+    and set of known terms between all jobs. Jobs wait in a bounded queue for one of
+    job_workers threads; each streams its glossary (see GlossaryGenerator.stream_glossary) into
+    the job as the chunks are done.
+
+    Attributes
+    ----------
+        job_workers (int): The number of documents processed at the same time.
+        max_workers (int): The maximum number of concurrent model requests per document.
+        max_queue (int): The maximum number of jobs waiting for a worker.
+        cache (ExtractionCache): The shared extraction cache, or None.
+        store (TermStore): The store every glossary is added to, or None.
+        known_terms (KnownTerms): The terms of the store, not requested again, or None.
+        prefilter (bool): Whether chunks with few candidate terms are skipped.
+        document_root (str): The directory local documents may be submitted from by path, or
+            None to accept uploads only.
+    """
+
+    def __init__(  # noqa: PLR0913
+        self,
+        job_workers: int = DEFAULT_JOB_WORKERS,
+        max_workers: int = 1,
+        max_queue: int = DEFAULT_MAX_QUEUE,
+        use_cache: bool = True,
+        cache_dir: Optional[str] = None,
+        store_path: Optional[str] = None,
+        prefilter: bool = False,
+        skip_known: bool = False,
+        document_root: Optional[str] = None,
+    ):
+        """
+        Open the cache and store; the workers are started by start.
+
+        Args:
+            job_workers (int): The number of documents processed at the same time.
+            max_workers (int): The maximum number of concurrent model requests per document.
+            max_queue (int): The maximum number of jobs waiting for a worker.
+            use_cache (bool): Whether to reuse (and store) chunk extractions.
+            cache_dir (str): The cache directory, see ExtractionCache.
+            store_path (str): The term store to add the glossaries to, see TermStore.
+            prefilter (bool): Whether to skip chunks with few candidate terms.
+            skip_known (bool): Whether to take the terms of the store from there, including
+                those of earlier jobs, see KnownTerms. Requires store_path.
+            document_root (str): The directory local documents may be submitted from by path,
+                see submit_local. By default, only uploads are accepted, since a job returns
+                the contents of its document to the client.
+        """
+        if job_workers < 1:
+            raise ValueError(f"job_workers must be at least 1, got {job_workers}.")
+        self.job_workers = job_workers
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.prefilter = prefilter
+        self.document_root = os.path.realpath(document_root) if document_root else None
+        self.cache = ExtractionCache(cache_dir) if use_cache else None
+        self.store = TermStore(store_path) if store_path else None
+        self.known_terms = KnownTerms(self.store) if skip_known and self.store is not None else None
+        self._queue: "queue.Queue[Optional[GlossaryJob]]" = queue.Queue(max_queue)
+        self._jobs: "OrderedDict[str, GlossaryJob]" = OrderedDict()
+        self._jobs_lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> None:
+        """Configure the language model and start the workers."""
+        init_dspy()
+        work = bind_language_model(self._work)
+        for number in range(self.job_workers):
+            thread = threading.Thread(target=work, name=f"glossagen-job-{number}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(
+        self, path: str, source: Optional[str] = None, upload_directory: Optional[str] = None
+    ) -> GlossaryJob:
+        """
+        Queue a PDF or LaTeX document.
+
+        Args:
+            path (str): The file of the document.
+            source (str): The name of the document in the glossary. Defaults to path.
+            upload_directory (str): A directory to remove once the job is finished.
+
+        Returns
+        -------
+            GlossaryJob: The queued job.
+
+        Raises
+        ------
+            ValueError: If the file is not a PDF or LaTeX document.
+            queue.Full: If max_queue jobs are waiting already.
+        """
+        if not path.lower().endswith(DOCUMENT_EXTENSIONS):
+            raise ValueError(f"Expected a {' or '.join(DOCUMENT_EXTENSIONS)} file, got {path}.")
+        job = GlossaryJob(source or path, path, upload_directory)
+        with self._jobs_lock:
+            self._queue.put_nowait(job)
+            self._jobs[job.id] = job
+            finished = [old.id for old in self._jobs.values() if old.done]
+            for job_id in finished[: max(len(finished) - MAX_FINISHED_JOBS, 0)]:
+                del self._jobs[job_id]
+        return job
+
+    def submit_local(self, path: str) -> GlossaryJob:
+        """
+        Queue a document below document_root by its path, see submit.
+
+        Args:
+            path (str): The path of the document, absolute or relative to document_root.
+
+        Returns
+        -------
+            GlossaryJob: The queued job.
+
+        Raises
+        ------
+            PermissionError: If there is no document_root or the document (after resolving
+                symbolic links) is not below it.
+        """
+        if self.document_root is None:
+            raise PermissionError("Local documents are not accepted, upload the document.")
+        resolved = os.path.realpath(os.path.join(self.document_root, path))
+        if os.path.commonpath([resolved, self.document_root]) != self.document_root:
+            raise PermissionError(f"{path} is not below the document root.")
+        return self.submit(resolved, path)
+
+    def submit_upload(self, data: bytes, filename: str) -> GlossaryJob:
+        """
+        Save an uploaded document and queue it, see submit.
+
+        Args:
+            data (bytes): The content of the document.
+            filename (str): The name of the uploaded file, which determines its type.
+
+        Returns
+        -------
+            GlossaryJob: The queued job; the upload is removed once it is finished.
+        """
+        filename = os.path.basename(filename)
+        if not filename.lower().endswith(DOCUMENT_EXTENSIONS):
+            raise ValueError(f"Expected a {' or '.join(DOCUMENT_EXTENSIONS)} file, got {filename}.")
+        directory = tempfile.mkdtemp(prefix="glossagen-upload-")
+        path = os.path.join(directory, filename)
+        with open(path, "wb") as file:
+            file.write(data)
+        try:
+            return self.submit(path, filename, directory)
+        except Exception:
+            shutil.rmtree(directory, ignore_errors=True)
+            raise
+
+    def job(self, job_id: str) -> Optional[GlossaryJob]:
+        """Return the job with the given id, or None."""
+        with self._jobs_lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self) -> List[GlossaryJob]:
+        """Return the known jobs, oldest first."""
+        with self._jobs_lock:
+            return list(self._jobs.values())
+
+    def status(self) -> Dict[str, Any]:
+        """Return the state of the service as a JSON object."""
+        jobs = self.jobs()
+        return {
+            "status": "ok",
+            "job_workers": self.job_workers,
+            "max_queue": self.max_queue,
+            "queued": sum(job.status == "queued" for job in jobs),
+            "running": sum(job.status == "running" for job in jobs),
+            "store_entries": len(self.store) if self.store is not None else None,
+        }
+
+    def _work(self) -> None:
+        """Run queued jobs until the service is closed."""
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            self.run_job(job)
+
+    def run_job(self, job: GlossaryJob) -> None:
+        """Generate the glossary of a job, recording an error instead of raising."""
+        job.start()
+        try:
+            with trace("service.job", job=job.id, paper=job.source):
+                research_doc = load_document(job.path, job.source)
+                GlossaryGenerator(
+                    research_doc,
+                    max_workers=self.max_workers,
+                    cache=self.cache,
+                    store=self.store,
+                    prefilter=CandidatePrefilter() if self.prefilter else None,
+                    known_terms=self.known_terms,
+                ).stream_glossary(job.add_entry)
+                if self.known_terms is not None:
+                    self.known_terms.refresh()
+        except Exception as error:  # one bad document must not stop the service
+            print(f"Job {job.id} ({job.source}) failed: {error!r}")
+            job.finish(repr(error))
+        else:
+            job.finish()
+
+    def close(self) -> None:
+        """Finish the queued jobs, stop the workers and close the cache and store."""
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        while not self._queue.empty():  # without workers, e.g. if never started
+            job = self._queue.get_nowait()
+            if job is not None:
+                job.finish("The service was stopped.")
+        if self.cache is not None:
+            self.cache.close()
+        if self.store is not None:
+            self.store.close()
+
+
+class GlossaryRequestHandler(BaseHTTPRequestHandler):
+    """
+    The HTTP API of a GlossaryService.
+
+    - POST /jobs?filename=paper.pdf with the document as the body queues an upload;
+      POST /jobs with the JSON body {"path": "..."} queues a local file below the document root
+      of the service. Answers 202 with the job, 400 for other files, 403 for local files if
+      there is no document root or they are outside of it and 503 if the queue is full.
+    - GET /jobs lists the jobs, GET /jobs/<id> returns the status of a job.
+    - GET /jobs/<id>/entries streams the entries as JSON lines while the job runs.
+    - GET /health returns the state of the service.
+    """
+
+    server: "GlossaryHTTPServer"
+
+    def do_GET(self) -> None:
+        """Answer status requests and stream results."""
+        parts = [part for part in urlparse(self.path).path.split("/") if part]
+        if parts == ["health"]:
+            self._send_json(200, self.server.service.status())
+        elif parts == ["jobs"]:
+            self._send_json(200, [job.summary() for job in self.server.service.jobs()])
+        elif parts[:1] == ["jobs"] and parts[2:] in ([], ["entries"]):
+            job = self.server.service.job(parts[1])
+            if job is None:
+                self._send_json(404, {"error": f"Unknown job {parts[1]}."})
+            elif parts[2:]:
+                self._stream_entries(job)
+            else:
+                self._send_json(200, job.summary())
+        else:
+            self._send_json(404, {"error": f"Unknown path {self.path}."})
+
+    def do_POST(self) -> None:
+        """Queue a job."""
+        url = urlparse(self.path)
+        if url.path.rstrip("/") != "/jobs":
+            self._send_json(404, {"error": f"Unknown path {self.path}."})
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_UPLOAD_BYTES:
+            self._send_json(413, {"error": f"Uploads are limited to {MAX_UPLOAD_BYTES} bytes."})
+            return
+        body = self.rfile.read(length)
+        try:
+            if self.headers.get_content_type() == "application/json":
+                job = self.server.service.submit_local(json.loads(body)["path"])
+            else:
+                filename = parse_qs(url.query).get("filename", [""])[0]
+                job = self.server.service.submit_upload(body, filename)
+        except PermissionError as error:
+            self._send_json(403, {"error": str(error)})
+            return
+        except queue.Full:
+            self._send_json(503, {"error": "The job queue is full, try again later."})
+            return
+        except (ValueError, KeyError, TypeError) as error:
+            self._send_json(400, {"error": str(error)})
+            return
+        self._send_json(202, job.summary(), {"Location": f"/jobs/{job.id}"})
+
+    def _send_json(self, code: int, body: Any, headers: Optional[Dict[str, str]] = None) -> None:
+        """Send a JSON response."""
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _stream_entries(self, job: GlossaryJob) -> None:
+        """Send the entries of a job as JSON lines as they are found, until the job ends."""
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        try:
+            for entry in job.iter_entries():
+                self.wfile.write((json.dumps(glossary_row(entry)) + "\n").encode("utf-8"))
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):  # the client went away
+            pass
+        self.close_connection = True
+
+    def log_message(self, format: str, *args: Any) -> None:  # noqa: A002
+        """Leave the console to the progress messages of the jobs."""
+
+
+class GlossaryHTTPServer(ThreadingHTTPServer):
+    """A threading HTTP server answering for a GlossaryService."""
+
+    daemon_threads = True
+
+    def __init__(self, address: Any, service: GlossaryService):
+        """
+        Bind the server.
+
+        Args:
+            address (tuple[str, int]): The host and port; port 0 picks a free port.
+            service (GlossaryService): The service answering the requests.
+        """
+        super().__init__(address, GlossaryRequestHandler)
+        self.service = service
+
+
+def serve(host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, **service_options: Any) -> None:
+    """
+    Run the glossary service until interrupted.
+
+    Args:
+        host (str): The interface to listen on; the default only accepts local clients.
+        port (int): The port to listen on.
+        **service_options: The options of GlossaryService.
+    """
+    service = GlossaryService(**service_options)
+    service.start()
+    server = GlossaryHTTPServer((host, port), service)
+    print(f"Serving glossaries on http://{host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Stopping, waiting for the running jobs")
+    finally:
+        server.server_close()
+        service.close()
@@ -1,2 +1,229 @@
-from .dspy_utils import init_dspy
-from .pdf_utils import ResearchDoc, ResearchDocLoader
+"""Utilities of the glossary pipelines, imported lazily on first attribute access (PEP 562)."""
+
+import importlib
+from typing import TYPE_CHECKING, Any, Dict, List
+
+if TYPE_CHECKING:
+    from .cache_utils import ExtractionCache, cached_prediction
+    from .candidate_utils import CandidatePrefilter, ChunkCandidates, local_candidates
+    from .dedup_utils import StreamingDeduplicator, cluster_terms, merge_near_duplicates
+    from .dspy_utils import (
+        bind_language_model,
+        current_lm_config,
+        init_dspy,
+        load_environment,
+        set_language_model,
+    )
+    from .gateway_utils import LMGateway, configure_gateway, get_gateway
+    from .graph_utils import (
+        CsvGraphSink,
+        GraphDocument,
+        GraphNode,
+        GraphRelationship,
+        GraphSink,
+        Neo4jSink,
+        SqliteGraphSink,
+        make_graph_sink,
+        write_graph_batch,
+    )
+    from .latex_utils import LatexFileCache, iter_latex_blocks, iter_latex_segments
+    from .manifest_utils import JobManifest, config_hash, file_hash
+    from .metrics_utils import MetricsLogger, make_logger
+    from .offline_utils import InMemoryGraph, OfflineGraphTransformer, OfflineLM
+    from .pdf_utils import (
+        ResearchDoc,
+        ResearchDocLoader,
+        iter_body_blocks,
+        iter_page_layouts,
+        iter_pdf_segments,
+    )
+    from .ranking_utils import TermRanker
+    from .section_utils import Section, detect_sections, detect_text_sections
+    from .segment_utils import Segment, TextBlock, segment_document, segment_text
+    from .store_utils import KnownTerms, StoredTerm, TermStore
+    from .stream_utils import (
+        CsvGlossaryWriter,
+        GlossaryWriter,
+        JsonlGlossaryWriter,
+        ParquetGlossaryWriter,
+        aiterate_in_thread,
+        glossary_row,
+        iterate_in_thread,
+        make_glossary_writer,
+    )
+    from .token_utils import (
+        CharRatioTokenizer,
+        TokenBudget,
+        Tokenizer,
+        chunk_document,
+        get_tokenizer,
+        pack_document,
+    )
+    from .tracing_utils import (
+        Span,
+        Tracer,
+        bind_span,
+        get_tracer,
+        instrument_language_model,
+        make_tracer,
+        set_tracer,
+        trace,
+    )
+
+_EXPORTS: Dict[str, List[str]] = {
+    "cache_utils": ["ExtractionCache", "cached_prediction"],
+    "candidate_utils": ["CandidatePrefilter", "ChunkCandidates", "local_candidates"],
+    "dedup_utils": ["StreamingDeduplicator", "cluster_terms", "merge_near_duplicates"],
+    "dspy_utils": [
+        "bind_language_model",
+        "current_lm_config",
+        "init_dspy",
+        "load_environment",
+        "set_language_model",
+    ],
+    "gateway_utils": ["LMGateway", "configure_gateway", "get_gateway"],
+    "graph_utils": [
+        "CsvGraphSink",
+        "GraphDocument",
+        "GraphNode",
+        "GraphRelationship",
+        "GraphSink",
+        "Neo4jSink",
+        "SqliteGraphSink",
+        "make_graph_sink",
+        "write_graph_batch",
+    ],
+    "latex_utils": ["LatexFileCache", "iter_latex_blocks", "iter_latex_segments"],
+    "manifest_utils": ["JobManifest", "config_hash", "file_hash"],
+    "metrics_utils": ["MetricsLogger", "make_logger"],
+    "offline_utils": ["InMemoryGraph", "OfflineGraphTransformer", "OfflineLM"],
+    "pdf_utils": [
+        "ResearchDoc",
+        "ResearchDocLoader",
+        "iter_body_blocks",
+        "iter_page_layouts",
+        "iter_pdf_segments",
+    ],
+    "ranking_utils": ["TermRanker"],
+    "section_utils": ["Section", "detect_sections", "detect_text_sections"],
+    "segment_utils": ["Segment", "TextBlock", "segment_document", "segment_text"],
+    "store_utils": ["KnownTerms", "StoredTerm", "TermStore"],
+    "stream_utils": [
+        "CsvGlossaryWriter",
+        "GlossaryWriter",
+        "JsonlGlossaryWriter",
+        "ParquetGlossaryWriter",
+        "aiterate_in_thread",
+        "glossary_row",
+        "iterate_in_thread",
+        "make_glossary_writer",
+    ],
+    "token_utils": [
+        "CharRatioTokenizer",
+        "TokenBudget",
+        "Tokenizer",
+        "chunk_document",
+        "get_tokenizer",
+        "pack_document",
+    ],
+    "tracing_utils": [
+        "Span",
+        "Tracer",
+        "bind_span",
+        "get_tracer",
+        "instrument_language_model",
+        "make_tracer",
+        "set_tracer",
+        "trace",
+    ],
+}
+_MODULES = {name: module for module, names in _EXPORTS.items() for name in names}
+
+__all__ = [
+    "CandidatePrefilter",
+    "CharRatioTokenizer",
+    "ChunkCandidates",
+    "CsvGlossaryWriter",
+    "CsvGraphSink",
+    "ExtractionCache",
+    "GlossaryWriter",
+    "GraphDocument",
+    "GraphNode",
+    "GraphRelationship",
+    "GraphSink",
+    "InMemoryGraph",
+    "JobManifest",
+    "JsonlGlossaryWriter",
+    "KnownTerms",
+    "LMGateway",
+    "LatexFileCache",
+    "MetricsLogger",
+    "Neo4jSink",
+    "OfflineGraphTransformer",
+    "OfflineLM",
+    "ParquetGlossaryWriter",
+    "ResearchDoc",
+    "ResearchDocLoader",
+    "Section",
+    "Segment",
+    "Span",
+    "SqliteGraphSink",
+    "StoredTerm",
+    "StreamingDeduplicator",
+    "TermRanker",
+    "TermStore",
+    "TextBlock",
+    "TokenBudget",
+    "Tokenizer",
+    "Tracer",
+    "aiterate_in_thread",
+    "bind_language_model",
+    "bind_span",
+    "cached_prediction",
+    "chunk_document",
+    "cluster_terms",
+    "config_hash",
+    "configure_gateway",
+    "current_lm_config",
+    "detect_sections",
+    "detect_text_sections",
+    "file_hash",
+    "get_gateway",
+    "get_tokenizer",
+    "get_tracer",
+    "glossary_row",
+    "init_dspy",
+    "instrument_language_model",
+    "iter_body_blocks",
+    "iter_latex_blocks",
+    "iter_latex_segments",
+    "iter_page_layouts",
+    "iter_pdf_segments",
+    "iterate_in_thread",
+    "load_environment",
+    "local_candidates",
+    "make_glossary_writer",
+    "make_graph_sink",
+    "make_logger",
+    "make_tracer",
+    "merge_near_duplicates",
+    "pack_document",
+    "segment_document",
+    "segment_text",
+    "set_language_model",
+    "set_tracer",
+    "trace",
+    "write_graph_batch",
+]
+
+
+def __getattr__(name: str) -> Any:
+    if name not in _MODULES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{_MODULES[name]}", __name__), name)
+    globals()[name] = value  # later lookups bypass __getattr__
+    return value
+
+
+def __dir__() -> List[str]:
+    return sorted(set(globals()) | set(__all__))
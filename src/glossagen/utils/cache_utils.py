@@ -0,0 +1,239 @@
+"""Persistent, content-addressed cache for language model extraction results."""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Type, TypeVar
+
+from pydantic import BaseModel, TypeAdapter
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "glossagen")
+DEFAULT_MAX_SIZE_BYTES = 256 * 1024 * 1024
+
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+
+def signature_fingerprint(signature: Type[Any]) -> str:
+    """
+    Describe a dspy signature by its instructions, fields and output schemas.
+
+    Any change to the prompt a signature produces (instructions, field descriptions or the
+    pydantic models of typed fields) changes the fingerprint and thereby the cache keys.
+
+    Args:
+        signature (type[dspy.Signature]): The signature to describe.
+
+    Returns
+    -------
+        str: A JSON description of the signature.
+    """
+    fields = {}
+    for name, field in signature.fields.items():
+        try:
+            schema: Any = TypeAdapter(field.annotation).json_schema()
+        except Exception:  # not every annotation has a JSON schema
+            schema = repr(field.annotation)
+        extra = field.json_schema_extra or {}
+        fields[name] = {
+            "kind": extra.get("__dspy_field_type"),
+            "desc": extra.get("desc"),
+            "prefix": extra.get("prefix"),
+            "schema": schema,
+        }
+    return json.dumps({"instructions": signature.instructions, "fields": fields}, sort_keys=True)
+
+
+class ExtractionCache:
+    """
+    An on-disk cache of language model predictions, keyed on everything that determines them.
+
+    The key is a SHA-256 hash of the signature fingerprint, the model name, max_tokens and the
+    prediction inputs (e.g. the chunk text). Entries are stored in a SQLite file in cache_dir.
+    Once the stored values exceed max_size_bytes, the least recently used entries are evicted.
+
+    Attributes
+    ----------
+        cache_dir (str): The directory containing the cache database.
+        max_size_bytes (int): The maximum total size of the cached values.
+        hits (int): The number of cache hits since the cache was opened.
+        misses (int): The number of cache misses since the cache was opened.
+    """
+
+    def __init__(
+        self, cache_dir: Optional[str] = None, max_size_bytes: int = DEFAULT_MAX_SIZE_BYTES
+    ):
+        """
+        Open (and create if necessary) the cache.
+
+        Args:
+            cache_dir (str): The cache directory. Defaults to $GLOSSAGEN_CACHE_DIR or
+                ~/.cache/glossagen.
+            max_size_bytes (int): The maximum total size of the cached values.
+        """
+        self.cache_dir: str = (
+            cache_dir or os.environ.get("GLOSSAGEN_CACHE_DIR") or DEFAULT_CACHE_DIR
+        )
+        self.max_size_bytes = max_size_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            os.path.join(self.cache_dir, "extractions.sqlite"), check_same_thread=False
+        )
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                "last_access REAL NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)"
+            )
+
+    @staticmethod
+    def make_key(signature: Type[Any], model: str, max_tokens: int, inputs: Dict[str, Any]) -> str:
+        """
+        Compute the cache key of a prediction.
+
+        Args:
+            signature (type[dspy.Signature]): The signature used for the prediction.
+            model (str): The name of the language model.
+            max_tokens (int): The maximum number of generated tokens.
+            inputs (dict): The input fields of the prediction.
+
+        Returns
+        -------
+            str: The hex digest identifying the prediction.
+        """
+        payload = json.dumps(
+            {
+                "signature": signature_fingerprint(signature),
+                "model": model,
+                "max_tokens": max_tokens,
+                "inputs": inputs,
+            },
+            sort_keys=True,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        Look up a cached value and mark it as recently used.
+
+        Args:
+            key (str): The cache key.
+
+        Returns
+        -------
+            Any: The JSON-decoded value, or None if the key is not cached.
+        """
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                "SELECT value FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._connection.execute(
+                "UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key)
+            )
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any) -> None:
+        """
+        Store a JSON-serializable value and evict old entries if the cache is too large.
+
+        Args:
+            key (str): The cache key.
+            value (Any): The value to store.
+        """
+        serialized = json.dumps(value)
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, last_access) "
+                "VALUES (?, ?, ?, ?)",
+                (key, serialized, len(serialized), time.time()),
+            )
+            self._evict()
+
+    def _evict(self) -> None:
+        """Delete the least recently used entries until the cache fits into max_size_bytes."""
+        (total_size,) = self._connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM entries"
+        ).fetchone()
+        if total_size <= self.max_size_bytes:
+            return
+        rows = self._connection.execute(
+            "SELECT key, size FROM entries ORDER BY last_access ASC"
+        ).fetchall()
+        evicted = []
+        for key, size in rows:
+            if total_size <= self.max_size_bytes:
+                break
+            evicted.append((key,))
+            total_size -= size
+        self._connection.executemany("DELETE FROM entries WHERE key = ?", evicted)
+
+    def clear(self) -> None:
+        """Remove all entries from the cache."""
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM entries")
+        with self._lock:
+            self._connection.execute("VACUUM")
+
+    def __len__(self) -> int:
+        """Return the number of cached entries."""
+        with self._lock:
+            (count,) = self._connection.execute("SELECT COUNT(*) FROM entries").fetchone()
+        return int(count)
+
+    def close(self) -> None:
+        """Close the underlying database connection."""
+        with self._lock:
+            self._connection.close()
+
+
+def cached_prediction(  # noqa: PLR0913
+    cache: Optional[ExtractionCache],
+    signature: Type[Any],
+    inputs: Dict[str, Any],
+    predict: Callable[[], List[ModelT]],
+    item_type: Type[ModelT],
+    max_tokens: Optional[int] = None,
+) -> List[ModelT]:
+    """
+    Return a cached list prediction, or run the prediction and cache its result.
+
+    Args:
+        cache (ExtractionCache): The cache to use. If None, predict is always called.
+        signature (type[dspy.Signature]): The signature used by predict.
+        inputs (dict): The input fields passed to the signature.
+        predict (Callable): Runs the prediction and returns a list of pydantic models.
+        item_type (type[BaseModel]): The pydantic model of the list items.
+        max_tokens (int): The max_tokens predict requests, if it overrides the one of the
+            language model.
+
+    Returns
+    -------
+        list[BaseModel]: The predicted items.
+    """
+    if cache is None:
+        return predict()
+
+    from glossagen.utils.dspy_utils import current_lm_config
+
+    lm_config = current_lm_config()
+    if max_tokens is not None:
+        lm_config["max_tokens"] = max_tokens
+    cache_key = cache.make_key(signature, **lm_config, inputs=inputs)
+    cached = cache.get(cache_key)
+    if cached is not None:
+        return [item_type(**item) for item in cached]
+    items = predict()
+    cache.set(cache_key, [item.model_dump() for item in items])
+    return items
@@ -0,0 +1,240 @@
+"""Local detection of candidate terms, to skip chunks without technical vocabulary."""
+
+import math
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Sequence, Set, Tuple
+
+import numpy as np
+from pydantic import BaseModel
+
+from glossagen.utils.dedup_utils import (
+    WORD_SEPARATOR,
+    abbreviation_key,
+    acronym,
+    is_abbreviation,
+)
+
+DEFAULT_MIN_SCORE = 0.5  # weighted candidate occurrences per 100 words
+DEFAULT_MAX_CANDIDATES = 40
+DEFINITION_WEIGHT = 3.0
+ABBREVIATION_WEIGHT = 1.0
+PHRASE_WEIGHT = 0.5
+KEYWORD_WEIGHT = 0.5
+KEYWORD_MIN_COUNT = 2
+KEYWORD_MIN_IDF = math.log(2)  # in at most about half of the documents
+MAX_KEYWORDS = 10
+MAX_EXPANSION_WORDS = 8
+
+WORD = re.compile(r"[A-Za-z][A-Za-z\-]{2,}")
+ABBREVIATION = re.compile(r"\b[A-Z][A-Za-z0-9\-]*[A-Z][A-Za-z0-9\-]*\b")
+# "metal-organic frameworks (MOFs)": the words before the parentheses are cut to the expansion
+ABBREVIATION_DEFINITION = re.compile(
+    r"(?P<words>(?:[A-Za-z][\w\-]*[ \t]+){1,%d})\((?P<abbreviation>[A-Z][A-Za-z0-9\-]*[A-Z]"
+    r"[A-Za-z0-9\-]*)\)" % MAX_EXPANSION_WORDS
+)
+CAPITALIZED_PHRASE = re.compile(r"\b[A-Z][a-z]+(?:[ \-][A-Z][a-z]+)+\b")
+
+# Words of general and academic prose, which count as occurring in every background document
+COMMON_WORDS = frozenset(
+    """
+    about above after again against all also although among analysis and any are around
+    as at based be because been before being below between both but by can could data
+    described determined did different do does done due during each either et al figure
+    fig first for found from further furthermore given had has have having here however
+    if in into is it its itself large less low may method methods more most much must
+    new no nor not note obtained of on one only or other our out over performed present
+    previously report reported result results same sample samples second section should
+    show shown significant similar since small so some such supplementary table than that
+    the their them then there therefore these they this those three through thus to
+    two under using used very was we were what when where whereas which while who will
+    with within without work would yet study studies our figure respectively approximately
+    obtained addition compared experiment experimental information received university
+    department author authors acknowledgement acknowledgements funding support supported
+    grant thank thanks
+    """.split()
+)
+
+
+class ChunkCandidates(BaseModel):
+    """The candidate terms found in a chunk and whether the chunk is worth a model request."""
+
+    candidates: List[str]
+    score: float
+    words: int
+    keep: bool
+
+
+def find_definitions(text: str) -> List[Tuple[str, str]]:
+    """
+    Find abbreviations defined in parentheses, e.g. "metal-organic frameworks (MOFs)".
+
+    The expansion is cut to the words whose initials cover the abbreviation.
+
+    Args:
+        text (str): The text to search.
+
+    Returns
+    -------
+        list[tuple[str, str]]: The expansions and abbreviations, in order of appearance.
+    """
+    definitions = []
+    for match in ABBREVIATION_DEFINITION.finditer(text):
+        abbreviation = match.group("abbreviation")
+        letters = sum(char.isalpha() for char in abbreviation_key(abbreviation))
+        words = match.group("words").split()
+        expansion: List[str] = []
+        while words and len(acronym(" ".join(expansion))) < letters:
+            expansion.insert(0, words.pop())
+        if expansion and WORD_SEPARATOR.split(expansion[0])[0].lower() not in COMMON_WORDS:
+            definitions.append((" ".join(expansion), abbreviation))
+    return definitions
+
+
+def _local_candidates(text: str) -> Dict[str, float]:
+    """
+    Weigh the definitions, abbreviations and capitalized phrases of a text.
+
+    A capitalized phrase only adds weight when it recurs: names of people and institutions,
+    as in author notes and acknowledgements, are mostly mentioned once.
+    """
+    weights: Dict[str, float] = {}
+    defined: Set[str] = set()
+    for expansion, abbreviation in find_definitions(text):
+        candidate = f"{expansion} ({abbreviation})"
+        weights[candidate] = weights.get(candidate, 0.0) + DEFINITION_WEIGHT
+        defined.update((expansion, abbreviation_key(abbreviation)))
+    for abbreviation in ABBREVIATION.findall(text):
+        if is_abbreviation(abbreviation) and abbreviation_key(abbreviation) not in defined:
+            weights[abbreviation] = weights.get(abbreviation, 0.0) + ABBREVIATION_WEIGHT
+    phrases = Counter(CAPITALIZED_PHRASE.findall(text))
+    for phrase, count in phrases.items():
+        if phrase not in defined and phrase.split()[0].lower() not in COMMON_WORDS:
+            weights[phrase] = weights.get(phrase, 0.0) + PHRASE_WEIGHT * (count - 1)
+    return weights
+
+
+def local_candidates(text: str) -> List[str]:
+    """
+    Find the candidate terms of a single text: its definitions, abbreviations and phrases.
+
+    These are the candidates CandidatePrefilter finds without the keywords, which need the
+    other chunks of the document.
+
+    Args:
+        text (str): The text, e.g. a chunk.
+
+    Returns
+    -------
+        list[str]: The candidates, most weighty first.
+    """
+    weights = _local_candidates(text)
+    return sorted(weights, key=lambda candidate: -weights[candidate])
+
+
+class CandidatePrefilter:
+    """
+    Scores chunks by the density of candidate terms, without calling the language model.
+
+    A chunk's candidates are its abbreviations (with their expansion if defined in
+    parentheses), capitalized multi-word phrases and keywords: words repeated in the chunk but
+    rare in the other chunks and the background documents, by TF-IDF. The score is the
+    weighted number of candidate occurrences per 100 words; chunks below min_score, like
+    reference lists, acknowledgements or boilerplate, are not worth a request.
+
+    Attributes
+    ----------
+        min_score (float): The score a chunk needs to be kept.
+        max_candidates (int): The most candidates reported per chunk.
+        documents (int): The number of background documents.
+    """
+
+    def __init__(
+        self,
+        background: Iterable[str] = (),
+        min_score: float = DEFAULT_MIN_SCORE,
+        max_candidates: int = DEFAULT_MAX_CANDIDATES,
+    ):
+        """
+        Create the prefilter.
+
+        Args:
+            background (Iterable[str]): Texts of the background corpus, e.g. other papers.
+                Words of general prose (COMMON_WORDS) count as occurring in all of them.
+            min_score (float): The score a chunk needs to be kept.
+            max_candidates (int): The most candidates reported per chunk.
+        """
+        self.min_score = min_score
+        self.max_candidates = max_candidates
+        self.documents = 0
+        self._document_frequency: Counter[str] = Counter()
+        for text in background:
+            self.add_background(text)
+
+    def add_background(self, text: str) -> None:
+        """Count the words of a text as one more background document."""
+        self.documents += 1
+        self._document_frequency.update(set(word.lower() for word in WORD.findall(text)))
+
+    def _keywords(self, word_counts: List["Counter[str]"]) -> List[Dict[str, float]]:
+        """Find the TF-IDF keywords of every chunk, with their occurrences as weights."""
+        vocabulary = sorted(
+            {word for counts in word_counts for word in counts} - COMMON_WORDS,
+        )
+        if not vocabulary:
+            return [{} for _ in word_counts]
+        index = {word: column for column, word in enumerate(vocabulary)}
+        counts = np.zeros((len(word_counts), len(vocabulary)), dtype=np.float32)
+        for row, chunk_counts in enumerate(word_counts):
+            columns = [index[word] for word in chunk_counts if word in index]
+            counts[row, columns] = [chunk_counts[vocabulary[column]] for column in columns]
+
+        background = np.array([self._document_frequency[word] for word in vocabulary])
+        document_frequency = (counts > 0).sum(axis=0) + background
+        documents = len(word_counts) + self.documents
+        idf = np.log((1 + documents) / (1 + document_frequency))
+        tfidf = counts * idf
+        tfidf[(counts < KEYWORD_MIN_COUNT) | (idf < KEYWORD_MIN_IDF)[np.newaxis, :]] = 0.0
+
+        keywords = []
+        for row in range(len(word_counts)):
+            top = np.argsort(-tfidf[row])[:MAX_KEYWORDS]
+            keywords.append(
+                {
+                    vocabulary[column]: float(counts[row, column]) * KEYWORD_WEIGHT
+                    for column in top
+                    if tfidf[row, column] > 0
+                }
+            )
+        return keywords
+
+    def analyze(self, texts: Sequence[str]) -> List[ChunkCandidates]:
+        """
+        Find the candidates of the chunks of one document and decide which chunks to keep.
+
+        Args:
+            texts (Sequence[str]): The chunks, which are each other's background as well.
+
+        Returns
+        -------
+            list[ChunkCandidates]: The candidates and score of every chunk, in order.
+        """
+        words = [[word.lower() for word in WORD.findall(text)] for text in texts]
+        keywords = self._keywords([Counter(chunk_words) for chunk_words in words])
+        analyses = []
+        for text, chunk_words, chunk_keywords in zip(texts, words, keywords):
+            weights = _local_candidates(text)
+            for keyword, weight in chunk_keywords.items():
+                if not any(keyword in candidate.lower() for candidate in weights):
+                    weights[keyword] = weights.get(keyword, 0.0) + weight
+            score = sum(weights.values()) * 100 / max(len(chunk_words), 1)
+            ranked = sorted(weights, key=lambda candidate: -weights[candidate])
+            analyses.append(
+                ChunkCandidates(
+                    candidates=ranked[: self.max_candidates],
+                    score=round(score, 3),
+                    words=len(chunk_words),
+                    keep=score >= self.min_score,
+                )
+            )
+        return analyses
@@ -0,0 +1,462 @@
+"""Near-duplicate merging of glossary terms with MinHash, LSH and abbreviation linking."""
+
+import re
+import zlib
+from collections import defaultdict
+from typing import Dict, FrozenSet, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+import numpy.typing as npt
+
+NGRAM_SIZE = 3
+NUM_PERMUTATIONS = 128
+NUM_BANDS = 32  # bands of NUM_PERMUTATIONS // NUM_BANDS rows; candidates from Jaccard ~0.4 up
+MERGE_THRESHOLD = 0.8  # minimum Jaccard similarity of the n-gram sets of merged terms
+MAX_BUCKET_COMPARISONS = 16  # comparisons per term and bucket, keeps huge buckets linear
+MAX_ABBREVIATION_LENGTH = 12
+MIN_ABBREVIATION_CAPITALS = 2
+MIN_PLURAL_LENGTH = 4  # shorter words ending in "s" (e.g. "gas") are kept as they are
+MERSENNE_PRIME = (1 << 31) - 1
+SEED = 42
+
+NON_ALPHANUMERIC = re.compile(r"[^0-9a-z]+")
+PARENTHESIZED = re.compile(r"^(?P<outer>[^()]+?)\s*\((?P<inner>[^()]+)\)$")
+WORD_SEPARATOR = re.compile(r"[\s\-/]+")
+NUMBER = re.compile(r"\d+")
+
+
+def normalize_term(term: str) -> str:
+    """
+    Normalize a term for comparison: lower case, words only, no plural ending.
+
+    Args:
+        term (str): The term.
+
+    Returns
+    -------
+        str: The normalized term, e.g. "metal organic framework" for "Metal-organic frameworks".
+    """
+    words = NON_ALPHANUMERIC.sub(" ", term.lower()).split()
+    if words:
+        words[-1] = _singular(words[-1])
+    return " ".join(words)
+
+
+def _singular(word: str) -> str:
+    """Remove a common plural ending from a word."""
+    if len(word) < MIN_PLURAL_LENGTH or not word.endswith("s") or word.endswith("ss"):
+        return word
+    if word.endswith("ies"):
+        return word[:-3] + "y"
+    return word[:-1]
+
+
+def is_abbreviation(term: str) -> bool:
+    """
+    Decide whether a term is an abbreviation such as "MOF", "MOFs" or "ZIF-8".
+
+    Args:
+        term (str): The term.
+
+    Returns
+    -------
+        bool: True for single words of at most MAX_ABBREVIATION_LENGTH characters with at least
+            two capital letters.
+    """
+    term = term.strip()
+    return (
+        0 < len(term) <= MAX_ABBREVIATION_LENGTH
+        and not any(char.isspace() for char in term)
+        and sum(char.isupper() for char in term) >= MIN_ABBREVIATION_CAPITALS
+    )
+
+
+def split_abbreviation(term: str) -> Tuple[str, Optional[str]]:
+    """
+    Split a term of the form "expansion (ABBR)" or "ABBR (expansion)".
+
+    Args:
+        term (str): The term.
+
+    Returns
+    -------
+        tuple[str, str]: The expansion (or the whole term) and the abbreviation, or None if the
+            term is not written with both.
+    """
+    match = PARENTHESIZED.match(term.strip())
+    if match:
+        outer, inner = match.group("outer"), match.group("inner").strip()
+        if is_abbreviation(inner) and not is_abbreviation(outer):
+            return outer, inner
+        if is_abbreviation(outer) and not is_abbreviation(inner):
+            return inner, outer
+    return term.strip(), None
+
+
+def abbreviation_key(abbreviation: str) -> str:
+    """Normalize an abbreviation, e.g. "MOFs" to "mof"."""
+    key = abbreviation.strip()
+    if key.endswith("s") and key[:-1].isupper():
+        key = key[:-1]
+    return NON_ALPHANUMERIC.sub("", key.lower())
+
+
+def acronym(expansion: str) -> str:
+    """Return the initials of an expanded term, e.g. "mof" for "metal-organic framework"."""
+    return "".join(word[0] for word in WORD_SEPARATOR.split(expansion.lower()) if word)
+
+
+def char_ngrams(text: str, size: int = NGRAM_SIZE) -> FrozenSet[str]:
+    """Return the character n-grams of a normalized term, padded at both ends."""
+    padded = f" {text} "
+    return frozenset(padded[i : i + size] for i in range(max(len(padded) - size + 1, 1)))
+
+
+def _jaccard(first: FrozenSet[str], second: FrozenSet[str]) -> float:
+    """Return the Jaccard similarity of two sets."""
+    return len(first & second) / len(first | second) if first or second else 1.0
+
+
+class MinHasher:
+    """MinHash signatures of character n-gram sets, vectorized with numpy."""
+
+    def __init__(self, num_permutations: int = NUM_PERMUTATIONS, seed: int = SEED):
+        """
+        Draw the random hash functions.
+
+        Args:
+            num_permutations (int): The length of the signatures.
+            seed (int): The seed of the hash functions, so signatures are reproducible.
+        """
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, MERSENNE_PRIME, size=num_permutations, dtype=np.uint64)
+        self.b = rng.integers(0, MERSENNE_PRIME, size=num_permutations, dtype=np.uint64)
+
+    def signature(self, ngrams: FrozenSet[str]) -> npt.NDArray[np.uint64]:
+        """
+        Compute the MinHash signature of a set of n-grams.
+
+        Args:
+            ngrams (frozenset[str]): The n-grams.
+
+        Returns
+        -------
+            npt.NDArray[np.uint64]: The minimum of every hash function over the n-grams.
+        """
+        hashes = np.fromiter(
+            (zlib.crc32(ngram.encode("utf-8")) % MERSENNE_PRIME for ngram in ngrams),
+            dtype=np.uint64,
+            count=len(ngrams),
+        )
+        products = (self.a[:, None] * hashes[None, :] + self.b[:, None]) % MERSENNE_PRIME
+        signature: npt.NDArray[np.uint64] = products.min(axis=1)
+        return signature
+
+
+class _UnionFind:
+    """Disjoint sets of term indices."""
+
+    def __init__(self, size: int):
+        """Put every index into a set of its own."""
+        self.parent = list(range(size))
+
+    def find(self, index: int) -> int:
+        """Return the representative (smallest index) of the set containing index."""
+        while self.parent[index] != index:
+            self.parent[index] = self.parent[self.parent[index]]
+            index = self.parent[index]
+        return index
+
+    def union(self, first: int, second: int) -> None:
+        """Merge the sets containing first and second."""
+        first, second = self.find(first), self.find(second)
+        if first != second:
+            self.parent[max(first, second)] = min(first, second)
+
+    def groups(self) -> List[List[int]]:
+        """Return the sets, ordered by their smallest index."""
+        groups: Dict[int, List[int]] = defaultdict(list)
+        for index in range(len(self.parent)):
+            groups[self.find(index)].append(index)
+        return sorted(groups.values(), key=lambda group: group[0])
+
+
+class _LSHIndex:
+    """Buckets of MinHash signature bands that yield candidate near-duplicates."""
+
+    def __init__(self, hasher: MinHasher, num_bands: int):
+        """Create empty buckets for num_bands bands of the hasher's signatures."""
+        self.hasher = hasher
+        self.num_bands = num_bands
+        self.rows = len(hasher.a) // num_bands
+        if self.rows * num_bands != len(hasher.a):
+            raise ValueError(f"num_bands must divide the signature length {len(hasher.a)}.")
+        self.buckets: Dict[Tuple[int, bytes], List[int]] = defaultdict(list)
+
+    def add(self, index: int, ngrams: FrozenSet[str]) -> Set[int]:
+        """Add a term and return the earlier terms sharing a bucket with it."""
+        signature = self.hasher.signature(ngrams)
+        candidates: Set[int] = set()
+        for band in range(self.num_bands):
+            bucket = self.buckets[
+                (band, signature[band * self.rows : (band + 1) * self.rows].tobytes())
+            ]
+            candidates.update(bucket[:MAX_BUCKET_COMPARISONS])
+            bucket.append(index)
+        return candidates
+
+
+def _term_parts(term: str) -> Tuple[str, Optional[str]]:
+    """Return the expansion ("" for bare abbreviations) and the abbreviation of a term."""
+    expansion, abbreviation = split_abbreviation(term)
+    if abbreviation is None and is_abbreviation(expansion):
+        return "", expansion
+    return expansion, abbreviation
+
+
+def cluster_terms(
+    terms: Sequence[str],
+    threshold: float = MERGE_THRESHOLD,
+    num_bands: int = NUM_BANDS,
+    hasher: Optional[MinHasher] = None,
+) -> List[List[int]]:
+    """
+    Group terms that are near-duplicates or abbreviations of each other.
+
+    Terms are compared by the character n-grams of their normalized expansion. Candidate pairs
+    come from LSH buckets of MinHash signatures, so the run time grows linearly with the number
+    of terms; candidates are merged if they contain the same numbers and the Jaccard similarity
+    of their n-grams reaches the threshold. An abbreviation is linked to the terms written with
+    it ("metal-organic frameworks (MOFs)") and to the terms whose initials it spells, as long as
+    these belong to a single group.
+
+    Args:
+        terms (Sequence[str]): The terms.
+        threshold (float): The minimum Jaccard similarity of merged terms.
+        num_bands (int): The number of LSH bands; must divide the signature length.
+        hasher (MinHasher): The MinHash functions. Defaults to a seeded MinHasher.
+
+    Returns
+    -------
+        list[list[int]]: The groups of term indices, ordered by their first term.
+    """
+    index = _LSHIndex(hasher or MinHasher(), num_bands)
+    groups = _UnionFind(len(terms))
+    ngram_sets: Dict[int, FrozenSet[str]] = {}
+    numbers: Dict[int, List[str]] = {}
+    first_occurrences: Dict[str, int] = {}
+    abbreviations: Dict[str, List[int]] = defaultdict(list)
+    expansions: Dict[str, List[int]] = defaultdict(list)
+
+    for position, term in enumerate(terms):
+        expansion, abbreviation = _term_parts(term)
+        if abbreviation is not None:
+            abbreviations[abbreviation_key(abbreviation)].append(position)
+        normalized = normalize_term(expansion)
+        if " " in normalized:
+            expansions[acronym(expansion)].append(position)
+        if not normalized:
+            continue
+        if normalized in first_occurrences:  # exact duplicates need no LSH
+            groups.union(first_occurrences[normalized], position)
+            continue
+        first_occurrences[normalized] = position
+        ngram_sets[position] = char_ngrams(normalized)
+        numbers[position] = NUMBER.findall(normalized)
+        for other in index.add(position, ngram_sets[position]):
+            # "ZIF-8" and "ZIF-67" are similar strings but different materials
+            if (
+                numbers[position] == numbers[other]
+                and _jaccard(ngram_sets[position], ngram_sets[other]) >= threshold
+            ):
+                groups.union(position, other)
+
+    for key, positions in abbreviations.items():
+        for position in positions[1:]:
+            groups.union(positions[0], position)
+        roots = {groups.find(position) for position in expansions.get(key, [])}
+        if len(roots) == 1:
+            groups.union(positions[0], roots.pop())
+    return groups.groups()
+
+
+def canonical_member(terms: Sequence[str], definitions: Sequence[str]) -> int:
+    """
+    Choose the entry that represents a group of near-duplicate terms.
+
+    Entries written with expansion and abbreviation come first, then expanded terms, then the
+    longest definition; ties go to the earliest entry.
+
+    Args:
+        terms (Sequence[str]): The terms of the group.
+        definitions (Sequence[str]): Their definitions.
+
+    Returns
+    -------
+        int: The position of the canonical entry in the group.
+    """
+
+    def rank(position: int) -> Tuple[bool, bool, int, int]:
+        expansion, abbreviation = split_abbreviation(terms[position])
+        return (
+            abbreviation is not None,
+            not is_abbreviation(expansion),
+            len(definitions[position]),
+            -position,
+        )
+
+    return max(range(len(terms)), key=rank)
+
+
+def _spellings(terms: Sequence[str], cluster: List[int], canonical: str = "") -> List[str]:
+    """Return the distinct spellings of a cluster other than the canonical term, in order."""
+    spellings: List[str] = []
+    for index in cluster:
+        term = terms[index].strip()
+        if term != canonical.strip() and term not in spellings:
+            spellings.append(term)
+    return spellings
+
+
+def merge_near_duplicates(
+    terms: Sequence[str], definitions: Sequence[str], threshold: float = MERGE_THRESHOLD
+) -> List[Tuple[int, List[str]]]:
+    """
+    Merge near-duplicate glossary entries into one canonical entry with aliases.
+
+    Args:
+        terms (Sequence[str]): The terms of the entries.
+        definitions (Sequence[str]): The definitions of the entries.
+        threshold (float): The minimum Jaccard similarity of merged terms, see cluster_terms.
+
+    Returns
+    -------
+        list[tuple[int, list[str]]]: For every group, the index of the canonical entry and the
+            other spellings of the term, in order of first appearance.
+    """
+    merged = []
+    for cluster in cluster_terms(terms, threshold):
+        position = canonical_member(
+            [terms[index] for index in cluster], [definitions[index] for index in cluster]
+        )
+        canonical = cluster[position]
+        merged.append((canonical, _spellings(terms, cluster, terms[canonical])))
+    return merged
+
+
+class StreamingDeduplicator:
+    """
+    Merge near-duplicate glossary entries batch by batch, for glossaries read while they grow.
+
+    Terms are compared as in cluster_terms, but only with the terms of earlier batches and
+    their own batch: an entry either joins an existing group or a group is started for it. A
+    group keeps the canonical entry of the batch it was started in, since that entry may have
+    been handed out already; spellings found later are reported as aliases of the group. An
+    abbreviation is linked to the expansions it spells only while these belong to a single
+    group.
+
+    Attributes
+    ----------
+        threshold (float): The minimum Jaccard similarity of merged terms.
+        groups (int): The number of groups so far.
+    """
+
+    def __init__(
+        self,
+        threshold: float = MERGE_THRESHOLD,
+        num_bands: int = NUM_BANDS,
+        hasher: Optional[MinHasher] = None,
+    ):
+        """
+        Start without groups.
+
+        Args:
+            threshold (float): The minimum Jaccard similarity of merged terms.
+            num_bands (int): The number of LSH bands; must divide the signature length.
+            hasher (MinHasher): The MinHash functions. Defaults to a seeded MinHasher.
+        """
+        self.threshold = threshold
+        self.groups = 0
+        self._index = _LSHIndex(hasher or MinHasher(), num_bands)
+        self._term_groups: List[int] = []  # the group of every indexed term
+        self._ngram_sets: List[FrozenSet[str]] = []
+        self._numbers: List[List[str]] = []
+        self._normalized: Dict[str, int] = {}
+        self._abbreviations: Dict[str, int] = {}
+        self._expansions: Dict[str, Set[int]] = defaultdict(set)
+
+    def _find_group(self, term: str) -> int:
+        """Return the group of a term, starting a new one if it matches none, and index it."""
+        expansion, abbreviation = _term_parts(term)
+        normalized = normalize_term(expansion)
+        key = abbreviation_key(abbreviation) if abbreviation is not None else None
+        initials = acronym(expansion) if " " in normalized else None
+        group = self._abbreviations.get(key) if key is not None else None
+        if group is None and normalized:
+            group = self._normalized.get(normalized)
+        indexed = bool(normalized) and normalized not in self._normalized
+        if indexed:  # exact duplicates need no LSH
+            ngrams = char_ngrams(normalized)
+            numbers = NUMBER.findall(normalized)
+            for other in sorted(self._index.add(len(self._term_groups), ngrams)):
+                if (
+                    group is None
+                    and numbers == self._numbers[other]
+                    and _jaccard(ngrams, self._ngram_sets[other]) >= self.threshold
+                ):
+                    group = self._term_groups[other]
+        if group is None and key is not None and len(self._expansions.get(key, ())) == 1:
+            group = next(iter(self._expansions[key]))
+        if group is None and initials is not None and initials in self._abbreviations:
+            if self._expansions.get(initials, set()) <= {self._abbreviations[initials]}:
+                group = self._abbreviations[initials]
+        if group is None:
+            group = self.groups
+            self.groups += 1
+
+        if indexed:
+            self._term_groups.append(group)
+            self._ngram_sets.append(ngrams)
+            self._numbers.append(numbers)
+            self._normalized[normalized] = group
+        if key is not None:
+            self._abbreviations.setdefault(key, group)
+        if initials is not None:
+            self._expansions[initials].add(group)
+        return group
+
+    def merge(
+        self, terms: Sequence[str], definitions: Sequence[str]
+    ) -> Tuple[List[Tuple[int, List[str]]], Dict[int, List[str]]]:
+        """
+        Merge a batch of entries into the groups.
+
+        Args:
+            terms (Sequence[str]): The terms of the entries, e.g. of one chunk.
+            definitions (Sequence[str]): The definitions of the entries.
+
+        Returns
+        -------
+            tuple: The new groups like merge_near_duplicates, i.e. the index of the canonical
+                entry and the other spellings, numbered on from the groups before the batch;
+                and the new spellings of the earlier groups, by group.
+        """
+        earlier = self.groups
+        members: Dict[int, List[int]] = defaultdict(list)
+        for index, term in enumerate(terms):
+            members[self._find_group(term)].append(index)
+        merged = []
+        for group in range(earlier, self.groups):
+            cluster = members[group]
+            canonical = cluster[
+                canonical_member(
+                    [terms[index] for index in cluster], [definitions[index] for index in cluster]
+                )
+            ]
+            merged.append((canonical, _spellings(terms, cluster, terms[canonical])))
+        extended = {
+            group: _spellings(terms, cluster)
+            for group, cluster in members.items()
+            if group < earlier
+        }
+        return merged, extended
@@ -1,31 +1,78 @@
 """init dspy."""
 
+import functools
 import os
+from typing import Any, Callable, Dict, Optional, TypeVar
 
-import dsp
-import dspy
-import openai
-from dotenv import load_dotenv
+from typing_extensions import ParamSpec
 
-load_dotenv()
-openai.api_key = os.getenv("OPENAI_API_KEY")
+from glossagen.utils.gateway_utils import get_gateway
+from glossagen.utils.tracing_utils import instrument_language_model
+
+P = ParamSpec("P")
+T = TypeVar("T")
 
 system_prompt = """
 You are GlossaGen, a helpful AI that generates glossaries from scholarly
 articles. You're an expert in the field of materials and chemistry and
 give concise, structured, helpful answers whenever instructed."""
 
+# The language model init_dspy configures instead of creating one, see set_language_model
+_LANGUAGE_MODEL_OVERRIDE: Dict[str, Any] = {}
+
+
+@functools.cache
+def load_environment() -> None:
+    """
+    Load the .env file and pass the OpenAI API key to the openai package.
+
+    This happens once per process, when the first language model is set up, rather than when
+    glossagen is imported.
+    """
+    import openai
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    openai.api_key = os.getenv("OPENAI_API_KEY")
+
+
+def set_language_model(language_model: Optional[Any]) -> Optional[Any]:
+    """
+    Make every later init_dspy call configure the given language model.
+
+    The pipelines call init_dspy themselves, so this is how a local stand-in (e.g. OfflineLM
+    for benchmarks) replaces the OpenAI model without changing them.
+
+    Args:
+        language_model: The language model, or None to let init_dspy create one again.
+
+    Returns
+    -------
+        The language model set before, or None.
+    """
+    previous = _LANGUAGE_MODEL_OVERRIDE.pop("lm", None)
+    if language_model is not None:
+        _LANGUAGE_MODEL_OVERRIDE["lm"] = language_model
+    return previous
+
 
 def init_dspy(
-    language_model_class: dsp.GPT3 = dspy.OpenAI,
+    language_model_class: Optional[Any] = None,
     max_tokens: int = 3000,
     model: str = "gpt-3.5-turbo",
 ) -> None:
     """
     Initialize the dspy library with the specified parameters.
 
+    The language model is created once per process and reused by later calls, and its requests
+    go through the process-wide gateway (rate limits, shared HTTP client and coalescing of
+    identical requests, see LMGateway). If a language model was set with set_language_model, it
+    is configured instead and the arguments are ignored. Every request of the model is traced,
+    see instrument_language_model. The model replaces the one in the current dspy settings of
+    the thread, so repeated calls do not grow dspy's stack of settings.
+
     Args:
-        language_model_class: The class of the language model to use.
+        language_model_class: The class of the language model to use. Defaults to dspy.OpenAI.
         max_tokens (int): The maximum number of tokens to generate.
         model (str): The name of the language model to use.
 
@@ -33,8 +80,64 @@ def init_dspy(
     -------
         None
     """
-    language_model = language_model_class(
-        max_tokens=max_tokens, model=model, system_prompt=system_prompt
-    )
+    import dspy
+
+    gateway = get_gateway()
+    if "lm" in _LANGUAGE_MODEL_OVERRIDE:
+        language_model = gateway.attach(_LANGUAGE_MODEL_OVERRIDE["lm"])
+    else:
+        load_environment()
+        language_model = gateway.language_model(
+            language_model_class or dspy.OpenAI, model, max_tokens, system_prompt=system_prompt
+        )
+    dspy.settings.config["lm"] = instrument_language_model(language_model)
+
+
+def current_lm_config() -> Dict[str, Any]:
+    """
+    Return the model name and max_tokens of the language model configured in dspy.
+
+    Returns
+    -------
+        dict: The "model" and "max_tokens" of the configured language model.
+
+    Raises
+    ------
+        RuntimeError: If no language model has been configured, e.g. via init_dspy.
+    """
+    import dspy
+
+    language_model = dspy.settings.lm
+    if language_model is None:
+        raise RuntimeError("No language model configured. Call init_dspy first.")
+    return {
+        "model": language_model.kwargs.get("model"),
+        "max_tokens": language_model.kwargs.get("max_tokens"),
+    }
+
+
+def bind_language_model(function: Callable[P, T]) -> Callable[P, T]:
+    """
+    Bind a function to the language model configured in the calling thread.
+
+    dspy keeps its settings per thread and copies them when a thread first uses them. Pool
+    threads, whose ids are reused, would therefore keep a stale or missing language model; the
+    returned function configures the bound model for the duration of every call instead.
+
+    Args:
+        function (Callable): The function to run in other threads.
+
+    Returns
+    -------
+        Callable: The function, run with the language model of the calling thread.
+    """
+    import dspy
+
+    language_model = dspy.settings.lm
+
+    @functools.wraps(function)
+    def bound(*args: P.args, **kwargs: P.kwargs) -> T:
+        with dspy.settings.context(lm=language_model):
+            return function(*args, **kwargs)
 
-    dspy.settings.configure(lm=language_model)
+    return bound
@@ -0,0 +1,437 @@
+"""A process-wide gateway to the language model: shared clients, rate limits and coalescing."""
+
+import functools
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional, Tuple, TypeVar
+
+from glossagen.utils.token_utils import estimate_tokens
+from glossagen.utils.tracing_utils import trace
+
+T = TypeVar("T")
+
+DEFAULT_MAX_RETRIES = 6
+DEFAULT_BACKOFF = 1.0  # seconds before the first retry after a 429
+MAX_BACKOFF = 60.0
+DEFAULT_MAX_CONNECTIONS = 32
+DEFAULT_TIMEOUT = 120.0
+RATE_LIMIT_STATUS = 429
+
+
+class TokenBucket:
+    """
+    A bucket refilled at a constant rate per minute, up to one minute's worth.
+
+    Attributes
+    ----------
+        per_minute (float): The refill rate and capacity.
+        level (float): The available amount; negative after a request used more than reserved.
+    """
+
+    def __init__(self, per_minute: float):
+        """
+        Create a full bucket.
+
+        Args:
+            per_minute (float): The amount available per minute.
+        """
+        if per_minute <= 0:
+            raise ValueError(f"per_minute must be positive, got {per_minute}.")
+        self.per_minute = per_minute
+        self.level = per_minute
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        """Add what has accumulated since the last update."""
+        self.level = min(self.per_minute, self.level + (now - self._updated) * self.per_minute / 60)
+        self._updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Return the seconds until amount (at most the capacity) is available."""
+        self._refill(now)
+        missing = min(amount, self.per_minute) - self.level
+        return max(0.0, missing * 60 / self.per_minute)
+
+    def take(self, amount: float) -> None:
+        """Remove an amount from the bucket, which may leave it negative."""
+        self.level -= amount
+
+
+class RateLimiter:
+    """
+    Token-bucket limits on requests and tokens per minute, shared by all threads.
+
+    A request waits until both buckets allow it. After a rate limit error, pause stops all
+    requests for a while, so that concurrent workers back off together instead of retrying
+    into the limit one after the other.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+    ):
+        """
+        Create the limiter.
+
+        Args:
+            requests_per_minute (float): The request limit, or None for no limit.
+            tokens_per_minute (float): The token limit (prompt and completion), or None.
+        """
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self._paused_until = 0.0
+        self._condition = threading.Condition()
+
+    @property
+    def enabled(self) -> bool:
+        """Whether any limit is set."""
+        return self.requests is not None or self.tokens is not None
+
+    def acquire(self, tokens: int) -> float:
+        """
+        Wait until a request of the given size may be sent, and reserve it.
+
+        Args:
+            tokens (int): The estimated tokens of the request.
+
+        Returns
+        -------
+            float: The seconds waited.
+        """
+        start = time.monotonic()
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                wait = self._paused_until - now
+                if self.requests is not None:
+                    wait = max(wait, self.requests.wait_time(1, now))
+                if self.tokens is not None:
+                    wait = max(wait, self.tokens.wait_time(tokens, now))
+                if wait <= 0:
+                    break
+                self._condition.wait(wait)
+            if self.requests is not None:
+                self.requests.take(1)
+            if self.tokens is not None:
+                self.tokens.take(tokens)
+        return time.monotonic() - start
+
+    def adjust(self, tokens: int) -> None:
+        """Correct the reserved tokens by the difference to the tokens actually used."""
+        if self.tokens is not None:
+            with self._condition:
+                self.tokens.take(tokens)
+
+    def pause(self, seconds: float) -> None:
+        """Stop all requests for the given time."""
+        with self._condition:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+def _is_rate_limited(error: Exception) -> bool:
+    """Return whether an exception is a rate limit (HTTP 429) error of the API."""
+    return (
+        getattr(error, "status_code", None) == RATE_LIMIT_STATUS
+        or type(error).__name__ == "RateLimitError"
+    )
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Return the delay the API asked for in the Retry-After header, if any."""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    retry_after = headers.get("retry-after")
+    if retry_after is None:
+        return None
+    try:
+        return float(retry_after)
+    except (TypeError, ValueError):
+        return None
+
+
+def _request_key(language_model: Any, prompt: str, kwargs: Dict[str, Any]) -> str:
+    """Identify a request by the model, its settings and the prompt."""
+    request = {"provider": type(language_model).__name__, **language_model.kwargs, **kwargs}
+    payload = json.dumps([request, prompt], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LMGateway:
+    """
+    The single way of the pipelines to the language model API.
+
+    - Language models are created once per class, model and max_tokens and reused by every
+      init_dspy call, and OpenAI requests share one pooled keep-alive HTTP client.
+    - Requests wait for the token-bucket limits on requests and tokens per minute. A rate limit
+      error pauses all requests with exponential backoff (or the delay the API asks for) before
+      the request is retried.
+    - Identical requests in flight at the same time are sent once; the others wait for and
+      share the response.
+
+    Attributes
+    ----------
+        limiter (RateLimiter): The rate limits.
+        max_retries (int): The retries of a request after rate limit errors.
+        backoff (float): The pause in seconds after the first rate limit error of a request.
+        stats (dict): The numbers of "requests" sent, "coalesced" requests, "rate_limited"
+            responses and the "waited" seconds.
+    """
+
+    def __init__(  # noqa: PLR0913
+        self,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        max_connections: int = DEFAULT_MAX_CONNECTIONS,
+        backoff: float = DEFAULT_BACKOFF,
+    ):
+        """
+        Create the gateway.
+
+        Args:
+            requests_per_minute (float): The request limit, or None for no limit.
+            tokens_per_minute (float): The token limit, or None for no limit.
+            max_retries (int): The retries of a request after rate limit errors.
+            max_connections (int): The size of the HTTP connection pool.
+            backoff (float): The pause in seconds after the first rate limit error; it doubles
+                with every further error of a request.
+        """
+        self.limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_connections = max_connections
+        self.stats: Dict[str, float] = {
+            "requests": 0,
+            "coalesced": 0,
+            "rate_limited": 0,
+            "waited": 0.0,
+        }
+        self._models: Dict[Tuple[Any, ...], Any] = {}
+        self._in_flight: Dict[str, "Future[Any]"] = {}
+        self._http_client: Optional[Any] = None
+        self._lock = threading.Lock()
+
+    def http_client(self) -> Any:
+        """
+        Return the pooled keep-alive HTTP client, created on first use.
+
+        Returns
+        -------
+            httpx.Client: The client, to be passed to OpenAI clients (e.g. ChatOpenAI).
+        """
+        with self._lock:
+            if self._http_client is None:
+                import httpx
+
+                self._http_client = httpx.Client(
+                    limits=httpx.Limits(
+                        max_connections=self.max_connections,
+                        max_keepalive_connections=self.max_connections,
+                    ),
+                    timeout=DEFAULT_TIMEOUT,
+                )
+            return self._http_client
+
+    def _use_pooled_client(self) -> None:
+        """Send the requests of the openai module through the pooled client, retried here."""
+        import openai
+
+        client = self.http_client()
+        if openai.http_client is not client:
+            openai.http_client = client
+            openai.max_retries = 0
+
+    def language_model(
+        self, language_model_class: Any, model: str, max_tokens: int, **kwargs: Any
+    ) -> Any:
+        """
+        Return the language model of a class, model and max_tokens, creating it only once.
+
+        Args:
+            language_model_class: The class, e.g. dspy.OpenAI.
+            model (str): The model name.
+            max_tokens (int): The maximum number of tokens to generate.
+            kwargs: Further arguments of the class, used when the model is created.
+
+        Returns
+        -------
+            dsp.LM: The language model, with its requests sent through the gateway.
+        """
+        key = (language_model_class, model, max_tokens)
+        with self._lock:
+            language_model = self._models.get(key)
+        if language_model is not None:
+            return language_model
+        if getattr(language_model_class, "__module__", "").startswith(("dsp", "dspy")):
+            self._use_pooled_client()
+        language_model = self.attach(
+            language_model_class(model=model, max_tokens=max_tokens, **kwargs)
+        )
+        with self._lock:
+            return self._models.setdefault(key, language_model)
+
+    def attach(self, language_model: Any) -> Any:
+        """
+        Send the requests of a dspy language model through the gateway.
+
+        Attaching a model twice has no effect.
+
+        Args:
+            language_model (dsp.LM): The language model.
+
+        Returns
+        -------
+            dsp.LM: The same language model.
+        """
+        if getattr(language_model, "_glossagen_gateway", None) is self:
+            return language_model
+        basic_request = language_model.basic_request
+
+        @functools.wraps(basic_request)
+        def gateway_request(prompt: str, **kwargs: Any) -> Any:
+            max_tokens = kwargs.get("max_tokens") or language_model.kwargs.get("max_tokens") or 0
+            return self.call(
+                lambda: basic_request(prompt, **kwargs),
+                tokens=estimate_tokens(prompt) + int(max_tokens),
+                key=_request_key(language_model, prompt, kwargs),
+            )
+
+        language_model.basic_request = gateway_request
+        language_model._glossagen_gateway = self
+        return language_model
+
+    def call(self, request: Callable[[], T], tokens: int, key: Optional[str] = None) -> T:
+        """
+        Send a request to the API within the rate limits.
+
+        Args:
+            request (Callable): Sends the request and returns the response.
+            tokens (int): The estimated tokens of the request, prompt and completion.
+            key (str): Identifies the request; a request with the key of one in flight waits for
+                its response instead of being sent. None never coalesces.
+
+        Returns
+        -------
+            The response; for OpenAI-style responses, the reserved tokens are corrected by the
+            reported usage.
+        """
+        if key is None:
+            return self._send(request, tokens)
+        with self._lock:
+            leader = self._in_flight.get(key)
+            if leader is None:
+                future: "Future[T]" = Future()
+                self._in_flight[key] = future
+            else:
+                self.stats["coalesced"] += 1
+        if leader is not None:
+            result: T = leader.result()
+            return result
+        try:
+            response = self._send(request, tokens)
+            future.set_result(response)
+            return response
+        except BaseException as error:
+            future.set_exception(error)
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+    def _send(self, request: Callable[[], T], tokens: int) -> T:
+        """Wait for the rate limits, send the request and retry it after rate limit errors."""
+        attempt = 0
+        while True:
+            if self.limiter.enabled:
+                with trace("lm.throttle", tokens=tokens) as span:
+                    waited = self.limiter.acquire(tokens)
+                    span.set(waited=waited)
+            else:
+                waited = 0.0
+            with self._lock:
+                self.stats["requests"] += 1
+                self.stats["waited"] += waited
+            try:
+                response = request()
+            except Exception as error:
+                if not _is_rate_limited(error) or attempt >= self.max_retries:
+                    raise
+                with self._lock:
+                    self.stats["rate_limited"] += 1
+                backoff = min(MAX_BACKOFF, self.backoff * 2**attempt) * random.uniform(1, 1.5)
+                self.limiter.pause(_retry_after(error) or backoff)
+                attempt += 1
+                continue
+            usage = (response.get("usage") if isinstance(response, dict) else None) or {}
+            if usage.get("total_tokens"):
+                self.limiter.adjust(int(usage["total_tokens"]) - tokens)
+            return response
+
+    def close(self) -> None:
+        """Close the HTTP client and forget the language models."""
+        with self._lock:
+            if self._http_client is not None:
+                self._http_client.close()
+                self._http_client = None
+            self._models.clear()
+
+
+def _limit_from_environment(name: str) -> Optional[float]:
+    """Read a rate limit from the environment, e.g. GLOSSAGEN_RPM=500."""
+    value = os.getenv(name)
+    return float(value) if value else None
+
+
+_GATEWAY: Dict[str, LMGateway] = {}
+
+
+def get_gateway() -> LMGateway:
+    """
+    Return the gateway of the process, created on first use.
+
+    The limits default to $GLOSSAGEN_RPM and $GLOSSAGEN_TPM (none if unset); see
+    configure_gateway to change them.
+
+    Returns
+    -------
+        LMGateway: The gateway.
+    """
+    gateway = _GATEWAY.get("gateway")
+    if gateway is None:
+        gateway = _GATEWAY.setdefault(
+            "gateway",
+            LMGateway(
+                _limit_from_environment("GLOSSAGEN_RPM"), _limit_from_environment("GLOSSAGEN_TPM")
+            ),
+        )
+    return gateway
+
+
+def configure_gateway(
+    requests_per_minute: Optional[float] = None,
+    tokens_per_minute: Optional[float] = None,
+    max_retries: int = DEFAULT_MAX_RETRIES,
+) -> LMGateway:
+    """
+    Set the rate limits of the gateway of the process.
+
+    The language models and the HTTP client of the gateway are kept, only the limits change.
+
+    Args:
+        requests_per_minute (float): The request limit, or None for no limit.
+        tokens_per_minute (float): The token limit, or None for no limit.
+        max_retries (int): The retries of a request after rate limit errors.
+
+    Returns
+    -------
+        LMGateway: The gateway.
+    """
+    gateway = get_gateway()
+    gateway.limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+    gateway.max_retries = max_retries
+    return gateway
@@ -0,0 +1,495 @@
+"""Batched, idempotent writes of knowledge graph documents."""
+
+import csv
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+DEFAULT_BATCH_SIZE = 100  # graph documents per write
+GRAPH_SINKS = ("neo4j", "sqlite", "csv")
+
+GRAPH_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS nodes ("
+    "id TEXT NOT NULL, type TEXT NOT NULL, properties TEXT NOT NULL DEFAULT '{}', "
+    "PRIMARY KEY (id, type))",
+    "CREATE TABLE IF NOT EXISTS relationships ("
+    "source TEXT NOT NULL, source_type TEXT NOT NULL, type TEXT NOT NULL, "
+    "target TEXT NOT NULL, target_type TEXT NOT NULL, properties TEXT NOT NULL DEFAULT '{}', "
+    "PRIMARY KEY (source, source_type, type, target, target_type))",
+    # The primary key indexes the outgoing relationships, this one the incoming ones
+    "CREATE INDEX IF NOT EXISTS relationships_target ON relationships (target, target_type)",
+)
+
+
+class GraphNode(BaseModel):
+    """A node of a knowledge graph, with the same fields as the langchain Node."""
+
+    id: str
+    type: str = "Node"
+    properties: Dict[str, Any] = {}
+
+
+class GraphRelationship(BaseModel):
+    """A relationship of a knowledge graph, with the same fields as the langchain Relationship."""
+
+    source: GraphNode
+    target: GraphNode
+    type: str
+    properties: Dict[str, Any] = {}
+
+
+class GraphDocument(BaseModel):
+    """The nodes and relationships found in a document, like the langchain GraphDocument."""
+
+    nodes: List[GraphNode]
+    relationships: List[GraphRelationship]
+    source: Optional[Any] = None
+
+
+def _cypher_name(name: str) -> str:
+    """Quote a label or relationship type for Cypher, where they cannot be parameters."""
+    return "`" + name.replace("`", "``") + "`"
+
+
+def _node_key(node: Any) -> Tuple[str, str]:
+    """Return the id and type that identify a node."""
+    return (node.id, node.type)
+
+
+def _file_name(name: str) -> str:
+    """Turn a label or relationship type into a safe part of a file name."""
+    return re.sub(r"[^A-Za-z0-9]+", "_", name).strip("_") or "unnamed"
+
+
+def _csv_value(value: Any) -> str:
+    """Write strings as is and other property values as JSON."""
+    return value if isinstance(value, str) else json.dumps(value)
+
+
+def collect_graph_elements(
+    graph_documents: Iterable[Any],
+) -> Tuple[List[GraphNode], List[GraphRelationship]]:
+    """
+    Collect the distinct nodes and relationships of graph documents.
+
+    Nodes with the same id and type, and relationships with the same ends and type, are written
+    once, with the properties of all their occurrences (later ones win).
+
+    Args:
+        graph_documents (Iterable[GraphDocument]): The documents, e.g. from an
+            LLMGraphTransformer or offline_graph_document; langchain GraphDocuments work as well.
+
+    Returns
+    -------
+        tuple[list[GraphNode], list[GraphRelationship]]: The nodes and the relationships, in
+            order of first appearance.
+    """
+    nodes: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    relationships: Dict[Tuple[Tuple[str, str], str, Tuple[str, str]], Dict[str, Any]] = {}
+    for document in graph_documents:
+        for node in document.nodes:
+            nodes.setdefault(_node_key(node), {}).update(node.properties or {})
+        for relationship in document.relationships:
+            source, target = _node_key(relationship.source), _node_key(relationship.target)
+            nodes.setdefault(source, {})
+            nodes.setdefault(target, {})
+            relationships.setdefault((source, relationship.type, target), {}).update(
+                relationship.properties or {}
+            )
+    graph_nodes = {
+        key: GraphNode(id=key[0], type=key[1], properties=properties)
+        for key, properties in nodes.items()
+    }
+    return list(graph_nodes.values()), [
+        GraphRelationship(
+            source=graph_nodes[source],
+            target=graph_nodes[target],
+            type=type_,
+            properties=properties,
+        )
+        for (source, type_, target), properties in relationships.items()
+    ]
+
+
+def merge_statements(
+    nodes: List[GraphNode], relationships: List[GraphRelationship]
+) -> List[Tuple[str, Dict[str, Any]]]:
+    """
+    Build the Cypher statements that merge nodes and relationships into a graph database.
+
+    There is one UNWIND statement per node label and per relationship type (with the labels of
+    its ends), so a batch takes a few round trips regardless of its size. Every statement uses
+    MERGE, so writing the same batch twice does not duplicate anything.
+
+    Args:
+        nodes (list[GraphNode]): The nodes, with id, type and properties.
+        relationships (list[GraphRelationship]): The relationships, with source, target, type
+            and properties.
+
+    Returns
+    -------
+        list[tuple[str, dict]]: The statements and their parameters; nodes come first.
+    """
+    node_rows: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    for node in nodes:
+        node_rows[node.type].append({"id": node.id, "properties": node.properties})
+    relationship_rows: Dict[Tuple[str, str, str], List[Dict[str, Any]]] = defaultdict(list)
+    for relationship in relationships:
+        key = (relationship.source.type, relationship.type, relationship.target.type)
+        relationship_rows[key].append(
+            {
+                "source": relationship.source.id,
+                "target": relationship.target.id,
+                "properties": relationship.properties,
+            }
+        )
+
+    statements = [
+        (
+            f"UNWIND $rows AS row MERGE (n:{_cypher_name(label)} {{id: row.id}}) "
+            "SET n += row.properties",
+            {"rows": rows},
+        )
+        for label, rows in node_rows.items()
+    ]
+    statements.extend(
+        (
+            f"UNWIND $rows AS row "
+            f"MERGE (s:{_cypher_name(source)} {{id: row.source}}) "
+            f"MERGE (t:{_cypher_name(target)} {{id: row.target}}) "
+            f"MERGE (s)-[r:{_cypher_name(relationship_type)}]->(t) SET r += row.properties",
+            {"rows": rows},
+        )
+        for (source, relationship_type, target), rows in relationship_rows.items()
+    )
+    return statements
+
+
+def write_graph_batch(graph: Any, graph_documents: Iterable[Any]) -> Tuple[int, int]:
+    """
+    Merge a batch of graph documents into a graph in a few bulk statements.
+
+    Graph sinks (and anything else with a merge_batch(nodes, relationships) method, e.g.
+    InMemoryGraph) receive the collected elements directly; any other graph (e.g. a
+    Neo4jGraph) has to provide query(cypher, params), which runs the statements of
+    merge_statements.
+
+    Args:
+        graph: The graph sink or database.
+        graph_documents (Iterable[GraphDocument]): The documents of the batch.
+
+    Returns
+    -------
+        tuple[int, int]: The number of distinct nodes and relationships written.
+    """
+    nodes, relationships = collect_graph_elements(graph_documents)
+    merge_batch = getattr(graph, "merge_batch", None)
+    if merge_batch is not None:
+        merge_batch(nodes, relationships)
+    else:
+        for cypher, params in merge_statements(nodes, relationships):
+            graph.query(cypher, params)
+    return len(nodes), len(relationships)
+
+
+class GraphSink:
+    """A backend that receives the merged nodes and relationships of a knowledge graph."""
+
+    def merge_batch(self, nodes: List[GraphNode], relationships: List[GraphRelationship]) -> None:
+        """
+        Merge a batch into the graph, in one write.
+
+        Merging has to be idempotent: nodes are identified by id and type and relationships by
+        their ends and type, and the properties of a later write win.
+
+        Args:
+            nodes (list[GraphNode]): The distinct nodes of the batch.
+            relationships (list[GraphRelationship]): The distinct relationships of the batch.
+        """
+
+    def close(self) -> None:
+        """Flush and release the backend."""
+
+
+class Neo4jSink(GraphSink):
+    """Merge batches into a Neo4j database, with the statements of merge_statements."""
+
+    def __init__(
+        self,
+        url: Optional[str] = None,
+        username: Optional[str] = None,
+        password: Optional[str] = None,
+        graph: Optional[Any] = None,
+    ):
+        """
+        Connect to the database.
+
+        Args:
+            url (str): The URI of the database. Defaults to $NEO4J_URI, which may be set in the
+                .env file like the credentials.
+            username (str): The user. Defaults to $NEO4J_USERNAME.
+            password (str): The password. Defaults to $NEO4J_PASSWORD.
+            graph: An existing Neo4jGraph (or anything with query(cypher, params)) to use instead
+                of connecting.
+        """
+        if graph is None:
+            from dotenv import load_dotenv
+            from langchain_community.graphs import Neo4jGraph
+
+            load_dotenv()
+            graph = Neo4jGraph(
+                url=url or os.getenv("NEO4J_URI"),
+                username=username or os.getenv("NEO4J_USERNAME"),
+                password=password or os.getenv("NEO4J_PASSWORD"),
+            )
+        self.graph = graph
+
+    def merge_batch(self, nodes: List[GraphNode], relationships: List[GraphRelationship]) -> None:
+        """Run one UNWIND/MERGE statement per node label and relationship type."""
+        for cypher, params in merge_statements(nodes, relationships):
+            self.graph.query(cypher, params)
+
+
+class SqliteGraphSink(GraphSink):
+    """
+    An embedded graph store: SQLite adjacency tables of nodes and relationships.
+
+    Every batch is merged in a single transaction with upserts, so no server is needed and
+    loading is limited by the disk rather than by round trips. The store can be queried
+    directly (neighbors) or exported for neo4j-admin import (export_csv).
+
+    Attributes
+    ----------
+        path (str): The path of the database file.
+    """
+
+    def __init__(self, path: str):
+        """
+        Open (and create if necessary) the store.
+
+        Args:
+            path (str): The database file, or ":memory:".
+        """
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            for statement in GRAPH_SCHEMA:
+                self._connection.execute(statement)
+
+    def merge_batch(self, nodes: List[GraphNode], relationships: List[GraphRelationship]) -> None:
+        """Upsert the nodes and relationships in one transaction."""
+        node_rows = [(node.id, node.type, json.dumps(node.properties)) for node in nodes]
+        relationship_rows = [
+            (
+                relationship.source.id,
+                relationship.source.type,
+                relationship.type,
+                relationship.target.id,
+                relationship.target.type,
+                json.dumps(relationship.properties),
+            )
+            for relationship in relationships
+        ]
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT INTO nodes (id, type, properties) VALUES (?, ?, ?) "
+                "ON CONFLICT (id, type) DO UPDATE "
+                "SET properties = json_patch(properties, excluded.properties)",
+                node_rows,
+            )
+            self._connection.executemany(
+                "INSERT INTO relationships "
+                "(source, source_type, type, target, target_type, properties) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (source, source_type, type, target, target_type) DO UPDATE "
+                "SET properties = json_patch(properties, excluded.properties)",
+                relationship_rows,
+            )
+
+    def neighbors(
+        self, node_id: str, node_type: Optional[str] = None
+    ) -> List[Tuple[str, str, str]]:
+        """
+        Find the relationships of a node, in both directions.
+
+        Args:
+            node_id (str): The id of the node.
+            node_type (str): The type of the node, or None for nodes of any type with that id.
+
+        Returns
+        -------
+            list[tuple[str, str, str]]: The (source, type, target) of every relationship.
+        """
+        condition = "" if node_type is None else " AND {end}_type = ?"
+        parameters = (node_id,) if node_type is None else (node_id, node_type)
+        query = "SELECT source, type, target FROM relationships WHERE {end} = ?" + condition
+        with self._lock:
+            rows = self._connection.execute(
+                query.format(end="source") + " UNION " + query.format(end="target"),
+                parameters + parameters,
+            ).fetchall()
+        return [tuple(row) for row in rows]
+
+    def counts(self) -> Tuple[int, int]:
+        """Return the numbers of nodes and relationships."""
+        with self._lock:
+            (nodes,) = self._connection.execute("SELECT COUNT(*) FROM nodes").fetchone()
+            (relationships,) = self._connection.execute(
+                "SELECT COUNT(*) FROM relationships"
+            ).fetchone()
+        return int(nodes), int(relationships)
+
+    def export_csv(self, directory: str) -> List[str]:
+        """
+        Export the graph as CSV files for `neo4j-admin database import full`.
+
+        There is one node file per label, with the ids in an ID space per label, and one
+        relationship file per relationship type and labels of its ends. Every property becomes
+        a column (strings as is, other values as JSON).
+
+        Args:
+            directory (str): The directory of the CSV files.
+
+        Returns
+        -------
+            list[str]: The --nodes and --relationships arguments of neo4j-admin, relative to
+                the directory.
+        """
+        os.makedirs(directory, exist_ok=True)
+        arguments = []
+        with self._lock:
+            labels = self._connection.execute(
+                "SELECT DISTINCT type FROM nodes ORDER BY type"
+            ).fetchall()
+            for index, (label,) in enumerate(labels):
+                name = f"nodes_{index}_{_file_name(label)}.csv"
+                self._export_table(
+                    os.path.join(directory, name),
+                    [f"id:ID({label})", ":LABEL"],
+                    "SELECT id, ?, properties FROM nodes WHERE type = ?",
+                    (label, label),
+                )
+                arguments.append(f"--nodes={name}")
+
+            types = self._connection.execute(
+                "SELECT DISTINCT source_type, type, target_type FROM relationships "
+                "ORDER BY source_type, type, target_type"
+            ).fetchall()
+            for index, (source, relationship_type, target) in enumerate(types):
+                name = f"relationships_{index}_{_file_name(relationship_type)}.csv"
+                self._export_table(
+                    os.path.join(directory, name),
+                    [f":START_ID({source})", f":END_ID({target})", ":TYPE"],
+                    "SELECT source, target, type, properties FROM relationships "
+                    "WHERE source_type = ? AND type = ? AND target_type = ?",
+                    (source, relationship_type, target),
+                )
+                arguments.append(f"--relationships={name}")
+        return arguments
+
+    def _export_table(
+        self, path: str, columns: List[str], query: str, parameters: Tuple[str, ...]
+    ) -> None:
+        """
+        Stream the rows of a query to a CSV file, with a column for every property.
+
+        The query has to select the values of the fixed columns and then the properties.
+        """
+        # The id column of nodes is also their id property
+        keys = [
+            key
+            for (key,) in self._connection.execute(
+                f"SELECT DISTINCT key FROM ({query}) AS selected, "
+                "json_each(selected.properties) WHERE key != 'id' ORDER BY key",
+                parameters,
+            )
+        ]
+        with open(path, "w", encoding="utf-8", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(columns + keys)
+            for *values, encoded in self._connection.execute(query, parameters):
+                properties = json.loads(encoded)
+                writer.writerow(
+                    values
+                    + [_csv_value(properties[key]) if key in properties else "" for key in keys]
+                )
+
+    def close(self) -> None:
+        """Close the underlying database connection."""
+        with self._lock:
+            self._connection.close()
+
+
+class CsvGraphSink(GraphSink):
+    """
+    Write the graph as CSV files for neo4j-admin import, the fastest way to load a large graph.
+
+    Batches are merged into a temporary SqliteGraphSink, so that the files contain every node
+    and relationship once (neo4j-admin rejects duplicate ids) with the columns of all their
+    properties; the files are written on close.
+
+    Attributes
+    ----------
+        directory (str): The directory of the CSV files.
+        arguments (list[str]): The arguments of neo4j-admin, once the sink is closed.
+    """
+
+    def __init__(self, directory: str):
+        """
+        Create the staging store.
+
+        Args:
+            directory (str): The directory of the CSV files.
+        """
+        self.directory = directory
+        self.arguments: List[str] = []
+        self._staging = tempfile.TemporaryDirectory(prefix="glossagen-graph-")
+        self._store = SqliteGraphSink(os.path.join(self._staging.name, "graph.sqlite"))
+
+    def merge_batch(self, nodes: List[GraphNode], relationships: List[GraphRelationship]) -> None:
+        """Merge the batch into the staging store."""
+        self._store.merge_batch(nodes, relationships)
+
+    def close(self) -> None:
+        """Write the CSV files and remove the staging store."""
+        self.arguments = self._store.export_csv(self.directory)
+        self._store.close()
+        self._staging.cleanup()
+
+
+def make_graph_sink(kind: str, path: Optional[str] = None) -> GraphSink:
+    """
+    Create a graph sink with one of the built-in backends.
+
+    Args:
+        kind (str): "neo4j" (the database of $NEO4J_URI), "sqlite" (embedded store) or "csv"
+            (files for neo4j-admin import).
+        path (str): The SQLite file (default: knowledge_graph.sqlite) or the CSV directory
+            (default: knowledge_graph_csv).
+
+    Returns
+    -------
+        GraphSink: The sink; close it when the graph is complete.
+
+    Raises
+    ------
+        ValueError: If kind is not one of GRAPH_SINKS.
+    """
+    if kind == "neo4j":
+        return Neo4jSink()
+    if kind == "sqlite":
+        return SqliteGraphSink(path or "knowledge_graph.sqlite")
+    if kind == "csv":
+        return CsvGraphSink(path or "knowledge_graph_csv")
+    raise ValueError(f"kind must be one of {', '.join(GRAPH_SINKS)}, got {kind!r}.")
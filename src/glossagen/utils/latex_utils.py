@@ -0,0 +1,577 @@
+"""Single-pass, streaming extraction of the text of LaTeX projects."""
+
+import os
+import re
+import threading
+import unicodedata
+from collections import OrderedDict, deque
+from typing import Deque, Dict, Iterator, List, Optional, Tuple
+
+from glossagen.utils.segment_utils import Segment, TextBlock, iter_block_segments
+
+# One token per command (\name, \name* or a control symbol like \%), comment, paragraph break
+# (blank line), run of plain text, line break or special character
+TOKEN = re.compile(
+    r"(?P<command>\\(?:[A-Za-z@]+\*?|[\s\S]))"
+    r"|(?P<comment>%[^\n]*)"
+    r"|(?P<paragraph>\n[ \t]*(?:\n[ \t]*)+)"
+    r"|(?P<text>[^\\%{}$~\n]+|\n)"
+    r"|(?P<special>[{}$~])"
+)
+LIGATURE = re.compile(r"---|--|``|''")
+LIGATURES = {"---": "—", "--": "–", "``": "“", "''": "”"}
+PARAMETER = re.compile(r"#(\d)")
+# A space left before punctuation by a dropped command, e.g. "porous \cite{key}."
+DROPPED_SPACE = re.compile(r" (?=[.,;:!?)\]])")
+OPTIONAL_END = re.compile(r"\]")
+
+DEFAULT_MAX_FILES = 256  # files kept by a LatexFileCache
+MAX_INCLUDE_DEPTH = 32
+MAX_MACRO_EXPANSIONS = 100000  # per document, against recursive definitions
+
+SECTIONING = ("part", "chapter", "section", "subsection", "subsubsection", "paragraph")
+INCLUDES = ("input", "include", "subfile")
+MACRO_DEFINITIONS = ("newcommand", "renewcommand", "providecommand")
+# Environments without text worth a glossary; their contents are skipped, nested ones included
+SKIPPED_ENVIRONMENTS = frozenset(
+    (
+        "figure table wrapfigure sidewaysfigure sidewaystable tabular tabularx longtable "
+        "equation align alignat gather multline eqnarray flalign displaymath math "
+        "tikzpicture picture thebibliography titlepage"
+    ).split()
+)
+# Environments whose contents are not LaTeX, skipped up to the matching \end
+VERBATIM_ENVIRONMENTS = frozenset(
+    "verbatim Verbatim lstlisting minted comment pycode pyblock pyverbatim pyconsole".split()
+)
+HEADING_ENVIRONMENTS = {"abstract": "Abstract"}
+# Commands whose arguments are not text, with the number of their mandatory arguments
+DROPPED_ARGUMENTS = {
+    "label": 1,
+    "ref": 1,
+    "eqref": 1,
+    "autoref": 1,
+    "cref": 1,
+    "Cref": 1,
+    "pageref": 1,
+    "cite": 1,
+    "citep": 1,
+    "citet": 1,
+    "citealp": 1,
+    "citeauthor": 1,
+    "citeyear": 1,
+    "nocite": 1,
+    "includegraphics": 1,
+    "includeonly": 1,
+    "usepackage": 1,
+    "documentclass": 1,
+    "bibliographystyle": 1,
+    "bibliography": 1,
+    "addbibresource": 1,
+    "graphicspath": 1,
+    "url": 1,
+    "vspace": 1,
+    "hspace": 1,
+    "pagestyle": 1,
+    "thispagestyle": 1,
+    "hypersetup": 1,
+    "geometry": 1,
+    "href": 1,  # the URL; the link text stays
+    "setlength": 2,
+    "setcounter": 2,
+    "addtocounter": 2,
+    "definecolor": 3,
+    "newenvironment": 3,
+    "renewenvironment": 3,
+}
+LITERALS = {
+    "LaTeX": "LaTeX",
+    "TeX": "TeX",
+    "ldots": "...",
+    "dots": "...",
+    "textdegree": "°",
+    "degree": "°",
+    "times": "×",
+    "pm": "±",
+    "cdot": "·",
+    "sim": "~",
+    "approx": "≈",
+    "leq": "≤",
+    "geq": "≥",
+    "le": "≤",
+    "ge": "≥",
+    "rightarrow": "→",
+    "to": "→",
+    "AA": "Å",
+    "i": "ı",
+    "ss": "ß",
+    "textendash": "–",
+    "textemdash": "—",
+}
+GREEK_LETTERS = frozenset(
+    "alpha beta gamma delta epsilon zeta eta theta iota kappa lambda mu nu xi pi rho sigma "
+    "tau upsilon phi chi psi omega".split()
+)
+CONTROL_SYMBOLS = {
+    "\\": " ",
+    " ": " ",
+    "\n": " ",
+    ",": " ",
+    ";": " ",
+    ":": " ",
+    "!": "",
+    "-": "",
+    "/": "",
+    "@": "",
+    "%": "%",
+    "&": "&",
+    "#": "#",
+    "_": "_",
+    "$": "$",
+    "{": "{",
+    "}": "}",
+}
+ACCENTS = {"'": "́", "`": "̀", '"': "̈", "^": "̂", "~": "̃"}
+
+Token = Tuple[str, str]
+_HEADING_END: Token = ("heading_end", "")
+
+
+class LatexFileCache:
+    """
+    The contents of LaTeX files by path, read again only when a file changes.
+
+    Files included by several documents, e.g. shared preambles or macros of the chapters of a
+    thesis, are read from disk once.
+    """
+
+    def __init__(self, max_files: int = DEFAULT_MAX_FILES):
+        """
+        Create an empty cache.
+
+        Args:
+            max_files (int): The maximum number of files kept; the least recently used ones
+                are dropped first.
+        """
+        self.max_files = max_files
+        self._files: "OrderedDict[str, Tuple[Tuple[int, int], str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def read(self, path: str) -> str:
+        """
+        Return the text of a file.
+
+        Args:
+            path (str): The path of the file.
+
+        Returns
+        -------
+            str: The text, decoded as UTF-8 (undecodable bytes are replaced).
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        version = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            cached = self._files.get(path)
+            if cached is not None and cached[0] == version:
+                self._files.move_to_end(path)
+                return cached[1]
+        with open(path, encoding="utf-8", errors="replace") as file:
+            text = file.read()
+        with self._lock:
+            self._files[path] = (version, text)
+            self._files.move_to_end(path)
+            while len(self._files) > self.max_files:
+                self._files.popitem(last=False)
+        return text
+
+
+_FILE_CACHE = LatexFileCache()
+
+
+def _tokenize(text: str) -> Iterator[Token]:
+    """Split LaTeX source into (kind, text) tokens, lazily."""
+    for match in TOKEN.finditer(text):
+        yield match.lastgroup or "text", match.group()
+
+
+def _plain(tokens: List[Token]) -> str:
+    """Return the text of tokens, e.g. the name of an environment or file."""
+    return "".join(value for kind, value in tokens if kind != "comment").strip()
+
+
+def _greek(name: str) -> Optional[str]:
+    r"""Return the Greek letter of a command like \alpha or \Delta."""
+    if name.lower() not in GREEK_LETTERS:
+        return None
+    case = "CAPITAL" if name[0].isupper() else "SMALL"
+    try:
+        return unicodedata.lookup(f"GREEK {case} LETTER {name.upper()}")
+    except KeyError:
+        return None
+
+
+class LatexTokenizer:
+    r"""
+    Turn a LaTeX project into paragraph and heading blocks in a single pass.
+
+    The root file is tokenized lazily with one precompiled pattern; \input, \include and
+    \subfile are resolved relative to the root file and tokenized in place. Only the text
+    between \begin{document} and \end{document} is kept (all of it if the root file has no
+    document environment), and:
+
+    - sectioning commands and the abstract become heading blocks;
+    - figures, tables, display math and other SKIPPED_ENVIRONMENTS are skipped, however deeply
+      their environments are nested, as are verbatim-like environments;
+    - macros defined with \newcommand or \def are expanded, with their arguments;
+    - the arguments of references, citations and other DROPPED_ARGUMENTS are dropped, while
+      the arguments of any other command (e.g. \emph) are kept as text;
+    - inline math is kept as plain text, e.g. $\mathrm{CO}_2$ becomes CO2.
+
+    Attributes
+    ----------
+        path (str): The root file of the project.
+        cache (LatexFileCache): The cache the files are read from.
+    """
+
+    def __init__(self, path: str, cache: Optional[LatexFileCache] = None):
+        """
+        Initialize a LatexTokenizer object.
+
+        Args:
+            path (str): The root file of the project.
+            cache (LatexFileCache): The file cache; defaults to one shared by the process.
+        """
+        self.path = path
+        self.cache = cache or _FILE_CACHE
+        self._directory = os.path.dirname(os.path.abspath(path))
+        self._pending: Deque[Token] = deque()
+        self._sources: List[Tuple[Optional[str], Iterator[Token]]] = []
+        self._macros: Dict[str, Tuple[int, List[Token]]] = {}
+        self._expansions = 0
+        self._capture = True
+        self._math = False
+        self._words: List[str] = []
+        self._offset = 0
+
+    def _next(self) -> Optional[Token]:
+        """Return the next token, from pushed back tokens, included files and the root file."""
+        if self._pending:
+            return self._pending.popleft()
+        while self._sources:
+            token = next(self._sources[-1][1], None)
+            if token is not None:
+                return token
+            self._sources.pop()
+        return None
+
+    def _push(self, tokens: List[Token]) -> None:
+        """Make tokens the next ones to be read."""
+        self._pending.extendleft(reversed(tokens))
+
+    def _read_group(self) -> List[Token]:
+        """Read the tokens up to the brace closing the one just read."""
+        tokens = []
+        depth = 1
+        while (token := self._next()) is not None:
+            if token == ("special", "{"):
+                depth += 1
+            elif token == ("special", "}"):
+                depth -= 1
+                if depth == 0:
+                    break
+            tokens.append(token)
+        return tokens
+
+    def _read_argument(self) -> List[Token]:
+        """Read a mandatory argument: a braced group, a command or a single character."""
+        while (token := self._next()) is not None:
+            kind, value = token
+            if kind == "comment" or (kind == "text" and not value.strip()):
+                continue
+            if token == ("special", "{"):
+                return self._read_group()
+            if kind == "text":
+                value = value.lstrip()
+                if len(value) > 1:
+                    self._push([("text", value[1:])])
+                return [("text", value[0])]
+            return [token]
+        return []
+
+    def _read_optional(self) -> Optional[List[Token]]:
+        """Read an optional [argument], if the next token starts one."""
+        token = self._next()
+        if token is None:
+            return None
+        kind, value = token
+        if kind != "text" or not value.lstrip(" \t").startswith("["):
+            self._push([token])
+            return None
+        tokens: List[Token] = []
+        value = value.lstrip(" \t")[1:]
+        while True:
+            if kind == "text" and (match := OPTIONAL_END.search(value)) is not None:
+                tokens.append(("text", value[: match.start()]))
+                if value[match.end() :]:
+                    self._push([("text", value[match.end() :])])
+                return tokens
+            tokens.append((kind, value))
+            token = self._next()
+            if token is None:
+                return tokens
+            kind, value = token
+
+    def _include(self, name: str, clear_page: bool) -> None:
+        """Continue with the tokens of an included file."""
+        path = os.path.join(self._directory, name)
+        if not os.path.isfile(path) and os.path.isfile(path + ".tex"):
+            path += ".tex"
+        path = os.path.abspath(path)
+        active = [source for source, _ in self._sources if source is not None]
+        if not os.path.isfile(path):
+            print(f"LaTeX include not found: {name} (in {self.path})")
+            return
+        if path in active or len(active) >= MAX_INCLUDE_DEPTH:
+            return
+        if clear_page:
+            self._push([("paragraph", "\n\n")])
+        # Tokens pushed back (e.g. of a macro expansion) come after the included file
+        if self._pending:
+            self._sources.append((None, iter(list(self._pending))))
+            self._pending.clear()
+        self._sources.append((path, _tokenize(self.cache.read(path))))
+
+    def _define_macro(self, command: str) -> None:
+        r"""Record a macro defined with \newcommand or \def."""
+        if command == "def":
+            name_token = self._next()
+            parameters = 0
+            while (token := self._next()) is not None and token != ("special", "{"):
+                parameters += len(PARAMETER.findall(token[1]))
+            body = self._read_group()
+        else:
+            argument = self._read_argument()
+            name_token = argument[0] if argument else None
+            count = self._read_optional()
+            parameters = int(_plain(count)) if count and _plain(count).isdigit() else 0
+            self._read_optional()  # the default of the first argument
+            body = self._read_argument()
+        if name_token is None or name_token[0] != "command":
+            return
+        name = name_token[1][1:]
+        if command != "providecommand" or name not in self._macros:
+            self._macros[name] = (parameters, body)
+
+    def _expand_macro(self, name: str) -> None:
+        """Replace a macro by its body, with the parameters replaced by the arguments."""
+        parameters, body = self._macros[name]
+        arguments = [self._read_argument() for _ in range(parameters)]
+        self._expansions += 1
+        if self._expansions > MAX_MACRO_EXPANSIONS:
+            return
+        expansion: List[Token] = []
+        for kind, value in body:
+            if kind != "text" or "#" not in value:
+                expansion.append((kind, value))
+                continue
+            for index, part in enumerate(PARAMETER.split(value)):
+                if index % 2 == 0:
+                    expansion.append(("text", part))
+                elif 0 < int(part) <= len(arguments):
+                    expansion.extend(arguments[int(part) - 1])
+        self._push(expansion)
+
+    def _skip_environment(self, name: str) -> None:
+        """Skip to the end of an environment, including the environments nested in it."""
+        verbatim = name.rstrip("*") in VERBATIM_ENVIRONMENTS
+        depth = 1
+        while (token := self._next()) is not None:
+            if token == ("command", "\\begin") and not verbatim:
+                self._read_argument()
+                depth += 1
+            elif token == ("command", "\\end"):
+                if verbatim:
+                    if _plain(self._read_argument()) == name:
+                        return
+                    continue
+                self._read_argument()
+                depth -= 1
+                if depth == 0:
+                    return
+
+    def _skip_until(self, closing: List[Token]) -> None:
+        r"""Skip display math up to its closing tokens, e.g. $$ or \]."""
+        matched = 0
+        while (token := self._next()) is not None:
+            matched = matched + 1 if token == closing[matched] else int(token == closing[0])
+            if matched == len(closing):
+                return
+
+    def _text(self, value: str) -> None:
+        """Append plain text, without sub- and superscript marks in math."""
+        if self._math:
+            self._emit(value.replace("^", "").replace("_", ""))
+        else:
+            self._emit(LIGATURE.sub(lambda match: LIGATURES[match.group()], value))
+
+    def _dollar(self) -> None:
+        """Toggle inline math at a $, or skip display math at $$."""
+        following = self._next()
+        if following == ("special", "$"):
+            self._skip_until([("special", "$"), ("special", "$")])
+            return
+        self._math = not self._math
+        if following is not None:
+            self._push([following])
+
+    def _flush(self, is_heading: bool = False) -> Optional[TextBlock]:
+        """End the current paragraph or heading and return it as a block, if it has text."""
+        text = " ".join(unicodedata.normalize("NFC", "".join(self._words)).split())
+        text = DROPPED_SPACE.sub("", text)
+        self._words = []
+        if not text:
+            return None
+        block = TextBlock(text=text + "\n\n", start=self._offset, is_heading=is_heading)
+        self._offset += len(block.text)
+        return block
+
+    def _emit(self, text: str) -> None:
+        """Append text to the current paragraph, if it is in the document body."""
+        if self._capture:
+            self._words.append(text)
+
+    def _command(self, value: str) -> Tuple[bool, Optional[TextBlock]]:
+        """
+        Handle a command token.
+
+        Returns
+        -------
+            tuple[bool, TextBlock]: Whether the document ended, and the block completed by the
+                command, if any.
+        """
+        name = value[1:]
+        if not name[:1].isalpha():
+            return self._control_symbol(name)
+        base = name.rstrip("*")
+        if name in self._macros:
+            self._expand_macro(name)
+        elif base in ("begin", "end"):
+            return self._environment(base, _plain(self._read_argument()))
+        elif base in SECTIONING:
+            self._read_optional()
+            block = self._flush()
+            self._push(self._read_argument() + [_HEADING_END])
+            return False, block
+        elif base in INCLUDES:
+            self._include(_plain(self._read_argument()), clear_page=base == "include")
+        elif base in MACRO_DEFINITIONS or base == "def":
+            self._define_macro(base)
+        elif base == "item":
+            block = self._flush()
+            self._push(self._read_optional() or [])
+            return False, block
+        elif base in DROPPED_ARGUMENTS:
+            for _ in range(DROPPED_ARGUMENTS[base]):
+                self._read_optional()
+                self._read_argument()
+        elif name in LITERALS:
+            self._emit(LITERALS[name])
+        elif (letter := _greek(name)) is not None:
+            self._emit(letter)
+        return False, None
+
+    def _control_symbol(self, symbol: str) -> Tuple[bool, Optional[TextBlock]]:
+        """Handle a command consisting of a backslash and one other character."""
+        if symbol == "[":
+            self._skip_until([("command", "\\]")])
+        elif symbol in "()":
+            self._math = symbol == "("
+        elif symbol in ACCENTS:
+            self._push(self._read_argument() + [("text", ACCENTS[symbol])])
+        elif symbol == "\\":
+            self._read_optional()  # e.g. \\[2pt]
+            self._emit(" ")
+        else:
+            self._emit(CONTROL_SYMBOLS.get(symbol, ""))
+        return False, None
+
+    def _environment(self, command: str, name: str) -> Tuple[bool, Optional[TextBlock]]:
+        r"""Handle \begin{name} and \end{name}."""
+        if name == "document":
+            self._capture = command == "begin"
+            return command == "end", self._flush()
+        if command == "begin" and name.rstrip("*") in SKIPPED_ENVIRONMENTS | VERBATIM_ENVIRONMENTS:
+            self._skip_environment(name)
+            return False, None
+        block = self._flush()
+        if command == "begin" and name in HEADING_ENVIRONMENTS:
+            self._push([("text", HEADING_ENVIRONMENTS[name]), _HEADING_END])
+        return False, block
+
+    def blocks(self) -> Iterator[TextBlock]:
+        """
+        Tokenize the project.
+
+        Yields
+        ------
+            TextBlock: The paragraphs and headings in document order; their texts end with a
+                blank line and concatenate to the document text.
+        """
+        text = self.cache.read(self.path)
+        self._capture = "\\begin{document}" not in text
+        self._sources = [(os.path.abspath(self.path), _tokenize(text))]
+        while (token := self._next()) is not None:
+            kind, value = token
+            block = None
+            if kind == "text":
+                self._text(value)
+            elif kind == "paragraph":
+                block = self._flush()
+            elif token == _HEADING_END:
+                block = self._flush(is_heading=True)
+            elif value == "~":
+                self._emit(" ")
+            elif value == "$":
+                self._dollar()
+            elif kind == "command":
+                ended, block = self._command(value)
+                if ended:
+                    if block is not None:
+                        yield block
+                    return
+            if block is not None:
+                yield block
+        if (block := self._flush()) is not None:
+            yield block
+
+
+def iter_latex_blocks(path: str, cache: Optional[LatexFileCache] = None) -> Iterator[TextBlock]:
+    """
+    Stream the paragraphs and headings of a LaTeX project, see LatexTokenizer.
+
+    Args:
+        path (str): The root .tex file.
+        cache (LatexFileCache): The file cache; defaults to one shared by the process.
+
+    Yields
+    ------
+        TextBlock: The blocks in document order.
+    """
+    return LatexTokenizer(path, cache).blocks()
+
+
+def iter_latex_segments(path: str, target_size: int, overlap: int = 0) -> Iterator[Segment]:
+    """
+    Stream the segments of a LaTeX project without holding its text in memory.
+
+    Args:
+        path (str): The root .tex file.
+        target_size (int): The maximum length of a segment in characters.
+        overlap (int): The maximum overlap between consecutive segments in characters.
+
+    Yields
+    ------
+        Segment: The segments in document order, cut at headings and paragraphs.
+    """
+    return iter_block_segments(iter_latex_blocks(path), target_size, overlap)
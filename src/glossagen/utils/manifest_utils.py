@@ -0,0 +1,194 @@
+"""Append-only job manifest that makes corpus runs resumable."""
+
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel
+
+HASH_BLOCK_SIZE = 1 << 20
+
+
+def file_hash(path: str) -> str:
+    """
+    Compute the SHA-256 hash of a file's content.
+
+    Args:
+        path (str): The path of the file.
+
+    Returns
+    -------
+        str: The hex digest of the file content.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def config_hash(config: Dict[str, Any]) -> str:
+    """
+    Compute a hash of a run configuration.
+
+    Args:
+        config (dict): The JSON-serializable settings that determine the results of a run.
+
+    Returns
+    -------
+        str: The hex digest of the configuration.
+    """
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class PaperState(BaseModel):
+    """The progress of one paper as recorded in the manifest."""
+
+    file_hash: str
+    config_hash: str
+    num_chunks: int
+    chunks: Dict[int, List[Dict[str, Any]]] = {}
+    output_path: Optional[str] = None
+
+    @property
+    def done(self) -> bool:
+        """Whether the glossary of the paper has been written."""
+        return self.output_path is not None
+
+
+class JobManifest:
+    """
+    A journal of the papers and chunks completed by a corpus run.
+
+    Every event is appended as one JSON line and flushed to disk immediately, so a run that is
+    killed loses at most the chunks in flight. Opening the manifest replays the journal. A paper
+    is identified by its path and is only reused if its file hash and the run configuration are
+    unchanged.
+
+    Attributes
+    ----------
+        path (str): The path of the journal file.
+        papers (dict[str, PaperState]): The latest state of every recorded paper.
+    """
+
+    def __init__(self, path: str):
+        """
+        Open a manifest, replaying the existing journal if there is one.
+
+        Args:
+            path (str): The path of the journal file.
+        """
+        self.path = path
+        self.papers: Dict[str, PaperState] = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            self._replay()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+
+    def _replay(self) -> None:
+        """Rebuild the paper states from the journal, ignoring a truncated last line."""
+        with open(self.path, encoding="utf-8") as file:
+            for line in file:
+                try:
+                    event = json.loads(line)
+                except json.JSONDecodeError:  # the run was killed while writing this line
+                    continue
+                self._apply(event)
+
+    def _apply(self, event: Dict[str, Any]) -> None:
+        """Update the paper states with one journal event."""
+        paper = event["paper"]
+        if event["event"] == "start":
+            self.papers[paper] = PaperState(
+                file_hash=event["file_hash"],
+                config_hash=event["config_hash"],
+                num_chunks=event["num_chunks"],
+            )
+        elif paper in self.papers and event["event"] == "chunk":
+            self.papers[paper].chunks[event["index"]] = event["entries"]
+        elif paper in self.papers and event["event"] == "done":
+            self.papers[paper].output_path = event["output_path"]
+
+    def _append(self, event: Dict[str, Any]) -> None:
+        """Apply an event and write it durably to the journal."""
+        with self._lock:
+            self._apply(event)
+            self._file.write(json.dumps(event) + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def lookup(self, paper: str, paper_hash: str, run_config_hash: str) -> Optional[PaperState]:
+        """
+        Return the recorded state of a paper if it belongs to the same file and configuration.
+
+        Args:
+            paper (str): The path of the paper.
+            paper_hash (str): The current hash of the paper file.
+            run_config_hash (str): The hash of the current run configuration.
+
+        Returns
+        -------
+            PaperState: The reusable state, or None if the paper has to be processed afresh.
+        """
+        state = self.papers.get(paper)
+        if state is None or (state.file_hash, state.config_hash) != (paper_hash, run_config_hash):
+            return None
+        return state
+
+    def start_paper(
+        self, paper: str, paper_hash: str, run_config_hash: str, num_chunks: int
+    ) -> None:
+        """Record that a paper is processed afresh, discarding earlier chunk results."""
+        self._append(
+            {
+                "event": "start",
+                "paper": paper,
+                "file_hash": paper_hash,
+                "config_hash": run_config_hash,
+                "num_chunks": num_chunks,
+            }
+        )
+
+    def record_chunk(self, paper: str, index: int, entries: List[Dict[str, Any]]) -> None:
+        """Record the extracted entries of a completed chunk."""
+        self._append({"event": "chunk", "paper": paper, "index": index, "entries": entries})
+
+    def finish_paper(self, paper: str, output_path: str) -> None:
+        """Record that the glossary of a paper has been written."""
+        self._append({"event": "done", "paper": paper, "output_path": output_path})
+
+    def compact(self) -> None:
+        """Rewrite the journal with only the current state of every paper."""
+        with self._lock:
+            temporary_path = self.path + ".tmp"
+            with open(temporary_path, "w", encoding="utf-8") as file:
+                for paper, state in self.papers.items():
+                    events: List[Dict[str, Any]] = [
+                        {
+                            "event": "start",
+                            "paper": paper,
+                            "file_hash": state.file_hash,
+                            "config_hash": state.config_hash,
+                            "num_chunks": state.num_chunks,
+                        }
+                    ]
+                    events.extend(
+                        {"event": "chunk", "paper": paper, "index": index, "entries": entries}
+                        for index, entries in sorted(state.chunks.items())
+                    )
+                    if state.output_path is not None:
+                        events.append(
+                            {"event": "done", "paper": paper, "output_path": state.output_path}
+                        )
+                    file.writelines(json.dumps(event) + "\n" for event in events)
+            self._file.close()
+            os.replace(temporary_path, self.path)
+            self._file = open(self.path, "a", encoding="utf-8")
+
+    def close(self) -> None:
+        """Close the journal file."""
+        with self._lock:
+            self._file.close()
@@ -0,0 +1,230 @@
+"""Optional, non-blocking experiment logging with pluggable backends."""
+
+import json
+import os
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Literal, Optional, Sequence
+
+DEFAULT_BATCH_SIZE = 64
+DEFAULT_FLUSH_INTERVAL = 1.0  # seconds a record may wait for a batch to fill up
+DEFAULT_MAX_QUEUE = 10000
+SINK_KINDS = ("none", "jsonl", "wandb")
+
+WandbMode = Literal["online", "offline", "disabled"]
+
+
+class MetricsSink:
+    """A backend that receives batches of records from a MetricsLogger."""
+
+    def write_batch(self, records: List[Dict[str, Any]]) -> None:
+        """
+        Write a batch of records.
+
+        Args:
+            records (list[dict]): Records with the keys "time", "metrics" and "tables" (a dict
+                of table name to {"columns": [...], "rows": [[...], ...]}).
+        """
+
+    def close(self) -> None:
+        """Flush and release the backend."""
+
+
+class JsonlSink(MetricsSink):
+    """Append every record as one JSON line to a local file."""
+
+    def __init__(self, path: str):
+        """
+        Open the file for appending.
+
+        Args:
+            path (str): The path of the JSONL file.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+
+    def write_batch(self, records: List[Dict[str, Any]]) -> None:
+        """Append the records and flush the file."""
+        self._file.writelines(json.dumps(record, default=str) + "\n" for record in records)
+        self._file.flush()
+
+    def close(self) -> None:
+        """Close the file."""
+        self._file.close()
+
+
+class WandbSink(MetricsSink):
+    """Log to a single offline wandb run, to be synced later with `wandb sync`."""
+
+    def __init__(
+        self,
+        project: str = "GlossaGen",
+        config: Optional[Dict[Any, Any]] = None,
+        mode: WandbMode = "offline",
+    ):
+        """
+        Start the wandb run.
+
+        Args:
+            project (str): The name of the wandb project.
+            config (dict): Configuration parameters for the wandb run.
+            mode (WandbMode): The wandb mode; "offline" never waits for the network.
+        """
+        import wandb
+
+        self._wandb = wandb
+        self._run = wandb.init(project=project, config=config, mode=mode)
+
+    def write_batch(self, records: List[Dict[str, Any]]) -> None:
+        """Log every record as one wandb step, with its tables as wandb.Table."""
+        for record in records:
+            data = dict(record["metrics"])
+            for name, table in record["tables"].items():
+                data[name] = self._wandb.Table(columns=table["columns"], data=table["rows"])
+            self._run.log(data)
+
+    def close(self) -> None:
+        """Finish the wandb run."""
+        self._run.finish()
+
+
+class MetricsLogger:
+    """
+    Log metrics from the pipeline without ever waiting for the backend.
+
+    Records are put on a bounded queue and written in batches by a background thread, which
+    also creates the backend, so slow imports or network access don't delay the caller either.
+    If the queue is full, records are dropped and counted rather than blocking.
+
+    Attributes
+    ----------
+        dropped (int): The number of records dropped because the queue was full.
+        failed (int): The number of records the backend failed to write.
+    """
+
+    def __init__(
+        self,
+        sink_factory: Callable[[], MetricsSink],
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+        max_queue: int = DEFAULT_MAX_QUEUE,
+    ):
+        """
+        Start the background thread.
+
+        Args:
+            sink_factory (Callable): Creates the backend; called in the background thread.
+            batch_size (int): The maximum number of records written at once.
+            flush_interval (float): The maximum time in seconds a record waits for a batch.
+            max_queue (int): The maximum number of records waiting to be written.
+        """
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+        self._queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue(max_queue)
+        self._closed = False
+        self._thread = threading.Thread(
+            target=self._run, args=(sink_factory,), name="glossagen-metrics", daemon=True
+        )
+        self._thread.start()
+
+    def log(
+        self, metrics: Dict[str, Any], tables: Optional[Dict[str, Dict[str, Sequence[Any]]]] = None
+    ) -> None:
+        """
+        Queue a record for logging and return immediately.
+
+        Args:
+            metrics (dict): Scalar metrics, e.g. {"Glossary Length": 42}.
+            tables (dict): Tables by name, each {"columns": [...], "rows": [[...], ...]}.
+        """
+        if self._closed:
+            return
+        record = {"time": time.time(), "metrics": metrics, "tables": tables or {}}
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+    def _next_batch(self) -> List[Optional[Dict[str, Any]]]:
+        """Wait for a record, then collect more until the batch is full or the interval ends."""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while batch[-1] is not None and len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get(timeout=max(deadline - time.monotonic(), 0)))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self, sink_factory: Callable[[], MetricsSink]) -> None:
+        """Write the queued records in batches until the logger is closed."""
+        try:
+            sink: Optional[MetricsSink] = sink_factory()
+        except Exception as error:  # logging must never break the pipeline
+            print(f"Metrics logging disabled: {error!r}")
+            sink = None
+        while True:
+            batch = self._next_batch()
+            records = [record for record in batch if record is not None]
+            if records and sink is not None:
+                try:
+                    sink.write_batch(records)
+                except Exception as error:
+                    self.failed += len(records)
+                    print(f"Metrics logging failed: {error!r}")
+            elif records:
+                self.failed += len(records)
+            if batch[-1] is None:
+                break
+        if sink is not None:
+            sink.close()
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """
+        Write the remaining records and release the backend.
+
+        Args:
+            timeout (float): The maximum time in seconds to wait for the background thread.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+
+def make_logger(
+    kind: str,
+    path: Optional[str] = None,
+    project: str = "GlossaGen",
+    config: Optional[Dict[Any, Any]] = None,
+) -> MetricsLogger:
+    """
+    Create a MetricsLogger with one of the built-in backends.
+
+    Args:
+        kind (str): "none" (discard everything), "jsonl" (local file) or "wandb" (offline run).
+        path (str): The JSONL file. Defaults to glossagen_metrics.jsonl.
+        project (str): The wandb project.
+        config (dict): The configuration of the wandb run.
+
+    Returns
+    -------
+        MetricsLogger: The logger; close it when the run is done.
+
+    Raises
+    ------
+        ValueError: If kind is not one of SINK_KINDS.
+    """
+    if kind == "none":
+        return MetricsLogger(MetricsSink)
+    if kind == "jsonl":
+        return MetricsLogger(lambda: JsonlSink(path or "glossagen_metrics.jsonl"))
+    if kind == "wandb":
+        return MetricsLogger(lambda: WandbSink(project, config))
+    raise ValueError(f"kind must be one of {', '.join(SINK_KINDS)}, got {kind!r}.")
@@ -0,0 +1,256 @@
+"""Deterministic local stand-ins for the language model and the graph database."""
+
+import json
+import re
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import dsp
+
+from glossagen.utils.graph_utils import (
+    GraphDocument,
+    GraphNode,
+    GraphRelationship,
+    GraphSink,
+    collect_graph_elements,
+)
+from glossagen.utils.token_utils import CHARS_PER_TOKEN
+
+DEFINITION_LENGTH = 200
+TERMS_PER_CALL = 8
+
+ABBREVIATION = re.compile(r"\b[A-Z][A-Za-z]*[A-Z][A-Za-z0-9\-]*\b")
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+OFFLINE_LABELS = [
+    "Material: Substances and compounds, e.g. frameworks, oxides and solvents.",
+    "Property: Measurable characteristics of materials, e.g. porosity or stability.",
+    "Process: Methods and procedures, e.g. synthesis, characterization or activation.",
+    "Other: Terms that fit none of the other labels.",
+]
+OFFLINE_RELATIONS = ["contain", "synthesize", "measure", "improve", "relate to"]
+
+
+def _input_text(prompt: str) -> str:
+    """Return the part of a dspy prompt after the instructions and demonstrations."""
+    return prompt.rsplit("\n---\n", 1)[-1]
+
+
+def offline_glossary(prompt: str) -> Dict[str, Any]:
+    """Answer a Text2GlossarySignature prompt with the abbreviations of the text."""
+    entries: Dict[str, str] = {}
+    for sentence in SENTENCE_END.split(_input_text(prompt)):
+        for term in ABBREVIATION.findall(sentence):
+            if term not in entries and len(entries) < TERMS_PER_CALL:
+                entries[term] = " ".join(sentence.split())[:DEFINITION_LENGTH]
+    return {
+        "value": [{"term": term, "definition": definition} for term, definition in entries.items()]
+    }
+
+
+def offline_labels(prompt: str) -> Dict[str, Any]:
+    """Answer a Glossary2Labels prompt with a fixed set of labels."""
+    return {"value": [{"label": label} for label in OFFLINE_LABELS]}
+
+
+def offline_relations(prompt: str) -> Dict[str, Any]:
+    """Answer a Glossary2Relations prompt with a fixed set of relations."""
+    return {"value": [{"relation": relation} for relation in OFFLINE_RELATIONS]}
+
+
+OFFLINE_ANSWERS: Dict[str, Callable[[str], Dict[str, Any]]] = {
+    "Glossary:": offline_glossary,
+    "Labels:": offline_labels,
+    "Relations:": offline_relations,
+}
+
+
+class OfflineLM(dsp.LM):
+    """
+    A deterministic language model that answers locally, for benchmarks and tests.
+
+    The answer depends on the output field the prompt ends with (see OFFLINE_ANSWERS): glossary
+    prompts get the abbreviations of the text, label and relation prompts a fixed ontology, and
+    any other prompt an empty list. Every request sleeps for the configured latency, so that the
+    concurrency of the pipelines can be measured, and records an estimate of its token usage in
+    the same format as the OpenAI API.
+
+    Attributes
+    ----------
+        latency (float): The time in seconds every request takes.
+        seconds_per_token (float): The additional time per completion token.
+        history (list[dict]): The prompt, response and usage of every request.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        seconds_per_token: float = 0.0,
+        model: str = "offline",
+        max_tokens: int = 3000,
+        **kwargs: Any,
+    ):
+        """
+        Create the language model.
+
+        Args:
+            latency (float): The time in seconds every request takes.
+            seconds_per_token (float): The additional time per completion token.
+            model (str): The model name reported in the configuration.
+            max_tokens (int): The max_tokens reported in the configuration.
+            kwargs: Ignored, so that init_dspy can create the model like dspy.OpenAI.
+        """
+        super().__init__(model)
+        self.kwargs["max_tokens"] = max_tokens
+        self.provider = "offline"
+        self.latency = latency
+        self.seconds_per_token = seconds_per_token
+        self._lock = threading.Lock()
+
+    def answer(self, prompt: str) -> str:
+        """Return the completion of a prompt, without latency."""
+        lines = prompt.rstrip().splitlines()
+        prefix = lines[-1].strip() if lines else ""
+        respond = OFFLINE_ANSWERS.get(prefix)
+        return json.dumps(respond(prompt) if respond else {"value": []})
+
+    def basic_request(self, prompt: str, **kwargs: Any) -> Dict[str, Any]:
+        """Answer a prompt after the configured latency and record it in the history."""
+        completion = self.answer(prompt)
+        usage = {
+            "prompt_tokens": len(prompt) // CHARS_PER_TOKEN,
+            "completion_tokens": len(completion) // CHARS_PER_TOKEN,
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        time.sleep(self.latency + self.seconds_per_token * usage["completion_tokens"])
+        response = {
+            "choices": [{"text": completion, "finish_reason": "stop"}],
+            "usage": usage,
+        }
+        with self._lock:
+            self.history.append(
+                {"prompt": prompt, "response": response, "kwargs": kwargs, "raw_kwargs": kwargs}
+            )
+        return response
+
+    def __call__(
+        self,
+        prompt: str,
+        only_completed: bool = True,
+        return_sorted: bool = False,
+        **kwargs: Any,
+    ) -> List[str]:
+        """Return the completions of a prompt, like dspy.OpenAI."""
+        response = self.basic_request(prompt, **kwargs)
+        return [choice["text"] for choice in response["choices"]]
+
+    def usage(self) -> Dict[str, int]:
+        """Return the number of requests and the total token usage so far."""
+        with self._lock:
+            history = list(self.history)
+        totals: Dict[str, int] = defaultdict(int)
+        for entry in history:
+            for key, value in entry["response"]["usage"].items():
+                totals[key] += value
+        return {"requests": len(history), **totals}
+
+
+class InMemoryGraph(GraphSink):
+    """
+    A graph database in memory, a stand-in for Neo4jGraph in tests and benchmarks.
+
+    Nodes are merged by id and type and relationships by their ends and type, as by the MERGE
+    statements of write_graph_batch, so adding the same documents twice does not change the
+    graph.
+
+    Attributes
+    ----------
+        nodes (dict): The properties of every node, by (id, type).
+        relationships (dict): The properties of every relationship, by (source, type, target).
+        writes (int): The number of batches written.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        """
+        Create an empty graph.
+
+        Args:
+            latency (float): The time in seconds every write takes, to simulate the round trip
+                to a database.
+        """
+        self.latency = latency
+        self.nodes: Dict[Any, Dict[str, Any]] = {}
+        self.relationships: Dict[Any, Dict[str, Any]] = {}
+        self.writes = 0
+        self._lock = threading.Lock()
+
+    def merge_batch(self, nodes: List[GraphNode], relationships: List[GraphRelationship]) -> None:
+        """Merge nodes and relationships into the graph, in one write."""
+        time.sleep(self.latency)
+        with self._lock:
+            self.writes += 1
+            for node in nodes:
+                self.nodes.setdefault((node.id, node.type), {}).update(node.properties)
+            for relationship in relationships:
+                key = (
+                    (relationship.source.id, relationship.source.type),
+                    relationship.type,
+                    (relationship.target.id, relationship.target.type),
+                )
+                self.relationships.setdefault(key, {}).update(relationship.properties)
+
+    def add_graph_documents(self, graph_documents: Iterable[Any], **kwargs: Any) -> None:
+        """
+        Merge graph documents into the graph, like Neo4jGraph.add_graph_documents.
+
+        Args:
+            graph_documents (Iterable[GraphDocument]): The documents; langchain GraphDocuments
+                work as well.
+            kwargs: Ignored, e.g. include_source of Neo4jGraph.
+        """
+        self.merge_batch(*collect_graph_elements(graph_documents))
+
+
+def offline_graph_document(text: str, source: Optional[Any] = None) -> GraphDocument:
+    """
+    Build a graph document from a text without a language model.
+
+    The abbreviations of the text become nodes, and consecutive abbreviations are related.
+
+    Args:
+        text (str): The text.
+        source: The document the text was taken from.
+
+    Returns
+    -------
+        GraphDocument: The nodes and relationships of the text.
+    """
+    nodes = [GraphNode(id=term) for term in dict.fromkeys(ABBREVIATION.findall(text))]
+    relationships = [
+        GraphRelationship(source=first, target=second, type="RELATED_TO")
+        for first, second in zip(nodes, nodes[1:])
+    ]
+    return GraphDocument(nodes=nodes, relationships=relationships, source=source)
+
+
+class OfflineGraphTransformer:
+    """A stand-in for LLMGraphTransformer, building graph documents with offline_graph_document."""
+
+    def __init__(self, latency: float = 0.0):
+        """
+        Create the transformer.
+
+        Args:
+            latency (float): The time in seconds every document takes, like a request to the
+                language model.
+        """
+        self.latency = latency
+
+    def convert_to_graph_documents(self, documents: Iterable[Any]) -> List[GraphDocument]:
+        """Convert documents with a page_content (e.g. langchain Documents) to graph documents."""
+        graph_documents = []
+        for document in documents:
+            time.sleep(self.latency)
+            graph_documents.append(offline_graph_document(document.page_content, document))
+        return graph_documents
@@ -1,22 +1,159 @@
 """Base classes for document extraction."""
 
+import functools
+import multiprocessing
 import os
-import re
-from typing import Dict, Optional
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Generator, Iterator, List, Optional, Tuple
 
-import dspy
 import fitz  # PyMuPDF
 from pydantic import BaseModel
 
-from glossagen.utils import init_dspy
-
-
-class MetadataSignature(dspy.Signature):
-    """Extracts metadata from the publication text."""
-
-    publication_text: str = dspy.InputField()
-    title: str = dspy.OutputField(desc="Title of the publication.")
-    doi: str = dspy.OutputField(desc="Digital Object Identifier (DOI) of the publication.")
+from glossagen.utils.latex_utils import iter_latex_blocks
+from glossagen.utils.section_utils import (
+    Section,
+    back_matter_start,
+    detect_sections,
+    detect_text_sections,
+    is_back_matter_heading,
+)
+from glossagen.utils.segment_utils import (
+    Segment,
+    TextBlock,
+    iter_block_segments,
+    layout_blocks,
+    page_layout,
+)
+from glossagen.utils.tracing_utils import trace
+
+PARALLEL_PAGE_THRESHOLD = 64  # pages below which a PDF is always read in a single process
+PAGE_RANGES_PER_WORKER = 4
+
+
+def _extract_page_range(
+    paper_path: str, first: int, last: int
+) -> List[Tuple[List[TextBlock], Any]]:
+    """Extract the layout of the pages first to last (exclusive) with a separate PDF handle."""
+    doc = fitz.open(paper_path)
+    try:
+        return [page_layout(doc[number]) for number in range(first, last)]
+    finally:
+        doc.close()
+
+
+def iter_page_layouts(
+    paper_path: str, workers: int = 1, threshold: int = PARALLEL_PAGE_THRESHOLD
+) -> Generator[Tuple[List[TextBlock], Any], None, None]:
+    """
+    Extract the layout of every page of a PDF, in page order.
+
+    Documents with at least `threshold` pages are split into page ranges that are extracted by
+    `workers` processes, each opening the PDF itself. Smaller documents, or workers=1, are read
+    lazily in this process so that small papers don't pay the pool startup costs. Page ranges
+    that have not started when the iterator is closed are cancelled.
+
+    Args:
+        paper_path (str): The path of the PDF file.
+        workers (int): The number of worker processes.
+        threshold (int): The minimum number of pages for a parallel extraction.
+
+    Yields
+    ------
+        tuple: The output of page_layout for every page.
+    """
+    if workers < 1:
+        raise ValueError("workers must be at least 1.")
+    doc = fitz.open(paper_path)
+    try:
+        num_pages = doc.page_count
+        if workers == 1 or num_pages < threshold:
+            for page in doc:
+                yield page_layout(page)
+            return
+    finally:
+        doc.close()
+
+    # Several ranges per worker balance the load and let early ranges arrive sooner
+    range_size = -(-num_pages // (workers * PAGE_RANGES_PER_WORKER))
+    starts = range(0, num_pages, range_size)
+    executor = ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+    )
+    try:
+        futures = [
+            executor.submit(
+                _extract_page_range, paper_path, first, min(first + range_size, num_pages)
+            )
+            for first in starts
+        ]
+        for future in futures:
+            yield from future.result()
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+
+def iter_body_blocks(paper_path: str, workers: int = 1) -> Iterator[TextBlock]:
+    """
+    Lazily read the text blocks of a PDF, page by page, up to the back matter.
+
+    The back matter starts at the first references, acknowledgements, author or supporting
+    information heading, see is_back_matter_heading. Pages after it are not read (or, when
+    extracting in parallel, no longer scheduled), and the PDF is closed as soon as the
+    iteration ends.
+
+    Args:
+        paper_path (str): The path of the PDF file.
+        workers (int): The number of processes extracting the pages, see iter_page_layouts.
+
+    Yields
+    ------
+        TextBlock: The text blocks of the body in reading order.
+    """
+    pages = iter_page_layouts(paper_path, workers)
+    try:
+        for block in layout_blocks(pages):
+            if is_back_matter_heading(block):
+                return
+            yield block
+    finally:
+        pages.close()
+
+
+def iter_pdf_segments(paper_path: str, target_size: int, overlap: int = 0) -> Iterator[Segment]:
+    """
+    Stream the segments of a PDF's body without holding the whole document in memory.
+
+    Args:
+        paper_path (str): The path of the PDF file.
+        target_size (int): The maximum length of a segment in characters.
+        overlap (int): The maximum overlap between consecutive segments in characters.
+
+    Yields
+    ------
+        Segment: The segments of the body in document order.
+    """
+    return iter_block_segments(iter_body_blocks(paper_path), target_size, overlap)
+
+
+@functools.cache
+def _metadata_signature() -> Any:
+    """Define MetadataSignature, importing dspy only when the signature is needed."""
+    import dspy
+
+    class MetadataSignature(dspy.Signature):
+        """Extracts metadata from the publication text."""
+
+        publication_text: str = dspy.InputField()
+        title: str = dspy.OutputField(desc="Title of the publication.")
+        doi: str = dspy.OutputField(desc="Digital Object Identifier (DOI) of the publication.")
+
+    return MetadataSignature
+
+
+def __getattr__(name: str) -> Any:
+    if name == "MetadataSignature":
+        return _metadata_signature()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 class ResearchDoc(BaseModel):
@@ -25,6 +162,8 @@ class ResearchDoc(BaseModel):
     doc_src: str
     fitz_paper: Optional[fitz.Document] = None
     paper: str = ""
+    blocks: List[TextBlock] = []
+    sections: List[Section] = []
     metadata_dict: Dict[str, str] = {}
 
     class Config:
@@ -45,34 +184,83 @@ class ResearchDoc(BaseModel):
         -------
             ResearchDoc: The created ResearchDoc instance.
         """
-        research_doc = cls(doc_src="Latex", fitz_paper=None, paper=text)
+        research_doc = cls(doc_src=doc_src, fitz_paper=None, paper=text)
         return research_doc
 
     @classmethod
-    def from_dir(cls, paper_dir: str) -> "ResearchDoc":
+    def from_dir(cls, paper_dir: str, workers: int = 1) -> "ResearchDoc":
         """
         Create a ResearchDoc instance from dir containing a research paper.
 
         Args:
             paper_dir (str): The dir path containing the research paper.
+            workers (int): The number of processes extracting the pages of large PDFs.
+
+        Returns
+        -------
+            ResearchDoc: The created ResearchDoc instance.
+        """
+        return cls.from_pdf(
+            os.path.join(paper_dir, "paper.pdf"), doc_src=paper_dir, workers=workers
+        )
+
+    @classmethod
+    def from_pdf(
+        cls, paper_path: str, doc_src: Optional[str] = None, workers: int = 1
+    ) -> "ResearchDoc":
+        """
+        Create a ResearchDoc instance from the path of a PDF file.
+
+        The pages are read lazily and reading stops at the references section, see
+        iter_body_blocks. The PDF is closed afterwards; its blocks and fonts are kept in
+        `blocks` for the segmentation.
+
+        Args:
+            paper_path (str): The path of the PDF file.
+            doc_src (str): The source of the document. Defaults to paper_path.
+            workers (int): The number of processes extracting the pages of large PDFs, see
+                iter_page_layouts.
+
+        Returns
+        -------
+            ResearchDoc: The created ResearchDoc instance.
+        """
+        doc_src = doc_src or paper_path
+        with trace("pdf.load", paper=doc_src, workers=workers) as span:
+            blocks = list(iter_body_blocks(paper_path, workers))
+            text = "".join(block.text for block in blocks)
+            research_doc = cls(doc_src=doc_src, paper=text, blocks=blocks)
+            research_doc.extract_metadata()
+            span.set(blocks=len(blocks), characters=len(text))
+        with trace("pdf.trim", paper=doc_src, characters=len(research_doc.paper)) as span:
+            research_doc.trim_at_references()
+            span.set(trimmed_characters=len(research_doc.paper))
+        return research_doc
+
+    @classmethod
+    def from_latex(cls, latex_path: str, doc_src: Optional[str] = None) -> "ResearchDoc":
+        """
+        Create a ResearchDoc instance from the root file of a LaTeX project.
+
+        Included files are followed and the paragraphs and section headings are kept in
+        `blocks` for the segmentation, see LatexTokenizer. The text is trimmed at the
+        bibliography or other back matter.
+
+        Args:
+            latex_path (str): The path of the root .tex file.
+            doc_src (str): The source of the document. Defaults to latex_path.
 
         Returns
         -------
             ResearchDoc: The created ResearchDoc instance.
         """
-        paper_path = os.path.join(paper_dir, "paper.pdf")
-        doc = fitz.open(paper_path)
-        text = "".join(page.get_text() for page in doc)
-        research_doc = cls(doc_src=paper_dir, fitz_paper=doc, paper=text)
-        research_doc.extract_metadata()
-        print("--------------------------------------------------")
-        print(f"Lenght of paper: {len(research_doc.paper)}")
-        # print(research_doc.paper[:3000])
-        print("--------------------------------------------------")
-        research_doc.trim_at_references()
-        print(f"Lenght of paper: {len(research_doc.paper)}")
-        # print(research_doc.paper[:3000])
-        print("--------------------------------------------------")
+        doc_src = doc_src or latex_path
+        with trace("latex.load", paper=doc_src) as span:
+            blocks = list(iter_latex_blocks(latex_path))
+            text = "".join(block.text for block in blocks)
+            research_doc = cls(doc_src=doc_src, paper=text, blocks=blocks)
+            research_doc.trim_at_references()
+            span.set(blocks=len(blocks), characters=len(text))
         return research_doc
 
     def extract_metadata(self) -> None:
@@ -93,24 +281,45 @@ class ResearchDoc(BaseModel):
         doi = "bar"
         self.metadata_dict = {"title": title, "doi": doi}
 
-    def trim_at_references(self) -> None:
-        """Trim the document text at the start of the references section."""
-        # Regex to detect 'REFERENCES' and ensure it's followed by typical reference entries
-        pattern = re.compile(
-            r"\bREFERENCES\b\s*" r"(?=\s*(?:\(\d+\)|\d+\.)\s+[A-Z][a-z]+.*?\d{4})",
-            re.IGNORECASE | re.DOTALL,
-        )
-        match = pattern.search(self.paper)
-        if match:
-            # If 'REFERENCES' is found, cut the text
-            self.paper = self.paper[: match.start()]
+    def detect_sections(self) -> None:
+        """
+        Find the sections of the paper and store them in `sections`.
 
-        # if no match is found, cut after last occ of 'Acknowledgements' or 'Data Availability'
+        The headings are recognized by their font size and weight if the layout of the paper is
+        known (`blocks`), otherwise only the back matter headings are found, as lines of their
+        own.
+        """
+        if self.blocks:
+            self.sections = detect_sections(self.blocks, len(self.paper))
         else:
-            pattern = re.compile(r"\bAcknowledgements\b|\bData Availability\b", re.IGNORECASE)
-            match = pattern.search(self.paper)
-            if match:
-                self.paper = self.paper[: match.start()]
+            self.sections = detect_text_sections(self.paper)
+
+    def section_texts(self) -> List[str]:
+        """
+        Return the text of every section, with the text before the first heading as one more.
+
+        Returns
+        -------
+            list[str]: The non-empty section texts in document order, or [] if no sections
+                were detected.
+        """
+        if not self.sections:
+            return []
+        spans = [(0, self.sections[0].start)]
+        spans += [(section.start, section.end) for section in self.sections]
+        return [self.paper[start:end] for start, end in spans if self.paper[start:end].strip()]
+
+    def trim_at_references(self) -> None:
+        """Trim the document text at the start of the references or other back matter."""
+        if not self.sections:
+            self.detect_sections()
+        start = back_matter_start(self.sections)
+        if start is None:
+            return
+        self.paper = self.paper[:start]
+        self.sections = [section for section in self.sections if section.start < start]
+        if self.sections:
+            self.sections[-1].end = start
 
 
 class ResearchDocLoader:
@@ -132,10 +341,13 @@ class ResearchDocLoader:
         if not os.path.exists(directory):
             raise FileNotFoundError(f"The specified directory {directory} does not exist.")
 
-    def load(self) -> ResearchDoc:
+    def load(self, workers: int = 1) -> ResearchDoc:
         """
         Load the research document from the specified directory.
 
+        Args:
+            workers (int): The number of processes extracting the pages of large PDFs.
+
         Returns
         -------
             ResearchDoc: The loaded research document.
@@ -148,7 +360,7 @@ class ResearchDocLoader:
         file_path = os.path.join(self.directory, "paper.pdf")
         if not os.path.exists(file_path):
             raise FileNotFoundError(f"Required file 'paper.pdf' not found in {self.directory}.")
-        return ResearchDoc.from_dir(self.directory)
+        return ResearchDoc.from_dir(self.directory, workers=workers)
 
 
 def main() -> None:
@@ -161,6 +373,8 @@ def main() -> None:
     # )
     document_directory = "./papers/Chem. Rev. 2024, 124, 2352-2418"
 
+    from glossagen.utils import init_dspy
+
     init_dspy()
     loader = ResearchDocLoader(document_directory)
     research_doc = loader.load()
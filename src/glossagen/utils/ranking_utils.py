@@ -0,0 +1,210 @@
+"""Local importance ranking of glossary entries from vectorized term statistics."""
+
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Sequence, Set, TypeVar
+
+import numpy as np
+import numpy.typing as npt
+
+from glossagen.utils.dedup_utils import is_abbreviation, split_abbreviation
+from glossagen.utils.store_utils import WORD, TermStore, term_key
+
+T = TypeVar("T")
+
+FEATURES = ("frequency", "spread", "abbreviation", "idf")
+DEFAULT_WEIGHTS: Dict[str, float] = {
+    "frequency": 1.0,
+    "spread": 1.0,
+    "abbreviation": 0.5,
+    "idf": 0.5,
+}
+
+
+def term_spellings(entry: Any) -> Set[str]:
+    """
+    Return the normalized spellings of a glossary entry, see term_key.
+
+    Args:
+        entry (TerminusTechnicus): The entry; `aliases` are included if the entry has them.
+
+    Returns
+    -------
+        set[str]: The keys of the term, its aliases and both forms of "expansion (ABBR)".
+    """
+    spellings = set()
+    for spelling in [entry.term, *getattr(entry, "aliases", [])]:
+        for part in split_abbreviation(spelling):
+            if part and term_key(part):
+                spellings.add(term_key(part))
+    return spellings
+
+
+def _has_abbreviation(entry: Any) -> bool:
+    """Return whether an entry is, or is written with, an abbreviation."""
+    return any(
+        is_abbreviation(spelling) or split_abbreviation(spelling)[1] is not None
+        for spelling in [entry.term, *getattr(entry, "aliases", [])]
+    )
+
+
+def occurrence_matrix(entries: Sequence[Any], texts: Sequence[str]) -> npt.NDArray[np.float64]:
+    """
+    Count the occurrences of every entry in every text.
+
+    Each text is read once: at every word that starts a spelling, the following words are
+    looked up in the spellings of all entries.
+
+    Args:
+        entries (Sequence[TerminusTechnicus]): The glossary entries.
+        texts (Sequence[str]): The texts, e.g. the chunks of a paper.
+
+    Returns
+    -------
+        np.ndarray: The occurrences, with one row per text and one column per entry.
+    """
+    columns: Dict[str, List[int]] = defaultdict(list)
+    for column, entry in enumerate(entries):
+        for spelling in term_spellings(entry):
+            columns[spelling].append(column)
+    # The lengths of the spellings starting with a word
+    lengths: Dict[str, Set[int]] = defaultdict(set)
+    for spelling in columns:
+        lengths[spelling.split()[0]].add(len(spelling.split()))
+    counts = np.zeros((len(texts), len(entries)), dtype=np.float64)
+    keys: Dict[str, str] = {}  # normalizing every distinct word once
+    for row, text in enumerate(texts):
+        words = [
+            keys.get(word) or keys.setdefault(word, term_key(word)) for word in WORD.findall(text)
+        ]
+        for start, word in enumerate(words):
+            for length in lengths.get(word, ()):
+                matched = columns.get(" ".join(words[start : start + length]))
+                if matched:
+                    counts[row, matched] += 1
+    return counts
+
+
+class TermRanker:
+    """
+    Ranks glossary entries by importance without calling the language model.
+
+    Every entry gets four features, each scaled to [0, 1]:
+
+    - frequency: its occurrences in the paper (log-scaled, relative to the most frequent entry),
+    - spread: the fraction of the sections of the paper it occurs in,
+    - abbreviation: whether it is or has an abbreviation,
+    - idf: how rare it is among the papers of the term store, if there is one.
+
+    The score is the weighted sum of the features.
+
+    Attributes
+    ----------
+        store (TermStore): The store of earlier glossaries for the idf, or None.
+        weights (dict[str, float]): The weight of every feature.
+        top_k (int): The number of entries to keep, or None for all.
+        min_score (float): The score an entry needs to be kept, or None.
+    """
+
+    def __init__(
+        self,
+        store: Optional[TermStore] = None,
+        weights: Optional[Dict[str, float]] = None,
+        top_k: Optional[int] = None,
+        min_score: Optional[float] = None,
+    ):
+        """
+        Create the ranker.
+
+        Args:
+            store (TermStore): The store of earlier glossaries for the idf feature. Without
+                one, the idf feature is 1 for every entry.
+            weights (dict[str, float]): Weights overriding DEFAULT_WEIGHTS.
+            top_k (int): The number of entries to keep, or None for all.
+            min_score (float): The score an entry needs to be kept, or None.
+        """
+        unknown = set(weights or {}) - set(FEATURES)
+        if unknown:
+            raise ValueError(f"Unknown features {sorted(unknown)}, expected some of {FEATURES}.")
+        self.store = store
+        self.weights = {**DEFAULT_WEIGHTS, **(weights or {})}
+        self.top_k = top_k
+        self.min_score = min_score
+
+    def _idf(self, entries: Sequence[Any], paper: Optional[str]) -> npt.NDArray[np.float64]:
+        """Return the scaled inverse paper frequency of the entries in the store."""
+        if self.store is None:
+            return np.ones(len(entries))
+        papers = len(set(self.store.papers()) - {paper})
+        if papers == 0:
+            return np.ones(len(entries))
+        spellings = [[entry.term, *getattr(entry, "aliases", [])] for entry in entries]
+        frequency = self.store.paper_frequency(
+            [spelling for entry in spellings for spelling in entry], exclude_paper=paper
+        )
+        document_frequency = np.array(
+            [
+                max(frequency.get(spelling.casefold(), 0) for spelling in entry)
+                for entry in spellings
+            ]
+        )
+        scale = np.log(1 + papers)
+        idf: npt.NDArray[np.float64] = np.log((1 + papers) / (1 + document_frequency)) / scale
+        return idf
+
+    def features(
+        self, entries: Sequence[Any], texts: Sequence[str], paper: Optional[str] = None
+    ) -> npt.NDArray[np.float64]:
+        """
+        Compute the features of the entries.
+
+        Args:
+            entries (Sequence[TerminusTechnicus]): The glossary entries.
+            texts (Sequence[str]): The parts of the paper the spread is computed over, i.e. its
+                sections (see ResearchDoc.section_texts) or, without those, its chunks.
+            paper (str): The paper, which is left out of the idf if it is in the store already.
+
+        Returns
+        -------
+            np.ndarray: One row per entry, with the columns in the order of FEATURES.
+        """
+        counts = occurrence_matrix(entries, texts)
+        frequency = np.log1p(counts.sum(axis=0))
+        if frequency.size and frequency.max() > 0:
+            frequency /= frequency.max()
+        spread = (counts > 0).mean(axis=0) if len(texts) else np.zeros(len(entries))
+        abbreviation = np.array([_has_abbreviation(entry) for entry in entries], dtype=np.float64)
+        return np.column_stack([frequency, spread, abbreviation, self._idf(entries, paper)])
+
+    def score(
+        self, entries: Sequence[Any], texts: Sequence[str], paper: Optional[str] = None
+    ) -> npt.NDArray[np.float64]:
+        """Return the importance of every entry, the weighted sum of its features."""
+        if not entries:
+            return np.zeros(0)
+        weights = np.array([self.weights[feature] for feature in FEATURES])
+        scores: npt.NDArray[np.float64] = self.features(entries, texts, paper) @ weights
+        return scores
+
+    def rank(
+        self, entries: Sequence[T], texts: Sequence[str], paper: Optional[str] = None
+    ) -> List[T]:
+        """
+        Sort the entries by importance, most important first, and keep the top ones.
+
+        Args:
+            entries (Sequence[TerminusTechnicus]): The glossary entries.
+            texts (Sequence[str]): The sections of the paper, or its chunks, see features.
+            paper (str): The paper, which is left out of the idf if it is in the store already.
+
+        Returns
+        -------
+            list[TerminusTechnicus]: The top_k entries with at least min_score; entries with the
+                same score keep their order.
+        """
+        scores = self.score(entries, texts, paper)
+        order = np.argsort(-scores, kind="stable")
+        if self.min_score is not None:
+            order = order[scores[order] >= self.min_score]
+        if self.top_k is not None:
+            order = order[: self.top_k]
+        return [entries[index] for index in order]
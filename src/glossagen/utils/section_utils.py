@@ -0,0 +1,147 @@
+"""Single-pass detection of the sections and back matter of research documents."""
+
+import re
+from typing import Iterable, List, Optional
+
+from pydantic import BaseModel
+
+from glossagen.utils.segment_utils import HEADING_MAX_LENGTH, TextBlock
+
+# Headings of the parts of a paper that follow the body, by kind. A heading has to consist of
+# one of these titles only, optionally numbered and followed by a colon or period.
+BACK_MATTER_TITLES = {
+    "references": r"references(?:\s+and\s+notes)?|bibliography|literature\s+cited",
+    "acknowledgements": r"acknowledge?ments?",
+    "author_information": r"authors?'?\s+information|author\s+contributions",
+    "supporting_information": r"supporting\s+information|supplementary\s+(?:information|material)",
+    "data_availability": r"data\s+availability(?:\s+statement)?",
+    "declarations": r"declarations",
+}
+BACK_MATTER_HEADING = re.compile(
+    r"^(?:[0-9]+|[IVX]+)?\.?\s*(?:"
+    + "|".join(f"(?P<{kind}>{title})" for kind, title in BACK_MATTER_TITLES.items())
+    + r")\s*[:.]?$",
+    re.IGNORECASE,
+)
+
+
+class Section(BaseModel):
+    """A section of a document, from its heading to the next heading."""
+
+    title: str
+    start: int
+    end: int
+    back_matter: Optional[str] = None  # the kind of back matter, see BACK_MATTER_TITLES
+
+
+def back_matter_kind(title: str) -> Optional[str]:
+    """
+    Classify a heading as one of the back matter sections of a paper.
+
+    Args:
+        title (str): The text of the heading.
+
+    Returns
+    -------
+        str: The kind of back matter (a key of BACK_MATTER_TITLES), or None for other headings.
+    """
+    title = title.strip()
+    if len(title) > HEADING_MAX_LENGTH:
+        return None
+    match = BACK_MATTER_HEADING.match(title)
+    return match.lastgroup if match else None
+
+
+def is_back_matter_heading(block: TextBlock) -> bool:
+    """
+    Decide whether a block is the heading of a back matter section.
+
+    The title alone is not enough: the block has to be set apart by its font, i.e. be a heading
+    or bold, so that a line reading "References" inside a paragraph is ignored.
+
+    Args:
+        block (TextBlock): The block to classify.
+
+    Returns
+    -------
+        bool: True if the block starts the back matter.
+    """
+    return (block.is_heading or block.bold) and back_matter_kind(block.text) is not None
+
+
+def _close_sections(sections: List[Section], length: int) -> List[Section]:
+    """Let every section end where the next one starts, and the last one at length."""
+    for section, following in zip(sections, sections[1:]):
+        section.end = following.start
+    if sections:
+        sections[-1].end = length
+    return sections
+
+
+def detect_sections(blocks: Iterable[TextBlock], length: int) -> List[Section]:
+    """
+    Find the sections of a document from the font size and weight of its blocks.
+
+    Runs in a single pass over the blocks; every heading block (see is_heading) and every bold
+    back matter title starts a section.
+
+    Args:
+        blocks (Iterable[TextBlock]): The blocks of the document in reading order.
+        length (int): The length of the document text.
+
+    Returns
+    -------
+        list[Section]: The sections in document order.
+    """
+    sections = []
+    for block in blocks:
+        if block.start >= length:
+            break
+        if block.is_heading or is_back_matter_heading(block):
+            title = " ".join(block.text.split())
+            sections.append(
+                Section(
+                    title=title, start=block.start, end=length, back_matter=back_matter_kind(title)
+                )
+            )
+    return _close_sections(sections, length)
+
+
+def detect_text_sections(text: str) -> List[Section]:
+    """
+    Find the back matter sections of a plain text document, without layout information.
+
+    Runs in a single pass over the lines of the text; a line consisting only of a back matter
+    title starts a section.
+
+    Args:
+        text (str): The document text.
+
+    Returns
+    -------
+        list[Section]: The back matter sections in document order.
+    """
+    sections = []
+    start = 0
+    for line in text.splitlines(keepends=True):
+        kind = back_matter_kind(line)
+        if kind is not None:
+            sections.append(
+                Section(title=line.strip(), start=start, end=len(text), back_matter=kind)
+            )
+        start += len(line)
+    return _close_sections(sections, len(text))
+
+
+def back_matter_start(sections: Iterable[Section]) -> Optional[int]:
+    """
+    Return where the back matter of a document starts.
+
+    Args:
+        sections (Iterable[Section]): The sections of the document in document order.
+
+    Returns
+    -------
+        int: The offset of the first back matter heading, or None if there is none.
+    """
+    return next((section.start for section in sections if section.back_matter), None)
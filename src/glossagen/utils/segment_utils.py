@@ -0,0 +1,464 @@
+"""Structure-aware segmentation of research documents into model-sized chunks."""
+
+import bisect
+import re
+from collections import Counter
+from typing import Any, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from pydantic import BaseModel
+
+# A sentence ends with ., ! or ? (optionally followed by a closing bracket or quote) and is
+# followed by whitespace and an upper-case letter, digit or opening bracket.
+SENTENCE_BREAK = re.compile(r"(?<=[.!?])[)\]\"']?\s+(?=[A-Z0-9(\[])")
+PARAGRAPH_BREAK = re.compile(r"\n[ \t]*\n\s*")
+
+BOLD_FLAG = 16  # bit of the PyMuPDF span flags marking a bold font
+HEADING_SIZE_RATIO = 1.1
+HEADING_MAX_LENGTH = 120
+HEADING_MIN_LETTERS = 3
+
+
+class TextBlock(BaseModel):
+    """A paragraph-like block of a document with its layout information."""
+
+    text: str
+    start: int
+    page: Optional[int] = None
+    font_size: float = 0.0
+    bold: bool = False
+    is_heading: bool = False
+
+
+class Segment(BaseModel):
+    """A contiguous slice of a document, cut at structural boundaries."""
+
+    text: str
+    start: int
+    end: int
+    section: Optional[str] = None
+
+
+def page_blocks(page: Any, offset: int, size_counts: "Counter[float]") -> List[TextBlock]:
+    """
+    Extract the text blocks of one PyMuPDF page together with their font information.
+
+    Args:
+        page (fitz.Page): The page.
+        offset (int): The offset of the page text in the document text.
+        size_counts (Counter): Characters per font size seen so far; updated with this page.
+
+    Returns
+    -------
+        list[TextBlock]: The text blocks of the page in reading order, headings not yet marked.
+    """
+    blocks = []
+    for block in page.get_text("dict")["blocks"]:
+        if block["type"] != 0:  # image block
+            continue
+        spans = [span for line in block["lines"] for span in line["spans"]]
+        text = "".join(
+            "".join(span["text"] for span in line["spans"]) + "\n" for line in block["lines"]
+        )
+        # The font of the block is the one covering most of its characters
+        block_sizes: Counter[float] = Counter()
+        bold_chars = 0
+        for span in spans:
+            size = round(span["size"], 1)
+            block_sizes[size] += len(span["text"])
+            size_counts[size] += len(span["text"])
+            if span["flags"] & BOLD_FLAG:
+                bold_chars += len(span["text"])
+        blocks.append(
+            TextBlock(
+                text=text,
+                start=offset,
+                page=page.number,
+                font_size=block_sizes.most_common(1)[0][0] if block_sizes else 0.0,
+                bold=bold_chars * 2 > sum(block_sizes.values()),
+            )
+        )
+        offset += len(text)
+    return blocks
+
+
+def page_layout(page: Any) -> "Tuple[List[TextBlock], Counter[float]]":
+    """
+    Extract the text blocks of one PyMuPDF page independently of the other pages.
+
+    The result can be computed in a worker process and is placed in the document by
+    layout_blocks.
+
+    Args:
+        page (fitz.Page): The page.
+
+    Returns
+    -------
+        tuple[list[TextBlock], Counter]: The blocks with offsets relative to the page, and the
+            number of characters per font size on the page.
+    """
+    size_counts: Counter[float] = Counter()
+    return page_blocks(page, 0, size_counts), size_counts
+
+
+def layout_blocks(pages: "Iterable[Tuple[List[TextBlock], Counter[float]]]") -> Iterator[TextBlock]:
+    """
+    Place the blocks of consecutive pages at their document offsets and mark headings.
+
+    The body font size is the most common size among the pages seen so far, so a page's
+    headings are known as soon as the page has been read.
+
+    Args:
+        pages (Iterable[tuple]): The output of page_layout for every page, in page order.
+
+    Yields
+    ------
+        TextBlock: The text blocks in reading order.
+    """
+    size_counts: Counter[float] = Counter()
+    offset = 0
+    for blocks, page_sizes in pages:
+        size_counts.update(page_sizes)
+        body_size = size_counts.most_common(1)[0][0] if size_counts else None
+        for block in blocks:
+            block.start = offset
+            if body_size is not None:
+                block.is_heading = is_heading(block, body_size)
+            offset += len(block.text)
+            yield block
+
+
+def iter_fitz_blocks(pages: Iterable[Any]) -> Iterator[TextBlock]:
+    """
+    Lazily extract the text blocks of PyMuPDF pages, marking headings.
+
+    Pages are read one at a time, see layout_blocks. The concatenated block texts equal the
+    concatenated `page.get_text()` output, so block offsets are offsets into
+    `ResearchDoc.paper`.
+
+    Args:
+        pages (Iterable[fitz.Page]): The pages, e.g. an opened fitz.Document.
+
+    Returns
+    -------
+        Iterator[TextBlock]: The text blocks in reading order.
+    """
+    return layout_blocks(page_layout(page) for page in pages)
+
+
+def blocks_from_fitz(fitz_paper: Any) -> List[TextBlock]:
+    """
+    Extract the text blocks of a PyMuPDF document together with their font information.
+
+    Args:
+        fitz_paper (fitz.Document): The opened PDF document.
+
+    Returns
+    -------
+        list[TextBlock]: The text blocks in reading order, see iter_fitz_blocks.
+    """
+    return list(iter_fitz_blocks(fitz_paper))
+
+
+def is_heading(block: TextBlock, body_size: float) -> bool:
+    """
+    Decide whether a block is a heading, given the font size of the body text.
+
+    Args:
+        block (TextBlock): The block to classify.
+        body_size (float): The most common font size of the document.
+
+    Returns
+    -------
+        bool: True if the block is short, contains words and is set larger or bold.
+    """
+    text = block.text.strip()
+    if len(text) > HEADING_MAX_LENGTH or sum(c.isalpha() for c in text) < HEADING_MIN_LETTERS:
+        return False
+    return block.font_size >= body_size * HEADING_SIZE_RATIO or (
+        block.bold and block.font_size >= body_size
+    )
+
+
+def blocks_from_text(text: str) -> List[TextBlock]:
+    """
+    Split plain text into paragraph blocks at blank lines.
+
+    Args:
+        text (str): The text to split.
+
+    Returns
+    -------
+        list[TextBlock]: The paragraphs, without layout information.
+    """
+    blocks = []
+    start = 0
+    for match in PARAGRAPH_BREAK.finditer(text):
+        if match.end() < len(text):
+            blocks.append(TextBlock(text=text[start : match.end()], start=start))
+            start = match.end()
+    if start < len(text):
+        blocks.append(TextBlock(text=text[start:], start=start))
+    return blocks
+
+
+class StreamingSegmenter:
+    """
+    Cut a stream of text blocks into segments of at most target_size characters.
+
+    Each segment ends at the best boundary in the second half of its window, preferring section
+    headings over paragraph (block) starts over sentence ends over whitespace. Only if none of
+    these exist is the text cut mid-word. A run of consecutive headings (e.g. a section and its
+    first subsection) is only broken before its first heading.
+
+    Blocks are fed one at a time and segments are emitted as soon as enough text has arrived to
+    decide where they end, so only about one segment of text is buffered.
+
+    Attributes
+    ----------
+        target_size (int): The maximum length of a segment in characters.
+        overlap (int): The maximum number of characters a segment repeats from its predecessor.
+            The overlap starts at a sentence or paragraph boundary.
+    """
+
+    def __init__(self, target_size: int, overlap: int = 0):
+        """
+        Initialize a StreamingSegmenter object.
+
+        Args:
+            target_size (int): The maximum length of a segment in characters.
+            overlap (int): The maximum overlap between consecutive segments in characters.
+        """
+        if target_size <= 0:
+            raise ValueError(f"target_size must be positive, got {target_size}.")
+        if not 0 <= overlap < target_size:
+            raise ValueError(f"overlap must be in [0, target_size), got {overlap}.")
+        self.target_size = target_size
+        self.overlap = overlap
+        self._buffer = ""  # the text from self._offset on
+        self._offset = 0
+        self._start = 0  # where the next segment starts
+        self._block_starts: List[int] = []
+        self._break_headings: List[int] = []
+        self._heading_starts: List[int] = []
+        self._heading_texts: List[str] = []
+        self._section: Optional[str] = None  # the last heading dropped from the buffer
+        self._previous_is_heading = False
+
+    @property
+    def _end(self) -> int:
+        """The offset of the end of the text fed so far."""
+        return self._offset + len(self._buffer)
+
+    def feed(self, block: TextBlock) -> Iterator[Segment]:
+        """
+        Append a block to the text and emit the segments that are complete.
+
+        Args:
+            block (TextBlock): The next block of the document.
+
+        Yields
+        ------
+            Segment: The completed segments in document order.
+        """
+        position = self._end
+        if position > 0:
+            self._block_starts.append(position)
+        if block.is_heading:
+            self._heading_starts.append(position)
+            self._heading_texts.append(block.text.strip())
+            if position > 0 and not self._previous_is_heading:
+                self._break_headings.append(position)
+        self._previous_is_heading = block.is_heading
+        self._buffer += block.text
+        while self._end > self._start + self.target_size:
+            yield self._next_segment()
+
+    def finish(self) -> Iterator[Segment]:
+        """
+        Emit the remaining segments once the whole document has been fed.
+
+        Yields
+        ------
+            Segment: The remaining segments in document order.
+        """
+        while self._start < self._end:
+            yield self._next_segment()
+
+    def _local(self, position: int) -> int:
+        """Convert a document offset into an index into the buffer."""
+        return position - self._offset
+
+    def _find_break(self, lower: int, upper: int) -> Optional[int]:
+        """Find the best document offset in (lower, upper] to end a segment, if there is one."""
+        for starts in (self._break_headings, self._block_starts):
+            index = bisect.bisect_right(starts, upper) - 1
+            if index >= 0 and starts[index] > lower:
+                return starts[index]
+        sentence_end = None
+        for match in SENTENCE_BREAK.finditer(self._buffer, self._local(lower), self._local(upper)):
+            sentence_end = match.end() + self._offset
+        if sentence_end is not None and sentence_end > lower:
+            return sentence_end
+        whitespace = self._buffer.rfind(" ", self._local(lower), self._local(upper))
+        if whitespace != -1 and whitespace + self._offset > lower:
+            return whitespace + self._offset + 1
+        return None
+
+    def _overlap_start(self, start: int, end: int) -> int:
+        """Find where the segment after [start, end) starts, reaching back at most overlap."""
+        if self.overlap <= 0:
+            return end
+        lower = max(start + 1, end - self.overlap)
+        candidates = []
+        index = bisect.bisect_left(self._block_starts, lower)
+        if index < len(self._block_starts) and self._block_starts[index] < end:
+            candidates.append(self._block_starts[index])
+        match = SENTENCE_BREAK.search(self._buffer, self._local(lower), self._local(end))
+        if match is not None:
+            candidates.append(match.end() + self._offset)
+        if not candidates:
+            whitespace = self._buffer.find(" ", self._local(lower), self._local(end))
+            candidates.append(whitespace + self._offset + 1 if whitespace != -1 else end)
+        return min(candidates)
+
+    def _next_segment(self) -> Segment:
+        """Cut the segment starting at self._start and drop the text no longer needed."""
+        start = self._start
+        upper = start + self.target_size
+        if upper >= self._end:
+            end = self._end
+        else:
+            end = (
+                self._find_break(start + self.target_size // 2, upper)
+                or self._find_break(start, upper)
+                or upper
+            )
+        heading_index = bisect.bisect_right(self._heading_starts, start) - 1
+        section = self._heading_texts[heading_index] if heading_index >= 0 else self._section
+        segment = Segment(
+            text=self._buffer[self._local(start) : self._local(end)],
+            start=start,
+            end=end,
+            section=section,
+        )
+        self._start = end if end >= self._end else self._overlap_start(start, end)
+        self._drop_before(self._start)
+        return segment
+
+    def _drop_before(self, position: int) -> None:
+        """Forget the text and boundaries before a document offset."""
+        self._buffer = self._buffer[self._local(position) :]
+        self._offset = position
+        self._block_starts = self._block_starts[bisect.bisect_left(self._block_starts, position) :]
+        self._break_headings = self._break_headings[
+            bisect.bisect_left(self._break_headings, position) :
+        ]
+        dropped = bisect.bisect_right(self._heading_starts, position)
+        if dropped > 0:
+            self._section = self._heading_texts[dropped - 1]
+            self._heading_starts = self._heading_starts[dropped:]
+            self._heading_texts = self._heading_texts[dropped:]
+
+
+def iter_block_segments(
+    blocks: Iterable[TextBlock], target_size: int, overlap: int = 0
+) -> Iterator[Segment]:
+    """
+    Lazily cut a stream of text blocks into segments, see StreamingSegmenter.
+
+    Args:
+        blocks (Iterable[TextBlock]): The blocks of the document in order.
+        target_size (int): The maximum length of a segment in characters.
+        overlap (int): The maximum overlap between consecutive segments in characters.
+
+    Yields
+    ------
+        Segment: The segments in document order.
+    """
+    segmenter = StreamingSegmenter(target_size, overlap)
+    for block in blocks:
+        yield from segmenter.feed(block)
+    yield from segmenter.finish()
+
+
+def iter_segments(
+    text: str,
+    target_size: int,
+    overlap: int = 0,
+    blocks: Optional[Sequence[TextBlock]] = None,
+) -> Iterator[Segment]:
+    """
+    Cut a text into segments of at most target_size characters at structural boundaries.
+
+    Args:
+        text (str): The text to segment.
+        target_size (int): The maximum length of a segment in characters.
+        overlap (int): The maximum number of characters a segment repeats from its predecessor.
+            The overlap starts at a sentence or paragraph boundary.
+        blocks (Sequence[TextBlock]): The blocks of the text, which must concatenate to text.
+            Defaults to the paragraphs of text.
+
+    Yields
+    ------
+        Segment: The segments in document order.
+    """
+    return iter_block_segments(
+        blocks_from_text(text) if blocks is None else blocks, target_size, overlap
+    )
+
+
+def segment_text(text: str, target_size: int, overlap: int = 0) -> List[Segment]:
+    """
+    Segment plain text at paragraph and sentence boundaries.
+
+    Args:
+        text (str): The text to segment.
+        target_size (int): The maximum length of a segment in characters.
+        overlap (int): The maximum overlap between consecutive segments in characters.
+
+    Returns
+    -------
+        list[Segment]: The segments in document order.
+    """
+    return list(iter_segments(text, target_size, overlap))
+
+
+def _truncate_blocks(blocks: Sequence[TextBlock], length: int) -> List[TextBlock]:
+    """Cut a list of blocks covering a text down to the first length characters."""
+    truncated = []
+    for block in blocks:
+        if block.start >= length:
+            break
+        if block.start + len(block.text) > length:
+            truncated.append(block.model_copy(update={"text": block.text[: length - block.start]}))
+        else:
+            truncated.append(block)
+    return truncated
+
+
+def segment_document(research_doc: Any, target_size: int, overlap: int = 0) -> List[Segment]:
+    """
+    Segment a research document at section, paragraph and sentence boundaries.
+
+    For PDFs, the blocks and fonts recorded when loading the document (`research_doc.blocks`)
+    or read from the still open PDF (`research_doc.fitz_paper`) determine the paragraphs and
+    section headings. Otherwise, the paper text is split at blank lines.
+
+    Args:
+        research_doc (ResearchDoc): The document to segment.
+        target_size (int): The maximum length of a segment in characters.
+        overlap (int): The maximum overlap between consecutive segments in characters.
+
+    Returns
+    -------
+        list[Segment]: The segments of `research_doc.paper` in document order.
+    """
+    text = research_doc.paper
+    pdf_blocks: List[TextBlock] = list(research_doc.blocks)
+    if not pdf_blocks and research_doc.fitz_paper is not None:
+        pdf_blocks = blocks_from_fitz(research_doc.fitz_paper)
+    blocks: Optional[List[TextBlock]] = None
+    # The paper is the text of the blocks, possibly trimmed at the references
+    if pdf_blocks and "".join(block.text for block in pdf_blocks).startswith(text):
+        blocks = _truncate_blocks(pdf_blocks, len(text))
+    return list(iter_segments(text, target_size, overlap, blocks))
@@ -0,0 +1,424 @@
+"""Persistent cross-paper glossary store with prefix and full-text lookup."""
+
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+from glossagen.utils.dedup_utils import is_abbreviation, normalize_term, split_abbreviation
+
+DEFAULT_STORE_PATH = os.path.join(
+    os.path.expanduser("~"), ".local", "share", "glossagen", "glossary.sqlite"
+)
+DEFAULT_LIMIT = 20
+ALIAS_SEPARATOR = "; "
+MAX_CODE_POINT = "\U0010ffff"
+MAX_PARAMETERS = 500  # below SQLite's limit of host parameters per statement
+TERM_END = ""  # key of the entry in a trie node, never a word
+WORD = re.compile(r"[A-Za-z0-9]+")
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS terms ("
+    "id INTEGER PRIMARY KEY, term TEXT NOT NULL, key TEXT NOT NULL, definition TEXT NOT NULL, "
+    "aliases TEXT NOT NULL DEFAULT '', paper TEXT NOT NULL, chunk INTEGER, added REAL NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS terms_key ON terms (key)",
+    "CREATE INDEX IF NOT EXISTS terms_paper ON terms (paper)",
+    # External content FTS index over the terms table, kept in sync by triggers
+    "CREATE VIRTUAL TABLE IF NOT EXISTS terms_fts USING fts5("
+    "term, definition, aliases, content='terms', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    "CREATE TRIGGER IF NOT EXISTS terms_insert AFTER INSERT ON terms BEGIN "
+    "INSERT INTO terms_fts (rowid, term, definition, aliases) "
+    "VALUES (new.id, new.term, new.definition, new.aliases); END",
+    "CREATE TRIGGER IF NOT EXISTS terms_delete AFTER DELETE ON terms BEGIN "
+    "INSERT INTO terms_fts (terms_fts, rowid, term, definition, aliases) "
+    "VALUES ('delete', old.id, old.term, old.definition, old.aliases); END",
+)
+COLUMNS = "terms.term, terms.definition, terms.aliases, terms.paper, terms.chunk"
+
+
+class StoredTerm(BaseModel):
+    """A glossary entry of the store, with the paper it was extracted from."""
+
+    term: str
+    definition: str
+    aliases: List[str] = []
+    paper: str
+    chunk: Optional[int] = None
+
+
+def _fts_query(query: str) -> str:
+    """Quote every word of a query, so that it is matched literally (all words, any order)."""
+    return " ".join('"' + word.replace('"', '""') + '"' for word in query.split())
+
+
+class TermStore:
+    """
+    A SQLite database of the glossary entries of many papers.
+
+    Every entry is stored with the paper it was extracted from and its location (the index of
+    the chunk). Terms are indexed for case-insensitive prefix lookups, and terms, definitions
+    and aliases are indexed with SQLite FTS5 for full-text search.
+
+    Attributes
+    ----------
+        path (str): The path of the database file.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        Open (and create if necessary) the store.
+
+        Args:
+            path (str): The database file. Defaults to $GLOSSAGEN_STORE or
+                ~/.local/share/glossagen/glossary.sqlite.
+        """
+        self.path: str = path or os.environ.get("GLOSSAGEN_STORE") or DEFAULT_STORE_PATH
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            for statement in SCHEMA:
+                self._connection.execute(statement)
+
+    def add_glossary(self, paper: str, entries: Iterable[Any], replace: bool = True) -> int:
+        """
+        Store the glossary of a paper in a single transaction.
+
+        Args:
+            paper (str): The paper the entries were extracted from, e.g. its path.
+            entries (Iterable[TerminusTechnicus]): The entries; `aliases` and `chunk` are
+                stored if the entries have them.
+            replace (bool): Whether to remove the entries stored earlier for the paper, so that
+                regenerating a glossary does not duplicate it.
+
+        Returns
+        -------
+            int: The number of stored entries.
+        """
+        added = time.time()
+        rows = [
+            (
+                entry.term,
+                entry.term.casefold(),
+                entry.definition,
+                ALIAS_SEPARATOR.join(getattr(entry, "aliases", [])),
+                paper,
+                getattr(entry, "chunk", None),
+                added,
+            )
+            for entry in entries
+        ]
+        with self._lock, self._connection:
+            if replace:
+                self._connection.execute("DELETE FROM terms WHERE paper = ?", (paper,))
+            self._connection.executemany(
+                "INSERT INTO terms (term, key, definition, aliases, paper, chunk, added) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+        return len(rows)
+
+    def remove_paper(self, paper: str) -> None:
+        """Remove all entries of a paper."""
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM terms WHERE paper = ?", (paper,))
+
+    def _select(self, sql: str, parameters: Tuple[Any, ...]) -> List[StoredTerm]:
+        """Run a query returning COLUMNS and convert the rows."""
+        with self._lock:
+            rows = self._connection.execute(sql, parameters).fetchall()
+        return [
+            StoredTerm(
+                term=term,
+                definition=definition,
+                aliases=aliases.split(ALIAS_SEPARATOR) if aliases else [],
+                paper=paper,
+                chunk=chunk,
+            )
+            for term, definition, aliases, paper, chunk in rows
+        ]
+
+    def lookup_prefix(self, prefix: str, limit: int = DEFAULT_LIMIT) -> List[StoredTerm]:
+        """
+        Find the entries whose term starts with a prefix, ignoring case.
+
+        Args:
+            prefix (str): The beginning of the term.
+            limit (int): The maximum number of entries to return.
+
+        Returns
+        -------
+            list[StoredTerm]: The matching entries, ordered by term.
+        """
+        key = prefix.casefold()
+        return self._select(
+            f"SELECT {COLUMNS} FROM terms WHERE key >= ? AND key < ? ORDER BY key, id LIMIT ?",
+            (key, key + MAX_CODE_POINT, limit),
+        )
+
+    def search(self, query: str, limit: int = DEFAULT_LIMIT, raw: bool = False) -> List[StoredTerm]:
+        """
+        Find the entries whose term, definition or aliases contain all words of a query.
+
+        Args:
+            query (str): The words to search for.
+            limit (int): The maximum number of entries to return.
+            raw (bool): Whether the query is in the FTS5 query syntax (e.g. "zeol*" or
+                "term: MOF") instead of plain words.
+
+        Returns
+        -------
+            list[StoredTerm]: The matching entries, best matches first.
+        """
+        match = query if raw else _fts_query(query)
+        if not match:
+            return []
+        return self._select(
+            f"SELECT {COLUMNS} FROM terms_fts JOIN terms ON terms.id = terms_fts.rowid "
+            "WHERE terms_fts MATCH ? ORDER BY bm25(terms_fts, 10.0, 1.0, 5.0) LIMIT ?",
+            (match, limit),
+        )
+
+    def entries_since(self, last_id: int = 0) -> List[Tuple[int, StoredTerm]]:
+        """
+        Return the entries added after a row id, for incremental reloads.
+
+        Args:
+            last_id (int): The largest row id seen so far.
+
+        Returns
+        -------
+            list[tuple[int, StoredTerm]]: The row ids and entries, in order of insertion.
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT terms.id, {COLUMNS} FROM terms WHERE id > ? ORDER BY id", (last_id,)
+            ).fetchall()
+        return [
+            (
+                row_id,
+                StoredTerm(
+                    term=term,
+                    definition=definition,
+                    aliases=aliases.split(ALIAS_SEPARATOR) if aliases else [],
+                    paper=paper,
+                    chunk=chunk,
+                ),
+            )
+            for row_id, term, definition, aliases, paper, chunk in rows
+        ]
+
+    def paper_frequency(
+        self, terms: Iterable[str], exclude_paper: Optional[str] = None
+    ) -> Dict[str, int]:
+        """
+        Count the papers with an entry for each of a number of terms, ignoring case.
+
+        Args:
+            terms (Iterable[str]): The terms.
+            exclude_paper (str): A paper not to count, e.g. the one being ranked.
+
+        Returns
+        -------
+            dict[str, int]: The number of papers per case-folded term, for the terms found.
+        """
+        keys = sorted({term.casefold() for term in terms})
+        frequency: Dict[str, int] = {}
+        for start in range(0, len(keys), MAX_PARAMETERS):
+            batch = keys[start : start + MAX_PARAMETERS]
+            with self._lock:
+                rows = self._connection.execute(
+                    "SELECT key, COUNT(DISTINCT paper) FROM terms "
+                    f"WHERE key IN ({', '.join('?' * len(batch))}) AND paper IS NOT ? "
+                    "GROUP BY key",
+                    (*batch, exclude_paper),
+                ).fetchall()
+            frequency.update(rows)
+        return frequency
+
+    def papers(self) -> List[str]:
+        """Return the papers with stored entries."""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT DISTINCT paper FROM terms ORDER BY paper"
+            ).fetchall()
+        return [paper for (paper,) in rows]
+
+    def __len__(self) -> int:
+        """Return the number of stored entries."""
+        with self._lock:
+            (count,) = self._connection.execute("SELECT COUNT(*) FROM terms").fetchone()
+        return int(count)
+
+    def close(self) -> None:
+        """Close the underlying database connection."""
+        with self._lock:
+            self._connection.close()
+
+
+def _words(text: str) -> List[str]:
+    """Split a text into lower-case, singular words, e.g. "MOFs" into ["mof"]."""
+    return [normalize_term(word) for word in WORD.findall(text)]
+
+
+def term_key(term: str) -> str:
+    """Normalize a term for KnownTerms: lower case, words only, every word singular."""
+    return " ".join(_words(term))
+
+
+class KnownTerms:
+    """
+    An in-memory dictionary of the terms of earlier glossaries, for lookups and search in text.
+
+    Terms and aliases are kept in a set of normalized keys (see term_key) and a trie over their
+    words, so that all known terms of a chunk are found in one pass over its words. Both forms
+    of "expansion (ABBR)" terms are known. Abbreviations only match text that contains capital
+    letters, so that "BET" does not match "bet".
+
+    Attributes
+    ----------
+        store (TermStore): The store the terms are loaded from, or None.
+        last_id (int): The largest row id of the store loaded so far.
+    """
+
+    def __init__(self, store: Optional[TermStore] = None):
+        """
+        Create the dictionary and load the terms of a store.
+
+        Args:
+            store (TermStore): The store to load the terms from, see refresh.
+        """
+        self.store = store
+        self.last_id = 0
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._entries: Dict[str, StoredTerm] = {}
+        self._trie: Dict[str, Any] = {}
+        self._loaded = 0
+        if store is not None:
+            self.refresh()
+
+    def __len__(self) -> int:
+        """Return the number of known keys, including aliases."""
+        return len(self._entries)
+
+    def _add_key(self, text: str, entry: StoredTerm) -> None:
+        """Make a spelling of a term known."""
+        words = _words(text)
+        if not words:
+            return
+        self._entries.setdefault(" ".join(words), entry)
+        node = self._trie
+        for word in words:
+            node = node.setdefault(word, {})
+        node.setdefault(TERM_END, (entry, is_abbreviation(text)))
+
+    def add(self, entry: Any, paper: str = "") -> None:
+        """
+        Make a glossary entry known, with its aliases.
+
+        Args:
+            entry (TerminusTechnicus): The entry; `aliases` are added if the entry has them.
+            paper (str): The paper the entry comes from.
+        """
+        stored = (
+            entry
+            if isinstance(entry, StoredTerm)
+            else StoredTerm(
+                term=entry.term,
+                definition=entry.definition,
+                aliases=getattr(entry, "aliases", []),
+                paper=paper,
+            )
+        )
+        with self._lock:
+            for spelling in [stored.term, *stored.aliases]:
+                for part in split_abbreviation(spelling):
+                    if part:
+                        self._add_key(part, stored)
+
+    def refresh(self) -> int:
+        """
+        Load the entries added to the store since the last refresh.
+
+        Only new rows are read. If entries were removed (e.g. a paper's glossary was replaced),
+        the dictionary is rebuilt, so that terms removed from the store are forgotten.
+
+        Returns
+        -------
+            int: The number of entries loaded.
+        """
+        if self.store is None:
+            return 0
+        with self._refresh_lock:
+            entries = self.store.entries_since(self.last_id)
+            if self._loaded + len(entries) > len(self.store):
+                with self._lock:
+                    self._entries, self._trie = {}, {}
+                self.last_id, self._loaded = 0, 0
+                entries = self.store.entries_since()
+            for row_id, entry in entries:
+                self.add(entry)
+                self.last_id = row_id
+            self._loaded += len(entries)
+        return len(entries)
+
+    def lookup(self, term: str) -> Optional[StoredTerm]:
+        """
+        Return the known entry of a term, or None.
+
+        Args:
+            term (str): The term, also of the form "expansion (ABBR)".
+
+        Returns
+        -------
+            StoredTerm: The entry the term (or one of its forms) belongs to.
+        """
+        for part in split_abbreviation(term):
+            if part:
+                entry = self._entries.get(term_key(part))
+                if entry is not None:
+                    return entry
+        return None
+
+    def is_known(self, term: str) -> bool:
+        """Return whether a term (or one of its forms) is known."""
+        return self.lookup(term) is not None
+
+    def find(self, text: str) -> List[StoredTerm]:
+        """
+        Find the known terms in a text, preferring the longest match at every word.
+
+        Args:
+            text (str): The text, e.g. a chunk.
+
+        Returns
+        -------
+            list[StoredTerm]: The entries found, each once, in order of first appearance.
+        """
+        matches = list(WORD.finditer(text))
+        words = [normalize_term(match.group()) for match in matches]
+        found: Dict[str, StoredTerm] = {}
+        start = 0
+        while start < len(words):
+            node, end, best = self._trie, start, None
+            while end < len(words) and words[end] in node:
+                node = node[words[end]]
+                end += 1
+                if TERM_END in node:
+                    entry, abbreviation = node[TERM_END]
+                    span = text[matches[start].start() : matches[end - 1].end()]
+                    if not abbreviation or any(char.isupper() for char in span):
+                        best = (end, entry)
+            if best is None:
+                start += 1
+            else:
+                start, entry = best
+                found.setdefault(entry.term, entry)
+        return list(found.values())
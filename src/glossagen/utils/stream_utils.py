@@ -0,0 +1,314 @@
+"""Streaming of glossary entries: producers in background threads and incremental writers."""
+
+import asyncio
+import concurrent.futures
+import csv
+import json
+import os
+import queue
+import threading
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+DEFAULT_MAX_PENDING = 64  # items a producer may be ahead of its consumer
+POLL_INTERVAL = 0.1  # seconds between checks whether the consumer is gone
+DEFAULT_ROW_GROUP_SIZE = 1000
+GLOSSARY_COLUMNS = ["Term", "Definition", "Aliases"]
+GLOSSARY_FORMATS = ("jsonl", "csv", "parquet")
+
+Producer = Callable[[Callable[[T], None]], object]  # what a producer returns is ignored
+
+_ITEM, _ERROR, _DONE = "item", "error", "done"
+
+
+class _StreamClosed(Exception):
+    """Raised in a producer when its consumer stopped reading."""
+
+
+def _run_producer(produce: Producer[Any], put: Callable[[Tuple[str, Any]], None]) -> None:
+    """Run a producer, passing its items, then its error or the end of the stream, to put."""
+    try:
+        produce(lambda item: put((_ITEM, item)))
+    except _StreamClosed:
+        return
+    except BaseException as error:  # raised again in the consumer
+        outcome: Tuple[str, Any] = (_ERROR, error)
+    else:
+        outcome = (_DONE, None)
+    try:
+        put(outcome)
+    except _StreamClosed:
+        pass
+
+
+def iterate_in_thread(produce: Producer[T], max_pending: int = DEFAULT_MAX_PENDING) -> Iterator[T]:
+    """
+    Run a producer in a background thread and yield the items it emits as they come.
+
+    The producer is called with an emit function, which it calls for every item. Emit blocks
+    while max_pending items are waiting, so a slow consumer slows the producer down instead of
+    filling up memory. An exception of the producer is raised in the consumer. If the consumer
+    stops early, the next emit raises in the producer, which can clean up and end.
+
+    Args:
+        produce (Callable): The producer; it is started on the first next().
+        max_pending (int): The most items waiting for the consumer.
+
+    Yields
+    ------
+        The items, in the order they were emitted.
+    """
+    items: "queue.Queue[Tuple[str, Any]]" = queue.Queue(max_pending)
+    closed = threading.Event()
+
+    def put(item: Tuple[str, Any]) -> None:
+        while True:
+            if closed.is_set():
+                raise _StreamClosed()
+            try:
+                items.put(item, timeout=POLL_INTERVAL)
+                return
+            except queue.Full:
+                continue
+
+    threading.Thread(
+        target=_run_producer, args=(produce, put), name="glossagen-stream", daemon=True
+    ).start()
+    try:
+        while True:
+            kind, value = items.get()
+            if kind == _ERROR:
+                raise value
+            if kind == _DONE:
+                return
+            yield value
+    finally:
+        closed.set()
+
+
+async def aiterate_in_thread(
+    produce: Producer[T], max_pending: int = DEFAULT_MAX_PENDING
+) -> AsyncIterator[T]:
+    """
+    Run a producer in a background thread and yield the items it emits to an event loop.
+
+    This is the asynchronous counterpart of iterate_in_thread: the event loop keeps running
+    while the producer works, e.g. waits for the language model.
+
+    Args:
+        produce (Callable): The producer; it is started on the first iteration.
+        max_pending (int): The most items waiting for the consumer.
+
+    Yields
+    ------
+        The items, in the order they were emitted.
+    """
+    loop = asyncio.get_running_loop()
+    items: "asyncio.Queue[Tuple[str, Any]]" = asyncio.Queue(max_pending)
+    closed = threading.Event()
+
+    def put(item: Tuple[str, Any]) -> None:
+        future = asyncio.run_coroutine_threadsafe(items.put(item), loop)
+        while True:
+            if closed.is_set():
+                future.cancel()
+                raise _StreamClosed()
+            try:
+                future.result(timeout=POLL_INTERVAL)
+                return
+            except concurrent.futures.TimeoutError:
+                continue
+
+    threading.Thread(
+        target=_run_producer, args=(produce, put), name="glossagen-stream", daemon=True
+    ).start()
+    try:
+        while True:
+            kind, value = await items.get()
+            if kind == _ERROR:
+                raise value
+            if kind == _DONE:
+                return
+            yield value
+    finally:
+        closed.set()
+
+
+def glossary_row(entry: Any) -> Dict[str, str]:
+    """
+    Return a glossary entry as a row of the glossary table.
+
+    Args:
+        entry (TerminusTechnicus): The entry; `aliases` are included if the entry has them.
+
+    Returns
+    -------
+        dict[str, str]: The "Term", "Definition" and "Aliases" (separated by "; ").
+    """
+    return {
+        "Term": entry.term,
+        "Definition": entry.definition,
+        "Aliases": "; ".join(getattr(entry, "aliases", [])),
+    }
+
+
+class GlossaryWriter:
+    """
+    Writes glossary entries one at a time, so the file can be read while the glossary grows.
+
+    Every format has the columns of the glossary table, see glossary_row. Writers are context
+    managers and close their file on exit.
+
+    Attributes
+    ----------
+        path (str): The output file.
+        written (int): The number of entries written.
+    """
+
+    def __init__(self, path: str):
+        """
+        Create the directory of the output file.
+
+        Args:
+            path (str): The output file; an existing file is replaced.
+        """
+        self.path = path
+        self.written = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def write(self, entry: Any) -> None:
+        """Write an entry."""
+        self.write_row(glossary_row(entry))
+        self.written += 1
+
+    def write_row(self, row: Dict[str, str]) -> None:
+        """Write a row of the glossary table."""
+
+    def close(self) -> None:
+        """Write what is buffered and close the file."""
+
+    def __enter__(self) -> "GlossaryWriter":
+        """Return the writer."""
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        """Close the writer."""
+        self.close()
+
+
+class JsonlGlossaryWriter(GlossaryWriter):
+    """Write every entry as one JSON line, flushed right away."""
+
+    def __init__(self, path: str):
+        """Open the file."""
+        super().__init__(path)
+        self._file = open(path, "w", encoding="utf-8")
+
+    def write_row(self, row: Dict[str, str]) -> None:
+        """Write the row as a JSON line."""
+        self._file.write(json.dumps(row, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def close(self) -> None:
+        """Close the file."""
+        self._file.close()
+
+
+class CsvGlossaryWriter(GlossaryWriter):
+    """Write a CSV file like pandas.DataFrame.to_csv, one flushed row per entry."""
+
+    def __init__(self, path: str):
+        """Open the file and write the header."""
+        super().__init__(path)
+        self._file = open(path, "w", encoding="utf-8", newline="")
+        self._writer = csv.DictWriter(self._file, fieldnames=GLOSSARY_COLUMNS)
+        self._writer.writeheader()
+        self._file.flush()
+
+    def write_row(self, row: Dict[str, str]) -> None:
+        """Write the row."""
+        self._writer.writerow(row)
+        self._file.flush()
+
+    def close(self) -> None:
+        """Close the file."""
+        self._file.close()
+
+
+class ParquetGlossaryWriter(GlossaryWriter):
+    """
+    Write a Parquet file with pyarrow, one row group per row_group_size entries.
+
+    Parquet files can only be read once they are closed, but memory stays bounded by the row
+    group.
+
+    Attributes
+    ----------
+        row_group_size (int): The number of entries buffered before they are written.
+    """
+
+    def __init__(self, path: str, row_group_size: int = DEFAULT_ROW_GROUP_SIZE):
+        """
+        Open the file.
+
+        Args:
+            path (str): The output file.
+            row_group_size (int): The number of entries buffered before they are written.
+
+        Raises
+        ------
+            ImportError: If pyarrow is not installed.
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        super().__init__(path)
+        self.row_group_size = row_group_size
+        self._pa = pa
+        self._schema = pa.schema([(column, pa.string()) for column in GLOSSARY_COLUMNS])
+        self._writer = pq.ParquetWriter(path, self._schema)
+        self._rows: List[Dict[str, str]] = []
+
+    def write_row(self, row: Dict[str, str]) -> None:
+        """Buffer the row, writing a row group once the buffer is full."""
+        self._rows.append(row)
+        if len(self._rows) >= self.row_group_size:
+            self._flush()
+
+    def _flush(self) -> None:
+        """Write the buffered rows as a row group."""
+        if self._rows:
+            self._writer.write_table(self._pa.Table.from_pylist(self._rows, schema=self._schema))
+            self._rows = []
+
+    def close(self) -> None:
+        """Write the last row group and the footer."""
+        self._flush()
+        self._writer.close()
+
+
+def make_glossary_writer(path: str, kind: Optional[str] = None) -> GlossaryWriter:
+    """
+    Create a glossary writer for one of the built-in formats.
+
+    Args:
+        path (str): The output file.
+        kind (str): "jsonl", "csv" or "parquet". Defaults to the extension of path.
+
+    Returns
+    -------
+        GlossaryWriter: The writer; close it when the glossary is complete.
+
+    Raises
+    ------
+        ValueError: If kind is not one of GLOSSARY_FORMATS.
+    """
+    kind = kind or os.path.splitext(path)[1].lstrip(".").lower()
+    if kind == "jsonl":
+        return JsonlGlossaryWriter(path)
+    if kind == "csv":
+        return CsvGlossaryWriter(path)
+    if kind == "parquet":
+        return ParquetGlossaryWriter(path)
+    raise ValueError(f"kind must be one of {', '.join(GLOSSARY_FORMATS)}, got {kind!r}.")
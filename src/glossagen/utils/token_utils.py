@@ -0,0 +1,384 @@
+"""Token counting and token-budget packing of documents into language model requests."""
+
+import abc
+import functools
+import math
+from typing import Any, Dict, List, Optional
+
+from glossagen.utils.segment_utils import Segment, iter_segments, segment_document
+
+CHARS_PER_TOKEN = 4  # rough size of an English token, if no tokenizer is available
+DEFAULT_CONTEXT_WINDOW = 16385
+DEFAULT_MAX_OUTPUT_TOKENS = 4096
+DEFAULT_CHUNK_TOKENS = 8000  # larger chunks make the model skip terms
+DEFAULT_PROMPT_TOKENS = 600  # instructions and output schema of the glossary signature
+DEFAULT_OUTPUT_RATIO = 0.35  # glossary tokens per text token of a dense chunk
+DEFAULT_MIN_OUTPUT_TOKENS = 256
+BALANCE_SLACK = 1.1  # room for the segmenter to find a boundary near the balanced size
+
+# The context window and the maximum completion of the models, by name prefix
+MODEL_LIMITS: Dict[str, Dict[str, int]] = {
+    "gpt-3.5-turbo": {"context_window": 16385, "max_output_tokens": 4096},
+    "gpt-4o-mini": {"context_window": 128000, "max_output_tokens": 16384},
+    "gpt-4o": {"context_window": 128000, "max_output_tokens": 4096},
+    "gpt-4-turbo": {"context_window": 128000, "max_output_tokens": 4096},
+    "gpt-4": {"context_window": 8192, "max_output_tokens": 4096},
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the number of tokens of a text, for rate limiting before the API counts them."""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def model_limits(model: Optional[str]) -> Dict[str, int]:
+    """
+    Look up the context window and maximum completion of a model in MODEL_LIMITS.
+
+    Args:
+        model (str): The model name; dated versions ("gpt-4o-2024-05-13") use the base limits.
+
+    Returns
+    -------
+        dict: The "context_window" and "max_output_tokens", with defaults for unknown models.
+    """
+    defaults = {
+        "context_window": DEFAULT_CONTEXT_WINDOW,
+        "max_output_tokens": DEFAULT_MAX_OUTPUT_TOKENS,
+    }
+    if model is None:
+        return defaults
+    limits = MODEL_LIMITS.get(model) or next(
+        (
+            MODEL_LIMITS[name]
+            for name in sorted(MODEL_LIMITS, key=len, reverse=True)
+            if model.startswith(name)
+        ),
+        defaults,
+    )
+    return dict(limits)
+
+
+class Tokenizer(abc.ABC):
+    """Counts the tokens of a text the way a language model does."""
+
+    name = "tokenizer"
+
+    @abc.abstractmethod
+    def count(self, text: str) -> int:
+        """Return the number of tokens of a text."""
+
+
+class CharRatioTokenizer(Tokenizer):
+    """
+    Estimates the tokens of a text from its length, without any model files.
+
+    Attributes
+    ----------
+        chars_per_token (float): The average number of characters per token.
+    """
+
+    name = "chars"
+
+    def __init__(self, chars_per_token: float = CHARS_PER_TOKEN):
+        """
+        Create the tokenizer.
+
+        Args:
+            chars_per_token (float): The average number of characters per token.
+        """
+        if chars_per_token <= 0:
+            raise ValueError(f"chars_per_token must be positive, got {chars_per_token}.")
+        self.chars_per_token = chars_per_token
+
+    def count(self, text: str) -> int:
+        """Return the estimated number of tokens of a text."""
+        return math.ceil(len(text) / self.chars_per_token)
+
+
+class TiktokenTokenizer(Tokenizer):
+    """
+    Counts tokens with the tiktoken encoding of an OpenAI model.
+
+    Attributes
+    ----------
+        encoding (tiktoken.Encoding): The encoding of the model.
+    """
+
+    name = "tiktoken"
+
+    def __init__(self, model: Optional[str] = None):
+        """
+        Load the encoding of a model; unknown models use cl100k_base.
+
+        Args:
+            model (str): The model name.
+
+        Raises
+        ------
+            ImportError: If tiktoken is not installed.
+        """
+        import tiktoken
+
+        try:
+            self.encoding = tiktoken.encoding_for_model(model or "")
+        except KeyError:
+            self.encoding = tiktoken.get_encoding("cl100k_base")
+
+    def count(self, text: str) -> int:
+        """Return the number of tokens of a text."""
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+
+@functools.lru_cache(maxsize=None)
+def get_tokenizer(model: Optional[str] = None) -> Tokenizer:
+    """
+    Return the tokenizer of a model: tiktoken if it is installed, else CharRatioTokenizer.
+
+    The encodings of tiktoken are downloaded on first use, so offline the character ratio is
+    used as well.
+
+    Args:
+        model (str): The model name.
+
+    Returns
+    -------
+        Tokenizer: The tokenizer, shared by all callers with the same model.
+    """
+    try:
+        return TiktokenTokenizer(model)
+    except Exception:  # not installed, or the encoding cannot be downloaded
+        return CharRatioTokenizer()
+
+
+class TokenBudget:
+    """
+    The token limits of one glossary request, derived from the model's context window.
+
+    A chunk of n tokens is sent with max_tokens = min_output_tokens + output_ratio * n, capped
+    at max_output_tokens. The largest chunk is the one whose expected output still fits into
+    max_output_tokens and whose prompt and output fit into the context window, so that the
+    JSON glossary is not truncated.
+
+    Attributes
+    ----------
+        tokenizer (Tokenizer): Counts the tokens of the chunks.
+        context_window (int): The tokens of prompt and completion the model accepts.
+        max_output_tokens (int): The most tokens the model generates per request.
+        prompt_tokens (int): The tokens of the prompt besides the chunk.
+        output_ratio (float): The expected glossary tokens per chunk token.
+        min_output_tokens (int): The completion tokens requested for even the shortest chunk.
+        max_chunk_tokens (int): An upper limit of the chunk size independent of the model.
+    """
+
+    def __init__(  # noqa: PLR0913
+        self,
+        tokenizer: Optional[Tokenizer] = None,
+        context_window: int = DEFAULT_CONTEXT_WINDOW,
+        max_output_tokens: int = DEFAULT_MAX_OUTPUT_TOKENS,
+        prompt_tokens: int = DEFAULT_PROMPT_TOKENS,
+        output_ratio: float = DEFAULT_OUTPUT_RATIO,
+        min_output_tokens: int = DEFAULT_MIN_OUTPUT_TOKENS,
+        max_chunk_tokens: Optional[int] = DEFAULT_CHUNK_TOKENS,
+    ):
+        """
+        Create the budget.
+
+        Args:
+            tokenizer (Tokenizer): Counts the tokens of the chunks. Defaults to
+                CharRatioTokenizer.
+            context_window (int): The tokens of prompt and completion the model accepts.
+            max_output_tokens (int): The most tokens the model generates per request.
+            prompt_tokens (int): The tokens of the prompt besides the chunk.
+            output_ratio (float): The expected glossary tokens per chunk token.
+            min_output_tokens (int): The completion tokens requested for the shortest chunk.
+            max_chunk_tokens (int): An upper limit of the chunk size, or None for none.
+        """
+        self.tokenizer = tokenizer or CharRatioTokenizer()
+        self.context_window = context_window
+        self.max_output_tokens = max_output_tokens
+        self.prompt_tokens = prompt_tokens
+        self.output_ratio = output_ratio
+        self.min_output_tokens = min_output_tokens
+        self.max_chunk_tokens = max_chunk_tokens
+        if self.chunk_tokens <= 0:
+            raise ValueError(
+                f"A context window of {context_window} tokens leaves no room for the text."
+            )
+
+    @classmethod
+    def for_model(
+        cls, model: Optional[str], tokenizer: Optional[Tokenizer] = None, **kwargs: Any
+    ) -> "TokenBudget":
+        """
+        Create the budget of a model from MODEL_LIMITS.
+
+        Args:
+            model (str): The model name.
+            tokenizer (Tokenizer): Counts the tokens. Defaults to get_tokenizer(model).
+            kwargs: Further arguments of TokenBudget, overriding the model limits.
+
+        Returns
+        -------
+            TokenBudget: The budget.
+        """
+        return cls(tokenizer or get_tokenizer(model), **{**model_limits(model), **kwargs})
+
+    @property
+    def chunk_tokens(self) -> int:
+        """The most tokens of text one request can take."""
+        available = self.max_output_tokens - self.min_output_tokens
+        limit = int(available / self.output_ratio) if self.output_ratio > 0 else available
+        limit = min(
+            limit,
+            int(
+                (self.context_window - self.prompt_tokens - self.min_output_tokens)
+                / (1 + self.output_ratio)
+            ),
+        )
+        if self.max_chunk_tokens is not None:
+            limit = min(limit, self.max_chunk_tokens)
+        return limit
+
+    def count(self, text: str) -> int:
+        """Return the number of tokens of a text."""
+        return self.tokenizer.count(text)
+
+    def output_tokens(self, chunk_tokens: int) -> int:
+        """
+        Return the max_tokens of the request for a chunk.
+
+        Args:
+            chunk_tokens (int): The tokens of the chunk.
+
+        Returns
+        -------
+            int: The completion tokens expected for the chunk, within max_output_tokens and
+                the room the context window leaves.
+        """
+        expected = self.min_output_tokens + math.ceil(chunk_tokens * self.output_ratio)
+        room = self.context_window - self.prompt_tokens - chunk_tokens
+        return max(1, min(expected, self.max_output_tokens, room))
+
+
+def _split_segment(segment: Segment, budget: TokenBudget, tokens: int) -> List[Segment]:
+    """Cut a segment with more tokens than the budget into pieces that fit."""
+    limit = budget.chunk_tokens
+    if tokens <= limit or len(segment.text) <= 1:
+        return [segment]
+    target = max(1, int(len(segment.text) * limit / tokens * 0.9))
+    pieces = []
+    for part in iter_segments(segment.text, min(target, len(segment.text) - 1)):
+        piece = Segment(
+            text=part.text,
+            start=segment.start + part.start,
+            end=segment.start + part.end,
+            section=part.section or segment.section,
+        )
+        pieces.extend(_split_segment(piece, budget, budget.count(piece.text)))
+    return pieces
+
+
+def _merge(first: Segment, second: Segment) -> Segment:
+    """Join two consecutive, possibly overlapping segments."""
+    overlap = max(0, first.end - second.start)
+    return Segment(
+        text=first.text + second.text[overlap:],
+        start=first.start,
+        end=second.end,
+        section=first.section,
+    )
+
+
+def pack_segments(segments: List[Segment], budget: TokenBudget) -> List[Segment]:
+    """
+    Fit segments to a token budget: split the ones that are too long, then merge neighbours.
+
+    Consecutive segments are merged as long as the result fits into budget.chunk_tokens, so
+    short segments, like the tail of a document or a section cut off before a heading, do not
+    cost a request of their own.
+
+    Args:
+        segments (list[Segment]): The segments in document order.
+        budget (TokenBudget): The budget of one request.
+
+    Returns
+    -------
+        list[Segment]: The packed segments in document order.
+    """
+    pieces: List[Segment] = []
+    counts: List[int] = []
+    for segment in segments:
+        for piece in _split_segment(segment, budget, budget.count(segment.text)):
+            pieces.append(piece)
+            counts.append(budget.count(piece.text))
+
+    packed: List[Segment] = []
+    packed_tokens = 0
+    for piece, tokens in zip(pieces, counts):
+        # Counting the overlap twice errs on the safe side
+        if packed and packed_tokens + tokens <= budget.chunk_tokens:
+            packed[-1] = _merge(packed[-1], piece)
+            packed_tokens += tokens
+        else:
+            packed.append(piece)
+            packed_tokens = tokens
+    return packed
+
+
+def pack_document(research_doc: Any, budget: TokenBudget, overlap: int = 0) -> List[Segment]:
+    """
+    Segment a research document into as few chunks as the token budget allows.
+
+    The document is cut into the smallest number of equally sized segments that fit the budget
+    (at section, paragraph and sentence boundaries, see segment_document), which are then
+    fitted with pack_segments.
+
+    Args:
+        research_doc (ResearchDoc): The document to segment.
+        budget (TokenBudget): The budget of one request.
+        overlap (int): The maximum overlap between consecutive segments in characters.
+
+    Returns
+    -------
+        list[Segment]: The segments of `research_doc.paper` in document order.
+    """
+    text = research_doc.paper
+    if not text:
+        return []
+    tokens = max(1, budget.count(text))
+    limit = budget.chunk_tokens
+    chunks = math.ceil(tokens / limit)
+    target = min(
+        int(limit * len(text) / tokens),
+        math.ceil(len(text) / chunks * BALANCE_SLACK),
+    )
+    target = max(target, 1)
+    segments = segment_document(research_doc, target, min(overlap, target - 1))
+    return pack_segments(segments, budget)
+
+
+def chunk_document(
+    research_doc: Any,
+    chunk_size: Optional[int] = None,
+    overlap: int = 0,
+    budget: Optional[TokenBudget] = None,
+) -> List[Segment]:
+    """
+    Split a research document into the chunks of its glossary requests.
+
+    Args:
+        research_doc (ResearchDoc): The document to split.
+        chunk_size (int): The maximum size of a chunk in characters, see segment_document. By
+            default, the chunks are packed by tokens instead, see pack_document.
+        overlap (int): The maximum overlap between consecutive chunks in characters.
+        budget (TokenBudget): The budget of one request, used without chunk_size. Defaults to
+            that of an unknown model.
+
+    Returns
+    -------
+        list[Segment]: The chunks in document order.
+    """
+    if chunk_size is not None:
+        return segment_document(research_doc, chunk_size, overlap)
+    return pack_document(research_doc, budget or TokenBudget.for_model(None), overlap)
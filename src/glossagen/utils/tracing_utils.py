@@ -0,0 +1,573 @@
+"""Per-stage tracing of the pipelines: spans with timings, token counts and cost."""
+
+import contextlib
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+import urllib.request
+from collections import defaultdict
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, TypeVar
+
+from typing_extensions import ParamSpec
+
+P = ParamSpec("P")
+T = TypeVar("T")
+
+TRACE_SINKS = ("none", "json", "otlp")
+DEFAULT_MAX_SPANS = 100000
+SERVICE_NAME = "glossagen"
+LM_REQUEST = "lm.request"
+
+# USD per million prompt and completion tokens, for the cost estimates of the summary
+MODEL_PRICES: Dict[str, Tuple[float, float]] = {
+    "gpt-3.5-turbo": (0.5, 1.5),
+    "gpt-4o": (5.0, 15.0),
+    "gpt-4-turbo": (10.0, 30.0),
+    "gpt-4": (30.0, 60.0),
+    "offline": (0.0, 0.0),
+}
+
+
+def estimate_cost(
+    model: Optional[str], prompt_tokens: int, completion_tokens: int
+) -> Optional[float]:
+    """
+    Estimate the cost of a language model request from MODEL_PRICES.
+
+    Args:
+        model (str): The model name; dated versions ("gpt-4o-2024-05-13") use the base price.
+        prompt_tokens (int): The number of prompt tokens.
+        completion_tokens (int): The number of completion tokens.
+
+    Returns
+    -------
+        float: The cost in USD, or None for models without a price.
+    """
+    if model is None:
+        return None
+    prices = MODEL_PRICES.get(model) or next(
+        (
+            MODEL_PRICES[name]
+            for name in sorted(MODEL_PRICES, key=len, reverse=True)
+            if model.startswith(name)
+        ),
+        None,
+    )
+    if prices is None:
+        return None
+    return (prompt_tokens * prices[0] + completion_tokens * prices[1]) / 1e6
+
+
+class Span:
+    """
+    A timed stage of a run, e.g. loading a PDF or one language model request.
+
+    Attributes
+    ----------
+        name (str): The name of the stage, e.g. "pdf.load".
+        trace_id (str): The id shared by all spans of one trace (32 hex digits).
+        span_id (str): The id of the span (16 hex digits).
+        parent_id (str): The span_id of the enclosing span, or None.
+        start_ns (int): The start time in nanoseconds since the epoch.
+        end_ns (int): The end time in nanoseconds since the epoch, or None while running.
+        attributes (dict): Details such as the paper, sizes or token counts.
+        error (str): The exception the span ended with, or None.
+    """
+
+    __slots__ = (
+        "name",
+        "trace_id",
+        "span_id",
+        "parent_id",
+        "start_ns",
+        "end_ns",
+        "attributes",
+        "error",
+    )
+
+    def __init__(self, name: str, parent: Optional["Span"], attributes: Dict[str, Any]):
+        """Start a span, in the trace of its parent if there is one."""
+        self.name = name
+        self.trace_id: str = parent.trace_id if parent is not None else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent is not None else None
+        self.attributes = attributes
+        if parent is not None and "paper" in parent.attributes:
+            self.attributes.setdefault("paper", parent.attributes["paper"])
+        self.error: Optional[str] = None
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+
+    def set(self, **attributes: Any) -> None:
+        """Add or replace attributes."""
+        self.attributes.update(attributes)
+
+    @property
+    def seconds(self) -> float:
+        """The duration of the span in seconds (so far, while it is running)."""
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e9
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the span as a JSON-serializable dict."""
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "seconds": self.seconds,
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+_CURRENT_SPAN: "contextvars.ContextVar[Optional[Span]]" = contextvars.ContextVar(
+    "glossagen_span", default=None
+)
+
+
+class SpanExporter:
+    """A backend that receives the finished spans of a Tracer."""
+
+    def export(self, spans: Sequence[Span]) -> None:
+        """Write finished spans."""
+
+    def close(self) -> None:
+        """Flush and release the backend."""
+
+
+class JsonTraceExporter(SpanExporter):
+    """Append every span as one JSON line to a local trace file."""
+
+    def __init__(self, path: str):
+        """
+        Open the file for appending.
+
+        Args:
+            path (str): The path of the trace file.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+
+    def export(self, spans: Sequence[Span]) -> None:
+        """Append the spans and flush the file."""
+        self._file.writelines(json.dumps(span.to_dict(), default=str) + "\n" for span in spans)
+        self._file.flush()
+
+    def close(self) -> None:
+        """Close the file."""
+        self._file.close()
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    """Convert an attribute value to an OTLP AnyValue."""
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_span(span: Span) -> Dict[str, Any]:
+    """Convert a finished span to an OTLP/JSON Span."""
+    return {
+        "traceId": span.trace_id,
+        "spanId": span.span_id,
+        "parentSpanId": span.parent_id or "",
+        "name": span.name,
+        "kind": 1,  # SPAN_KIND_INTERNAL
+        "startTimeUnixNano": str(span.start_ns),
+        "endTimeUnixNano": str(span.end_ns),
+        "attributes": [
+            {"key": key, "value": _otlp_value(value)}
+            for key, value in span.attributes.items()
+            if value is not None
+        ],
+        # STATUS_CODE_ERROR or STATUS_CODE_OK
+        "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+    }
+
+
+def otlp_request(spans: Sequence[Span]) -> Dict[str, Any]:
+    """
+    Convert spans to an OTLP/JSON ExportTraceServiceRequest.
+
+    Args:
+        spans (Sequence[Span]): The finished spans.
+
+    Returns
+    -------
+        dict: The request, as accepted by the /v1/traces endpoint of OpenTelemetry collectors.
+    """
+    resource = {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]}
+    scope_spans = {"scope": {"name": __name__}, "spans": [_otlp_span(span) for span in spans]}
+    return {"resourceSpans": [{"resource": resource, "scopeSpans": [scope_spans]}]}
+
+
+class OtlpJsonExporter(SpanExporter):
+    """
+    Export spans in the OTLP/JSON format of OpenTelemetry.
+
+    Spans go to a file, one ExportTraceServiceRequest per line like the file exporter of the
+    OpenTelemetry collector writes them, or are posted to the /v1/traces endpoint of a collector.
+    """
+
+    def __init__(self, target: str, timeout: float = 10.0):
+        """
+        Open the file or remember the endpoint.
+
+        Args:
+            target (str): A file path, or the http(s) URL of a collector, e.g.
+                http://localhost:4318.
+            timeout (float): The timeout in seconds of requests to a collector.
+        """
+        self.timeout = timeout
+        self._endpoint: Optional[str] = None
+        self._file = None
+        if target.startswith(("http://", "https://")):
+            endpoint = target.rstrip("/")
+            self._endpoint = (
+                endpoint if endpoint.endswith("/v1/traces") else endpoint + "/v1/traces"
+            )
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(target)), exist_ok=True)
+            self._file = open(target, "a", encoding="utf-8")
+
+    def export(self, spans: Sequence[Span]) -> None:
+        """Write or post the spans as one request."""
+        if not spans:
+            return
+        body = json.dumps(otlp_request(spans), default=str)
+        if self._file is not None:
+            self._file.write(body + "\n")
+            self._file.flush()
+            return
+        request = urllib.request.Request(
+            self._endpoint,  # type: ignore[arg-type]
+            data=body.encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout):
+            pass
+
+    def close(self) -> None:
+        """Close the file, if any."""
+        if self._file is not None:
+            self._file.close()
+
+
+class Tracer:
+    """
+    Record spans of the pipeline stages and hand them to exporters.
+
+    Spans nest: a span started while another one is running in the same thread (or in a
+    function wrapped with bind_span) becomes its child. Finished spans are kept for the summary
+    until the tracer is flushed; beyond max_spans, spans are dropped and counted.
+
+    Attributes
+    ----------
+        exporters (list[SpanExporter]): The backends the spans are written to.
+        dropped (int): The number of spans dropped because max_spans was reached.
+    """
+
+    def __init__(self, exporters: Sequence[SpanExporter] = (), max_spans: int = DEFAULT_MAX_SPANS):
+        """
+        Create a tracer.
+
+        Args:
+            exporters (Sequence[SpanExporter]): The backends to write the spans to on flush.
+            max_spans (int): The maximum number of finished spans kept in memory.
+        """
+        self.exporters = list(exporters)
+        self.max_spans = max_spans
+        self.dropped = 0
+        self._spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Span]:
+        """
+        Time a stage.
+
+        Args:
+            name (str): The name of the stage.
+            attributes: Details of the stage; more can be added with Span.set.
+
+        Yields
+        ------
+            Span: The running span.
+        """
+        span = Span(name, _CURRENT_SPAN.get(), attributes)
+        token = _CURRENT_SPAN.set(span)
+        try:
+            yield span
+        except BaseException as error:
+            span.error = repr(error)
+            raise
+        finally:
+            span.end_ns = time.time_ns()
+            _CURRENT_SPAN.reset(token)
+            with self._lock:
+                if len(self._spans) < self.max_spans:
+                    self._spans.append(span)
+                else:
+                    self.dropped += 1
+
+    def spans(self) -> List[Span]:
+        """Return the finished spans that have not been flushed yet."""
+        with self._lock:
+            return list(self._spans)
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """
+        Aggregate the finished spans by stage.
+
+        Returns
+        -------
+            list[dict]: For every stage name, in order of first appearance: the number of spans
+                and errors, the total and maximum seconds, and the tokens and cost of the
+                language model requests.
+        """
+        stages: Dict[str, Dict[str, Any]] = {}
+        for span in self.spans():
+            stage = stages.setdefault(
+                span.name,
+                {
+                    "stage": span.name,
+                    "count": 0,
+                    "errors": 0,
+                    "seconds": 0.0,
+                    "max_seconds": 0.0,
+                    "prompt_tokens": 0,
+                    "completion_tokens": 0,
+                    "cost": None,
+                },
+            )
+            stage["count"] += 1
+            stage["errors"] += span.error is not None
+            stage["seconds"] += span.seconds
+            stage["max_seconds"] = max(stage["max_seconds"], span.seconds)
+            stage["prompt_tokens"] += span.attributes.get("prompt_tokens", 0)
+            stage["completion_tokens"] += span.attributes.get("completion_tokens", 0)
+            if span.attributes.get("cost") is not None:
+                stage["cost"] = (stage["cost"] or 0.0) + span.attributes["cost"]
+        return list(stages.values())
+
+    def paper_summary(self) -> List[Dict[str, Any]]:
+        """
+        Aggregate the finished spans by paper.
+
+        Returns
+        -------
+            list[dict]: For every paper: the wall time from its first to its last span, the
+                number of language model requests and retries, and their tokens and cost.
+        """
+        papers: Dict[str, Dict[str, Any]] = {}
+        bounds: Dict[str, List[int]] = defaultdict(list)
+        for span in self.spans():
+            paper = span.attributes.get("paper")
+            if paper is None:
+                continue
+            bounds[paper].extend([span.start_ns, span.end_ns or span.start_ns])
+            totals = papers.setdefault(
+                paper,
+                {
+                    "paper": paper,
+                    "requests": 0,
+                    "retries": 0,
+                    "prompt_tokens": 0,
+                    "completion_tokens": 0,
+                    "cost": None,
+                },
+            )
+            if span.name != LM_REQUEST:
+                continue
+            totals["requests"] += 1
+            totals["retries"] += span.error is not None
+            totals["prompt_tokens"] += span.attributes.get("prompt_tokens", 0)
+            totals["completion_tokens"] += span.attributes.get("completion_tokens", 0)
+            if span.attributes.get("cost") is not None:
+                totals["cost"] = (totals["cost"] or 0.0) + span.attributes["cost"]
+        for paper, totals in papers.items():
+            totals["seconds"] = (max(bounds[paper]) - min(bounds[paper])) / 1e9
+        return list(papers.values())
+
+    def format_summary(self) -> str:
+        """Format the stage and paper summaries as tables."""
+
+        def cost(value: Optional[float]) -> str:
+            return f"${value:.4f}" if value is not None else "-"
+
+        lines = [
+            f"{'stage':<20} {'count':>6} {'errors':>6} {'seconds':>9} {'max':>8} "
+            f"{'prompt tok':>10} {'compl tok':>10} {'cost':>9}"
+        ]
+        for stage in self.summary():
+            lines.append(
+                f"{stage['stage']:<20} {stage['count']:>6} {stage['errors']:>6} "
+                f"{stage['seconds']:>9.3f} {stage['max_seconds']:>8.3f} "
+                f"{stage['prompt_tokens']:>10} {stage['completion_tokens']:>10} "
+                f"{cost(stage['cost']):>9}"
+            )
+        papers = self.paper_summary()
+        if papers:
+            lines.append("")
+            lines.append(
+                f"{'paper':<40} {'seconds':>9} {'requests':>8} {'retries':>7} "
+                f"{'tokens':>10} {'cost':>9}"
+            )
+            for paper in papers:
+                tokens = paper["prompt_tokens"] + paper["completion_tokens"]
+                lines.append(
+                    f"{str(paper['paper'])[-40:]:<40} {paper['seconds']:>9.3f} "
+                    f"{paper['requests']:>8} {paper['retries']:>7} {tokens:>10} "
+                    f"{cost(paper['cost']):>9}"
+                )
+        if self.dropped:
+            lines.append(f"({self.dropped} spans dropped)")
+        return "\n".join(lines)
+
+    def flush(self) -> None:
+        """Export the finished spans and forget them."""
+        with self._lock:
+            spans, self._spans = self._spans, []
+        for exporter in self.exporters:
+            try:
+                exporter.export(spans)
+            except Exception as error:  # tracing must never break the pipeline
+                print(f"Trace export failed: {error!r}")
+
+    def close(self) -> None:
+        """Export the remaining spans and release the exporters."""
+        self.flush()
+        for exporter in self.exporters:
+            exporter.close()
+
+
+_TRACER: Dict[str, Tracer] = {"tracer": Tracer()}
+
+
+def get_tracer() -> Tracer:
+    """Return the tracer of the process, see set_tracer."""
+    return _TRACER["tracer"]
+
+
+def set_tracer(tracer: Tracer) -> Tracer:
+    """
+    Make a tracer record the spans of the pipelines.
+
+    Args:
+        tracer (Tracer): The tracer.
+
+    Returns
+    -------
+        Tracer: The tracer set before.
+    """
+    previous = _TRACER["tracer"]
+    _TRACER["tracer"] = tracer
+    return previous
+
+
+def trace(name: str, **attributes: Any) -> "contextlib.AbstractContextManager[Span]":
+    """Time a stage with the tracer of the process, see Tracer.span."""
+    return get_tracer().span(name, **attributes)
+
+
+def bind_span(function: Callable[P, T]) -> Callable[P, T]:
+    """
+    Bind a function to the span running in the calling thread.
+
+    Spans started by the function in other threads, e.g. of a ThreadPoolExecutor, then become
+    children of that span instead of starting traces of their own.
+
+    Args:
+        function (Callable): The function to run in other threads.
+
+    Returns
+    -------
+        Callable: The function, run with the span of the calling thread as the current span.
+    """
+    parent = _CURRENT_SPAN.get()
+
+    @functools.wraps(function)
+    def bound(*args: P.args, **kwargs: P.kwargs) -> T:
+        token = _CURRENT_SPAN.set(parent)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _CURRENT_SPAN.reset(token)
+
+    return bound
+
+
+def instrument_language_model(language_model: Any) -> Any:
+    """
+    Trace every request of a dspy language model as an "lm.request" span.
+
+    The spans record the model, the latency, the prompt and completion tokens reported by the
+    API and the estimated cost. Requests retried by dspy show up as failed spans followed by
+    another attempt. Instrumenting a model twice has no effect.
+
+    Args:
+        language_model (dsp.LM): The language model, e.g. dspy.OpenAI.
+
+    Returns
+    -------
+        dsp.LM: The same language model.
+    """
+    if getattr(language_model, "_glossagen_traced", False):
+        return language_model
+    basic_request = language_model.basic_request
+
+    @functools.wraps(basic_request)
+    def traced_request(prompt: str, **kwargs: Any) -> Any:
+        model = kwargs.get("model") or language_model.kwargs.get("model")
+        with trace(LM_REQUEST, model=model, prompt_characters=len(prompt)) as span:
+            response = basic_request(prompt, **kwargs)
+            usage = (response.get("usage") if isinstance(response, dict) else None) or {}
+            prompt_tokens = int(usage.get("prompt_tokens", 0))
+            completion_tokens = int(usage.get("completion_tokens", 0))
+            span.set(
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                cost=estimate_cost(model, prompt_tokens, completion_tokens),
+            )
+            return response
+
+    language_model.basic_request = traced_request
+    language_model._glossagen_traced = True
+    return language_model
+
+
+def make_tracer(kind: str, path: Optional[str] = None) -> Tracer:
+    """
+    Create a Tracer with one of the built-in exporters.
+
+    Args:
+        kind (str): "none" (summary only), "json" (local JSON lines trace file) or "otlp"
+            (OTLP/JSON file or collector URL).
+        path (str): The trace file or collector URL. Defaults to glossagen_trace.jsonl, or
+            glossagen_trace.otlp.jsonl for "otlp".
+
+    Returns
+    -------
+        Tracer: The tracer; close it when the run is done.
+
+    Raises
+    ------
+        ValueError: If kind is not one of TRACE_SINKS.
+    """
+    if kind == "none":
+        return Tracer()
+    if kind == "json":
+        return Tracer([JsonTraceExporter(path or "glossagen_trace.jsonl")])
+    if kind == "otlp":
+        return Tracer([OtlpJsonExporter(path or "glossagen_trace.otlp.jsonl")])
+    raise ValueError(f"kind must be one of {', '.join(TRACE_SINKS)}, got {kind!r}.")
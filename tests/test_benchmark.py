@@ -0,0 +1,55 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from glossagen.benchmark import make_synthetic_pdf, run_benchmarks
+from glossagen.pipelines.generate_glossary import GlossaryGenerator
+from glossagen.utils import InMemoryGraph, OfflineLM, ResearchDoc, init_dspy, set_language_model
+from glossagen.utils.offline_utils import offline_graph_document
+
+
+@pytest.fixture
+def offline_lm():
+    language_model = OfflineLM()
+    previous = set_language_model(language_model)
+    init_dspy()
+    yield language_model
+    set_language_model(previous)
+
+
+def test_offline_lm_answers_glossary_prompts_in_worker_threads(offline_lm):
+    # Distinct chunks, identical ones in flight at the same time would be coalesced
+    text = "".join(
+        f"The metal-organic framework (MOF) {i} is porous. ZIF-8 is a MOF. " for i in range(20)
+    )
+    research_doc = ResearchDoc.from_text(text=text, doc_src="test")
+    for _ in range(2):  # pool threads of the second run must not keep a stale model
+        generator = GlossaryGenerator(research_doc, chunk_size=200, max_workers=3)
+        results = generator.extract_chunks(generator.split_into_chunks())
+        assert generator.failed_chunks == []
+    assert [entry.term for entry in results[0]] == ["MOF", "ZIF-8"]
+    assert offline_lm.usage()["requests"] == 2 * len(results)
+
+
+def test_in_memory_graph_merges_nodes():
+    graph = InMemoryGraph()
+    document = offline_graph_document("MOF and ZIF-8 adsorb CO2.")
+    graph.add_graph_documents([document])
+    graph.add_graph_documents([document])
+    assert sorted(node_id for node_id, _ in graph.nodes) == ["CO2", "MOF", "ZIF-8"]
+    assert len(graph.relationships) == 2
+
+
+def test_run_benchmarks_writes_json(tmp_path):
+    pdf = make_synthetic_pdf(str(tmp_path / "small.pdf"), pages=2)
+    output = tmp_path / "results.json"
+    results = run_benchmarks([pdf], [], synthetic_pages=[], output=str(output))
+
+    assert json.loads(Path(output).read_text()) == results
+    (document,) = results["documents"]
+    assert document["pages"] == 3
+    assert (
+        document["stages"]["extract"]["lm"]["requests"] == document["stages"]["segment"]["chunks"]
+    )
+    assert document["end_to_end"]["terms"] > 0
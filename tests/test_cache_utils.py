@@ -0,0 +1,63 @@
+from glossagen.pipelines.generate_glossary import TerminusTechnicus, Text2GlossarySignature
+from glossagen.pipelines.glossary_to_ontology import Glossary2Labels
+from glossagen.utils.cache_utils import ExtractionCache, cached_prediction
+
+
+def test_key_depends_on_all_inputs():
+    key = ExtractionCache.make_key(Text2GlossarySignature, "gpt-3.5-turbo", 3000, {"text": "a"})
+    assert key == ExtractionCache.make_key(
+        Text2GlossarySignature, "gpt-3.5-turbo", 3000, {"text": "a"}
+    )
+    assert key != ExtractionCache.make_key(Glossary2Labels, "gpt-3.5-turbo", 3000, {"text": "a"})
+    assert key != ExtractionCache.make_key(Text2GlossarySignature, "gpt-4o", 3000, {"text": "a"})
+    assert key != ExtractionCache.make_key(
+        Text2GlossarySignature, "gpt-3.5-turbo", 1000, {"text": "a"}
+    )
+    assert key != ExtractionCache.make_key(
+        Text2GlossarySignature, "gpt-3.5-turbo", 3000, {"text": "b"}
+    )
+
+
+def test_get_set_persist(tmp_path):
+    cache = ExtractionCache(str(tmp_path))
+    assert cache.get("key") is None
+    cache.set("key", [{"term": "MOF", "definition": "metal-organic framework"}])
+    cache.close()
+
+    reopened = ExtractionCache(str(tmp_path))
+    assert reopened.get("key") == [{"term": "MOF", "definition": "metal-organic framework"}]
+    assert (reopened.hits, reopened.misses) == (1, 0)
+    reopened.clear()
+    assert len(reopened) == 0
+
+
+def test_lru_eviction(tmp_path):
+    value = "x" * 100
+    cache = ExtractionCache(str(tmp_path), max_size_bytes=250)
+    cache.set("a", value)
+    cache.set("b", value)
+    cache.get("a")  # "b" is now the least recently used entry
+    cache.set("c", value)
+    assert cache.get("b") is None
+    assert cache.get("a") == value
+    assert cache.get("c") == value
+
+
+def test_cached_prediction_skips_repeated_calls(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        "glossagen.utils.dspy_utils.current_lm_config",
+        lambda: {"model": "stand-in", "max_tokens": 100},
+    )
+    cache = ExtractionCache(str(tmp_path))
+    calls = []
+
+    def predict():
+        calls.append(1)
+        return [TerminusTechnicus(term="XRD", definition="X-ray diffraction")]
+
+    for _ in range(3):
+        result = cached_prediction(
+            cache, Text2GlossarySignature, {"text": "chunk"}, predict, TerminusTechnicus
+        )
+        assert result == [TerminusTechnicus(term="XRD", definition="X-ray diffraction")]
+    assert len(calls) == 1
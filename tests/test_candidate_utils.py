@@ -0,0 +1,116 @@
+from glossagen.pipelines.generate_glossary import GlossaryGenerator, TerminusTechnicus
+from glossagen.utils import CandidatePrefilter, KnownTerms, ResearchDoc, TermStore
+from glossagen.utils.candidate_utils import find_definitions
+
+TERMS = (
+    "Metal-organic frameworks (MOFs) adsorb CO2. The zeolitic imidazolate framework (ZIF-8) "
+    "is a MOF with sodalite topology. Sodalite cages of ZIF-8 host CO2."
+)
+METHODS = (
+    "The samples were washed three times with water and dried overnight at room temperature, "
+    "then stored in a closed vial until further use."
+)
+THANKS = "We thank the Swiss National Science Foundation for funding and John Smith for help."
+
+
+def test_find_definitions_cuts_the_expansion():
+    assert find_definitions("we used the metal-organic framework (MOF) and zeolite (ZIFs)") == [
+        ("metal-organic framework", "MOF")
+    ]
+    assert find_definitions(TERMS) == [
+        ("Metal-organic frameworks", "MOFs"),
+        ("zeolitic imidazolate framework", "ZIF-8"),
+    ]
+
+
+def test_term_poor_chunks_are_skipped():
+    terms, methods, thanks = CandidatePrefilter(background=[METHODS, THANKS]).analyze(
+        [TERMS, METHODS, THANKS]
+    )
+    assert terms.keep and not methods.keep and not thanks.keep
+    assert terms.candidates[:2] == [
+        "Metal-organic frameworks (MOFs)",
+        "zeolitic imidazolate framework (ZIF-8)",
+    ]
+    assert "sodalite" in terms.candidates  # repeated, and rare in the background
+    assert methods.candidates == []
+
+
+def test_generator_sends_kept_chunks_with_their_candidates():
+    requests = []
+
+    def predictor(text, candidates):
+        requests.append(candidates)
+        return type("Prediction", (), {"glossary": [TerminusTechnicus(term="MOF", definition="")]})
+
+    research_doc = ResearchDoc.from_text(text=TERMS, doc_src="test")
+    generator = GlossaryGenerator(research_doc, chunk_size=100, prefilter=CandidatePrefilter())
+    generator.candidate_predictor = predictor
+    results = generator.extract_chunks([TERMS, METHODS, THANKS])
+
+    assert generator.skipped_chunks == [1, 2]
+    assert [len(result) for result in results] == [1, 0, 0]
+    assert requests == [
+        "Metal-organic frameworks (MOFs); zeolitic imidazolate framework (ZIF-8); CO2; sodalite"
+    ]
+
+
+def test_known_terms_are_not_requested_again(tmp_path):
+    store = TermStore(str(tmp_path / "terms.sqlite"))
+    store.add_glossary(
+        "old.pdf",
+        [
+            TerminusTechnicus(term="Metal-organic framework (MOF)", definition="stored"),
+            TerminusTechnicus(term="CO2", definition="carbon dioxide"),
+        ],
+    )
+    requests = []
+
+    def predictor(text, candidates, known_terms):
+        requests.append((candidates, known_terms))
+        return type(
+            "Prediction", (), {"glossary": [TerminusTechnicus(term="ZIF-8", definition="")]}
+        )
+
+    research_doc = ResearchDoc.from_text(text=TERMS, doc_src="test")
+    generator = GlossaryGenerator(
+        research_doc, chunk_size=100, prefilter=CandidatePrefilter(), known_terms=KnownTerms(store)
+    )
+    generator.new_terms_predictor = predictor
+    known_only = "MOFs adsorb CO2 in Metal-Organic Frameworks (MOFs)."
+    results = generator.extract_chunks([TERMS, known_only])
+
+    assert generator.skipped_chunks == [1]
+    assert requests == [
+        ("zeolitic imidazolate framework (ZIF-8)", "Metal-organic framework (MOF); CO2")
+    ]
+    assert [[entry.term for entry in result] for result in results] == [
+        ["ZIF-8", "Metal-organic framework (MOF)", "CO2"],
+        ["Metal-organic framework (MOF)", "CO2"],
+    ]
+    store.close()
+
+
+def test_known_terms_that_are_no_candidates_are_not_added(tmp_path):
+    store = TermStore(str(tmp_path / "terms.sqlite"))
+    store.add_glossary(
+        "old.pdf",
+        [
+            TerminusTechnicus(term="CO2", definition="carbon dioxide"),
+            TerminusTechnicus(term="Topology", definition="a general term"),
+        ],
+    )
+
+    def predictor(text, candidates, known_terms):
+        return type("Prediction", (), {"glossary": []})
+
+    research_doc = ResearchDoc.from_text(text=TERMS, doc_src="test")
+    for prefilter in (None, CandidatePrefilter()):
+        generator = GlossaryGenerator(
+            research_doc, chunk_size=100, prefilter=prefilter, known_terms=KnownTerms(store)
+        )
+        generator.new_terms_predictor = predictor
+        results = generator.extract_chunks([TERMS])
+
+        assert [[entry.term for entry in result] for result in results] == [["CO2"]]
+    store.close()
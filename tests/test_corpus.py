@@ -0,0 +1,128 @@
+import shutil
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from glossagen.pipelines import corpus
+from glossagen.pipelines.generate_glossary import GlossaryGenerator, TerminusTechnicus
+from glossagen.utils import OfflineLM, TermStore, init_dspy, set_language_model
+
+PAPER_PATH = Path(__file__).parents[1] / "data" / "paper.pdf"
+
+
+def fake_extract_chunk(self, part_text, candidates=None):
+    return [TerminusTechnicus(term=f"term {len(part_text)}", definition=part_text[:20])]
+
+
+@pytest.fixture(autouse=True)
+def no_language_model(monkeypatch):
+    monkeypatch.setattr(corpus, "init_dspy", lambda: None)
+    monkeypatch.setattr(
+        corpus,
+        "_run_config",
+        lambda chunk_size, chunk_overlap, **options: {"chunk_size": chunk_size, **options},
+    )
+
+
+def test_corpus_writes_one_glossary_per_document(tmp_path, monkeypatch):
+    monkeypatch.setattr(GlossaryGenerator, "extract_chunk", fake_extract_chunk)
+    root = tmp_path / "corpus"
+    (root / "reviews").mkdir(parents=True)
+    shutil.copy(PAPER_PATH, root / "reviews" / "zeolites.pdf")
+    (root / "broken.pdf").write_text("not a pdf")
+    (root / "thesis.tex").write_text(
+        "\\documentclass{article}\n\\begin{document}\nZeolites are porous.\n\\end{document}\n"
+    )
+    output = tmp_path / "out"
+
+    index = corpus.generate_corpus_glossaries(
+        str(root), str(output), parse_workers=2, lm_workers=2, chunk_size=5000, use_cache=False
+    )
+
+    assert (output / "reviews" / "zeolites.glossary.csv").exists()
+    assert (output / "thesis.glossary.csv").exists()
+    assert not (output / "broken.glossary.csv").exists()
+    assert set(index["Paper"]) == {str(root / "reviews" / "zeolites.pdf"), str(root / "thesis.tex")}
+    pd.testing.assert_frame_equal(pd.read_csv(output / "index.csv", keep_default_na=False), index)
+
+
+def test_corpus_run_resumes_from_manifest(tmp_path, monkeypatch):
+    calls = []
+    fail = {"enabled": True}
+
+    def flaky_extract_chunk(self, part_text, candidates=None):
+        calls.append(part_text)
+        if fail["enabled"] and len(calls) == 2:
+            raise RuntimeError("killed")
+        return fake_extract_chunk(self, part_text)
+
+    monkeypatch.setattr(GlossaryGenerator, "extract_chunk", flaky_extract_chunk)
+    root = tmp_path / "corpus"
+    root.mkdir()
+    shutil.copy(PAPER_PATH, root / "paper.pdf")
+    output = tmp_path / "out"
+
+    def run():
+        calls.clear()
+        return corpus.generate_corpus_glossaries(
+            str(root), str(output), parse_workers=1, lm_workers=1, chunk_size=5000, use_cache=False
+        )
+
+    run()
+    num_chunks = len(calls)
+    assert num_chunks > 2
+
+    fail["enabled"] = False
+    index = run()
+    assert len(calls) == 1  # only the failed chunk is redone
+    assert len(index) == num_chunks
+
+    run()
+    assert calls == []  # the finished paper is skipped
+
+    with open(root / "paper.pdf", "ab") as file:
+        file.write(b"\n% changed")
+    run()
+    assert len(calls) == num_chunks  # a changed file is redone
+
+
+def test_corpus_papers_are_prefiltered_ranked_and_stored(tmp_path, monkeypatch):
+    candidates_sent = []
+
+    def extract_chunk(self, part_text, candidates=None):
+        candidates_sent.append(candidates)
+        return [
+            TerminusTechnicus(term="zeolite", definition="A porous aluminosilicate."),
+            TerminusTechnicus(term="faujasite", definition="A zeolite framework."),
+        ]
+
+    monkeypatch.setattr(GlossaryGenerator, "extract_chunk", extract_chunk)
+    root = tmp_path / "corpus"
+    root.mkdir()
+    shutil.copy(PAPER_PATH, root / "paper.pdf")
+    output = tmp_path / "out"
+    store_path = str(tmp_path / "terms.sqlite")
+
+    previous = set_language_model(OfflineLM())
+    try:
+        init_dspy()  # the token budget of the configured model
+        index = corpus.generate_corpus_glossaries(
+            str(root),
+            str(output),
+            parse_workers=1,
+            lm_workers=2,
+            use_cache=False,
+            store_path=store_path,
+            prefilter=True,
+            top_k=1,
+        )
+    finally:
+        set_language_model(previous)
+
+    assert candidates_sent
+    assert all(candidates is not None for candidates in candidates_sent)
+    assert len(index) == 1
+    store = TermStore(store_path)
+    assert len(store) == 2  # the entries ranked out are stored, too
+    store.close()
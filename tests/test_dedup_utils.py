@@ -0,0 +1,46 @@
+from glossagen.utils import StreamingDeduplicator, cluster_terms, merge_near_duplicates
+
+
+def test_variants_and_abbreviations_are_merged():
+    terms = [
+        "metal-organic framework",
+        "Metal organic frameworks (MOFs)",
+        "MOF",
+        "Zeolites",
+        "zeolite",
+        "X-ray diffraction",
+        "XRD",
+    ]
+    merged = merge_near_duplicates(terms, ["definition"] * len(terms))
+    assert [(terms[index], aliases) for index, aliases in merged] == [
+        ("Metal organic frameworks (MOFs)", ["metal-organic framework", "MOF"]),
+        ("Zeolites", ["zeolite"]),
+        ("X-ray diffraction", ["XRD"]),
+    ]
+
+
+def test_distinct_terms_are_kept_apart():
+    terms = ["Zeolite A", "Zeolite X", "MS", "mass spectrometry", "materials science"]
+    assert cluster_terms(terms) == [[0], [1], [2], [3], [4]]
+
+
+def test_many_terms():
+    terms = [f"compound {i} oxide" for i in range(2000)] + ["Compound 7 oxides"]
+    clusters = cluster_terms(terms)
+    assert len(clusters) == 2000
+    assert [7, 2000] in clusters
+
+
+def test_streaming_deduplicator_keeps_earlier_groups():
+    deduplicator = StreamingDeduplicator()
+    first = ["MOF", "Metal organic frameworks (MOFs)", "zeolite"]
+    assert deduplicator.merge(first, ["short", "longer", "z"]) == (
+        [(1, ["MOF"]), (2, [])],
+        {},
+    )
+    second = ["metal-organic framework", "Zeolites", "X-ray diffraction", "XRD", "ZIF-8"]
+    assert deduplicator.merge(second, [""] * 5) == (
+        [(2, ["XRD"]), (4, [])],
+        {0: ["metal-organic framework"], 1: ["Zeolites"]},
+    )
+    assert deduplicator.groups == 4
@@ -0,0 +1,86 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import dspy
+import pytest
+
+from glossagen.utils import LMGateway, OfflineLM, init_dspy, set_language_model
+from glossagen.utils.gateway_utils import TokenBucket
+
+
+class RateLimitError(Exception):
+    status_code = 429
+
+
+def test_identical_requests_in_flight_are_sent_once():
+    gateway = LMGateway()
+    language_model = gateway.attach(OfflineLM(latency=0.1))
+    gateway.attach(language_model)  # no second wrapper
+    with ThreadPoolExecutor(4) as executor:
+        answers = list(executor.map(language_model, ["Text: MOF\n\nGlossary:"] * 4))
+    assert len({answer[0] for answer in answers}) == 1
+    assert language_model.usage()["requests"] == 1
+    assert gateway.stats["coalesced"] == 3
+
+
+def test_init_dspy_replaces_the_configured_model():
+    previous = set_language_model(OfflineLM())
+    try:
+        init_dspy()
+        stack = dspy.settings.stack_by_thread[threading.get_ident()]
+        depth = len(stack)
+        for _ in range(3):
+            init_dspy()
+        assert len(stack) == depth
+        assert dspy.settings.lm is not None
+    finally:
+        set_language_model(previous)
+
+
+def test_language_models_are_reused():
+    gateway = LMGateway()
+    language_model = gateway.language_model(OfflineLM, "offline", 100)
+    assert gateway.language_model(OfflineLM, "offline", 100) is language_model
+    assert gateway.language_model(OfflineLM, "offline", 200) is not language_model
+
+
+def test_rate_limit_errors_pause_and_retry():
+    gateway = LMGateway(requests_per_minute=6000, max_retries=2, backoff=0.1)
+    calls = []
+
+    def request():
+        calls.append(time.monotonic())
+        if len(calls) < 3:
+            raise RateLimitError()
+        return {"choices": [], "usage": {"total_tokens": 5}}
+
+    assert gateway.call(request, tokens=10)["usage"]["total_tokens"] == 5
+    assert gateway.stats["rate_limited"] == 2
+    assert calls[2] - calls[0] >= 0.3  # backed off 0.1 s and then 0.2 s
+
+    with pytest.raises(RateLimitError):
+        LMGateway(max_retries=0).call(lambda: (_ for _ in ()).throw(RateLimitError()), tokens=1)
+
+
+def test_token_bucket_refills_at_its_rate():
+    bucket = TokenBucket(per_minute=600)
+    now = time.monotonic()
+    assert bucket.wait_time(600, now) == 0
+    bucket.take(600)
+    assert bucket.wait_time(60, now) == pytest.approx(6.0)
+    assert bucket.wait_time(60, now + 6) == pytest.approx(0.0)
+    assert bucket.wait_time(10000, now + 60) == 0  # larger requests wait for a full bucket
+
+
+def test_limits_are_shared_by_threads():
+    gateway = LMGateway(requests_per_minute=600)  # one request per 0.1 s once the bucket is empty
+    gateway.limiter.requests.take(600)
+    start = time.monotonic()
+    threads = [threading.Thread(target=gateway.call, args=(dict, 1)) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert time.monotonic() - start >= 0.25
+    assert gateway.stats["requests"] == 3
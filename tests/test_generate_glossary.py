@@ -0,0 +1,89 @@
+import threading
+import time
+
+import pytest
+
+from glossagen.pipelines.generate_glossary import GlossaryGenerator, TerminusTechnicus
+from glossagen.utils import ResearchDoc, TermStore
+
+
+class FakePrediction:
+    def __init__(self, glossary):
+        self.glossary = glossary
+
+
+class FakePredictor:
+    """Stand-in for the TypedPredictor that returns one term per chunk."""
+
+    def __init__(self, fail_on=(), delay=0.0):
+        self.fail_on = set(fail_on)
+        self.delay = delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, text):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            # later chunks finish first to check that the chunk order is kept
+            time.sleep(self.delay / (int(text[0]) + 1))
+            if text[0] in self.fail_on:
+                raise RuntimeError("bad chunk")
+            return FakePrediction([TerminusTechnicus(term=f"term {text[0]}", definition=text)])
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+
+def make_generator(max_workers, predictor):
+    paper = "".join(str(i) * 10 for i in range(6))
+    research_doc = ResearchDoc.from_text(text=paper, doc_src="test")
+    generator = GlossaryGenerator(research_doc, chunk_size=10, max_workers=max_workers)
+    generator.glossary_predictor = predictor
+    return generator
+
+
+@pytest.mark.parametrize("max_workers", [1, 3])
+def test_extract_chunks_keeps_chunk_order(max_workers):
+    predictor = FakePredictor(delay=0.05)
+    generator = make_generator(max_workers, predictor)
+    results = generator.extract_chunks(generator.split_into_chunks())
+    assert [part[0].term for part in results] == [f"term {i}" for i in range(6)]
+    assert predictor.max_in_flight <= max_workers
+
+
+def test_extract_chunks_isolates_failures():
+    generator = make_generator(3, FakePredictor(fail_on={"2", "4"}))
+    results = generator.extract_chunks(generator.split_into_chunks())
+    assert generator.failed_chunks == [2, 4]
+    assert [len(part) for part in results] == [1, 1, 0, 1, 0, 1]
+
+
+def test_invalid_worker_count():
+    with pytest.raises(ValueError):
+        make_generator(0, FakePredictor())
+
+
+def test_iter_glossary_yields_entries_as_chunks_complete(tmp_path):
+    predictor = FakePredictor(delay=0.2)
+    generator = make_generator(6, predictor)
+    generator.store = TermStore(str(tmp_path / "terms.sqlite"))
+    entries = list(generator.iter_glossary())
+    assert entries[0].term == "term 5"  # the fastest chunk, not the first
+    assert sorted(entry.term for entry in entries) == [f"term {i}" for i in range(6)]
+    assert [entry.chunk for entry in entries] == [int(entry.term[-1]) for entry in entries]
+    assert len(generator.store) == 6
+    generator.store.close()
+
+
+def test_iter_glossary_stops_with_its_consumer():
+    predictor = FakePredictor(delay=0.05)
+    generator = make_generator(1, predictor)
+    stream = generator.iter_glossary()
+    assert next(stream).term == "term 0"
+    stream.close()
+    time.sleep(0.3)
+    assert predictor.in_flight == 0
+    assert generator.failed_chunks == []
@@ -0,0 +1,78 @@
+import threading
+
+import pytest
+
+from glossagen.pipelines.glossary_to_ontology import (
+    OntologyEntityLabels,
+    OntologyGenerator,
+    OntologyRelation,
+    merge_labels,
+    merge_relations,
+)
+from glossagen.utils import OfflineLM, init_dspy, set_language_model
+from glossagen.utils.offline_utils import OFFLINE_LABELS, OFFLINE_RELATIONS
+
+
+@pytest.fixture
+def offline_lm():
+    language_model = OfflineLM(latency=0.05)
+    previous = set_language_model(language_model)
+    init_dspy()
+    yield language_model
+    set_language_model(previous)
+
+
+def test_shards_are_predicted_concurrently_and_merged(offline_lm):
+    glossary = {f"Term{i}": f"Definition {i}." for i in range(10)}
+    generator = OntologyGenerator(glossary, shard_size=3, max_workers=3)
+    assert len(generator.shards) == 4
+
+    lock = threading.Lock()
+    in_flight = [0, 0]  # current and most requests in flight
+    predict_shard = generator._predict_shard
+
+    def counting_predict_shard(*args):
+        with lock:
+            in_flight[0] += 1
+            in_flight[1] = max(in_flight)
+        try:
+            return predict_shard(*args)
+        finally:
+            with lock:
+                in_flight[0] -= 1
+
+    generator._predict_shard = counting_predict_shard
+    ontology = generator.generate_ontology_from_glossary()
+    assert offline_lm.usage()["requests"] == 8
+    assert 1 < in_flight[1] <= generator.max_workers
+    assert list(ontology.labels) == [label.split(":")[0] for label in OFFLINE_LABELS]
+    assert ontology.relationships == OFFLINE_RELATIONS
+
+    unsharded = OntologyGenerator(glossary, shard_size=None).generate_ontology_from_glossary()
+    assert ontology.labels == unsharded.labels
+    assert ontology.relationships == unsharded.relationships
+
+
+def test_small_glossaries_are_a_single_shard():
+    generator = OntologyGenerator({"MOF": "A porous framework."}, shard_size=None)
+    assert generator.shards == [generator.glossary_text] == ["MOF: A porous framework."]
+
+
+def test_merge_deduplicates_labels_and_relations():
+    labels = merge_labels(
+        [
+            [
+                OntologyEntityLabels(label="Material: Substances."),
+                OntologyEntityLabels(label="Other"),
+            ],
+            [OntologyEntityLabels(label=" material : Compounds: e.g. MOFs.")],
+        ]
+    )
+    assert labels == {"Material": "Substances.", "Other": ""}
+    relations = merge_relations(
+        [
+            [OntologyRelation(relation="relate to"), OntologyRelation(relation="Contain")],
+            [OntologyRelation(relation="relate  to"), OntologyRelation(relation="contain.")],
+        ]
+    )
+    assert relations == ["relate to", "Contain"]
@@ -1,3 +1,38 @@
+import subprocess
+import sys
+
+HEAVY_MODULES = ("dspy", "langchain", "openai", "pandas", "wandb")
+
+
+def imported_modules(statement):
+    """Run an import in a fresh interpreter and return the heavy modules it loaded."""
+    code = f"import sys; {statement}; print(' '.join(sorted(sys.modules)))"
+    output = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    ).stdout
+    return {module.split(".")[0] for module in output.split()} & set(HEAVY_MODULES)
+
+
 def test_import():
-    # Dummy test that does the bare minimum, remove when done!
-    pass
+    assert imported_modules("import glossagen.cli, glossagen.pipelines, glossagen.utils") == set()
+
+
+def test_parse_workers_skip_language_model_stack():
+    assert imported_modules("from glossagen.pipelines.parsing import parse_document") == set()
+
+
+def test_help_does_not_load_pipelines():
+    code = "import sys; sys.argv = ['glossagen', '--help']; import glossagen.cli as cli; cli.main()"
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    assert result.returncode == 0
+    assert "--corpus" in result.stdout
+
+
+def test_lazy_exports():
+    from glossagen import pipelines, utils
+
+    assert utils.ExtractionCache.__module__ == "glossagen.utils.cache_utils"
+    assert callable(pipelines.generate_glossary)
+    assert set(utils.__all__) <= set(dir(utils))
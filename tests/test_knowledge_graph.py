@@ -0,0 +1,168 @@
+import csv
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from glossagen.pipelines.knowledge_graph import build_knowledge_graph
+from glossagen.utils import (
+    CsvGraphSink,
+    InMemoryGraph,
+    Neo4jSink,
+    OfflineGraphTransformer,
+    SqliteGraphSink,
+    make_graph_sink,
+    write_graph_batch,
+)
+from glossagen.utils.graph_utils import collect_graph_elements
+from glossagen.utils.offline_utils import offline_graph_document
+
+
+class CountingTransformer(OfflineGraphTransformer):
+    """Offline transformer that records the concurrent calls and fails on request."""
+
+    def __init__(self, fail_on=()):
+        super().__init__(latency=0.01)
+        self.fail_on = set(fail_on)
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def convert_to_graph_documents(self, documents):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if documents[0].page_content in self.fail_on:
+                raise RuntimeError("bad chunk")
+            return super().convert_to_graph_documents(documents)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+
+class CypherGraph:
+    """Records the statements sent to a Neo4jGraph-like query method."""
+
+    def __init__(self):
+        self.statements = []
+
+    def query(self, cypher, params):
+        self.statements.append((cypher, params))
+
+
+def make_documents(count):
+    return [SimpleNamespace(page_content=f"MOF{i} binds CO2 and SO2.") for i in range(count)]
+
+
+def test_build_knowledge_graph_writes_every_chunk_in_batches():
+    transformer = CountingTransformer(fail_on={"MOF3 binds CO2 and SO2."})
+    graph = InMemoryGraph()
+    stats = build_knowledge_graph(
+        make_documents(10), transformer, graph, max_workers=3, batch_size=4
+    )
+
+    assert stats["documents"] == 10
+    assert stats["failed"] == 1
+    assert stats["batches"] == graph.writes == 3
+    assert len(graph.nodes) == 9 + 2  # one MOF per chunk, CO2 and SO2 shared
+    assert transformer.max_in_flight <= 3
+
+
+def test_build_knowledge_graph_is_idempotent():
+    graph = InMemoryGraph()
+    for _ in range(2):
+        build_knowledge_graph(make_documents(5), OfflineGraphTransformer(), graph, batch_size=2)
+    assert len(graph.nodes) == 7
+    assert len(graph.relationships) == 5 + 1
+
+
+def test_write_graph_batch_merges_with_one_statement_per_label_and_type():
+    graph = CypherGraph()
+    documents = [offline_graph_document("MOF and ZIF-8 adsorb CO2."), offline_graph_document("MOF")]
+    assert write_graph_batch(graph, documents) == (3, 2)
+    (nodes, node_params), (relationships, relationship_params) = graph.statements
+    assert nodes.startswith("UNWIND $rows AS row MERGE (n:`Node` {id: row.id})")
+    assert [row["id"] for row in node_params["rows"]] == ["MOF", "ZIF-8", "CO2"]
+    assert "MERGE (s)-[r:`RELATED_TO`]->(t)" in relationships
+    assert len(relationship_params["rows"]) == 2
+
+
+def test_build_knowledge_graph_rejects_empty_batches():
+    with pytest.raises(ValueError):
+        build_knowledge_graph([], OfflineGraphTransformer(), InMemoryGraph(), batch_size=0)
+
+
+def test_documents_are_consumed_lazily():
+    consumed = []
+
+    def documents():
+        for document in make_documents(50):
+            consumed.append(document)
+            yield document
+
+    transformer = OfflineGraphTransformer(latency=0.01)
+    graph = InMemoryGraph()
+    start = time.perf_counter()
+    build_knowledge_graph(documents(), transformer, graph, max_workers=2, batch_size=100)
+    assert len(consumed) == 50
+    assert time.perf_counter() - start < 50 * 0.01  # two requests at a time
+
+
+def test_sqlite_sink_merges_batches_and_finds_neighbors(tmp_path):
+    sink = SqliteGraphSink(str(tmp_path / "graph.sqlite"))
+    for _ in range(2):
+        build_knowledge_graph(make_documents(5), OfflineGraphTransformer(), sink, batch_size=2)
+    nodes, relationships = collect_graph_elements([offline_graph_document("MOF0 and CO2")])
+    nodes[0].properties = {"name": "framework"}
+    sink.merge_batch(nodes, relationships)
+
+    assert sink.counts() == (7, 6)
+    assert sorted(sink.neighbors("CO2")) == [("CO2", "RELATED_TO", "SO2")] + [
+        (f"MOF{i}", "RELATED_TO", "CO2") for i in range(5)
+    ]
+    assert sink.neighbors("CO2", "Material") == []
+    sink.close()
+
+
+def test_csv_sink_writes_neo4j_admin_import_files(tmp_path):
+    directory = tmp_path / "csv"
+    sink = make_graph_sink("csv", str(directory))
+    assert isinstance(sink, CsvGraphSink)
+    build_knowledge_graph(make_documents(3), OfflineGraphTransformer(), sink, batch_size=1)
+    nodes, relationships = collect_graph_elements([offline_graph_document("MOF0")])
+    nodes[0].properties = {"year": 2024}
+    sink.merge_batch(nodes, relationships)
+    sink.close()
+
+    assert sink.arguments == [
+        "--nodes=nodes_0_Node.csv",
+        "--relationships=relationships_0_RELATED_TO.csv",
+    ]
+    with open(directory / "nodes_0_Node.csv", encoding="utf-8") as file:
+        rows = list(csv.reader(file))
+    assert rows[0] == ["id:ID(Node)", ":LABEL", "year"]
+    assert sorted(rows[1:]) == [
+        ["CO2", "Node", ""],
+        ["MOF0", "Node", "2024"],
+        ["MOF1", "Node", ""],
+        ["MOF2", "Node", ""],
+        ["SO2", "Node", ""],
+    ]
+    with open(directory / "relationships_0_RELATED_TO.csv", encoding="utf-8") as file:
+        header, *rows = csv.reader(file)
+    assert header == [":START_ID(Node)", ":END_ID(Node)", ":TYPE"]
+    assert len(rows) == 4
+
+
+def test_neo4j_sink_runs_merge_statements():
+    graph = CypherGraph()
+    sink = Neo4jSink(graph=graph)
+    build_knowledge_graph(make_documents(2), OfflineGraphTransformer(), sink)
+    assert len(graph.statements) == 2  # one per label and relationship type
+
+
+def test_make_graph_sink_rejects_unknown_kinds():
+    with pytest.raises(ValueError):
+        make_graph_sink("graphml")
@@ -0,0 +1,107 @@
+import pandas as pd
+
+from glossagen.pipelines.latex_glossary import extract_text_from_latex, glossary_to_latex
+from glossagen.pipelines.parsing import discover_documents
+from glossagen.utils import LatexFileCache, ResearchDoc, iter_latex_blocks, iter_latex_segments
+
+MAIN = r"""\documentclass{book}
+\input{macros}
+\newcommand{\mof}{metal-organic framework}
+\newcommand{\abbr}[2]{#1 (#2)}
+\def\zif{ZIF-8}
+\begin{document}
+\begin{abstract}
+A \mof{} is porous. % \section{Not a heading}
+\end{abstract}
+\chapter[Short]{Introduction\label{ch:intro}}
+\include{chapters/intro}
+\section*{Methods}
+The \abbr{Brunauer--Emmett--Teller}{BET} area of \zif\ was $1500\,\mathrm{m}^2$ for
+$\mathrm{CO}_2$ at $77~\mathrm{K}$ in a \emph{caf\'e} \cite[p.~3]{key}.
+\begin{figure}[h]
+\begin{tikzpicture}\node{inner};\end{tikzpicture}
+\caption{Hidden caption}
+\end{figure}
+\begin{itemize}
+\item First item
+\item[b)] Second \ref{x} item
+\end{itemize}
+\[ E = mc^2 \]
+\begin{verbatim}
+\end{itemize} { unbalanced
+\end{verbatim}
+Last paragraph with \unknown{kept text} and $\alpha$-alumina.
+\section*{References}
+Smith et al.
+\end{document}
+Ignored after the end.
+"""
+
+
+def write_project(root):
+    (root / "chapters").mkdir()
+    (root / "main.tex").write_text(MAIN, encoding="utf-8")
+    (root / "macros.tex").write_text("\\newcommand{\\si}[1]{#1 SI}\n")
+    (root / "chapters" / "intro.tex").write_text(
+        "Zeolites are \\si{microporous}.\n\nSecond paragraph \\input{chapters/intro}\n"
+    )
+    return root / "main.tex"
+
+
+def test_blocks_follow_includes_and_expand_macros(tmp_path):
+    blocks = list(iter_latex_blocks(str(write_project(tmp_path))))
+    assert [(block.text.strip(), block.is_heading) for block in blocks] == [
+        ("Abstract", True),
+        ("A metal-organic framework is porous.", False),
+        ("Introduction", True),
+        ("Zeolites are microporous SI.", False),
+        ("Second paragraph", False),  # the recursive \input is ignored
+        ("Methods", True),
+        (
+            "The Brunauer–Emmett–Teller (BET) area of ZIF-8 was 1500 m2 for CO2 at 77 K in a café.",
+            False,
+        ),
+        ("First item", False),
+        ("b) Second item", False),
+        ("Last paragraph with kept text and α-alumina.", False),
+        ("References", True),
+        ("Smith et al.", False),
+    ]
+    assert "".join(block.text for block in blocks) == extract_text_from_latex(
+        str(tmp_path / "main.tex")
+    )
+    assert [block.start for block in blocks[1:]] == [
+        block.start + len(block.text) for block in blocks[:-1]
+    ]
+
+
+def test_research_doc_from_latex_keeps_sections(tmp_path):
+    research_doc = ResearchDoc.from_latex(str(write_project(tmp_path)))
+    assert "Smith" not in research_doc.paper  # trimmed at the references
+    assert [section.title for section in research_doc.sections] == [
+        "Abstract",
+        "Introduction",
+        "Methods",
+    ]
+    segments = list(iter_latex_segments(str(tmp_path / "main.tex"), target_size=120))
+    assert [segment.section for segment in segments] == ["Abstract", "Methods", "Methods"]
+    assert segments[1].text.startswith("Methods\n\n")
+
+
+def test_file_cache_rereads_changed_files(tmp_path):
+    path = tmp_path / "paper.tex"
+    path.write_text("Zeolites.")
+    cache = LatexFileCache(max_files=1)
+    assert cache.read(str(path)) == "Zeolites."
+    path.write_text("MOFs and zeolites.")
+    assert cache.read(str(path)) == "MOFs and zeolites."
+
+
+def test_glossary_to_latex_escapes_special_characters():
+    glossary = pd.DataFrame({"Term": ["R&D"], "Definition": ["100% of\nthe_budget"]})
+    assert glossary_to_latex(glossary) == "\\textbf{R\\&D}: 100\\% of the\\_budget\\\\"
+
+
+def test_corpus_skips_included_latex_files(tmp_path):
+    write_project(tmp_path)
+    assert discover_documents(str(tmp_path)) == [str(tmp_path / "main.tex")]
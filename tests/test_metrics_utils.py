@@ -0,0 +1,63 @@
+import json
+import threading
+import time
+
+import pytest
+
+from glossagen.utils import MetricsLogger, make_logger
+from glossagen.utils.metrics_utils import MetricsSink
+
+
+class SlowSink(MetricsSink):
+    def __init__(self):
+        self.batches = []
+        self.release = threading.Event()
+
+    def write_batch(self, records):
+        self.release.wait()
+        self.batches.append(records)
+
+
+def test_jsonl_sink(tmp_path):
+    path = tmp_path / "metrics.jsonl"
+    logger = make_logger("jsonl", str(path))
+    logger.log(
+        {"Glossary Length": 2}, tables={"Glossary": {"columns": ["Term"], "rows": [["MOF"]]}}
+    )
+    logger.log({"Glossary Length": 3})
+    logger.close()
+
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [record["metrics"]["Glossary Length"] for record in records] == [2, 3]
+    assert records[0]["tables"]["Glossary"]["rows"] == [["MOF"]]
+
+
+def test_logging_never_blocks():
+    sink = SlowSink()
+    logger = MetricsLogger(lambda: sink, batch_size=10, flush_interval=0.05, max_queue=5)
+    start = time.monotonic()
+    for step in range(100):
+        logger.log({"step": step})
+    assert time.monotonic() - start < 1
+    assert logger.dropped > 0
+
+    sink.release.set()
+    logger.close()
+    logged = [record["metrics"]["step"] for batch in sink.batches for record in batch]
+    assert len(logged) + logger.dropped == 100
+    assert all(len(batch) <= 10 for batch in sink.batches)
+
+
+def test_broken_sink_is_ignored():
+    def broken_sink():
+        raise RuntimeError("no backend")
+
+    logger = MetricsLogger(broken_sink)
+    logger.log({"step": 0})
+    logger.close()
+    assert logger.failed == 1
+
+
+def test_unknown_sink():
+    with pytest.raises(ValueError):
+        make_logger("tensorboard")
@@ -0,0 +1,97 @@
+import pytest
+
+from glossagen.pipelines.generate_glossary import GlossaryEntry, GlossaryGenerator
+from glossagen.utils import OfflineLM, ResearchDoc, TermRanker, TermStore, set_language_model
+from glossagen.utils.ranking_utils import occurrence_matrix
+from glossagen.utils.section_utils import Section
+
+CHUNKS = [
+    "Metal-organic frameworks (MOFs) are porous. MOFs adsorb CO2 at low pressure.",
+    "The MOF was washed with ethanol. Powder X-ray diffraction confirmed the MOF phase.",
+    "Each metal-organic framework was activated under vacuum before CO2 uptake.",
+]
+ENTRIES = [
+    GlossaryEntry(term="ethanol", definition="A solvent."),
+    GlossaryEntry(term="Metal-organic framework (MOF)", definition="A porous crystal."),
+    GlossaryEntry(term="CO2", definition="Carbon dioxide."),
+    GlossaryEntry(term="vacuum", definition="Low pressure."),
+]
+
+
+def test_occurrence_matrix_counts_every_spelling():
+    counts = occurrence_matrix(ENTRIES, CHUNKS)
+    assert counts[:, 1].tolist() == [3, 2, 1]  # the expansion, "(MOFs)" and "MOFs"
+    assert counts[:, 2].tolist() == [1, 0, 1]
+
+
+def test_rank_prefers_frequent_widespread_abbreviations():
+    ranker = TermRanker(top_k=2)
+    assert [entry.term for entry in ranker.rank(ENTRIES, CHUNKS)] == [
+        "Metal-organic framework (MOF)",
+        "CO2",
+    ]
+    features = ranker.features(ENTRIES, CHUNKS)
+    assert features.shape == (4, 4)
+    assert features[:, 3].tolist() == [1, 1, 1, 1]  # no store, no idf
+    assert TermRanker(min_score=10).rank(ENTRIES, CHUNKS) == []
+    with pytest.raises(ValueError):
+        TermRanker(weights={"length": 1.0})
+
+
+def test_terms_common_in_the_store_rank_lower(tmp_path):
+    store = TermStore(str(tmp_path / "terms.sqlite"))
+    for paper in ["a.pdf", "b.pdf", "c.pdf"]:
+        store.add_glossary(paper, [GlossaryEntry(term="co2", definition="")])
+    store.add_glossary("this.pdf", [GlossaryEntry(term="vacuum", definition="")])
+    ranker = TermRanker(store, weights={"frequency": 0, "spread": 0, "abbreviation": 0, "idf": 1})
+    scores = ranker.score(ENTRIES, CHUNKS, paper="this.pdf")
+    assert scores[2] == 0.0  # in every other paper
+    assert scores[0] == scores[1] == scores[3] == 1.0  # the paper itself does not count
+    store.close()
+
+
+def test_rerank_filters_the_ranked_short_list():
+    generator = GlossaryGenerator(
+        ResearchDoc.from_text(text="", doc_src="test"), ranker=TermRanker(top_k=3), rerank=True
+    )
+    prediction = type("Prediction", (), {"important_terms": [ENTRIES[2]]})
+    generator.reranker = lambda termini_technici: prediction
+    assert generator.rank_glossary(ENTRIES, CHUNKS) == [ENTRIES[2]]
+
+
+def test_the_store_gets_the_entries_ranked_out(tmp_path):
+    previous = set_language_model(OfflineLM())
+    store = TermStore(str(tmp_path / "terms.sqlite"))
+    generator = GlossaryGenerator(
+        ResearchDoc.from_text(text=" ".join(CHUNKS), doc_src="this.pdf"),
+        chunk_size=1000,
+        store=store,
+        ranker=TermRanker(top_k=1),
+    )
+    generator.glossary_predictor = lambda text: type("Prediction", (), {"glossary": ENTRIES})
+    try:
+        glossary = generator.generate_glossary_from_doc()
+    finally:
+        set_language_model(previous)
+    assert glossary["Term"].tolist() == ["Metal-organic framework (MOF)"]
+    assert len(store) == len(ENTRIES)
+    store.close()
+
+
+def test_spread_is_computed_over_the_sections():
+    paper = "".join(CHUNKS)
+    research_doc = ResearchDoc.from_text(text=paper, doc_src="test")
+    research_doc.sections = [
+        Section(title="Results", start=len(CHUNKS[0]), end=len(CHUNKS[0]) + len(CHUNKS[1])),
+        Section(title="Methods", start=len(CHUNKS[0]) + len(CHUNKS[1]), end=len(paper)),
+    ]
+    assert research_doc.section_texts() == CHUNKS  # the text before the first heading, too
+    ranker = TermRanker(weights={"frequency": 0, "spread": 1, "abbreviation": 0, "idf": 0})
+    generator = GlossaryGenerator(research_doc, ranker=ranker)
+    ranked = generator.rank_glossary(ENTRIES[2:] + ENTRIES[:2], [paper])  # a single chunk
+    assert [entry.term for entry in ranked] == [
+        "Metal-organic framework (MOF)",
+        "CO2",
+        "vacuum",
+        "ethanol",
+    ]
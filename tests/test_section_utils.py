@@ -0,0 +1,37 @@
+from pathlib import Path
+
+import fitz
+
+from glossagen.utils import ResearchDoc, detect_sections, detect_text_sections
+from glossagen.utils.segment_utils import blocks_from_fitz
+
+PAPER_PATH = Path(__file__).parents[1] / "data" / "paper.pdf"
+BODY = "As discussed in the references below, zeolites are porous.\n" * 50
+
+
+def test_text_back_matter_requires_heading_line():
+    text = BODY + "2. References\n(1) Smith, J. Zeolites. 2020.\n"
+    sections = detect_text_sections(text)
+    assert [(section.back_matter, section.start) for section in sections] == [
+        ("references", len(BODY))
+    ]
+    assert sections[0].end == len(text)
+
+
+def test_trim_at_first_back_matter():
+    text = BODY + "Acknowledgements\nWe thank ETH.\nReferences\n(1) Smith, J. 2020.\n"
+    research_doc = ResearchDoc.from_text(text, doc_src="test")
+    research_doc.trim_at_references()
+    assert research_doc.paper == BODY
+
+
+def test_pdf_sections_from_layout():
+    blocks = blocks_from_fitz(fitz.open(PAPER_PATH))
+    text = "".join(block.text for block in blocks)
+    sections = detect_sections(blocks, len(text))
+    titles = [section.title for section in sections]
+    assert titles.index("Introduction") < titles.index("Results") < titles.index("References")
+    back_matter = {section.back_matter: section for section in sections if section.back_matter}
+    assert text[back_matter["references"].start :].startswith("References\n")
+    for section, following in zip(sections, sections[1:]):
+        assert section.end == following.start
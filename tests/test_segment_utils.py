@@ -0,0 +1,76 @@
+from pathlib import Path
+
+import fitz
+import pytest
+
+from glossagen.utils import ResearchDoc, iter_body_blocks, iter_page_layouts, iter_pdf_segments
+from glossagen.utils.segment_utils import blocks_from_fitz, segment_document, segment_text
+
+PAPER_PATH = Path(__file__).parents[1] / "data" / "paper.pdf"
+PARAGRAPH = "Zeolites are aluminosilicates. They have micropores. MOFs are porous too.\n\n"
+
+
+def test_segments_end_at_paragraphs():
+    text = PARAGRAPH * 10
+    segments = segment_text(text, target_size=200)
+    assert "".join(segment.text for segment in segments) == text
+    for segment in segments:
+        assert len(segment.text) <= 200
+        assert segment.text.endswith("\n\n")
+
+
+def test_segments_end_at_sentences_without_paragraphs():
+    text = PARAGRAPH.strip().replace("\n", " ") * 5
+    segments = segment_text(text, target_size=100)
+    assert "".join(segment.text for segment in segments) == text
+    for segment in segments[:-1]:
+        assert segment.text.rstrip().endswith(".")
+
+
+def test_overlap_starts_at_sentence():
+    text = PARAGRAPH.replace("\n\n", " ") * 10
+    segments = segment_text(text, target_size=200, overlap=60)
+    for previous, segment in zip(segments, segments[1:]):
+        assert previous.start < segment.start < previous.end
+        assert previous.end - segment.start <= 60
+        assert text[segment.start - 2 : segment.start] == ". "
+
+
+def test_invalid_sizes():
+    with pytest.raises(ValueError):
+        segment_text("text", target_size=0)
+    with pytest.raises(ValueError):
+        segment_text("text", target_size=10, overlap=10)
+
+
+def test_pdf_segments_start_at_headings():
+    doc = fitz.open(PAPER_PATH)
+    blocks = blocks_from_fitz(doc)
+    assert "".join(block.text for block in blocks) == "".join(page.get_text() for page in doc)
+    headings = {block.text.strip() for block in blocks if block.is_heading}
+    assert {"Introduction", "Results", "References"} <= headings
+
+    research_doc = ResearchDoc(doc_src="data", fitz_paper=doc, paper=doc[0].get_text())
+    segments = segment_document(research_doc, target_size=1000)
+    assert "".join(segment.text for segment in segments) == research_doc.paper
+
+
+def test_streamed_pdf_stops_at_references():
+    body = "".join(block.text for block in iter_body_blocks(str(PAPER_PATH)))
+    assert "Introduction" in body
+    assert "\nReferences\n" not in body
+
+    segments = list(iter_pdf_segments(str(PAPER_PATH), target_size=1000))
+    assert "".join(segment.text for segment in segments) == body
+    assert all(len(segment.text) <= 1000 for segment in segments)
+
+    research_doc = ResearchDoc.from_pdf(str(PAPER_PATH))
+    assert research_doc.fitz_paper is None
+    assert body.startswith(research_doc.paper)
+
+
+def test_parallel_page_extraction_matches_serial():
+    serial = list(iter_page_layouts(str(PAPER_PATH)))
+    parallel = list(iter_page_layouts(str(PAPER_PATH), workers=2, threshold=1))
+    assert [blocks for blocks, _ in parallel] == [blocks for blocks, _ in serial]
+    assert [sizes for _, sizes in parallel] == [sizes for _, sizes in serial]
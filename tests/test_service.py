@@ -0,0 +1,94 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+from glossagen.service import GlossaryHTTPServer, GlossaryService
+from glossagen.utils import OfflineLM, set_language_model
+
+PAPER = rb"""\documentclass{article}
+\begin{document}
+\section{Introduction}
+The metal-organic framework (MOF) is porous. ZIF-8 is a MOF.
+\end{document}
+"""
+
+
+@pytest.fixture
+def start_server(tmp_path):
+    previous = set_language_model(OfflineLM())
+    servers = []
+
+    def start(service, start_workers=True):
+        if start_workers:
+            service.start()
+        server = GlossaryHTTPServer(("127.0.0.1", 0), service)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append((server, service))
+        return f"http://127.0.0.1:{server.server_address[1]}"
+
+    yield start
+    for server, service in servers:
+        server.shutdown()
+        server.server_close()
+        service.close()
+    set_language_model(previous)
+
+
+def request(url, data=None, content_type="application/octet-stream"):
+    headers = {"Content-Type": content_type} if data is not None else {}
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, data, headers)) as response:
+            return response.status, response.read().decode("utf-8")
+    except urllib.error.HTTPError as error:
+        return error.code, error.read().decode("utf-8")
+
+
+def test_uploaded_documents_share_the_warm_store(tmp_path, start_server):
+    store_path = str(tmp_path / "terms.sqlite")
+    service = GlossaryService(use_cache=False, store_path=store_path, skip_known=True)
+    url = start_server(service)
+
+    jobs = []
+    for name in ["first.tex", "second.tex"]:
+        status, body = request(f"{url}/jobs?filename={name}", PAPER)
+        assert status == 202
+        jobs.append(json.loads(body)["id"])
+    status, body = request(f"{url}/jobs/{jobs[0]}/entries")  # streams until the job is done
+    assert status == 200
+    assert [json.loads(line)["Term"] for line in body.splitlines()] == ["MOF", "ZIF-8"]
+    request(f"{url}/jobs/{jobs[1]}/entries")
+
+    summaries = [json.loads(request(f"{url}/jobs/{job_id}")[1]) for job_id in jobs]
+    assert [summary["status"] for summary in summaries] == ["done", "done"]
+    assert [summary["source"] for summary in summaries] == ["first.tex", "second.tex"]
+    assert json.loads(request(f"{url}/health")[1])["store_entries"] == 4
+    assert service.store.papers() == ["first.tex", "second.tex"]
+
+
+def test_bad_requests_and_full_queue(start_server):
+    service = GlossaryService(use_cache=False, max_queue=1)
+    url = start_server(service, start_workers=False)  # nothing leaves the queue
+
+    assert request(f"{url}/jobs?filename=paper.docx", b"...")[0] == 400
+    assert request(f"{url}/jobs", b"{}", "application/json")[0] == 400
+    assert request(f"{url}/jobs/unknown")[0] == 404
+    assert request(f"{url}/jobs?filename=paper.tex", PAPER)[0] == 202
+    assert request(f"{url}/jobs?filename=paper.tex", PAPER)[0] == 503
+    assert json.loads(request(f"{url}/health")[1])["queued"] == 1
+
+
+def test_local_documents_only_below_the_document_root(tmp_path, start_server):
+    (tmp_path / "paper.tex").write_bytes(PAPER)
+    local = json.dumps({"path": "/etc/x.pdf"}).encode()
+    url = start_server(GlossaryService(use_cache=False), start_workers=False)
+    assert request(f"{url}/jobs", local, "application/json")[0] == 403
+
+    url = start_server(GlossaryService(use_cache=False, document_root=str(tmp_path)), False)
+    assert request(f"{url}/jobs", local, "application/json")[0] == 403
+    outside = json.dumps({"path": "../x.pdf"}).encode()
+    assert request(f"{url}/jobs", outside, "application/json")[0] == 403
+    inside = json.dumps({"path": "paper.tex"}).encode()
+    assert request(f"{url}/jobs", inside, "application/json")[0] == 202
@@ -0,0 +1,69 @@
+from glossagen.pipelines.generate_glossary import GlossaryEntry, TerminusTechnicus
+from glossagen.utils import KnownTerms, TermStore
+
+ENTRIES = [
+    GlossaryEntry(
+        term="Metal-organic framework (MOF)",
+        definition="A porous crystal of metal nodes and organic linkers.",
+        aliases=["MOF", "metal organic frameworks"],
+        chunk=0,
+    ),
+    TerminusTechnicus(term="Metallocene", definition="A sandwich compound."),
+    TerminusTechnicus(term="Zeolite", definition="A microporous aluminosilicate."),
+]
+
+
+def test_prefix_and_full_text_lookup(tmp_path):
+    store = TermStore(str(tmp_path / "terms.sqlite"))
+    assert store.add_glossary("a.pdf", ENTRIES) == 3
+
+    assert [entry.term for entry in store.lookup_prefix("meta")] == [
+        "Metal-organic framework (MOF)",
+        "Metallocene",
+    ]
+    (mof,) = store.search("organic linkers")
+    assert mof.aliases == ["MOF", "metal organic frameworks"]
+    assert (mof.paper, mof.chunk) == ("a.pdf", 0)
+    assert [entry.term for entry in store.search("aluminosilicat*", raw=True)] == ["Zeolite"]
+    assert store.search('"') == []
+    store.close()
+
+
+def test_regenerated_paper_replaces_its_entries(tmp_path):
+    path = str(tmp_path / "terms.sqlite")
+    store = TermStore(path)
+    store.add_glossary("a.pdf", ENTRIES)
+    store.add_glossary("b.pdf", ENTRIES[2:])
+    store.add_glossary("a.pdf", ENTRIES[:1])
+    store.close()
+
+    store = TermStore(path)
+    assert len(store) == 2
+    assert store.papers() == ["a.pdf", "b.pdf"]
+    assert store.search("sandwich") == []
+    store.close()
+
+
+def test_known_terms_find_terms_and_reload_incrementally(tmp_path):
+    store = TermStore(str(tmp_path / "terms.sqlite"))
+    store.add_glossary("a.pdf", ENTRIES)
+    known = KnownTerms(store)
+
+    assert known.is_known("metal-organic frameworks (MOFs)")
+    assert known.lookup("MOFs").term == "Metal-organic framework (MOF)"
+    text = "Zeolites and MOFs, unlike the metallocenes, adsorb water. A mof-fy word."
+    assert [entry.term for entry in known.find(text)] == [
+        "Zeolite",
+        "Metal-organic framework (MOF)",
+        "Metallocene",
+    ]
+    assert known.find("mof") == []  # abbreviations only match capitalized text
+
+    store.add_glossary("b.pdf", [TerminusTechnicus(term="X-ray diffraction", definition="XRD")])
+    assert known.refresh() == 1
+    assert known.is_known("X-ray diffraction")
+    store.add_glossary("a.pdf", ENTRIES[1:])  # replaces the glossary of a.pdf
+    known.refresh()
+    assert not known.is_known("MOF")
+    assert known.is_known("Zeolite") and known.is_known("X-ray diffraction")
+    store.close()
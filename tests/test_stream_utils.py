@@ -0,0 +1,57 @@
+import asyncio
+
+import pandas as pd
+import pytest
+
+from glossagen.pipelines.generate_glossary import GlossaryEntry, glossary_to_dataframe
+from glossagen.utils import aiterate_in_thread, iterate_in_thread, make_glossary_writer
+
+GLOSSARY = [
+    GlossaryEntry(term="MOF", definition="A porous, crystalline material.", aliases=["MOFs"]),
+    GlossaryEntry(term="BET", definition='Surface area from "N2" adsorption;\nin m2/g.'),
+]
+
+
+def produce_three(emit):
+    for item in range(3):
+        emit(item)
+
+
+def test_iterate_in_thread_passes_items_and_errors():
+    assert list(iterate_in_thread(produce_three, max_pending=1)) == [0, 1, 2]
+
+    def fail(emit):
+        emit("first")
+        raise RuntimeError("producer failed")
+
+    stream = iterate_in_thread(fail)
+    assert next(stream) == "first"
+    with pytest.raises(RuntimeError, match="producer failed"):
+        next(stream)
+
+
+def test_aiterate_in_thread():
+    async def collect():
+        return [item async for item in aiterate_in_thread(produce_three, max_pending=1)]
+
+    assert asyncio.run(collect()) == [0, 1, 2]
+
+
+@pytest.mark.parametrize("extension", ["jsonl", "csv", "parquet"])
+def test_writers_match_the_glossary_table(tmp_path, extension):
+    if extension == "parquet":
+        pytest.importorskip("pyarrow")
+    path = str(tmp_path / "out" / f"glossary.{extension}")
+    with make_glossary_writer(path) as writer:
+        for entry in GLOSSARY:
+            writer.write(entry)
+    assert writer.written == 2
+    if extension == "jsonl":
+        written = pd.read_json(path, lines=True, dtype=str)
+    elif extension == "csv":
+        written = pd.read_csv(path, keep_default_na=False)
+    else:
+        written = pd.read_parquet(path)
+    pd.testing.assert_frame_equal(written, glossary_to_dataframe(GLOSSARY))
+    with pytest.raises(ValueError):
+        make_glossary_writer(str(tmp_path / "glossary.xlsx"))
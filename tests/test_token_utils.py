@@ -0,0 +1,67 @@
+import pytest
+
+from glossagen.pipelines.generate_glossary import GlossaryGenerator, TerminusTechnicus
+from glossagen.utils import CharRatioTokenizer, ResearchDoc, Segment, TokenBudget, pack_document
+from glossagen.utils.token_utils import model_limits, pack_segments
+
+
+def make_budget(chunk_tokens):
+    return TokenBudget(CharRatioTokenizer(1), max_chunk_tokens=chunk_tokens)
+
+
+def test_chunks_fit_the_budget_without_a_short_tail():
+    paper = "".join(f"Paragraph {i} about MOFs and zeolites.\n\n" for i in range(100))
+    research_doc = ResearchDoc.from_text(text=paper, doc_src="test")
+    budget = make_budget(1000)
+
+    segments = pack_document(research_doc, budget)
+    assert "".join(segment.text for segment in segments) == paper
+    assert all(len(segment.text) <= 1000 for segment in segments)
+    assert len(segments) == -(-len(paper) // 1000)  # as few requests as possible
+    assert len(segments[-1].text) > 1000 // 2
+
+
+def test_pack_segments_splits_long_and_merges_short_segments():
+    text = "A sentence about MOFs. " * 10
+    segments = [
+        Segment(text=text, start=0, end=len(text), section="Introduction"),
+        Segment(text="Short.", start=len(text), end=len(text) + 6, section="Outlook"),
+    ]
+    packed = pack_segments(segments, make_budget(100))
+    assert "".join(segment.text for segment in packed) == text + "Short."
+    assert all(len(segment.text) <= 100 for segment in packed)
+    assert packed[0].section == "Introduction"
+    assert packed[-1].text.endswith("MOFs. Short.")
+
+
+def test_budget_follows_the_model_limits():
+    assert model_limits("gpt-4o-mini-2024-07-18")["max_output_tokens"] == 16384
+    assert model_limits("unknown")["context_window"] == 16385
+    budget = TokenBudget.for_model("gpt-4", CharRatioTokenizer(), max_chunk_tokens=None)
+    assert (
+        budget.chunk_tokens + budget.prompt_tokens + budget.output_tokens(budget.chunk_tokens)
+        <= budget.context_window
+    )
+    assert budget.output_tokens(100) < budget.output_tokens(4000) <= budget.max_output_tokens
+    with pytest.raises(ValueError):
+        TokenBudget(context_window=500)
+
+
+def test_generator_sizes_the_output_of_every_chunk():
+    requests = []
+
+    def predictor(text, config):
+        requests.append((len(text), config["max_tokens"]))
+        return type("Prediction", (), {"glossary": [TerminusTechnicus(term="MOF", definition="")]})
+
+    paper = "".join(f"Paragraph {i} about MOFs.\n\n" for i in range(60))
+    research_doc = ResearchDoc.from_text(text=paper, doc_src="test")
+    generator = GlossaryGenerator(research_doc, budget=make_budget(500))
+    generator.glossary_predictor = predictor
+    generator.extract_chunks(generator.split_into_chunks())
+
+    budget = generator.token_budget()
+    assert len(requests) == -(-len(paper) // 500)
+    assert [max_tokens for _, max_tokens in requests] == [
+        budget.output_tokens(length) for length, _ in requests
+    ]
@@ -0,0 +1,71 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from glossagen.utils import OfflineLM, Tracer, bind_span, instrument_language_model, make_tracer
+from glossagen.utils.tracing_utils import estimate_cost, set_tracer
+
+
+@pytest.fixture
+def tracer():
+    tracer = Tracer()
+    previous = set_tracer(tracer)
+    yield tracer
+    set_tracer(previous)
+
+
+def test_spans_nest_across_threads(tracer):
+    def extract(index):
+        with tracer.span("extract.chunk", chunk=index) as span:
+            return span
+
+    with tracer.span("glossary", paper="paper.pdf") as root:
+        with ThreadPoolExecutor(2) as executor:
+            children = list(executor.map(bind_span(extract), range(2)))
+    assert [span.parent_id for span in children] == [root.span_id, root.span_id]
+    assert {span.trace_id for span in children} == {root.trace_id}
+    assert children[0].attributes["paper"] == "paper.pdf"
+
+
+def test_failed_spans_record_the_error(tracer):
+    with pytest.raises(ValueError), tracer.span("pdf.load"):
+        raise ValueError("broken")
+    (span,) = tracer.spans()
+    assert span.error == "ValueError('broken')"
+    assert tracer.summary()[0]["errors"] == 1
+
+
+def test_language_model_requests_are_traced(tracer):
+    language_model = instrument_language_model(OfflineLM())
+    instrument_language_model(language_model)  # no second wrapper
+    with tracer.span("glossary", paper="paper.pdf"):
+        language_model("Text: MOF\n\nGlossary:")
+    request = next(span for span in tracer.spans() if span.name == "lm.request")
+    assert request.attributes["model"] == "offline"
+    assert request.attributes["prompt_tokens"] > 0
+    (paper,) = tracer.paper_summary()
+    assert paper["requests"] == 1
+    assert paper["cost"] == 0.0
+
+
+def test_estimate_cost():
+    assert estimate_cost("gpt-4o-2024-05-13", 1000000, 0) == 5.0
+    assert estimate_cost("unknown-model", 10, 10) is None
+
+
+@pytest.mark.parametrize("kind", ["json", "otlp"])
+def test_exporters_write_one_line_per_export(tmp_path, kind):
+    path = tmp_path / "trace.jsonl"
+    tracer = make_tracer(kind, str(path))
+    with tracer.span("glossary", chunks=3):
+        pass
+    tracer.close()
+    (line,) = path.read_text().splitlines()
+    record = json.loads(line)
+    if kind == "json":
+        assert record["name"] == "glossary"
+        assert record["attributes"] == {"chunks": 3}
+    else:
+        (span,) = record["resourceSpans"][0]["scopeSpans"][0]["spans"]
+        assert span["attributes"] == [{"key": "chunks", "value": {"intValue": "3"}}]